@@ -0,0 +1,158 @@
+"""
+ANN 召回的搜索参数（按召回路径、按档位配置）
+
+HNSW 索引建好之后，每次查询的精度 / 速度由搜索时的候选集大小（ef_search）决定；
+不设置时所有查询都使用服务端默认值。这里按召回路径配置：
+
+- ef_search：在召回事务内用 SET LOCAL 设置（事务结束自动恢复，不会影响连接池里其他请求）
+- candidate_factor：两阶段召回第一阶段（512 维前缀向量）的候选数 = top_k * candidate_factor
+  （interactive 档位默认取 PREFIX_RECALL_CANDIDATE_FACTOR 环境变量）
+
+两个档位：
+- interactive（默认）：在线搜索，偏向低延迟
+- offline：离线任务 / 评估脚本，偏向召回率
+
+离线任务切换档位（对其中创建的 asyncio 任务同样生效）：
+
+    with ann_search_profile("offline"):
+        await search_with_funnel(...)
+
+覆盖配置：ANN_SEARCH_PROFILES 环境变量（JSON，与 DEFAULT_PROFILES 结构相同，按路径合并），例如
+    ANN_SEARCH_PROFILES='{"interactive": {"image": {"ef_search": 160}}}'
+
+各路径的参数用 tune_ann_search.py 在真实数据上测出延迟 / recall 后再调整。
+"""
+import json
+import os
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# 服务端 ANN 搜索候选集大小的参数名（ADBPG FastANN）；设为空字符串表示不设置
+EF_SEARCH_SETTING = os.getenv("ANN_EF_SEARCH_SETTING", "fastann.hnsw_ef_search")
+
+# 两阶段召回第一阶段的候选倍数（interactive 档位的默认值；offline 档位默认 8）
+DEFAULT_CANDIDATE_FACTOR = max(1, int(os.getenv("PREFIX_RECALL_CANDIDATE_FACTOR", "4")))
+
+# 召回路径：text / image / caption（vector_db.search_by_*_embedding）、designer_sites（funnel_search）
+# "default" 是该档位下未单独配置的路径使用的参数
+DEFAULT_PROFILES: Dict[str, Dict[str, Dict[str, int]]] = {
+    "interactive": {
+        "default": {"ef_search": 100, "candidate_factor": DEFAULT_CANDIDATE_FACTOR},
+        # 图像路径是设计师搜索的主路径，多给一些搜索预算
+        "image": {"ef_search": 200, "candidate_factor": DEFAULT_CANDIDATE_FACTOR},
+        "designer_sites": {"ef_search": 200, "candidate_factor": DEFAULT_CANDIDATE_FACTOR},
+    },
+    "offline": {
+        "default": {"ef_search": 400, "candidate_factor": 8},
+    },
+}
+
+DEFAULT_PROFILE = "interactive"
+
+
+def _load_profiles() -> Dict[str, Dict[str, Dict[str, int]]]:
+    profiles = {name: {path: dict(values) for path, values in paths.items()} for name, paths in DEFAULT_PROFILES.items()}
+    raw = os.getenv("ANN_SEARCH_PROFILES", "").strip()
+    if not raw:
+        return profiles
+    try:
+        overrides = json.loads(raw)
+        for name, paths in overrides.items():
+            for path, values in paths.items():
+                profiles.setdefault(name, {}).setdefault(path, {}).update(
+                    {key: int(value) for key, value in values.items()}
+                )
+    except Exception as e:
+        print(f"[ANNSearch] Invalid ANN_SEARCH_PROFILES, using defaults: {e}")
+    return profiles
+
+
+PROFILES = _load_profiles()
+
+# 当前上下文使用的档位和临时覆盖参数（tune_ann_search.py 用覆盖参数扫描 ef_search）
+_current_profile: ContextVar[str] = ContextVar("ann_search_profile", default=DEFAULT_PROFILE)
+_current_overrides: ContextVar[Optional[Dict[str, int]]] = ContextVar("ann_search_overrides", default=None)
+
+# 连接池 -> 该连接池指向的服务端是否支持 EF_SEARCH_SETTING（每个连接池查询一次 pg_settings；
+# 各分片 / 读副本可能版本不同，不能用一个进程级的结论）
+_setting_supported: "weakref.WeakKeyDictionary[object, bool]" = weakref.WeakKeyDictionary()
+
+
+@contextmanager
+def ann_search_profile(profile: str, **overrides: int):
+    """
+    在当前上下文中使用指定档位（可附加覆盖参数，如 ef_search=64）
+
+    Raises:
+        ValueError: 未知档位
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown ANN search profile: {profile} (expected one of {sorted(PROFILES)})")
+    profile_token = _current_profile.set(profile)
+    overrides_token = _current_overrides.set(overrides or None)
+    try:
+        yield
+    finally:
+        _current_overrides.reset(overrides_token)
+        _current_profile.reset(profile_token)
+
+
+def settings(path: str) -> Dict[str, int]:
+    """当前档位下某个召回路径的参数（ef_search、candidate_factor）"""
+    profile = PROFILES.get(_current_profile.get(), PROFILES[DEFAULT_PROFILE])
+    result = {**profile.get("default", {}), **profile.get(path, {})}
+    overrides = _current_overrides.get()
+    if overrides:
+        result.update(overrides)
+    return result
+
+
+async def _is_setting_supported(conn, pool) -> bool:
+    """
+    服务端是否有 EF_SEARCH_SETTING 这个参数（按连接池缓存）
+
+    带点的参数名是自定义参数，对不存在的名字 SET 也会成功（只创建一个占位变量），
+    因此不能用 SET 是否报错来判断，而是查 pg_settings（占位变量不会出现在其中）
+    """
+    supported = _setting_supported.get(pool)
+    if supported is None:
+        supported = bool(await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM pg_settings WHERE name = $1);", EF_SEARCH_SETTING
+        ))
+        _setting_supported[pool] = supported
+        if not supported:
+            print(f"[ANNSearch] {EF_SEARCH_SETTING} is not supported by the server, using default search effort")
+    return supported
+
+
+@asynccontextmanager
+async def ann_search_transaction(conn, path: str, pool):
+    """
+    召回查询的事务：事务内 SET LOCAL ef_search，yield 该路径的参数
+
+    Args:
+        conn: 从 pool 借出的连接
+        path: 召回路径
+        pool: conn 所属的连接池（按连接池缓存服务端是否支持 EF_SEARCH_SETTING，不支持时不开事务设置）
+    """
+    path_settings = settings(path)
+    ef_search = path_settings.get("ef_search")
+    if not EF_SEARCH_SETTING or not ef_search or not await _is_setting_supported(conn, pool):
+        yield path_settings
+        return
+
+    async with conn.transaction():
+        await conn.execute(f"SET LOCAL {EF_SEARCH_SETTING} = {int(ef_search)}")
+        yield path_settings
+
+
+def stats() -> Dict:
+    return {
+        "setting": EF_SEARCH_SETTING or None,
+        "supported_pools": sum(1 for supported in _setting_supported.values() if supported),
+        "unsupported_pools": sum(1 for supported in _setting_supported.values() if not supported),
+        "profile": _current_profile.get(),
+        "profiles": PROFILES,
+    }
@@ -0,0 +1,135 @@
+"""
+回填入库派生列（host、site_domain 等，见 search/features.py）
+
+新写入的数据在 upsert 时已经计算了派生列；
+这个脚本用于给 Schema 升级之前写入的旧数据补齐这些列；派生列的计算规则变化后
+（例如 site_domain 改为按设计师网站域名归一子域名），重新执行一遍即可更新所有行。
+
+使用 (user_id, url) 主键做 keyset 分页，每批只读取计算所需的列，
+不会一次性把整张表加载到内存，也不会修改 updated_at。
+
+用法：
+
+1. 先 dry-run 看看要处理多少行：
+
+   python backfill_item_features.py
+
+2. 实际执行：
+
+   python backfill_item_features.py --execute
+   python backfill_item_features.py --user-id anonymous --execute
+"""
+import asyncio
+import argparse
+import sys
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_version
+from vector_db import get_shard_pools, close_pool, init_schema, ACTIVE_TABLE, _normalize_user_id
+from search.features import FEATURE_COLUMNS, FEATURE_SOURCE_COLUMNS, compute_item_features
+
+
+async def backfill_item_features(
+    user_id: Optional[str] = None,
+    batch_size: int = 500,
+    dry_run: bool = True,
+) -> int:
+    """
+    按 keyset 分页回填派生列
+
+    Args:
+        user_id: 只处理该用户（None 表示所有用户）
+        batch_size: 每批处理的行数
+        dry_run: 是否为试运行（只计算不写入）
+
+    Returns:
+        处理的行数
+    """
+    # 确保派生列已存在
+    await init_schema()
+
+    normalized_user = _normalize_user_id(user_id) if user_id else None
+    pools = await get_shard_pools(normalized_user)
+
+    source_sql = ", ".join(FEATURE_SOURCE_COLUMNS)
+    set_sql = ", ".join(f"{col} = ${i + 3}" for i, col in enumerate(FEATURE_COLUMNS))
+    update_sql = f"UPDATE {ACTIVE_TABLE} SET {set_sql} WHERE user_id = $1 AND url = $2"
+
+    print("=" * 60)
+    print(f"回填派生列: {', '.join(FEATURE_COLUMNS)}")
+    print(f"用户ID: {normalized_user or '所有用户'}")
+    print(f"模式: {'试运行' if dry_run else '实际执行'}")
+    print("=" * 60)
+
+    processed = 0
+    # 每个分片单独按 keyset 分页（分片之间 user_id 不重叠）
+    for pool in pools:
+        last_user, last_url = (normalized_user or ""), ""
+        while True:
+            async with pool.acquire() as conn:
+                if normalized_user:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, {source_sql}
+                        FROM {ACTIVE_TABLE}
+                        WHERE user_id = $1 AND url > $2
+                        ORDER BY url
+                        LIMIT $3;
+                    """, normalized_user, last_url, batch_size)
+                else:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, {source_sql}
+                        FROM {ACTIVE_TABLE}
+                        WHERE (user_id, url) > ($1, $2)
+                        ORDER BY user_id, url
+                        LIMIT $3;
+                    """, last_user, last_url, batch_size)
+
+                if not rows:
+                    break
+
+                updates = []
+                for row in rows:
+                    features = compute_item_features(dict(row))
+                    updates.append((row["user_id"], row["url"], *[features[col] for col in FEATURE_COLUMNS]))
+
+                if not dry_run:
+                    async with conn.transaction():
+                        await conn.executemany(update_sql, updates)
+                        # 与回填在同一个事务里递增涉及用户的数据版本号，使 API 进程中的缓存失效（见 data_version.py）
+                        await data_version.bump_users(conn, [update[0] for update in updates])
+
+            processed += len(rows)
+            last_user, last_url = rows[-1]["user_id"], rows[-1]["url"]
+            print(f"[Backfill] {'(dry-run) ' if dry_run else ''}processed {processed} rows (last: {last_user} / {last_url[:60]})")
+
+    print("=" * 60)
+    print(f"✅ 完成：{'将更新' if dry_run else '已更新'} {processed} 行")
+    print("=" * 60)
+    return processed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="回填入库派生列")
+    parser.add_argument("--user-id", type=str, default=None, help="用户 ID（默认: 所有用户）")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批行数（默认: 500）")
+    parser.add_argument("--execute", action="store_true", help="实际写入（默认: 试运行）")
+    args = parser.parse_args()
+
+    try:
+        await backfill_item_features(
+            user_id=args.user_id,
+            batch_size=args.batch_size,
+            dry_run=not args.execute,
+        )
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
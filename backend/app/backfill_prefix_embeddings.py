@@ -0,0 +1,220 @@
+"""
+回填两阶段召回的 512 维前缀向量（text/image/caption_embedding_512，见 vector_db.PREFIX_RECALL_ENABLED）
+
+新写入的数据在 upsert 时已经写入了前缀向量；
+这个脚本用于给 Schema 升级之前写入的旧数据补齐这些列（开启 PREFIX_RECALL_ENABLED 之前必须先回填）。
+
+前缀向量由 1024 维向量截取前 512 维并重新归一化得到，不需要重新调用 embedding API。
+使用 (user_id, url) 主键做 keyset 分页，只处理缺少前缀向量的行，不会修改 updated_at。
+
+用法：
+
+1. 先 dry-run 看看要处理多少行：
+
+   python backfill_prefix_embeddings.py
+
+2. 实际执行：
+
+   python backfill_prefix_embeddings.py --execute
+   python backfill_prefix_embeddings.py --user-id anonymous --execute
+
+3. 用某个用户的真实向量评估两阶段召回的 recall@k（以每条记录自身的向量为查询，在内存中计算）：
+
+   python backfill_prefix_embeddings.py --evaluate --user-id anonymous --top-k 20 --factor 4
+"""
+import asyncio
+import argparse
+import sys
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+import numpy as np
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from vector_db import (
+    get_read_pool,
+    get_shard_pools,
+    close_pool,
+    init_schema,
+    to_vector_str,
+    ACTIVE_TABLE,
+    PREFIX_EMBEDDING_COLUMNS,
+    _normalize_user_id,
+)
+import data_version
+from vector_cache import _as_vector
+from search.config import PREFIX_EMBED_DIM
+from search.features import prefix_embedding
+
+
+async def backfill_prefix_embeddings(
+    user_id: Optional[str] = None,
+    batch_size: int = 500,
+    dry_run: bool = True,
+) -> int:
+    """
+    按 keyset 分页回填前缀向量
+
+    Args:
+        user_id: 只处理该用户（None 表示所有用户）
+        batch_size: 每批处理的行数
+        dry_run: 是否为试运行（只计算不写入）
+
+    Returns:
+        处理的行数
+    """
+    # 确保前缀向量列已存在
+    await init_schema()
+
+    normalized_user = _normalize_user_id(user_id) if user_id else None
+    pools = await get_shard_pools(normalized_user)
+
+    source_sql = ", ".join(PREFIX_EMBEDDING_COLUMNS)
+    missing_sql = " OR ".join(
+        f"({source} IS NOT NULL AND {prefix} IS NULL)" for source, prefix in PREFIX_EMBEDDING_COLUMNS.items()
+    )
+    set_sql = ", ".join(
+        f"{prefix} = ${i + 3}::vector({PREFIX_EMBED_DIM})" for i, prefix in enumerate(PREFIX_EMBEDDING_COLUMNS.values())
+    )
+    update_sql = f"UPDATE {ACTIVE_TABLE} SET {set_sql} WHERE user_id = $1 AND url = $2"
+
+    print("=" * 60)
+    print(f"回填前缀向量: {', '.join(PREFIX_EMBEDDING_COLUMNS.values())}")
+    print(f"用户ID: {normalized_user or '所有用户'}")
+    print(f"模式: {'试运行' if dry_run else '实际执行'}")
+    print("=" * 60)
+
+    processed = 0
+    # 每个分片单独按 keyset 分页（分片之间 user_id 不重叠）
+    for pool in pools:
+        last_user, last_url = (normalized_user or ""), ""
+        while True:
+            async with pool.acquire() as conn:
+                if normalized_user:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, url, {source_sql}
+                        FROM {ACTIVE_TABLE}
+                        WHERE user_id = $1 AND url > $2 AND ({missing_sql})
+                        ORDER BY url
+                        LIMIT $3;
+                    """, normalized_user, last_url, batch_size)
+                else:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, url, {source_sql}
+                        FROM {ACTIVE_TABLE}
+                        WHERE (user_id, url) > ($1, $2) AND ({missing_sql})
+                        ORDER BY user_id, url
+                        LIMIT $3;
+                    """, last_user, last_url, batch_size)
+
+                if not rows:
+                    break
+
+                updates = []
+                for row in rows:
+                    prefixes = []
+                    for source in PREFIX_EMBEDDING_COLUMNS:
+                        vec = _as_vector(row[source])
+                        prefixes.append(to_vector_str(prefix_embedding(vec.tolist() if vec is not None else None)))
+                    updates.append((row["user_id"], row["url"], *prefixes))
+
+                if not dry_run:
+                    async with conn.transaction():
+                        await conn.executemany(update_sql, updates)
+                        # 与回填在同一个事务里递增涉及用户的数据版本号，使 API 进程中的缓存失效（见 data_version.py）
+                        await data_version.bump_users(conn, [update[0] for update in updates])
+
+            processed += len(rows)
+            last_user, last_url = rows[-1]["user_id"], rows[-1]["url"]
+            print(f"[Backfill] {'(dry-run) ' if dry_run else ''}processed {processed} rows (last: {last_user} / {last_url[:60]})")
+
+    print("=" * 60)
+    print(f"✅ 完成：{'将更新' if dry_run else '已更新'} {processed} 行")
+    print("=" * 60)
+    return processed
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+async def evaluate_prefix_recall(
+    user_id: Optional[str],
+    top_k: int = 20,
+    factor: int = 4,
+    max_queries: int = 200,
+) -> None:
+    """
+    评估两阶段召回（512 维前缀取 top_k * factor 个候选 → 1024 维重排）相对 1024 维精确搜索的 recall@k
+
+    用该用户每条记录自身的向量作为查询（最多 max_queries 条），全部在内存中暴力计算，不依赖 ANN 索引
+    """
+    normalized_user = _normalize_user_id(user_id)
+    pool = await get_read_pool(normalized_user)
+
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT {", ".join(PREFIX_EMBEDDING_COLUMNS)}
+            FROM {ACTIVE_TABLE}
+            WHERE user_id = $1 AND status = 'active';
+        """, normalized_user)
+
+    print("=" * 60)
+    print(f"两阶段召回评估（user_id={normalized_user}, top_k={top_k}, factor={factor}, prefix_dim={PREFIX_EMBED_DIM}）")
+    print("=" * 60)
+
+    rng = np.random.default_rng(0)
+    for source in PREFIX_EMBEDDING_COLUMNS:
+        vectors = [v for v in (_as_vector(row[source]) for row in rows) if v is not None]
+        if len(vectors) <= top_k:
+            print(f"{source}: 只有 {len(vectors)} 条向量，跳过")
+            continue
+
+        full = _unit_rows(np.vstack(vectors).astype(np.float32))
+        prefix = _unit_rows(full[:, :PREFIX_EMBED_DIM])
+        query_ids = rng.choice(len(full), size=min(max_queries, len(full)), replace=False)
+
+        recalls = []
+        for qi in query_ids:
+            exact = set(np.argsort(-(full @ full[qi]))[:top_k])
+            candidates = np.argsort(-(prefix @ prefix[qi]))[:top_k * factor]
+            reranked = candidates[np.argsort(-(full[candidates] @ full[qi]))][:top_k]
+            recalls.append(len(exact & set(reranked)) / top_k)
+
+        print(
+            f"{source}: {len(full)} 条, recall@{top_k} = {np.mean(recalls):.4f} "
+            f"(min {np.min(recalls):.2f}, {len(query_ids)} 个查询)"
+        )
+    print("=" * 60)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="回填 / 评估 512 维前缀向量")
+    parser.add_argument("--user-id", type=str, default=None, help="用户 ID（默认: 所有用户；--evaluate 时默认 anonymous）")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批行数（默认: 500）")
+    parser.add_argument("--execute", action="store_true", help="实际写入（默认: 试运行）")
+    parser.add_argument("--evaluate", action="store_true", help="评估两阶段召回的 recall@k（不写入）")
+    parser.add_argument("--top-k", type=int, default=20, help="评估的 top_k（默认: 20）")
+    parser.add_argument("--factor", type=int, default=4, help="评估的候选倍数（默认: 4）")
+    args = parser.parse_args()
+
+    try:
+        if args.evaluate:
+            await evaluate_prefix_recall(args.user_id, top_k=args.top_k, factor=args.factor)
+        else:
+            await backfill_prefix_embeddings(
+                user_id=args.user_id,
+                batch_size=args.batch_size,
+                dry_run=not args.execute,
+            )
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
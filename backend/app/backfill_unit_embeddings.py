@@ -0,0 +1,207 @@
+"""
+把已存储的 embedding 归一化为单位向量（text/image/caption_embedding，见 search/normalize.py）
+
+新写入的数据在 upsert 时已经归一化；
+这个脚本用于处理归一化上线之前写入的旧数据。所有向量都是单位向量之后，
+才能把 VECTOR_DISTANCE_MEASURE 切换为 ip（内积），否则内积排序会偏向范数大的向量。
+
+- 已经是单位向量的行（|norm - 1| < 1e-4）不更新
+- 维度不对 / NaN / 零向量无法参与相似度计算，置为 NULL
+- 512 维前缀向量本身就是截取后重新归一化的，不受影响
+- 不会修改 updated_at；row_fingerprint 不变，下次上传时这些行会被重写一次（之后恢复跳过）
+
+切换到 ip 的步骤：
+
+1. 先 dry-run 看看要处理多少行：
+
+   python backfill_unit_embeddings.py
+
+2. 实际执行：
+
+   python backfill_unit_embeddings.py --execute
+   python backfill_unit_embeddings.py --user-id anonymous --execute
+
+3. 设置 VECTOR_DISTANCE_MEASURE=ip，重建 ANN 索引（删除后由 init_schema 按新的距离重建）：
+
+   VECTOR_DISTANCE_MEASURE=ip python backfill_unit_embeddings.py --rebuild-indexes --execute
+
+4. 以 VECTOR_DISTANCE_MEASURE=ip 重启服务
+"""
+import asyncio
+import argparse
+import sys
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+import numpy as np
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from vector_db import (
+    get_shard_pool,
+    get_shard_pools,
+    close_pool,
+    init_schema,
+    to_vector_str,
+    ACTIVE_TABLE,
+    ACTIVE_TABLE_NAME,
+    NAMESPACE,
+    PREFIX_EMBEDDING_COLUMNS,
+    VECTOR_DISTANCE_MEASURE,
+    _normalize_user_id,
+)
+import data_version
+import shard_router
+from vector_cache import _as_vector
+from search.normalize import EMBEDDING_FIELDS, normalize_embeddings
+
+# 认为已经是单位向量的范数误差
+UNIT_NORM_TOLERANCE = 1e-4
+
+
+def _needs_update(vectors) -> bool:
+    for vec in vectors:
+        if vec is None:
+            continue
+        norm = float(np.linalg.norm(vec))
+        if not np.isfinite(norm) or abs(norm - 1.0) >= UNIT_NORM_TOLERANCE:
+            return True
+    return False
+
+
+async def backfill_unit_embeddings(
+    user_id: Optional[str] = None,
+    batch_size: int = 500,
+    dry_run: bool = True,
+) -> int:
+    """
+    按 keyset 分页把 embedding 归一化为单位向量
+
+    Args:
+        user_id: 只处理该用户（None 表示所有用户）
+        batch_size: 每批读取的行数
+        dry_run: 是否为试运行（只计算不写入）
+
+    Returns:
+        需要更新（dry-run）/ 已更新的行数
+    """
+    normalized_user = _normalize_user_id(user_id) if user_id else None
+    pools = await get_shard_pools(normalized_user)
+
+    source_sql = ", ".join(EMBEDDING_FIELDS)
+    not_null_sql = " OR ".join(f"{field} IS NOT NULL" for field in EMBEDDING_FIELDS)
+    set_sql = ", ".join(f"{field} = ${i + 3}::vector(1024)" for i, field in enumerate(EMBEDDING_FIELDS))
+    update_sql = f"UPDATE {ACTIVE_TABLE} SET {set_sql} WHERE user_id = $1 AND url = $2"
+
+    print("=" * 60)
+    print(f"归一化 embedding: {', '.join(EMBEDDING_FIELDS)}")
+    print(f"用户ID: {normalized_user or '所有用户'}")
+    print(f"模式: {'试运行' if dry_run else '实际执行'}")
+    print("=" * 60)
+
+    scanned = 0
+    updated = 0
+    # 每个分片单独按 keyset 分页（分片之间 user_id 不重叠）
+    for pool in pools:
+        last_user, last_url = (normalized_user or ""), ""
+        while True:
+            async with pool.acquire() as conn:
+                if normalized_user:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, url, {source_sql}
+                        FROM {ACTIVE_TABLE}
+                        WHERE user_id = $1 AND url > $2 AND ({not_null_sql})
+                        ORDER BY url
+                        LIMIT $3;
+                    """, normalized_user, last_url, batch_size)
+                else:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, url, {source_sql}
+                        FROM {ACTIVE_TABLE}
+                        WHERE (user_id, url) > ($1, $2) AND ({not_null_sql})
+                        ORDER BY user_id, url
+                        LIMIT $3;
+                    """, last_user, last_url, batch_size)
+
+                if not rows:
+                    break
+
+                updates = []
+                for row in rows:
+                    raw = [_as_vector(row[field]) for field in EMBEDDING_FIELDS]
+                    if not _needs_update(raw):
+                        continue
+                    unit = normalize_embeddings([vec.tolist() if vec is not None else None for vec in raw])
+                    updates.append((row["user_id"], row["url"], *[to_vector_str(vec) for vec in unit]))
+
+                if updates and not dry_run:
+                    async with conn.transaction():
+                        await conn.executemany(update_sql, updates)
+                        # 与回填在同一个事务里递增涉及用户的数据版本号，使 API 进程中的缓存失效（见 data_version.py）
+                        await data_version.bump_users(conn, [update[0] for update in updates])
+
+            scanned += len(rows)
+            updated += len(updates)
+            last_user, last_url = rows[-1]["user_id"], rows[-1]["url"]
+            print(
+                f"[Backfill] {'(dry-run) ' if dry_run else ''}scanned {scanned} rows, "
+                f"{'to update' if dry_run else 'updated'} {updated} (last: {last_user} / {last_url[:60]})"
+            )
+
+    print("=" * 60)
+    print(f"✅ 完成：扫描 {scanned} 行，{'将更新' if dry_run else '已更新'} {updated} 行")
+    print("=" * 60)
+    return updated
+
+
+async def rebuild_ann_indexes(dry_run: bool = True) -> None:
+    """逐个分片删除所有 embedding 列的 ANN 索引，再由 init_schema 按 VECTOR_DISTANCE_MEASURE 重建"""
+    columns = [*EMBEDDING_FIELDS, *PREFIX_EMBEDDING_COLUMNS.values()]
+    index_names = [f"idx_{ACTIVE_TABLE_NAME}_{column}" for column in columns]
+
+    print("=" * 60)
+    print(f"重建 ANN 索引（distancemeasure = {VECTOR_DISTANCE_MEASURE}）: {', '.join(index_names)}")
+    print(f"模式: {'试运行' if dry_run else '实际执行'}")
+    print("=" * 60)
+    if dry_run:
+        return
+
+    for shard in range(shard_router.SHARD_COUNT):
+        pool = await get_shard_pool(shard)
+        async with pool.acquire() as conn:
+            for index_name in index_names:
+                await conn.execute(f"DROP INDEX IF EXISTS {NAMESPACE}.{index_name};")
+                print(f"[Backfill] Dropped index {index_name} (shard {shard})")
+        await init_schema(shard)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="把已存储的 embedding 归一化为单位向量")
+    parser.add_argument("--user-id", type=str, default=None, help="用户 ID（默认: 所有用户）")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批行数（默认: 500）")
+    parser.add_argument("--execute", action="store_true", help="实际写入（默认: 试运行）")
+    parser.add_argument(
+        "--rebuild-indexes",
+        action="store_true",
+        help="按当前 VECTOR_DISTANCE_MEASURE 重建 ANN 索引（不做归一化回填）",
+    )
+    args = parser.parse_args()
+
+    try:
+        if args.rebuild_indexes:
+            await rebuild_ann_indexes(dry_run=not args.execute)
+        else:
+            await backfill_unit_embeddings(
+                user_id=args.user_id,
+                batch_size=args.batch_size,
+                dry_run=not args.execute,
+            )
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
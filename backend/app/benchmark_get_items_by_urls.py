@@ -0,0 +1,132 @@
+"""
+get_items_by_urls 基准测试
+
+对比旧实现（一条语句、每个 URL 一个 IN 占位符、返回完整行）和新实现
+（url = ANY 数组参数、分块并发、可选字段投影）在 10 ~ 5000 个 URL 时的耗时。
+
+URL 取自该用户已有的数据；用户数据不够时用不存在的 URL 补齐（只测查询本身的开销）。
+
+用法：
+
+   python benchmark_get_items_by_urls.py --user-id anonymous
+   python benchmark_get_items_by_urls.py --user-id anonymous --sizes 10,100,500 --repeat 5 --chunk-size 100
+"""
+import asyncio
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from vector_db import (
+    get_pool,
+    close_pool,
+    get_items_by_urls,
+    ACTIVE_TABLE,
+    ITEM_LOOKUP_COLUMNS,
+    _normalize_user_id,
+    _row_to_dict,
+)
+
+DEFAULT_SIZES = [10, 100, 500, 1000, 5000]
+# 同步接口实际用到的列（字段投影场景）
+PROJECTED_FIELDS = ["url", "content_hash", "text_embedding", "image_embedding"]
+
+
+async def legacy_get_items_by_urls(user_id: str, urls: List[str]) -> List[dict]:
+    """旧实现：每个 URL 一个占位符，语句文本随 URL 数量变化，每次都要重新规划"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        placeholders = ",".join(f"${i + 1}" for i in range(len(urls)))
+        rows = await conn.fetch(f"""
+            SELECT {", ".join(ITEM_LOOKUP_COLUMNS)}
+            FROM {ACTIVE_TABLE}
+            WHERE user_id = ${len(urls) + 1} AND url IN ({placeholders}) AND status = 'active';
+        """, *urls, user_id)
+        return [_row_to_dict(row) for row in rows]
+
+
+async def sample_urls(user_id: str, size: int) -> List[str]:
+    """取该用户的 size 个 URL，不足时补齐不存在的 URL"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT url FROM {ACTIVE_TABLE}
+            WHERE user_id = $1 AND status = 'active'
+            LIMIT $2;
+        """, user_id, size)
+    urls = [row["url"] for row in rows]
+    urls += [f"https://benchmark.invalid/missing/{i}" for i in range(size - len(urls))]
+    return urls
+
+
+async def time_call(func, repeat: int):
+    """执行 repeat 次，返回 (中位数毫秒, 返回行数)"""
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await func()
+        timings.append((time.perf_counter() - start) * 1000)
+        rows = len(result)
+    return statistics.median(timings), rows
+
+
+async def run_benchmark(user_id: str, sizes: List[int], repeat: int, chunk_size: int) -> None:
+    normalized_user = _normalize_user_id(user_id)
+
+    print("=" * 80)
+    print(f"get_items_by_urls 基准测试（user_id={normalized_user}, repeat={repeat}, chunk_size={chunk_size}）")
+    print("=" * 80)
+    print(f"{'URLs':>6} {'rows':>6} | {'legacy IN':>12} | {'ANY chunked':>12} | {'ANY + fields':>12} | speedup")
+    print("-" * 80)
+
+    for size in sizes:
+        urls = await sample_urls(normalized_user, size)
+
+        # 预热一次（建立连接、预编译语句）
+        await get_items_by_urls(normalized_user, urls, chunk_size=chunk_size)
+
+        legacy_ms, rows = await time_call(lambda: legacy_get_items_by_urls(normalized_user, urls), repeat)
+        chunked_ms, _ = await time_call(
+            lambda: get_items_by_urls(normalized_user, urls, chunk_size=chunk_size), repeat
+        )
+        projected_ms, _ = await time_call(
+            lambda: get_items_by_urls(normalized_user, urls, fields=PROJECTED_FIELDS, chunk_size=chunk_size),
+            repeat,
+        )
+        speedup = legacy_ms / projected_ms if projected_ms else 0.0
+        print(
+            f"{size:>6} {rows:>6} | {legacy_ms:>10.1f}ms | {chunked_ms:>10.1f}ms | "
+            f"{projected_ms:>10.1f}ms | {speedup:.1f}x"
+        )
+
+    print("=" * 80)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="get_items_by_urls 基准测试")
+    parser.add_argument("--user-id", type=str, default="anonymous", help="用户 ID（默认: anonymous）")
+    parser.add_argument(
+        "--sizes", type=str, default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="URL 数量列表，逗号分隔（默认: 10,100,500,1000,5000）",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="每组重复次数，取中位数（默认: 3）")
+    parser.add_argument("--chunk-size", type=int, default=200, help="每块 URL 数（默认: 200）")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    try:
+        await run_benchmark(args.user_id, sizes, args.repeat, args.chunk_size)
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
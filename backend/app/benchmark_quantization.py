@@ -0,0 +1,132 @@
+"""
+int8 量化召回率基准测试（不需要数据库）
+
+在合成语料上对比进程内向量缓存的三种搜索方式：
+- float32：原始矩阵暴力检索（基准答案）
+- int8：只在 int8 矩阵上检索（不重排）
+- int8 + rerank：int8 粗召回 top_k * rerank_factor 个候选，再用 float 向量重排（VECTOR_CACHE_QUANTIZATION=int8 的实际行为）
+
+输出 recall@k（与 float32 结果的重合率）、矩阵内存和单次查询耗时。
+
+合成语料：n_clusters 个随机中心，每条向量 = 中心 + 噪声（模拟同一主题的多个网页）；
+查询 = 随机一条语料向量 + 噪声。
+
+用法：
+
+   python benchmark_quantization.py
+   python benchmark_quantization.py --items 20000 --queries 200 --top-k 20 --rerank-factors 1,2,4,8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import vector_cache
+from vector_cache import UserVectorIndex, search_index
+
+
+def make_corpus(items: int, dim: int, clusters: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=items)
+    corpus = centers[labels] + noise * rng.normal(size=(items, dim)).astype(np.float32)
+    return corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picks = corpus[rng.integers(0, len(corpus), size=count)]
+    queries = picks + noise * rng.normal(size=picks.shape).astype(np.float32) / np.sqrt(corpus.shape[1])
+    return queries.astype(np.float32)
+
+
+def build_index(corpus: np.ndarray, quantize: bool) -> UserVectorIndex:
+    rows = [
+        {"url": f"https://synthetic.invalid/{i}", "is_doc": False, "text_embedding": vec}
+        for i, vec in enumerate(corpus)
+    ]
+    return UserVectorIndex(rows, quantize=quantize)
+
+
+def recall(results: List[Dict], truth: set) -> float:
+    return len({r["url"] for r in results} & truth) / len(truth) if truth else 1.0
+
+
+async def run_benchmark(args) -> None:
+    corpus = make_corpus(args.items, args.dim, args.clusters, args.noise, args.seed)
+    queries = make_queries(corpus, args.queries, args.query_noise, args.seed)
+    vectors_by_url = {f"https://synthetic.invalid/{i}": {"text_embedding": vec} for i, vec in enumerate(corpus)}
+
+    async def fetch_vectors(urls: List[str]) -> Dict[str, Dict]:
+        return {url: vectors_by_url[url] for url in urls}
+
+    float_index = build_index(corpus, quantize=False)
+    int8_index = build_index(corpus, quantize=True)
+
+    print("=" * 80)
+    print(f"int8 量化基准（items={args.items}, dim={args.dim}, queries={args.queries}, top_k={args.top_k}）")
+    print("=" * 80)
+    float_mb = float_index.modalities["text"].nbytes / 1024 / 1024
+    int8_mb = int8_index.modalities["text"].nbytes / 1024 / 1024
+    print(f"矩阵内存: float32 {float_mb:.1f} MB → int8 {int8_mb:.1f} MB ({float_mb / int8_mb:.1f}x)")
+    print("-" * 80)
+
+    truths = []
+    float_ms = []
+    for query in queries:
+        start = time.perf_counter()
+        results = float_index.search("text", query, args.top_k)
+        float_ms.append((time.perf_counter() - start) * 1000)
+        truths.append({r["url"] for r in results})
+    print(f"{'method':<22} | {'recall@' + str(args.top_k):>10} | {'min':>6} | {'p50 ms':>8}")
+    print(f"{'float32':<22} | {1.0:>10.4f} | {1.0:>6.2f} | {statistics.median(float_ms):>8.2f}")
+
+    recalls = []
+    timings = []
+    for query, truth in zip(queries, truths):
+        start = time.perf_counter()
+        results = int8_index.search("text", query, args.top_k)
+        timings.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall(results, truth))
+    print(f"{'int8 (no rerank)':<22} | {statistics.mean(recalls):>10.4f} | {min(recalls):>6.2f} | {statistics.median(timings):>8.2f}")
+
+    for factor in args.rerank_factors:
+        vector_cache.RERANK_FACTOR = factor
+        recalls = []
+        timings = []
+        for query, truth in zip(queries, truths):
+            start = time.perf_counter()
+            results = await search_index(int8_index, "text", query, args.top_k, fetch_vectors=fetch_vectors)
+            timings.append((time.perf_counter() - start) * 1000)
+            recalls.append(recall(results, truth))
+        label = f"int8 + rerank x{factor}"
+        print(f"{label:<22} | {statistics.mean(recalls):>10.4f} | {min(recalls):>6.2f} | {statistics.median(timings):>8.2f}")
+
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 量化召回率基准测试")
+    parser.add_argument("--items", type=int, default=20000, help="语料条数（默认: 20000）")
+    parser.add_argument("--dim", type=int, default=1024, help="向量维度（默认: 1024）")
+    parser.add_argument("--clusters", type=int, default=200, help="主题簇数量（默认: 200）")
+    parser.add_argument("--noise", type=float, default=0.8, help="簇内噪声（默认: 0.8）")
+    parser.add_argument("--query-noise", type=float, default=0.5, help="查询噪声（默认: 0.5）")
+    parser.add_argument("--queries", type=int, default=100, help="查询数量（默认: 100）")
+    parser.add_argument("--top-k", type=int, default=20, help="top_k（默认: 20）")
+    parser.add_argument("--rerank-factors", type=str, default="1,2,4,8", help="重排候选倍数，逗号分隔（默认: 1,2,4,8）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子（默认: 42）")
+    args = parser.parse_args()
+    args.rerank_factors = [int(f) for f in args.rerank_factors.split(",") if f.strip()]
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -162,7 +162,7 @@ async def cleanup_404_items(
         
         async with pool.acquire() as conn:
             deleted_count = await conn.execute(
-                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE tab_id = ANY($1::int[])",
+                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE tab_id = ANY($1::int[])",
                 tab_ids_to_delete
             )
         
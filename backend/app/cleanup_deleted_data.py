@@ -12,7 +12,7 @@ load_dotenv()
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from vector_db import get_pool, close_pool, NAMESPACE, ACTIVE_TABLE
+from vector_db import get_shard_pools, close_pool, NAMESPACE, ACTIVE_TABLE, delete_unreferenced_screenshot_blobs
 
 
 async def cleanup_deleted_data(days_threshold: int = 30, anonymize: bool = True):
@@ -23,59 +23,74 @@ async def cleanup_deleted_data(days_threshold: int = 30, anonymize: bool = True)
         days_threshold: 删除阈值（天数）
         anonymize: 如果为 True，匿名化数据；如果为 False，物理删除
     """
-    pool = await get_pool()
+    cutoff_date = datetime.now() - timedelta(days=days_threshold)
     
     try:
-        async with pool.acquire() as conn:
-            cutoff_date = datetime.now() - timedelta(days=days_threshold)
-            
-            # 查找需要清理的记录
-            count_query = f"""
-                SELECT COUNT(*) 
-                FROM {ACTIVE_TABLE}
-                WHERE status = 'deleted' 
-                  AND deleted_at < $1;
-            """
-            
-            count = await conn.fetchval(count_query, cutoff_date)
-            
-            print(f"[Cleanup] Found {count} records to clean up (deleted before {cutoff_date})")
-            
-            if count == 0:
-                print("[Cleanup] ✓ No records to clean up")
-                return
-            
-            if anonymize:
-                # 匿名化：清空敏感字段，保留 embedding 用于搜索
-                print("[Cleanup] Anonymizing data...")
-                result = await conn.execute(f"""
-                    UPDATE {ACTIVE_TABLE}
-                    SET 
-                        user_id = 'anonymous',
-                        title = NULL,
-                        description = NULL,
-                        image = NULL,
-                        screenshot_image = NULL,
-                        site_name = NULL,
-                        tab_id = NULL,
-                        tab_title = NULL,
-                        metadata = jsonb_build_object('anonymized', true, 'original_deleted_at', deleted_at),
-                        updated_at = NOW()
+        # 每个分片单独清理（截图 blob 和引用它的记录在同一个分片）
+        for shard, pool in enumerate(await get_shard_pools()):
+            async with pool.acquire() as conn:
+                # 查找需要清理的记录
+                count_query = f"""
+                    SELECT COUNT(*) 
+                    FROM {ACTIVE_TABLE}
                     WHERE status = 'deleted' 
                       AND deleted_at < $1;
-                """, cutoff_date)
+                """
                 
-                print(f"[Cleanup] ✓ Anonymized records: {result}")
-            else:
-                # 物理删除
-                print("[Cleanup] Physically deleting data...")
-                result = await conn.execute(f"""
-                    DELETE FROM {ACTIVE_TABLE}
-                    WHERE status = 'deleted' 
-                      AND deleted_at < $1;
-                """, cutoff_date)
+                count = await conn.fetchval(count_query, cutoff_date)
+                
+                print(f"[Cleanup] Shard {shard}: found {count} records to clean up (deleted before {cutoff_date})")
+                
+                if count == 0:
+                    print(f"[Cleanup] ✓ Shard {shard}: no records to clean up")
+                    continue
                 
-                print(f"[Cleanup] ✓ Deleted records: {result}")
+                async with conn.transaction():
+                    # 这些记录引用的截图：清理后没有其他记录引用的，在同一个事务里删除
+                    screenshot_hashes = [row["screenshot_hash"] for row in await conn.fetch(f"""
+                        SELECT DISTINCT screenshot_hash
+                        FROM {ACTIVE_TABLE}
+                        WHERE status = 'deleted'
+                          AND deleted_at < $1
+                          AND screenshot_hash IS NOT NULL;
+                    """, cutoff_date)]
+                    
+                    if anonymize:
+                        # 匿名化：清空敏感字段，保留 embedding 用于搜索
+                        print("[Cleanup] Anonymizing data...")
+                        result = await conn.execute(f"""
+                            UPDATE {ACTIVE_TABLE}
+                            SET 
+                                user_id = 'anonymous',
+                                title = NULL,
+                                description = NULL,
+                                image = NULL,
+                                screenshot_image = NULL,
+                                screenshot_hash = NULL,
+                                site_name = NULL,
+                                tab_id = NULL,
+                                tab_title = NULL,
+                                metadata = jsonb_build_object('anonymized', true, 'original_deleted_at', deleted_at),
+                                updated_at = NOW()
+                            WHERE status = 'deleted' 
+                              AND deleted_at < $1;
+                        """, cutoff_date)
+                    
+                        print(f"[Cleanup] ✓ Anonymized records: {result}")
+                    else:
+                        # 物理删除
+                        print("[Cleanup] Physically deleting data...")
+                        result = await conn.execute(f"""
+                            DELETE FROM {ACTIVE_TABLE}
+                            WHERE status = 'deleted' 
+                              AND deleted_at < $1;
+                        """, cutoff_date)
+                    
+                        print(f"[Cleanup] ✓ Deleted records: {result}")
+                    
+                    # 清理不再被任何记录引用的截图
+                    orphan_count = await delete_unreferenced_screenshot_blobs(conn, screenshot_hashes)
+                    print(f"[Cleanup] ✓ Deleted orphan screenshots: {orphan_count}")
     
     except Exception as e:
         print(f"[Cleanup] Error: {e}")
@@ -33,133 +33,42 @@ async def cleanup_duplicate_captions(
     print("="*80)
     
     async with pool.acquire() as conn:
-        # 检查字段是否存在
-        has_caption_field = await conn.fetchval(f"""
-            SELECT EXISTS (
-                SELECT FROM information_schema.columns 
-                WHERE table_schema = 'cleantab'
-                  AND table_name = 'opengraph_items_v2'
-                  AND column_name = 'image_caption'
-            );
-        """)
+        # 按 (user_id, caption_hash) 分组（走 (user_id, caption_hash) 索引，
+        # caption_hash 同时覆盖 image_caption 和 metadata->>'caption'，见 search/features.py）
+        params = []
+        user_clause = ""
+        if normalized_user:
+            user_clause = "AND user_id = $1"
+            params.append(normalized_user)
         
-        if not has_caption_field:
-            print("\n⚠️  image_caption 字段不存在，尝试使用 metadata->>'caption'")
-            # 使用 metadata 查询
-            if normalized_user:
-                query = f"""
-                    WITH normalized_captions AS (
-                        SELECT
-                            tab_id,
-                            url,
-                            title,
-                            created_at,
-                            LOWER(TRIM(COALESCE(metadata->>'caption', ''))) AS normalized_caption
-                        FROM {ACTIVE_TABLE}
-                        WHERE status = 'active'
-                          AND user_id = $1
-                          AND metadata ? 'caption'
-                          AND metadata->>'caption' IS NOT NULL
-                          AND metadata->>'caption' != ''
-                    )
-                    SELECT
-                        normalized_caption as caption,
-                        COUNT(*) as count,
-                        ARRAY_AGG(tab_id ORDER BY created_at DESC) as tab_ids,
-                        ARRAY_AGG(url ORDER BY created_at DESC) as urls,
-                        ARRAY_AGG(title ORDER BY created_at DESC) as titles
-                    FROM normalized_captions
-                    WHERE normalized_caption != ''
-                    GROUP BY normalized_caption
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC;
-                """
-                rows = await conn.fetch(query, normalized_user)
-            else:
-                query = f"""
-                    WITH normalized_captions AS (
-                        SELECT
-                            tab_id,
-                            url,
-                            title,
-                            created_at,
-                            LOWER(TRIM(COALESCE(metadata->>'caption', ''))) AS normalized_caption
-                        FROM {ACTIVE_TABLE}
-                        WHERE status = 'active'
-                          AND metadata ? 'caption'
-                          AND metadata->>'caption' IS NOT NULL
-                          AND metadata->>'caption' != ''
-                    )
-                    SELECT
-                        normalized_caption as caption,
-                        COUNT(*) as count,
-                        ARRAY_AGG(tab_id ORDER BY created_at DESC) as tab_ids,
-                        ARRAY_AGG(url ORDER BY created_at DESC) as urls,
-                        ARRAY_AGG(title ORDER BY created_at DESC) as titles
-                    FROM normalized_captions
-                    WHERE normalized_caption != ''
-                    GROUP BY normalized_caption
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC;
-                """
-                rows = await conn.fetch(query)
-        else:
-            # 使用新字段查询
-            if normalized_user:
-                query = f"""
-                    WITH normalized_captions AS (
-                        SELECT
-                            tab_id,
-                            url,
-                            title,
-                            created_at,
-                            LOWER(TRIM(COALESCE(image_caption, ''))) AS normalized_caption
-                        FROM {ACTIVE_TABLE}
-                        WHERE status = 'active'
-                          AND user_id = $1
-                          AND image_caption IS NOT NULL
-                          AND image_caption != ''
-                    )
-                    SELECT
-                        normalized_caption as caption,
-                        COUNT(*) as count,
-                        ARRAY_AGG(tab_id ORDER BY created_at DESC) as tab_ids,
-                        ARRAY_AGG(url ORDER BY created_at DESC) as urls,
-                        ARRAY_AGG(title ORDER BY created_at DESC) as titles
-                    FROM normalized_captions
-                    WHERE normalized_caption != ''
-                    GROUP BY normalized_caption
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC;
-                """
-                rows = await conn.fetch(query, normalized_user)
-            else:
-                query = f"""
-                    WITH normalized_captions AS (
-                        SELECT
-                            tab_id,
-                            url,
-                            title,
-                            created_at,
-                            LOWER(TRIM(COALESCE(image_caption, ''))) AS normalized_caption
-                        FROM {ACTIVE_TABLE}
-                        WHERE status = 'active'
-                          AND image_caption IS NOT NULL
-                          AND image_caption != ''
-                    )
-                    SELECT
-                        normalized_caption as caption,
-                        COUNT(*) as count,
-                        ARRAY_AGG(tab_id ORDER BY created_at DESC) as tab_ids,
-                        ARRAY_AGG(url ORDER BY created_at DESC) as urls,
-                        ARRAY_AGG(title ORDER BY created_at DESC) as titles
-                    FROM normalized_captions
-                    WHERE normalized_caption != ''
-                    GROUP BY normalized_caption
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC;
-                """
-                rows = await conn.fetch(query)
+        query = f"""
+            SELECT
+                user_id,
+                MIN(COALESCE(image_caption, metadata->>'caption')) as caption,
+                COUNT(*) as count,
+                ARRAY_AGG(tab_id ORDER BY created_at DESC) as tab_ids,
+                ARRAY_AGG(url ORDER BY created_at DESC) as urls,
+                ARRAY_AGG(title ORDER BY created_at DESC) as titles
+            FROM {ACTIVE_TABLE}
+            WHERE status = 'active'
+              AND caption_hash IS NOT NULL
+              {user_clause}
+            GROUP BY user_id, caption_hash
+            HAVING COUNT(*) > 1
+            ORDER BY count DESC;
+        """
+        rows = await conn.fetch(query, *params)
+        
+        missing_hash = await conn.fetchval(f"""
+            SELECT COUNT(*)
+            FROM {ACTIVE_TABLE}
+            WHERE status = 'active'
+              AND caption_hash IS NULL
+              AND (image_caption IS NOT NULL OR metadata ? 'caption')
+              {user_clause}
+        """, *params)
+        if missing_hash:
+            print(f"\n⚠️  {missing_hash} 条有 Caption 的记录还没有 caption_hash，请先运行 backfill_item_features.py")
         
         print(f"\n找到 {len(rows)} 组重复的 Caption")
         
@@ -214,32 +123,21 @@ async def cleanup_duplicate_captions(
                     # 使用 tab_id 删除
                     delete_tab_ids = tab_ids[1:]
                     if delete_tab_ids:
-                        if normalized_user:
-                            await conn.execute(
-                                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE user_id = $1 AND tab_id = ANY($2::int[])",
-                                normalized_user, delete_tab_ids
-                            )
-                        else:
-                            await conn.execute(
-                                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE tab_id = ANY($1::int[])",
-                                delete_tab_ids
-                            )
+                        # 分组已按 user_id 区分，删除时始终限定在该组的用户内
+                        await conn.execute(
+                            f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE user_id = $1 AND tab_id = ANY($2::int[])",
+                            row['user_id'], delete_tab_ids
+                        )
                         total_deleted += len(delete_tab_ids)
                         print(f"   ✅ 已删除 {len(delete_tab_ids)} 个重复项（使用 tab_id）")
                 else:
                     # 使用 url 删除
                     delete_urls = urls[1:]
                     if delete_urls:
-                        if normalized_user:
-                            await conn.execute(
-                                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE user_id = $1 AND url = ANY($2::text[])",
-                                normalized_user, delete_urls
-                            )
-                        else:
-                            await conn.execute(
-                                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE url = ANY($1::text[])",
-                                delete_urls
-                            )
+                        await conn.execute(
+                            f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE user_id = $1 AND url = ANY($2::text[])",
+                            row['user_id'], delete_urls
+                        )
                         total_deleted += len(delete_urls)
                         print(f"   ✅ 已删除 {len(delete_urls)} 个重复项（使用 url）")
             else:
@@ -265,30 +163,18 @@ async def cleanup_duplicate_captions(
                     if use_tab_id:
                         delete_tab_ids = tab_ids[1:]
                         if delete_tab_ids:
-                            if normalized_user:
-                                await conn.execute(
-                                    f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE user_id = $1 AND tab_id = ANY($2::int[])",
-                                    normalized_user, delete_tab_ids
-                                )
-                            else:
-                                await conn.execute(
-                                    f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE tab_id = ANY($1::int[])",
-                                    delete_tab_ids
-                                )
+                            await conn.execute(
+                                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE user_id = $1 AND tab_id = ANY($2::int[])",
+                                row['user_id'], delete_tab_ids
+                            )
                             total_deleted += len(delete_tab_ids)
                     else:
                         delete_urls = urls[1:]
                         if delete_urls:
-                            if normalized_user:
-                                await conn.execute(
-                                    f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE user_id = $1 AND url = ANY($2::text[])",
-                                    normalized_user, delete_urls
-                                )
-                            else:
-                                await conn.execute(
-                                    f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE url = ANY($1::text[])",
-                                    delete_urls
-                                )
+                            await conn.execute(
+                                f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE user_id = $1 AND url = ANY($2::text[])",
+                                row['user_id'], delete_urls
+                            )
                             total_deleted += len(delete_urls)
                 else:
                     if use_tab_id:
@@ -143,12 +143,12 @@ async def cleanup_duplicates(user_id: Optional[str] = None, dry_run: bool = True
                             if tab_id is not None:
                                 if normalized_user:
                                     await conn.execute(
-                                        f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW() WHERE tab_id = $1 AND user_id = $2 AND status = 'active'",
+                                        f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE tab_id = $1 AND user_id = $2 AND status = 'active'",
                                         tab_id, normalized_user
                                     )
                                 else:
                                     await conn.execute(
-                                        f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW() WHERE tab_id = $1 AND status = 'active'",
+                                        f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE tab_id = $1 AND status = 'active'",
                                         tab_id
                                     )
                     
@@ -157,7 +157,7 @@ async def cleanup_duplicates(user_id: Optional[str] = None, dry_run: bool = True
                     if normalized_user:
                         delete_query = f"""
                             UPDATE {ACTIVE_TABLE}
-                            SET status = 'deleted', deleted_at = NOW()
+                            SET status = 'deleted', deleted_at = NOW(), updated_at = NOW()
                             WHERE user_id = $1
                               AND status = 'active'
                               AND LOWER(REGEXP_REPLACE(REGEXP_REPLACE(REGEXP_REPLACE(url, '\\?.*$', ''), '#.*$', ''), '/$', '')) = $2
@@ -172,7 +172,7 @@ async def cleanup_duplicates(user_id: Optional[str] = None, dry_run: bool = True
                     else:
                         delete_query = f"""
                             UPDATE {ACTIVE_TABLE}
-                            SET status = 'deleted', deleted_at = NOW()
+                            SET status = 'deleted', deleted_at = NOW(), updated_at = NOW()
                             WHERE status = 'active'
                               AND LOWER(REGEXP_REPLACE(REGEXP_REPLACE(REGEXP_REPLACE(url, '\\?.*$', ''), '#.*$', ''), '/$', '')) = $1
                               AND created_at < (
@@ -260,7 +260,7 @@ async def cleanup_doc_items(user_id: Optional[str] = None, dry_run: bool = True)
                 # 批量更新
                 for tab_id in tab_ids:
                     await conn.execute(
-                        f"UPDATE {ACTIVE_TABLE} SET status = 'deleted' WHERE tab_id = $1",
+                        f"UPDATE {ACTIVE_TABLE} SET status = 'deleted', deleted_at = NOW(), updated_at = NOW() WHERE tab_id = $1",
                         tab_id
                     )
                 
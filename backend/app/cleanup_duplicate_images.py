@@ -6,7 +6,8 @@
 - 这些重复图片会在粗召回阶段被多次命中，占用召回配额和排序资源
 
 策略：
-- 以 (user_id, image) 或 (user_id, screenshot_image) 为维度分组
+- 以 (user_id, image_hash) 或 (user_id, screenshot_hash) 为维度分组
+  （image_hash 有 (user_id, image_hash) 索引，旧数据需先运行 backfill_item_features.py）
 - 对于每一组：
   - 按 created_at 降序排列
   - 保留最新的一条记录
@@ -58,41 +59,39 @@ async def find_duplicate_images(
         # 如果有 user_id，占位符应为 $2，否则为 $1
         count_placeholder = f"${len(params) + 1}"
 
-        # 按 image 分组
+        # 按 image_hash 分组（走 (user_id, image_hash) 索引，不直接比较可能很长的 image 字符串）
         image_query = f"""
             SELECT
                 user_id,
-                image,
+                MIN(image) AS image,
                 COUNT(*) AS cnt,
                 ARRAY_AGG(tab_id ORDER BY created_at DESC) AS tab_ids,
                 ARRAY_AGG(url ORDER BY created_at DESC) AS urls,
                 ARRAY_AGG(created_at ORDER BY created_at DESC) AS created_at_list
             FROM {ACTIVE_TABLE}
             WHERE status = 'active'
-              AND image IS NOT NULL
-              AND image != ''
+              AND image_hash IS NOT NULL
               {user_clause}
-            GROUP BY user_id, image
+            GROUP BY user_id, image_hash
             HAVING COUNT(*) >= {count_placeholder}
             ORDER BY cnt DESC;
         """
         image_rows = await conn.fetch(image_query, *params, min_count)
 
-        # 按 screenshot_image 分组
+        # 按 screenshot_hash 分组（截图本体在 screenshot_blobs 中，旧数据需先运行 migrate_screenshots_to_blobs.py）
         screenshot_query = f"""
             SELECT
                 user_id,
-                screenshot_image,
+                screenshot_hash,
                 COUNT(*) AS cnt,
                 ARRAY_AGG(tab_id ORDER BY created_at DESC) AS tab_ids,
                 ARRAY_AGG(url ORDER BY created_at DESC) AS urls,
                 ARRAY_AGG(created_at ORDER BY created_at DESC) AS created_at_list
             FROM {ACTIVE_TABLE}
             WHERE status = 'active'
-              AND screenshot_image IS NOT NULL
-              AND screenshot_image != ''
+              AND screenshot_hash IS NOT NULL
               {user_clause}
-            GROUP BY user_id, screenshot_image
+            GROUP BY user_id, screenshot_hash
             HAVING COUNT(*) >= {count_placeholder}
             ORDER BY cnt DESC;
         """
@@ -117,7 +116,7 @@ async def find_duplicate_images(
         screenshot_duplicates = []
         for r in screenshot_rows:
             d = row_to_dict(r)
-            d["screenshot_image"] = r["screenshot_image"]
+            d["screenshot_hash"] = r["screenshot_hash"]
             screenshot_duplicates.append(d)
 
         return image_duplicates, screenshot_duplicates
@@ -134,7 +133,6 @@ async def cleanup_duplicate_images(
     - 保留最新的一条 tab_id，其余全部 status='deleted'
     """
     pool = await get_pool()
-    normalized_user = _normalize_user_id(user_id) if user_id else None
 
     image_dups, screenshot_dups = await find_duplicate_images(user_id=user_id, min_count=min_count)
 
@@ -160,7 +158,7 @@ async def cleanup_duplicate_images(
     total_delete_by_screenshot = 0
     for group in screenshot_dups[:20]:
         print("\n----------------------------------------")
-        print(f"Screenshot: {group['screenshot_image'][:100]}...")
+        print(f"Screenshot: {group['screenshot_hash']}")
         print(f"重复次数: {group['cnt']}")
         print("URLs 示例:")
         for url in group["urls"][:3]:
@@ -198,13 +196,13 @@ async def cleanup_duplicate_images(
             await conn.execute(
                 f"""
                 UPDATE {ACTIVE_TABLE}
-                SET status = 'deleted'
+                SET status = 'deleted', deleted_at = NOW(), updated_at = NOW()
                 WHERE status = 'active'
                   AND tab_id = ANY($1::int[])
-                  {"AND user_id = $2" if normalized_user else ""}
+                  AND user_id = $2
                 """,
                 delete_ids,
-                *( [normalized_user] if normalized_user else [] ),
+                group["user_id"],
             )
 
         # 2. 按 screenshot_image 删除
@@ -220,13 +218,13 @@ async def cleanup_duplicate_images(
             await conn.execute(
                 f"""
                 UPDATE {ACTIVE_TABLE}
-                SET status = 'deleted'
+                SET status = 'deleted', deleted_at = NOW(), updated_at = NOW()
                 WHERE status = 'active'
                   AND tab_id = ANY($1::int[])
-                  {"AND user_id = $2" if normalized_user else ""}
+                  AND user_id = $2
                 """,
                 delete_ids,
-                *( [normalized_user] if normalized_user else [] ),
+                group["user_id"],
             )
 
     print("\n================================================================================")
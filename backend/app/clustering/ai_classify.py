@@ -10,7 +10,7 @@ import numpy as np
 from .config import MAX_LABELS
 from .layout import calculate_cluster_layout
 from search.embed import embed_text
-from search.fuse import cosine_similarity
+from search.normalize import normalize_embeddings
 
 
 async def classify_by_labels(
@@ -62,9 +62,30 @@ async def classify_by_labels(
     
     # 为每个卡片计算与每个标签的相似度
     # 使用 text_embedding 和 image_embedding 分别计算，然后融合
+    # 标签向量和卡片向量各批量归一化一次，相似度 = 单位向量矩阵乘法（不再对每一对重新计算范数）
     item_scores = {}  # {item_id: {label: score}}
+    label_names = list(label_embeddings.keys())
+    dim = len(next(iter(label_embeddings.values())))
+    label_matrix = np.array(
+        [vec if vec is not None else [0.0] * dim
+         for vec in normalize_embeddings([label_embeddings[label] for label in label_names], dim=dim)],
+        dtype=np.float32,
+    )
     
-    for item in available_items:
+    def _list_or_none(value):
+        return value if isinstance(value, list) and len(value) > 0 else None
+    
+    text_units = normalize_embeddings([_list_or_none(item.get("text_embedding")) for item in available_items], dim=dim)
+    image_units = normalize_embeddings([_list_or_none(item.get("image_embedding")) for item in available_items], dim=dim)
+    
+    def _label_sims(units) -> np.ndarray:
+        matrix = np.array([u if u is not None else [0.0] * dim for u in units], dtype=np.float32)
+        return matrix @ label_matrix.T  # (items, labels)
+    
+    text_sims = _label_sims(text_units)
+    image_sims = _label_sims(image_units)
+    
+    for idx, item in enumerate(available_items):
         item_id = item.get("id")
         if not item_id:
             continue
@@ -78,19 +99,10 @@ async def classify_by_labels(
         
         item_scores[item_id] = {}
         
-        for label, label_vec in label_embeddings.items():
-            text_sim = 0.0
-            image_sim = 0.0
-            
-            # 计算文本相似度
-            if text_emb and isinstance(text_emb, list) and len(text_emb) > 0:
-                if len(text_emb) == len(label_vec):
-                    text_sim = cosine_similarity(label_vec, text_emb)
-            
-            # 计算图像相似度
-            if image_emb and isinstance(image_emb, list) and len(image_emb) > 0:
-                if len(image_emb) == len(label_vec):
-                    image_sim = cosine_similarity(label_vec, image_emb)
+        for label_idx, label in enumerate(label_names):
+            # 维度不匹配 / 非法向量的相似度为 0
+            text_sim = float(text_sims[idx, label_idx])
+            image_sim = float(image_sims[idx, label_idx])
             
             # 融合相似度（默认权重：文本 60%，图像 40%）
             # 如果只有一种 embedding，使用单一相似度
@@ -0,0 +1,209 @@
+"""
+按用户的数据版本号（用于缓存失效）
+
+每个分片上的 user_data_versions 表为每个用户保存一个单调递增的版本号，
+所有修改用户数据的写入（upsert、Caption 更新、截图更新、软删除 / 恢复）在同一个事务里调用 bump。
+搜索结果、聚类、AI 洞察等缓存以 (user_id, version) 作为 key：数据变化后版本号变化，旧缓存自然不再命中，
+不需要猜测 TTL。
+
+- 读取：get_version(user_id)，进程内缓存 DATA_VERSION_CACHE_TTL 秒（默认 1 秒）；
+  本进程的写入提交后立即失效（invalidate），其他进程的写入最多延迟 TTL 秒（读副本时再加上复制延迟）可见
+- 版本号：GREATEST(version + 1, 当前毫秒时间戳)。用户迁移到另一个分片（rebalance_user_shard.py）后，
+  新分片上的版本号也一定大于旧分片上用过的版本号，不会和旧缓存的 key 冲突
+- 没有写入过的用户版本号为 0
+- 直接修改 active 数据的维护脚本（backfill_*、migrate_screenshots_to_blobs、rebalance_user_shard 等）在写入的
+  同一个事务里为涉及的用户调用 bump / bump_users，否则 API 进程中的缓存不会失效
+
+缓存使用方式：
+
+   version = await data_version.get_version(user_id)
+   if version is not None:
+       key = (user_id, version, ...)
+"""
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import db_routing
+
+# 进程内缓存版本号的时间（秒）；0 表示每次都查询数据库
+CACHE_TTL = float(os.getenv("DATA_VERSION_CACHE_TTL", "1"))
+
+
+def version_table() -> str:
+    from vector_db import NAMESPACE
+    return f"{NAMESPACE}.user_data_versions"
+
+
+async def create_table(conn) -> None:
+    """在当前分片上创建版本号表（vector_db.init_schema 调用）"""
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {version_table()} (
+            user_id TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+
+
+class VersionCache:
+    """user_id -> (版本号, 读取时间) 的进程内缓存"""
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[int, float]] = {}
+        # 读取期间发生的失效（读取完成后不缓存结果，避免缓存旧版本号）
+        self._generation: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bumps = 0
+        # bump_user 失败次数（数据已提交但版本号没有变化，其他进程的缓存要等下一次递增才失效）
+        self.bump_failures = 0
+
+    def get(self, user_id: str) -> Optional[int]:
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def generation(self, user_id: str) -> int:
+        return self._generation.get(user_id, 0)
+
+    def put(self, user_id: str, version: int, generation: int) -> None:
+        if self.ttl <= 0 or self._generation.get(user_id, 0) != generation:
+            return
+        self._entries[user_id] = (version, time.monotonic())
+        # 只保留 TTL 内的记录，避免字典无限增长
+        if len(self._entries) > 10000:
+            cutoff = time.monotonic() - self.ttl
+            for uid in [uid for uid, (_, at) in self._entries.items() if at < cutoff]:
+                self._entries.pop(uid, None)
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "ttl_s": self.ttl,
+            "users": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "bumps": self.bumps,
+            "bump_failures": self.bump_failures,
+        }
+
+
+cache = VersionCache()
+
+
+async def bump(conn, user_id: str) -> int:
+    """
+    递增用户的版本号（在写入数据的同一个连接 / 事务里调用，写入提交后再调用 invalidate）
+
+    Returns:
+        新的版本号
+    """
+    table = version_table()
+    version = await conn.fetchval(f"""
+        INSERT INTO {table} (user_id, version, updated_at)
+        VALUES ($1, (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT, NOW())
+        ON CONFLICT (user_id) DO UPDATE SET
+            version = GREATEST({table}.version + 1, EXCLUDED.version),
+            updated_at = NOW()
+        RETURNING version;
+    """, user_id)
+    cache.bumps += 1
+    return version
+
+
+async def bump_users(conn, user_ids) -> int:
+    """
+    批量递增多个用户的版本号（维护脚本按批写入时，在同一个事务里调用）
+
+    Returns:
+        递增的用户数
+    """
+    # 去重并排序：同一条语句不能两次更新同一行，固定的加锁顺序避免并发脚本互相死锁
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return 0
+    table = version_table()
+    await conn.execute(f"""
+        INSERT INTO {table} (user_id, version, updated_at)
+        SELECT user_id, (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT, NOW()
+        FROM unnest($1::text[]) AS user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            version = GREATEST({table}.version + 1, EXCLUDED.version),
+            updated_at = NOW();
+    """, user_ids)
+    cache.bumps += len(user_ids)
+    return len(user_ids)
+
+
+def invalidate(user_id: str) -> None:
+    """本进程的写入提交后调用，下一次 get_version 重新读取"""
+    cache.invalidate(user_id)
+
+
+async def bump_user(user_id: Optional[str]) -> int:
+    """
+    单独递增版本号（没有现成连接的写入路径，例如批量 upsert 结束后）
+
+    Returns:
+        新的版本号
+
+    Raises:
+        递增失败时抛出数据库异常：调用方的数据已经提交，版本号没有变化时其他进程的缓存不会失效，不能当作成功
+    """
+    from vector_db import get_pool, _normalize_user_id
+    user_id = _normalize_user_id(user_id)
+    try:
+        pool = await get_pool(user_id)
+        async with pool.acquire() as conn:
+            return await bump(conn, user_id)
+    except Exception:
+        cache.bump_failures += 1
+        raise
+    finally:
+        # 调用方的写入已经提交（见 db_routing.py 的 read-your-writes）
+        db_routing.mark_write(user_id)
+        invalidate(user_id)
+
+
+async def get_version(user_id: Optional[str]) -> Optional[int]:
+    """
+    用户当前的数据版本号（没有写入过为 0）
+
+    Returns:
+        版本号；读取失败返回 None（调用方此时不应使用缓存）
+    """
+    from vector_db import get_read_pool, _normalize_user_id
+    import query_registry
+    user_id = _normalize_user_id(user_id)
+    version = cache.get(user_id)
+    if version is not None:
+        return version
+
+    generation = cache.generation(user_id)
+    try:
+        # 本进程刚写入过的用户走主库（见 db_routing.py 的 read-your-writes）
+        pool = await get_read_pool(user_id)
+        async with pool.acquire() as conn:
+            version = await query_registry.fetchval(conn, "data_version.get", f"""
+                SELECT version FROM {version_table()} WHERE user_id = $1;
+            """, user_id)
+    except Exception as e:
+        print(f"[DataVersion] Error reading version for {user_id}: {e}")
+        return None
+    version = version or 0
+    cache.put(user_id, version, generation)
+    return version
+
+
+def stats() -> Dict:
+    return cache.stats()
@@ -0,0 +1,92 @@
+"""
+读写连接池路由
+
+搜索召回、列表等只读查询走读连接池（vector_db.get_read_pool），upsert、Caption 更新、软删除、
+清理脚本等写入走写连接池（vector_db.get_pool），两者不再争抢同一批连接。
+增量同步（get_user_changes）的水位线依赖主库的提交顺序，始终走写连接池（主库）。
+
+配置：
+- ADBPG_READ_DSNS：读库连接串（逗号分隔，与分片一一对应；未分片时填一个），通常指向只读副本
+- ADBPG_READ_POOL_MAX_SIZE：只设置这个时，读连接池连接主库，只做连接隔离
+- 都不设置时读写共用一个连接池（与拆分之前相同）
+
+Read-your-writes：副本有复制延迟，用户写入后立即搜索可能看不到刚写入的数据。
+写入事务提交后调用 mark_write(user_id) 记录该用户的写入时间（与 data_version.invalidate 一起调用），
+之后 READ_YOUR_WRITES_WINDOW 秒内该用户的读请求改走主库（例如 /api/v1/search/embedding 之后的搜索）。
+在提交之后记录：事务执行时间较长时，窗口仍从数据真正可见的时刻开始计算。
+写入时间记录在进程内；多进程部署时需要把同一用户的请求路由到同一进程（或调大窗口）。
+
+函数上的 @db_route("read") / @db_route("write") 只是路由标注（不包装函数、没有运行开销），
+标明该函数使用哪个连接池，便于审查新代码是否选对了连接池。
+"""
+import os
+import time
+from typing import Dict, Optional
+
+READ_DSNS = [dsn.strip() for dsn in os.getenv("ADBPG_READ_DSNS", "").split(",") if dsn.strip()]
+READ_POOL_MAX_SIZE = int(os.getenv("ADBPG_READ_POOL_MAX_SIZE")) if os.getenv("ADBPG_READ_POOL_MAX_SIZE") else None
+# 是否有独立的读连接池
+READ_POOL_ENABLED = bool(READ_DSNS) or READ_POOL_MAX_SIZE is not None
+# 读连接池是否指向副本（有复制延迟，需要 read-your-writes）
+READ_FROM_REPLICA = bool(READ_DSNS)
+# 写入后多少秒内该用户的读请求走主库（应大于副本的最大复制延迟）
+READ_YOUR_WRITES_WINDOW = float(os.getenv("ADBPG_READ_YOUR_WRITES_WINDOW", "10"))
+
+ROUTES = ("read", "write")
+
+# user_id -> 最近一次写入时间（time.monotonic()）
+_last_write: Dict[str, float] = {}
+_stats = {"replica_reads": 0, "primary_reads": 0, "read_your_writes": 0}
+
+
+def db_route(kind: str):
+    """
+    路由标注：@db_route("read") 使用读连接池，@db_route("write") 使用写连接池
+
+    Raises:
+        ValueError: kind 不是 read / write
+    """
+    if kind not in ROUTES:
+        raise ValueError(f"Unknown db route: {kind} (expected one of {ROUTES})")
+
+    def decorator(func):
+        func.__db_route__ = kind
+        return func
+
+    return decorator
+
+
+def mark_write(user_id: str) -> None:
+    """记录用户的写入时间（写入事务提交后调用）"""
+    if READ_FROM_REPLICA:
+        _last_write[user_id] = time.monotonic()
+        # 只保留窗口内的记录，避免字典无限增长
+        if len(_last_write) > 10000:
+            cutoff = time.monotonic() - READ_YOUR_WRITES_WINDOW
+            for uid in [uid for uid, at in _last_write.items() if at < cutoff]:
+                _last_write.pop(uid, None)
+
+
+def read_from_primary(user_id: Optional[str]) -> bool:
+    """该用户的读请求是否需要走主库（读连接池不是副本时永远不需要）"""
+    if not READ_FROM_REPLICA or user_id is None:
+        return False
+    written_at = _last_write.get(user_id)
+    if written_at is not None and time.monotonic() - written_at < READ_YOUR_WRITES_WINDOW:
+        _stats["read_your_writes"] += 1
+        return True
+    return False
+
+
+def record_read(replica: bool) -> None:
+    _stats["replica_reads" if replica else "primary_reads"] += 1
+
+
+def stats() -> Dict:
+    return {
+        "read_pool": READ_POOL_ENABLED,
+        "replica": READ_FROM_REPLICA,
+        "read_your_writes_window_s": READ_YOUR_WRITES_WINDOW,
+        "recent_writers": len(_last_write),
+        **_stats,
+    }
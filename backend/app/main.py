@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -111,6 +111,42 @@ async def favicon():
     return Response(status_code=204)
 
 
+@app.get("/api/v1/metrics/db")
+async def db_pool_metrics(top: int = 20, reset: bool = False):
+    """
+    数据库连接池指标
+
+    - pool: size / idle / in_use / waiting（当前值）和 max_waiting（峰值）
+    - acquire_wait: 获取连接的等待时间直方图（持续非零说明连接池饱和，需调大 ADBPG_POOL_MAX_SIZE）
+    - statements: 按总耗时排序的 SQL 耗时统计
+    - prepared_statements: 热点查询的调用次数和每个连接的语句缓存大小（见 query_registry.py）
+    - vector_cache: 进程内向量缓存的用户数、内存和命中率（见 vector_cache.py）
+    - ann_search: 各召回路径的 ANN 搜索参数（见 ann_search.py）
+    - routing / read_pool: 读写连接池拆分后的读连接池状态和 read-your-writes 次数（见 db_routing.py）
+    - data_version: 按用户数据版本号的进程内缓存命中率和递增次数（见 data_version.py）
+
+    Args:
+        top: 返回前多少条语句
+        reset: 读取后清零统计（便于压测时分段观察）
+    """
+    from vector_db import get_pool_metrics
+    from pool_metrics import metrics
+    import query_registry
+
+    import vector_cache
+    import ann_search
+    import data_version
+
+    snapshot = get_pool_metrics(top=max(1, min(top, 200)))
+    snapshot["vector_cache"] = vector_cache.cache.stats()
+    snapshot["ann_search"] = ann_search.stats()
+    snapshot["data_version"] = data_version.stats()
+    if reset:
+        metrics.reset()
+        query_registry.reset_stats()
+    return {"ok": True, **snapshot}
+
+
 # OpenGraph API
 class TabItem(BaseModel):
     url: str
@@ -220,6 +256,11 @@ class EmbeddingRequest(BaseModel):
     opengraph_items: List[Dict[str, Any]]
 
 
+class UploadCheckRequest(BaseModel):
+    # [{"url": ..., "content_hash": ...}]，content_hash 规则见 search/features.compute_content_hash
+    items: List[Dict[str, Any]]
+
+
 class SearchRequest(BaseModel):
     query: str
     top_k: Optional[int] = 20
@@ -270,8 +311,15 @@ async def generate_embeddings(
             })
         
         # ✅ 步骤 0: 规范化输入数据
+        # content_hash 以服务端按原始请求字段计算的为准（规则见 search/features.compute_content_hash），
+        # 规范化时保留，入库后与客户端握手时发送的哈希一致
         from search.normalize import normalize_opengraph_items
-        normalized_items = normalize_opengraph_items(request.opengraph_items)
+        from search.features import compute_content_hash
+        raw_items = [
+            {**item, "content_hash": compute_content_hash(item)} if isinstance(item, dict) else item
+            for item in request.opengraph_items
+        ]
+        normalized_items = normalize_opengraph_items(raw_items)
         print(f"[API] Normalized {len(normalized_items)} items from {len(request.opengraph_items)} input items")
         
         # ✅ 步骤 0.3: 请求去重 - 检查是否有正在处理的相同URL
@@ -296,19 +344,23 @@ async def generate_embeddings(
                     processing_urls_for_user.add(url)
         
         # ✅ 步骤 0.5: 检查数据库中已有的 embedding（自动补全逻辑）
-        from vector_db import get_items_by_urls
+        from vector_store import get_vector_store, is_vector_store_configured
         items_already_done = []
         items_to_process = []
         
-        db_host = os.getenv("ADBPG_HOST", "")
-        if db_host:
+        store_configured = is_vector_store_configured()
+        if store_configured:
             print(f"[API] Checking database for existing embeddings...")
             
             # 批量获取所有 URL 的数据
             urls = [item.get("url") for item in normalized_items if item.get("url")]
             existing_items_map = {}
             if urls:
-                existing_items = await get_items_by_urls(normalized_user_id, urls)
+                # 只取复用 embedding 需要的列
+                existing_items = await get_vector_store().get_items_by_urls(
+                    normalized_user_id, urls,
+                    fields=["url", "content_hash", "text_embedding", "image_embedding"],
+                )
                 existing_items_map = {item['url']: item for item in existing_items}
                 print(f"[API] Found {len(existing_items)} items in database")
             
@@ -318,8 +370,12 @@ async def generate_embeddings(
                     items_to_process.append(item)
                     continue
                 
-                # 检查数据库是否已有完整的 embedding
+                # 检查数据库是否已有完整的 embedding（内容变化过的不复用旧 embedding）
                 existing_item = existing_items_map.get(url)
+                if existing_item and existing_item.get("content_hash") and \
+                        existing_item["content_hash"] != item.get("content_hash"):
+                    items_to_process.append(item)
+                    continue
                 if existing_item:
                     has_text_emb = existing_item.get("text_embedding") and len(existing_item.get("text_embedding", [])) > 0
                     has_image_emb = existing_item.get("image_embedding") and len(existing_item.get("image_embedding", [])) > 0
@@ -354,7 +410,7 @@ async def generate_embeddings(
         else:
             # 没有配置数据库，全部需要处理
             items_to_process = normalized_items
-            print(f"[API] ADBPG_HOST not configured, processing all {len(items_to_process)} items")
+            print(f"[API] Vector store not configured, processing all {len(items_to_process)} items")
         
         # 1. 只为需要处理的项生成 embedding
         enriched_items = []
@@ -400,11 +456,11 @@ async def generate_embeddings(
         
         # 3. 调用 batch_upsert_items() 存储到数据库
         saved_count = 0
-        db_host = os.getenv("ADBPG_HOST", "")
-        if db_host and items_to_store:
+        upsert_stats = {"written": 0, "skipped": 0}
+        if store_configured and items_to_store:
             try:
-                from vector_db import batch_upsert_items
-                saved_count = await batch_upsert_items(items_to_store, user_id=normalized_user_id)
+                store = get_vector_store()
+                saved_count = await store.batch_upsert_items(items_to_store, user_id=normalized_user_id, stats=upsert_stats)
                 if saved_count > 0:
                     print(f"[API] ✓ Stored {saved_count}/{len(items_to_store)} items to vector DB")
                     
@@ -412,10 +468,11 @@ async def generate_embeddings(
                     try:
                         from search.auto_caption import batch_enqueue_caption_tasks
                         # 过滤出需要生成 Caption 的项（有图片但没有 Caption）
+                        # Caption 任务直接更新 ADBPG 表，本地 sqlite 后端不触发
                         items_for_caption = [
                             item for item in items_to_store
                             if item.get("image") and not item.get("image_caption")
-                        ]
+                        ] if store.name == "adbpg" else []
                         if items_for_caption:
                             await batch_enqueue_caption_tasks(
                                 normalized_user_id,
@@ -433,8 +490,8 @@ async def generate_embeddings(
                 print(f"[API] ⚠ Failed to store embeddings to DB: {e}")
                 import traceback
                 traceback.print_exc()
-        elif not db_host:
-            print(f"[API] ⚠ ADBPG_HOST not configured, skipping database storage")
+        elif not store_configured:
+            print(f"[API] ⚠ Vector store not configured, skipping database storage")
         elif not items_to_store:
             print(f"[API] ⚠ No items with embeddings to store")
         
@@ -478,6 +535,8 @@ async def generate_embeddings(
         return {
             "ok": True,
             "saved": saved_count,
+            "written": upsert_stats["written"],
+            "unchanged": upsert_stats["skipped"],
             "data": result_data
         }
     except Exception as e:
@@ -488,6 +547,51 @@ async def generate_embeddings(
         raise HTTPException(status_code=500, detail=error_detail)
 
 
+def _require_vector_store():
+    """没有可用的向量存储时返回 503（VECTOR_STORE_BACKEND=sqlite 时使用本地存储，不需要 ADBPG_HOST）"""
+    from vector_store import get_vector_store, is_vector_store_configured
+    if not is_vector_store_configured():
+        raise HTTPException(
+            status_code=503,
+            detail="Vector database not configured. Please set ADBPG_HOST environment variable."
+        )
+    return get_vector_store()
+
+
+@app.post("/api/v1/search/embedding/check")
+async def check_embedding_upload(
+    request: UploadCheckRequest,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """
+    上传握手（第一阶段）：客户端只发送 (url, content_hash)，
+    服务端返回需要上传的 URL；客户端再只把这些 item 发到 /api/v1/search/embedding
+    
+    Returns:
+        {"needed": [...], "unchanged": [...]}
+    """
+    try:
+        normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
+        
+        if not request.items:
+            return {"ok": True, "needed": [], "unchanged": []}
+        
+        from vector_store import get_vector_store, is_vector_store_configured
+        if not is_vector_store_configured():
+            # 没有配置向量存储：全部需要上传
+            urls = [item.get("url") for item in request.items if item.get("url")]
+            return {"ok": True, "needed": urls, "unchanged": []}
+        
+        needed, unchanged = await get_vector_store().find_items_needing_upload(normalized_user_id, request.items)
+        print(f"[API] Upload check: {len(request.items)} items → needed={len(needed)}, unchanged={len(unchanged)}")
+        return {"ok": True, "needed": needed, "unchanged": unchanged}
+    except Exception as e:
+        print(f"[API] Error in upload check: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/api/v1/search/query")
 async def search_content(
     request: SearchRequest,
@@ -508,13 +612,8 @@ async def search_content(
         if not request.query or not request.query.strip():
             raise HTTPException(status_code=400, detail="query parameter is required")
         
-        # 检查数据库配置
-        db_host = os.getenv("ADBPG_HOST", "")
-        if not db_host:
-            raise HTTPException(
-                status_code=503,
-                detail="Vector database not configured. Please set ADBPG_HOST environment variable."
-            )
+        # 检查向量存储配置
+        _require_vector_store()
         
         # 使用三阶段漏斗搜索
         normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
@@ -706,9 +805,9 @@ async def delete_tab(
     try:
         normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
         
-        from vector_db import soft_delete_tab
+        store = _require_vector_store()
         
-        success = await soft_delete_tab(normalized_user_id, tab_id)
+        success = await store.soft_delete_tab(normalized_user_id, tab_id)
         
         if success:
             return {"ok": True, "message": f"Tab {tab_id[:50]}... deleted successfully"}
@@ -726,6 +825,165 @@ async def delete_tab(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 分页列表单页最大条数
+LIST_TABS_MAX_LIMIT = 500
+
+
+@app.get("/api/v1/tabs")
+async def list_tabs(
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    fields: Optional[str] = None,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """
+    分页列出用户的 active tabs（按 updated_at 倒序，keyset 分页）
+    
+    Args:
+        cursor: 上一页返回的 next_cursor（第一页不传）
+        limit: 每页条数（最大 500）
+        fields: 逗号分隔的返回字段（默认不含 embedding 和截图）
+        user_id: 用户ID（从请求头获取）
+    
+    Returns:
+        {"items": [...], "next_cursor": ...}，next_cursor 为 null 表示没有更多数据
+    """
+    try:
+        normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
+        limit = max(1, min(limit, LIST_TABS_MAX_LIMIT))
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        
+        store = _require_vector_store()
+        
+        try:
+            page = await store.list_user_items(normalized_user_id, cursor=cursor, limit=limit, fields=field_list)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return {"ok": True, **page}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[API] Error listing tabs: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# 增量同步单次最大条数
+SYNC_MAX_LIMIT = 1000
+
+
+@app.get("/api/v1/sync")
+async def sync_changes(
+    since: Optional[str] = None,
+    limit: int = 500,
+    fields: Optional[str] = None,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """
+    增量同步：返回 since 水位线之后新增、更新或软删除的 tabs
+    
+    客户端用法：保存返回的 cursor，下次请求带上 since=cursor；
+    has_more 为 true 时立即继续拉取，否则按正常间隔轮询
+    
+    Args:
+        since: 上次返回的 cursor（首次同步不传）
+        limit: 单次最多返回条数（最大 1000）
+        fields: 逗号分隔的返回字段（默认精简字段，含 status）
+        user_id: 用户ID（从请求头获取）
+    """
+    try:
+        normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
+        limit = max(1, min(limit, SYNC_MAX_LIMIT))
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        
+        store = _require_vector_store()
+        
+        try:
+            result = await store.get_user_changes(normalized_user_id, since=since, limit=limit, fields=field_list)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return {"ok": True, **result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[API] Error syncing changes: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class BatchTabsRequest(BaseModel):
+    urls: Optional[List[str]] = None
+    tab_ids: Optional[List[str]] = None
+
+
+# 单次批量操作的最大条数（防止一次请求锁住过多行）
+BATCH_TABS_MAX_ITEMS = 1000
+
+
+async def _batch_set_tabs_status(request: BatchTabsRequest, user_id: Optional[str], status: str) -> Dict[str, Any]:
+    """批量软删除 / 恢复的公共逻辑"""
+    urls = request.urls or []
+    tab_ids = request.tab_ids or []
+    if not urls and not tab_ids:
+        raise HTTPException(status_code=400, detail="urls or tab_ids is required")
+    if len(urls) + len(tab_ids) > BATCH_TABS_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_TABS_MAX_ITEMS} items per request")
+    
+    normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
+    store = _require_vector_store()
+    
+    outcome = await store.batch_set_tabs_status(normalized_user_id, status, urls=urls, tab_ids=tab_ids)
+    return {"ok": True, **outcome}
+
+
+@app.post("/api/v1/tabs/batch-delete")
+async def batch_delete_tabs(
+    request: BatchTabsRequest,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """
+    批量软删除 tabs（一次 SQL 处理所有 URL / tab_id）
+    
+    Returns:
+        每个 URL / tab_id 的处理结果（updated / unchanged / not_found / invalid）
+    """
+    try:
+        return await _batch_set_tabs_status(request, user_id, "deleted")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[API] Error batch deleting tabs: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/tabs/batch-restore")
+async def batch_restore_tabs(
+    request: BatchTabsRequest,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """
+    批量恢复已软删除的 tabs
+    
+    Returns:
+        每个 URL / tab_id 的处理结果（updated / unchanged / not_found / invalid）
+    """
+    try:
+        return await _batch_set_tabs_status(request, user_id, "active")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[API] Error batch restoring tabs: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.delete("/api/v1/sessions/{session_id}")
 async def delete_session(
     session_id: str,
@@ -744,9 +1002,9 @@ async def delete_session(
     try:
         normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
         
-        from vector_db import soft_delete_session_tabs
+        store = _require_vector_store()
         
-        deleted_count = await soft_delete_session_tabs(normalized_user_id, session_id)
+        deleted_count = await store.soft_delete_session_tabs(normalized_user_id, session_id)
         
         if deleted_count > 0:
             return {
@@ -768,6 +1026,79 @@ async def delete_session(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/v1/sessions/{session_id}/tabs")
+async def list_session_tabs(
+    session_id: str,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """
+    列出一个 session 下的所有 active tabs
+    
+    Args:
+        session_id: Session ID
+        user_id: 用户ID（从请求头获取）
+    
+    Returns:
+        tabs 列表（不含 embedding 和截图）
+    """
+    try:
+        normalized_user_id = (user_id or "anonymous").strip() or "anonymous"
+        
+        store = _require_vector_store()
+        
+        tabs = await store.get_session_tabs(normalized_user_id, session_id)
+        return {"ok": True, "session_id": session_id, "tabs": tabs, "count": len(tabs)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[API] Error listing session tabs: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/screenshots/{screenshot_hash}")
+async def get_screenshot(
+    screenshot_hash: str,
+    user_id: Optional[str] = Header(None, alias="X-User-ID"),
+    query_user_id: Optional[str] = Query(None, alias="user_id"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """
+    按内容哈希读取截图（二进制，懒加载）
+
+    截图按 SHA-256 内容寻址，内容永远不会变化，因此直接用哈希作为 ETag，
+    并允许浏览器长期缓存；客户端带 If-None-Match 时返回 304。
+    只返回该用户的记录引用的截图（只查该用户所在的分片）；<img src> 无法携带 X-User-ID，
+    可以用查询参数 user_id（结果中的 screenshot_url 已经带上）
+
+    Args:
+        screenshot_hash: 截图内容哈希（列表/搜索结果中的 screenshot_hash）
+        user_id: 用户ID（从请求头获取）
+        query_user_id: 用户ID（查询参数 user_id，请求头优先）
+        if_none_match: 浏览器缓存的 ETag
+
+    Returns:
+        图片二进制
+    """
+    from fastapi.responses import Response
+
+    screenshot_hash = screenshot_hash.lower()
+    if len(screenshot_hash) != 64 or any(c not in "0123456789abcdef" for c in screenshot_hash):
+        raise HTTPException(status_code=400, detail="Invalid screenshot hash")
+
+    etag = f'"{screenshot_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    normalized_user_id = (user_id or query_user_id or "anonymous").strip() or "anonymous"
+    blob = await _require_vector_store().get_screenshot_blob(normalized_user_id, screenshot_hash)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    return Response(content=bytes(blob["data"]), media_type=blob["content_type"], headers=headers)
+
+
 @app.post("/api/v1/clustering/ai-discover")
 async def discover_clusters_api(request: AIDiscoverRequest):
     """
@@ -0,0 +1,151 @@
+"""
+把主表中的截图（screenshot_image，Base64 TEXT）迁移到 screenshot_blobs
+
+迁移后截图以二进制（BYTEA）按内容哈希单独存放，主表只保留 screenshot_hash，
+screenshot_image 置为 NULL。读取截图走 GET /api/v1/screenshots/{hash}。
+
+使用 (user_id, url) 主键做 keyset 分页，每批只读取有截图的行，
+不会一次性把所有截图加载到内存，也不会修改 updated_at。
+
+用法：
+
+1. 先 dry-run 看看要迁移多少行：
+
+   python migrate_screenshots_to_blobs.py
+
+2. 实际执行：
+
+   python migrate_screenshots_to_blobs.py --execute
+   python migrate_screenshots_to_blobs.py --user-id anonymous --execute
+"""
+import asyncio
+import argparse
+import sys
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_version
+from vector_db import (
+    get_shard_pools,
+    close_pool,
+    init_schema,
+    ACTIVE_TABLE,
+    _normalize_user_id,
+    decode_image_data_url,
+    store_screenshot_blob,
+)
+
+
+async def migrate_screenshots(
+    user_id: Optional[str] = None,
+    batch_size: int = 50,
+    dry_run: bool = True,
+) -> int:
+    """
+    按 keyset 分页迁移截图
+
+    Args:
+        user_id: 只处理该用户（None 表示所有用户）
+        batch_size: 每批处理的行数（截图较大，默认较小）
+        dry_run: 是否为试运行（只解析不写入）
+
+    Returns:
+        迁移的行数
+    """
+    # 确保 screenshot_hash 列和 screenshot_blobs 表已存在
+    await init_schema()
+
+    normalized_user = _normalize_user_id(user_id) if user_id else None
+    pools = await get_shard_pools(normalized_user)
+
+    print("=" * 60)
+    print("迁移截图: screenshot_image -> screenshot_blobs")
+    print(f"用户ID: {normalized_user or '所有用户'}")
+    print(f"模式: {'试运行' if dry_run else '实际执行'}")
+    print("=" * 60)
+
+    migrated = 0
+    invalid = 0
+    total_bytes = 0
+    # 每个分片单独按 keyset 分页（分片之间 user_id 不重叠；截图 blob 存在引用它的记录所在的分片）
+    for pool in pools:
+        last_user, last_url = (normalized_user or ""), ""
+        while True:
+            async with pool.acquire() as conn:
+                if normalized_user:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, url, screenshot_image
+                        FROM {ACTIVE_TABLE}
+                        WHERE user_id = $1 AND url > $2
+                          AND screenshot_image IS NOT NULL
+                        ORDER BY url
+                        LIMIT $3;
+                    """, normalized_user, last_url, batch_size)
+                else:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, url, screenshot_image
+                        FROM {ACTIVE_TABLE}
+                        WHERE (user_id, url) > ($1, $2)
+                          AND screenshot_image IS NOT NULL
+                        ORDER BY user_id, url
+                        LIMIT $3;
+                    """, last_user, last_url, batch_size)
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    decoded = decode_image_data_url(row["screenshot_image"])
+                    if not decoded:
+                        # 不是 Base64 data URL（例如截图的 http URL），保留在 screenshot_image 中，读取时直接返回原值
+                        invalid += 1
+                        continue
+                    total_bytes += len(decoded[1])
+                    migrated += 1
+                    if dry_run:
+                        continue
+                    async with conn.transaction():
+                        screenshot_hash = await store_screenshot_blob(conn, row["screenshot_image"])
+                        await conn.execute(f"""
+                            UPDATE {ACTIVE_TABLE}
+                            SET screenshot_hash = $1, screenshot_image = NULL
+                            WHERE user_id = $2 AND url = $3;
+                        """, screenshot_hash, row["user_id"], row["url"])
+                        # 与迁移在同一个事务里递增数据版本号，使 API 进程中的缓存失效（见 data_version.py）
+                        await data_version.bump(conn, row["user_id"])
+
+            last_user, last_url = rows[-1]["user_id"], rows[-1]["url"]
+            print(f"[Migrate] {'(dry-run) ' if dry_run else ''}migrated {migrated} rows, skipped {invalid} (last: {last_user} / {last_url[:60]})")
+
+    print("=" * 60)
+    print(f"✅ 完成：{'将迁移' if dry_run else '已迁移'} {migrated} 行（{total_bytes / 1024 / 1024:.1f} MB 二进制）")
+    if invalid:
+        print(f"⚠️  {invalid} 行 screenshot_image 不是 Base64 图片 data URL，保留原值，未迁移")
+    print("=" * 60)
+    return migrated
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="迁移截图到 screenshot_blobs")
+    parser.add_argument("--user-id", type=str, default=None, help="用户 ID（默认: 所有用户）")
+    parser.add_argument("--batch-size", type=int, default=50, help="每批行数（默认: 50）")
+    parser.add_argument("--execute", action="store_true", help="实际写入（默认: 试运行）")
+    args = parser.parse_args()
+
+    try:
+        await migrate_screenshots(
+            user_id=args.user_id,
+            batch_size=args.batch_size,
+            dry_run=not args.execute,
+        )
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,182 @@
+"""
+数据库连接池可观测性
+记录连接获取等待时间（直方图）、连接池使用量（in-use / idle / 等待中）和每条 SQL 的耗时，
+通过 GET /api/v1/metrics/db 查看，用于判断连接池是否饱和、调整 ADBPG_POOL_* 配置
+"""
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+# 直方图桶上界（毫秒），最后一个桶收集所有更大的值
+LATENCY_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# 超过该耗时（毫秒）的 SQL 打印慢查询日志（0 表示关闭）
+SLOW_QUERY_MS = float(os.getenv("ADBPG_SLOW_QUERY_MS", "1000"))
+
+# 最多按多少种语句分别统计（语句文本不固定时避免无限增长，超出的合并到 "<other>"）
+MAX_TRACKED_STATEMENTS = int(os.getenv("ADBPG_METRICS_MAX_STATEMENTS", "200"))
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class LatencyHistogram:
+    """固定桶的耗时直方图（毫秒）"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float) -> None:
+        for i, upper in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= upper:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def snapshot(self) -> Dict:
+        labels = [f"<={upper}ms" for upper in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class PoolMetrics:
+    """连接池指标（单进程内存统计，进程重启后清零）"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.acquire_wait = LatencyHistogram()
+        self.acquire_timeouts = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.statements: Dict[str, LatencyHistogram] = {}
+        self.query_errors = 0
+        self.started_at = time.time()
+
+    def acquire_started(self) -> None:
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def acquire_finished(self, elapsed_ms: float, timed_out: bool = False) -> None:
+        self.waiting -= 1
+        self.acquire_wait.observe(elapsed_ms)
+        if timed_out:
+            self.acquire_timeouts += 1
+
+    def observe_query(self, query: str, elapsed_ms: float, failed: bool = False) -> None:
+        label = statement_label(query)
+        histogram = self.statements.get(label)
+        if histogram is None:
+            if len(self.statements) >= MAX_TRACKED_STATEMENTS:
+                label = "<other>"
+                histogram = self.statements.setdefault(label, LatencyHistogram())
+            else:
+                histogram = self.statements[label] = LatencyHistogram()
+        histogram.observe(elapsed_ms)
+        if failed:
+            self.query_errors += 1
+        if SLOW_QUERY_MS and elapsed_ms >= SLOW_QUERY_MS:
+            print(f"[DBPool] 🐢 Slow query ({elapsed_ms:.0f}ms): {label[:200]}")
+
+    def snapshot(self, pool=None, top: int = 20) -> Dict:
+        """
+        导出当前指标
+
+        Args:
+            pool: asyncpg 连接池（提供 size / idle 实时值）
+            top: 按总耗时排序返回前多少条语句
+        """
+        gauges: Dict[str, Optional[int]] = {"waiting": self.waiting, "max_waiting": self.max_waiting}
+        if pool is not None:
+            size = pool.get_size()
+            idle = pool.get_idle_size()
+            gauges.update({
+                "size": size,
+                "idle": idle,
+                "in_use": size - idle,
+                "min_size": pool.get_min_size(),
+                "max_size": pool.get_max_size(),
+            })
+
+        ranked: List = sorted(self.statements.items(), key=lambda kv: kv[1].total_ms, reverse=True)
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "pool": gauges,
+            "acquire_wait": self.acquire_wait.snapshot(),
+            "acquire_timeouts": self.acquire_timeouts,
+            "query_errors": self.query_errors,
+            "statements": [
+                {"statement": label[:300], "total_ms": round(h.total_ms, 2), **h.snapshot()}
+                for label, h in ranked[:top]
+            ],
+        }
+
+
+def statement_label(query: str) -> str:
+    """把 SQL 文本压缩为一行作为统计维度（合并空白）"""
+    return _WHITESPACE_PATTERN.sub(" ", query or "").strip()
+
+
+def query_logger(record) -> None:
+    """asyncpg Connection.add_query_logger 回调（record 为 asyncpg LoggedQuery）"""
+    metrics.observe_query(record.query, record.elapsed * 1000, failed=record.exception is not None)
+
+
+class _TimedAcquire:
+    """pool.acquire() 的包装：记录等待时间和等待中的协程数"""
+
+    def __init__(self, pool, timeout: Optional[float]):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    async def __aenter__(self):
+        import asyncio
+        metrics.acquire_started()
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            self._conn = await self._pool.acquire(timeout=self._timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            metrics.acquire_finished((time.perf_counter() - start) * 1000, timed_out=timed_out)
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
+class InstrumentedPool:
+    """
+    asyncpg 连接池包装
+
+    acquire() 记录等待时间，其他属性和方法直接转发给原连接池
+    """
+
+    def __init__(self, pool, acquire_timeout: Optional[float] = None):
+        self._pool = pool
+        self._acquire_timeout = acquire_timeout
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _TimedAcquire:
+        return _TimedAcquire(self._pool, timeout if timeout is not None else self._acquire_timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+metrics = PoolMetrics()
@@ -0,0 +1,107 @@
+"""
+热点 SQL 的语句注册表
+每条热点查询有一个固定名字和固定的语句文本（可变长度的列表一律用数组参数 = ANY($n::text[])），
+语句文本不变，asyncpg 连接自带的语句缓存（statement_cache_size，见 vector_db.POOL_STATEMENT_CACHE_SIZE）
+就能按文本命中，每个连接只 PREPARE 一次，不再重复解析和规划。
+这里不再自己缓存 PreparedStatement：它绑定在一次 acquire 上，连接归还连接池后再使用会报 InterfaceError。
+命中率通过 GET /api/v1/metrics/db 查看：按原始连接记录每条语句的首次执行（PREPARE）和之后的复用。
+"""
+import weakref
+from typing import Dict, List, Optional
+
+import asyncpg
+
+# 名字 -> 语句文本（同一个名字只允许对应一条语句，防止把动态拼接的 SQL 注册进来）
+QUERIES: Dict[str, str] = {}
+
+# 名字 -> [首次在某个连接上执行（PREPARE）的次数, 在同一连接上复用的次数]
+_stats: Dict[str, List[int]] = {}
+
+# 原始连接 -> 在该连接上执行过的语句名（连接关闭 / 重连后随对象一起释放）
+_seen: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def register_query(name: str, sql: str) -> str:
+    """
+    注册一条语句
+
+    Raises:
+        ValueError: 同一个名字注册了不同的语句文本
+    """
+    existing = QUERIES.get(name)
+    if existing is None:
+        QUERIES[name] = sql
+    elif existing != sql:
+        raise ValueError(f"Query '{name}' is already registered with a different statement text")
+    return name
+
+
+async def _run(conn, name: str, sql: Optional[str], method: str, args):
+    if sql is not None:
+        register_query(name, sql)
+    _record(conn, name)
+    return await getattr(conn, method)(QUERIES[name], *args)
+
+
+def _record(conn, name: str) -> None:
+    """记录这条语句在这个连接上是首次执行还是复用（语句缓存挂在原始连接上，不是每次 acquire 的代理）"""
+    raw = getattr(conn, "_con", None) or conn
+    counts = _stats.setdefault(name, [0, 0])
+    try:
+        names = _seen.setdefault(raw, set())
+    except TypeError:
+        # 不支持弱引用的连接对象：无法判断，按首次执行计
+        counts[0] += 1
+        return
+    if name in names:
+        counts[1] += 1
+    else:
+        names.add(name)
+        counts[0] += 1
+
+
+async def fetch(conn, name: str, sql: Optional[str], *args) -> List[asyncpg.Record]:
+    """执行注册的语句，返回所有行"""
+    return await _run(conn, name, sql, "fetch", args)
+
+
+async def fetchrow(conn, name: str, sql: Optional[str], *args) -> Optional[asyncpg.Record]:
+    """执行注册的语句，返回第一行"""
+    return await _run(conn, name, sql, "fetchrow", args)
+
+
+async def fetchval(conn, name: str, sql: Optional[str], *args):
+    """执行注册的语句，返回第一行第一列"""
+    return await _run(conn, name, sql, "fetchval", args)
+
+
+def stats() -> Dict:
+    """
+    语句缓存命中率：hit_ratio = 复用次数 / 调用次数
+
+    复用次数是上限：连接的语句缓存是 LRU（statement_cache_size 条，和非注册的语句共用），
+    注册语句被挤出后再次执行会重新 PREPARE，这里仍记为复用；statement_cache_size 为 0 时没有复用
+    """
+    from vector_db import POOL_STATEMENT_CACHE_SIZE
+    queries = {}
+    for name, (prepares, reuses) in sorted(_stats.items()):
+        if not POOL_STATEMENT_CACHE_SIZE:
+            prepares, reuses = prepares + reuses, 0
+        queries[name] = {"calls": prepares + reuses, "prepares": prepares, "reuses": reuses}
+    calls = sum(q["calls"] for q in queries.values())
+    reuses = sum(q["reuses"] for q in queries.values())
+    return {
+        "registered": len(QUERIES),
+        "statement_cache_size": POOL_STATEMENT_CACHE_SIZE,
+        "connections": len(_seen),
+        "calls": calls,
+        "prepares": calls - reuses,
+        "reuses": reuses,
+        "hit_ratio": round(reuses / calls, 4) if calls else None,
+        "queries": queries,
+    }
+
+
+def reset_stats() -> None:
+    """清零调用统计（已经在连接上执行过的语句仍然算作已 PREPARE）"""
+    _stats.clear()
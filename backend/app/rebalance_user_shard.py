@@ -0,0 +1,267 @@
+"""
+把一个用户的数据迁移到另一个分片（见 shard_router.py）
+
+步骤：
+1. 记录源分片的当前时间 T0，按 url 做 keyset 分页，把该用户的所有行（包括 deleted 状态）和引用的截图
+   复制到目标分片（ON CONFLICT 覆盖，可重复执行）
+2. 在目录表中把该用户指向目标分片；等待 ADBPG_SHARD_MAP_TTL 秒，让所有进程的目录缓存过期
+3. 增量复制：源分片上 updated_at >= T0 的行（切换前仍写到源分片的数据）再复制一次
+   每批复制 / 删除都在同一个事务里递增该分片上的数据版本号（见 data_version.py）
+4. --delete-source：删除源分片上该用户的数据；也可以确认目标分片数据无误后再用 --cleanup-shard 删除
+
+所有列都以文本读出、按源表的列类型转换写入（向量、数组、jsonb、bytea 都适用），不需要维护列清单。
+迁移期间物理删除的行（cleanup 脚本）不会同步到目标分片。
+
+用法：
+
+1. 先 dry-run 看看要迁移多少行：
+
+   python rebalance_user_shard.py --user-id alice --to-shard 1
+
+2. 实际执行：
+
+   python rebalance_user_shard.py --user-id alice --to-shard 1 --execute
+   python rebalance_user_shard.py --user-id alice --to-shard 1 --execute --delete-source
+
+3. 稍后删除旧分片上残留的数据（不能是用户当前所在的分片）：
+
+   python rebalance_user_shard.py --user-id alice --cleanup-shard 0 --execute
+
+本地两个数据库演示（PostgreSQL + pgvector；ANN 索引是 ADBPG 特有的，本地建索引会打印警告，不影响演示）：
+
+   createdb cleantab_shard0 && createdb cleantab_shard1
+   for db in cleantab_shard0 cleantab_shard1; do psql -d $db -c "CREATE EXTENSION IF NOT EXISTS vector; CREATE SCHEMA IF NOT EXISTS cleantab;"; done
+   export ADBPG_SHARD_DSNS=postgresql://localhost/cleantab_shard0,postgresql://localhost/cleantab_shard1
+   python -c "import asyncio, vector_db; asyncio.run(vector_db.init_schema())"
+   # 写入一些数据后（用户按 md5(user_id) 分布到两个库），把某个用户迁移到另一个库：
+   python rebalance_user_shard.py --user-id anonymous --to-shard 1 --execute --delete-source
+"""
+import asyncio
+import argparse
+import sys
+import os
+from typing import List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_version
+import shard_router
+from vector_db import (
+    get_shard_pool,
+    close_pool,
+    init_schema,
+    ACTIVE_TABLE,
+    SCREENSHOT_BLOB_TABLE,
+    delete_unreferenced_screenshot_blobs,
+    _normalize_user_id,
+)
+
+
+async def _table_columns(conn, table: str) -> List[Tuple[str, str]]:
+    """(列名, 完整类型) 列表，例如 ("text_embedding", "vector(1024)")"""
+    rows = await conn.fetch(f"""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod) AS column_type
+        FROM pg_attribute a
+        WHERE a.attrelid = '{table}'::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum;
+    """)
+    return [(row["attname"], row["column_type"]) for row in rows]
+
+
+def _copy_sql(table: str, columns: List[Tuple[str, str]], conflict_columns: List[str]) -> Tuple[str, str]:
+    """(读取 SQL 的列表达式, 写入 SQL)：读取时全部转为 text，写入时按类型转换回来"""
+    select_sql = ", ".join(f"{name}::text AS {name}" for name, _ in columns)
+    placeholders = ", ".join(f"${i + 1}::{column_type}" for i, (_, column_type) in enumerate(columns))
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name, _ in columns if name not in conflict_columns)
+    on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    insert_sql = f"""
+        INSERT INTO {table} ({", ".join(name for name, _ in columns)})
+        VALUES ({placeholders})
+        ON CONFLICT ({", ".join(conflict_columns)}) {on_conflict};
+    """
+    return select_sql, insert_sql
+
+
+async def copy_user_rows(source_pool, target_pool, user_id: str, batch_size: int, since=None, dry_run: bool = True) -> int:
+    """
+    按 url keyset 分页复制用户的行（since 不为 None 时只复制 updated_at >= since 的行）
+
+    Returns:
+        复制的行数
+    """
+    async with source_pool.acquire() as conn:
+        columns = await _table_columns(conn, ACTIVE_TABLE)
+        blob_columns = await _table_columns(conn, SCREENSHOT_BLOB_TABLE)
+    column_names = [name for name, _ in columns]
+    select_sql, insert_sql = _copy_sql(ACTIVE_TABLE, columns, ["user_id", "url"])
+    blob_select_sql, blob_insert_sql = _copy_sql(SCREENSHOT_BLOB_TABLE, blob_columns, ["hash"])
+    since_sql = " AND updated_at >= $4" if since is not None else ""
+
+    last_url = ""
+    copied = 0
+    while True:
+        async with source_pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT {select_sql}
+                FROM {ACTIVE_TABLE}
+                WHERE user_id = $1 AND url > $2{since_sql}
+                ORDER BY url
+                LIMIT $3;
+            """, *([user_id, last_url, batch_size] + ([since] if since is not None else [])))
+            hashes = []
+            if "screenshot_hash" in column_names:
+                hashes = list({row["screenshot_hash"] for row in rows if row["screenshot_hash"]})
+            blobs = []
+            if hashes and blob_columns:
+                blobs = await conn.fetch(f"""
+                    SELECT {blob_select_sql} FROM {SCREENSHOT_BLOB_TABLE} WHERE hash = ANY($1::text[]);
+                """, hashes)
+
+        if not rows:
+            break
+
+        if not dry_run:
+            async with target_pool.acquire() as conn:
+                async with conn.transaction():
+                    # 先写截图，再写引用它们的行
+                    if blobs:
+                        await conn.executemany(blob_insert_sql, [tuple(blob.values()) for blob in blobs])
+                    await conn.executemany(insert_sql, [tuple(row[name] for name in column_names) for row in rows])
+                    # 版本号基于时间戳，一定大于源分片上用过的版本号（见 data_version.py）
+                    await data_version.bump(conn, user_id)
+
+        copied += len(rows)
+        last_url = rows[-1]["url"]
+        print(f"[Rebalance] {'(dry-run) ' if dry_run else ''}copied {copied} rows (last: {last_url[:60]})")
+    return copied
+
+
+async def delete_user_rows(pool, user_id: str, batch_size: int) -> int:
+    """按 url keyset 分页删除源分片上的用户数据（不再被引用的截图在同一个事务里删除）"""
+    deleted = 0
+    while True:
+        async with pool.acquire() as conn:
+            urls = [row["url"] for row in await conn.fetch(f"""
+                SELECT url FROM {ACTIVE_TABLE} WHERE user_id = $1 ORDER BY url LIMIT $2;
+            """, user_id, batch_size)]
+            if not urls:
+                break
+            async with conn.transaction():
+                rows = await conn.fetch(f"""
+                    DELETE FROM {ACTIVE_TABLE} WHERE user_id = $1 AND url = ANY($2::text[])
+                    RETURNING screenshot_hash;
+                """, user_id, urls)
+                await delete_unreferenced_screenshot_blobs(conn, [row["screenshot_hash"] for row in rows])
+                await data_version.bump(conn, user_id)
+        deleted += len(rows)
+        print(f"[Rebalance] deleted {deleted} rows from source shard")
+    return deleted
+
+
+async def rebalance_user(
+    user_id: str,
+    target_shard: int,
+    batch_size: int = 500,
+    dry_run: bool = True,
+    delete_source: bool = False,
+) -> None:
+    user_id = _normalize_user_id(user_id)
+    if shard_router.SHARD_COUNT == 1:
+        print("只有一个分片（未设置 ADBPG_SHARD_DSNS），不需要迁移")
+        return
+    if not 0 <= target_shard < shard_router.SHARD_COUNT:
+        raise ValueError(f"Invalid shard {target_shard} (SHARD_COUNT={shard_router.SHARD_COUNT})")
+
+    source_shard = await shard_router.shard_for_user(user_id)
+    print("=" * 60)
+    print(f"迁移用户: {user_id}  分片 {source_shard} → {target_shard}（共 {shard_router.SHARD_COUNT} 个分片）")
+    print(f"模式: {'试运行' if dry_run else '实际执行'}")
+    print("=" * 60)
+    if source_shard == target_shard:
+        print("用户已在目标分片上，不需要迁移")
+        return
+
+    source_pool = await get_shard_pool(source_shard)
+    target_pool = await get_shard_pool(target_shard)
+    if not dry_run:
+        await init_schema(target_shard)
+
+    async with source_pool.acquire() as conn:
+        # updated_at 是 timestamp（不带时区），T0 用同样的类型比较
+        started_at = await conn.fetchval("SELECT NOW()::timestamp;")
+
+    copied = await copy_user_rows(source_pool, target_pool, user_id, batch_size, dry_run=dry_run)
+    if dry_run:
+        print("=" * 60)
+        print(f"✅ 试运行完成：将复制 {copied} 行，然后把 {user_id} 指向分片 {target_shard}")
+        print("=" * 60)
+        return
+
+    await shard_router.set_user_shard(user_id, target_shard)
+    wait_s = shard_router.SHARD_MAP_TTL + 5
+    print(f"[Rebalance] Directory updated, waiting {wait_s:.0f}s for all processes to switch...")
+    await asyncio.sleep(wait_s)
+
+    delta = await copy_user_rows(source_pool, target_pool, user_id, batch_size, since=started_at, dry_run=False)
+    print(f"[Rebalance] Delta copy: {delta} rows updated on source during migration")
+
+    deleted = 0
+    if delete_source:
+        deleted = await delete_user_rows(source_pool, user_id, batch_size)
+
+    print("=" * 60)
+    print(f"✅ 完成：复制 {copied} 行（增量 {delta} 行），{user_id} 现在位于分片 {target_shard}")
+    if delete_source:
+        print(f"   已删除源分片 {source_shard} 上的 {deleted} 行")
+    else:
+        print(f"   源分片 {source_shard} 上的数据保留，确认无误后用 --cleanup-shard {source_shard} 删除")
+    print("=" * 60)
+
+
+async def cleanup_user_shard(user_id: str, shard: int, batch_size: int = 500, dry_run: bool = True) -> None:
+    """删除用户在旧分片上残留的数据（拒绝删除用户当前所在的分片）"""
+    user_id = _normalize_user_id(user_id)
+    current_shard = await shard_router.shard_for_user(user_id)
+    if shard == current_shard:
+        raise ValueError(f"Shard {shard} is the current shard of {user_id}, refusing to delete")
+    pool = await get_shard_pool(shard)
+    async with pool.acquire() as conn:
+        count = await conn.fetchval(f"SELECT COUNT(*) FROM {ACTIVE_TABLE} WHERE user_id = $1;", user_id)
+    print(f"分片 {shard} 上有 {user_id} 的 {count} 行（当前分片: {current_shard}）")
+    if not dry_run and count:
+        await delete_user_rows(pool, user_id, batch_size)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="把一个用户的数据迁移到另一个分片")
+    parser.add_argument("--user-id", type=str, required=True, help="用户 ID")
+    parser.add_argument("--to-shard", type=int, default=None, help="目标分片序号（ADBPG_SHARD_DSNS 中的位置，从 0 开始）")
+    parser.add_argument("--cleanup-shard", type=int, default=None, help="只删除该用户在这个旧分片上残留的数据")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批行数（默认: 500）")
+    parser.add_argument("--execute", action="store_true", help="实际执行（默认: 试运行）")
+    parser.add_argument("--delete-source", action="store_true", help="迁移完成后删除源分片上的数据")
+    args = parser.parse_args()
+
+    if (args.to_shard is None) == (args.cleanup_shard is None):
+        parser.error("需要指定 --to-shard 或 --cleanup-shard 之一")
+
+    try:
+        if args.cleanup_shard is not None:
+            await cleanup_user_shard(args.user_id, args.cleanup_shard, args.batch_size, dry_run=not args.execute)
+            return
+        await rebalance_user(
+            args.user_id,
+            args.to_shard,
+            batch_size=args.batch_size,
+            dry_run=not args.execute,
+            delete_source=args.delete_source,
+        )
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,7 +7,11 @@ from typing import List, Dict, Optional
 from .caption import enrich_item_with_caption, batch_enrich_items
 from .qwen_vl_client import QwenVLClient
 from .embed import embed_text
+from .features import compute_caption_features, prefix_embedding
+from .config import PREFIX_EMBED_DIM
 from vector_db import upsert_opengraph_item, get_pool, ACTIVE_TABLE, ACTIVE_TABLE_NAME, NAMESPACE, _normalize_user_id
+import data_version
+import db_routing
 import sys
 from pathlib import Path
 
@@ -56,8 +60,8 @@ async def _update_item_caption_in_db(
         是否更新成功
     """
     try:
-        pool = await get_pool()
         user_id = _normalize_user_id(user_id)
+        pool = await get_pool(user_id)
         
         async with pool.acquire() as conn:
             # 检查新字段是否存在（如果不存在，降级到 metadata）
@@ -70,66 +74,83 @@ async def _update_item_caption_in_db(
                 );
             """)
             
-            if has_new_fields:
-                # 使用新字段更新
-                caption_vec = to_vector_str(caption_embedding)
+            async with conn.transaction():
+                if has_new_fields:
+                    # 使用新字段更新
+                    caption_vec = to_vector_str(caption_embedding)
+                    # 同步更新依赖 caption 的派生列（caption_tokens 关键词召回、caption_hash 去重）
+                    caption_features = compute_caption_features(caption)
                 
-                await conn.execute(
-                    f"""
-                    UPDATE {ACTIVE_TABLE}
-                    SET image_caption = $1,
-                        caption_embedding = $2::vector(1024),
-                        dominant_colors = $3,
-                        style_tags = $4,
-                        object_tags = $5,
-                        updated_at = NOW()
-                    WHERE user_id = $6 AND url = $7
-                    """,
-                    caption,
-                    caption_vec,
-                    dominant_colors if dominant_colors else None,
-                    style_tags if style_tags else None,
-                    object_tags if object_tags else None,
-                    user_id,
-                    url
-                )
-            else:
-                # 降级到 metadata（向后兼容）
-                existing_metadata = await conn.fetchval(
-                    f"SELECT metadata FROM {ACTIVE_TABLE} WHERE user_id = $1 AND url = $2",
-                    user_id, url
-                )
+                    await conn.execute(
+                        f"""
+                        UPDATE {ACTIVE_TABLE}
+                        SET image_caption = $1,
+                            caption_embedding = $2::vector(1024),
+                            dominant_colors = $3,
+                            style_tags = $4,
+                            object_tags = $5,
+                            caption_tokens = $8,
+                            caption_hash = $9,
+                            caption_embedding_512 = $10::vector({PREFIX_EMBED_DIM}),
+                            updated_at = NOW()
+                        WHERE user_id = $6 AND url = $7
+                        """,
+                        caption,
+                        caption_vec,
+                        dominant_colors if dominant_colors else None,
+                        style_tags if style_tags else None,
+                        object_tags if object_tags else None,
+                        user_id,
+                        url,
+                        caption_features["caption_tokens"],
+                        caption_features["caption_hash"],
+                        to_vector_str(prefix_embedding(caption_embedding))
+                    )
+                else:
+                    # 降级到 metadata（向后兼容）
+                    existing_metadata = await conn.fetchval(
+                        f"SELECT metadata FROM {ACTIVE_TABLE} WHERE user_id = $1 AND url = $2",
+                        user_id, url
+                    )
                 
-                if existing_metadata:
-                    if isinstance(existing_metadata, str):
-                        import json
-                        metadata = json.loads(existing_metadata)
+                    if existing_metadata:
+                        if isinstance(existing_metadata, str):
+                            import json
+                            metadata = json.loads(existing_metadata)
+                        else:
+                            metadata = existing_metadata
                     else:
-                        metadata = existing_metadata
-                else:
-                    metadata = {}
+                        metadata = {}
+                
+                    # 更新 metadata 中的 caption 相关字段
+                    from datetime import datetime
+                    metadata["caption"] = caption
+                    metadata["dominant_colors"] = dominant_colors
+                    metadata["style_tags"] = style_tags
+                    metadata["object_tags"] = object_tags
+                    metadata["caption_generated_at"] = datetime.now().isoformat()
                 
-                # 更新 metadata 中的 caption 相关字段
-                from datetime import datetime
-                metadata["caption"] = caption
-                metadata["dominant_colors"] = dominant_colors
-                metadata["style_tags"] = style_tags
-                metadata["object_tags"] = object_tags
-                metadata["caption_generated_at"] = datetime.now().isoformat()
+                    import json
+                    metadata_json = json.dumps(metadata)
                 
-                import json
-                metadata_json = json.dumps(metadata)
+                    await conn.execute(
+                        f"""
+                        UPDATE {ACTIVE_TABLE}
+                        SET metadata = $1::jsonb,
+                            updated_at = NOW()
+                        WHERE user_id = $2 AND url = $3
+                        """,
+                        metadata_json, user_id, url
+                    )
                 
-                await conn.execute(
-                    f"""
-                    UPDATE {ACTIVE_TABLE}
-                    SET metadata = $1::jsonb,
-                        updated_at = NOW()
-                    WHERE user_id = $2 AND url = $3
-                    """,
-                    metadata_json, user_id, url
-                )
+                # 与 Caption 更新在同一个事务里递增数据版本号（见 data_version.py）
+                await data_version.bump(conn, user_id)
             
+            # Caption embedding / 标签变化后，进程内向量缓存需要重新加载
+            import vector_cache
+            vector_cache.invalidate_user(user_id)
+            db_routing.mark_write(user_id)
+            data_version.invalidate(user_id)
             return True
             
     except Exception as e:
@@ -179,7 +200,9 @@ async def _process_caption_task(task: Dict):
     # ✅ 查询数据库检查是否已有 Caption（避免重复处理）
     try:
         from vector_db import get_items_by_urls
-        existing_items = await get_items_by_urls(normalized_user_id, [url])
+        existing_items = await get_items_by_urls(
+            normalized_user_id, [url], fields=["url", "image_caption", "metadata"]
+        )
         if existing_items and len(existing_items) > 0:
             existing_item = existing_items[0]
             # 检查数据库中是否已有 caption
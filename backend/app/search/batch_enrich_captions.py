@@ -20,11 +20,13 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
-from vector_db import get_pool, close_pool, ACTIVE_TABLE, ACTIVE_TABLE_NAME, NAMESPACE, _normalize_user_id, _row_to_dict
+from vector_db import get_pool, get_shard_pools, close_pool, ACTIVE_TABLE, ACTIVE_TABLE_NAME, NAMESPACE, _normalize_user_id, _row_to_dict
+import data_version
 from search.caption import enrich_item_with_caption, batch_enrich_items
 from search.qwen_vl_client import QwenVLClient
 from search.embed import embed_text
-from search.config import get_api_key
+from search.features import compute_caption_features, prefix_embedding
+from search.config import PREFIX_EMBED_DIM, get_api_key
 
 
 def to_vector_str(vec: Optional[List[float]]) -> Optional[str]:
@@ -48,16 +50,18 @@ async def get_items_without_caption(
     - image IS NOT NULL AND image != ''（必须有图片）
     
     Args:
-        user_id: 用户 ID（如果为 None，获取所有用户）
+        user_id: 用户 ID（如果为 None，获取所有分片上的所有用户）
         max_items: 最多获取数量（如果为 None，获取所有）
     
     Returns:
-        数据项列表
+        数据项列表（按 created_at 倒序）
     """
-    pool = await get_pool()
+    if user_id:
+        user_id = _normalize_user_id(user_id)
+    pools = await get_shard_pools(user_id)
     
-    # 检查新字段是否存在
-    async with pool.acquire() as conn:
+    # 检查新字段是否存在（所有分片由 init_schema 建成同样的表结构）
+    async with pools[0].acquire() as conn:
         has_new_fields = await conn.fetchval(f"""
             SELECT EXISTS (
                 SELECT FROM information_schema.columns 
@@ -72,7 +76,6 @@ async def get_items_without_caption(
     if has_new_fields:
         # 使用新字段查询
         if user_id:
-            user_id = _normalize_user_id(user_id)
             if force_all:
                 where_clause = """WHERE user_id = $1 
                     AND status = 'active' 
@@ -88,7 +91,7 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata,
+                        tab_id, tab_title, metadata, created_at,
                         image_caption, caption_embedding, dominant_colors, style_tags, object_tags
                     FROM {ACTIVE_TABLE}
                     {where_clause}
@@ -100,7 +103,7 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata,
+                        tab_id, tab_title, metadata, created_at,
                         image_caption, caption_embedding, dominant_colors, style_tags, object_tags
                     FROM {ACTIVE_TABLE}
                     {where_clause}
@@ -120,7 +123,7 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata,
+                        tab_id, tab_title, metadata, created_at,
                         image_caption, caption_embedding, dominant_colors, style_tags, object_tags
                     FROM {ACTIVE_TABLE}
                     {where_clause}
@@ -132,7 +135,7 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata,
+                        tab_id, tab_title, metadata, created_at,
                         image_caption, caption_embedding, dominant_colors, style_tags, object_tags
                     FROM {ACTIVE_TABLE}
                     {where_clause}
@@ -141,7 +144,6 @@ async def get_items_without_caption(
     else:
         # 降级到 metadata 查询（向后兼容）
         if user_id:
-            user_id = _normalize_user_id(user_id)
             if force_all:
                 where_clause = "WHERE user_id = $1 AND status = 'active' AND image IS NOT NULL AND image != ''"
             else:
@@ -151,7 +153,7 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata
+                        tab_id, tab_title, metadata, created_at
                     FROM {ACTIVE_TABLE}
                     {where_clause}
                     ORDER BY created_at DESC
@@ -162,7 +164,7 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata
+                        tab_id, tab_title, metadata, created_at
                     FROM {ACTIVE_TABLE}
                     {where_clause}
                     ORDER BY created_at DESC
@@ -177,7 +179,7 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata
+                        tab_id, tab_title, metadata, created_at
                     FROM {ACTIVE_TABLE}
                     {where_clause}
                     ORDER BY created_at DESC
@@ -188,15 +190,23 @@ async def get_items_without_caption(
                 query = f"""
                     SELECT 
                         user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, metadata
+                        tab_id, tab_title, metadata, created_at
                     FROM {ACTIVE_TABLE}
                     {where_clause}
                     ORDER BY created_at DESC
                 """
     
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(query, *params)
-        items = [_row_to_dict(row) for row in rows]
+    items = []
+    for pool in pools:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+        items.extend(_row_to_dict(row) for row in rows)
+    
+    if len(pools) > 1:
+        # 每个分片各自取了最新的 max_items 条，合并后重新排序再截断
+        items.sort(key=lambda item: item.get("created_at") or datetime.min, reverse=True)
+        if max_items is not None:
+            items = items[:max_items]
     
     print(f"[BatchEnrich] Found {len(items)} items without caption")
     return items
@@ -226,10 +236,11 @@ async def update_item_caption(
     Returns:
         是否更新成功
     """
-    pool = await get_pool()
     user_id = _normalize_user_id(user_id)
     
     try:
+        # 写到该用户所在的分片
+        pool = await get_pool(user_id)
         async with pool.acquire() as conn:
             # 检查新字段是否存在（如果不存在，降级到 metadata）
             has_new_fields = await conn.fetchval(f"""
@@ -244,15 +255,20 @@ async def update_item_caption(
             if has_new_fields:
                 # 使用新字段更新
                 caption_vec = to_vector_str(caption_embedding)
+                # 同步更新依赖 caption 的派生列（caption_tokens 关键词召回、caption_hash 去重）
+                caption_features = compute_caption_features(caption)
                 
-                await conn.execute(
+                result = await conn.execute(
                     f"""
                     UPDATE {ACTIVE_TABLE}
                     SET image_caption = $1,
                         caption_embedding = $2::vector(1024),
+                        caption_embedding_512 = $10::vector({PREFIX_EMBED_DIM}),
                         dominant_colors = $3,
                         style_tags = $4,
                         object_tags = $5,
+                        caption_tokens = $8,
+                        caption_hash = $9,
                         updated_at = NOW()
                     WHERE user_id = $6 AND url = $7
                     """,
@@ -262,7 +278,11 @@ async def update_item_caption(
                     style_tags if style_tags else None,
                     object_tags if object_tags else None,
                     user_id,
-                    url
+                    url,
+                    caption_features["caption_tokens"],
+                    caption_features["caption_hash"],
+                    # 两阶段召回的 512 维前缀向量与 caption_embedding 一起更新
+                    to_vector_str(prefix_embedding(caption_embedding))
                 )
             else:
                 # 降级到 metadata（向后兼容）
@@ -290,7 +310,7 @@ async def update_item_caption(
                 import json
                 metadata_json = json.dumps(metadata)
                 
-                await conn.execute(
+                result = await conn.execute(
                     f"""
                     UPDATE {ACTIVE_TABLE}
                     SET metadata = $1::jsonb,
@@ -300,6 +320,12 @@ async def update_item_caption(
                     metadata_json, user_id, url
                 )
             
+            if result == "UPDATE 0":
+                print(f"[BatchEnrich] ⚠️  No row updated for {url[:50]}... (user {user_id})")
+                return False
+            
+            # 递增数据版本号，使 API 进程中按 (user_id, version) 缓存的结果失效（见 data_version.py）
+            await data_version.bump(conn, user_id)
             return True
             
     except Exception as e:
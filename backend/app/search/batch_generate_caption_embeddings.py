@@ -16,8 +16,9 @@ parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
 from vector_db import get_pool, close_pool, ACTIVE_TABLE, ACTIVE_TABLE_NAME, NAMESPACE, _normalize_user_id
+import data_version
 from search.embed import embed_text
-from search.config import EMBED_SLEEP_S
+from search.config import EMBED_SLEEP_S, PREFIX_EMBED_DIM
 
 
 async def batch_generate_caption_embeddings(
@@ -38,8 +39,9 @@ async def batch_generate_caption_embeddings(
     Returns:
         统计信息字典
     """
-    pool = await get_pool()
     normalized_user = _normalize_user_id(user_id)
+    # 该用户所在的分片
+    pool = await get_pool(normalized_user)
     
     stats = {
         "total_with_caption": 0,
@@ -208,14 +210,21 @@ async def _generate_and_update_embedding(
         
         # 更新数据库
         from vector_db import to_vector_str
+        from search.features import prefix_embedding
         caption_vec_str = to_vector_str(caption_vec)
         
-        await conn.execute(f"""
+        result = await conn.execute(f"""
             UPDATE {ACTIVE_TABLE}
             SET caption_embedding = $1::vector(1024),
+                caption_embedding_512 = $4::vector({PREFIX_EMBED_DIM}),
                 updated_at = NOW()
             WHERE user_id = $2 AND url = $3;
-        """, caption_vec_str, user_id, url)
+        """, caption_vec_str, user_id, url, to_vector_str(prefix_embedding(caption_vec)))
+        if result == "UPDATE 0":
+            print(f"  ⚠️  没有更新任何行: {url[:50]}...")
+            return False
+        # 递增数据版本号，使 API 进程中按 (user_id, version) 缓存的结果失效（见 data_version.py）
+        await data_version.bump(conn, user_id)
         
         print(f"  ✅ 已更新: {url[:50]}...")
         return True
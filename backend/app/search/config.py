@@ -10,6 +10,13 @@ MM_EMBED_ENDPOINT = f"{DASHSCOPE_API_URL}/services/embeddings/multimodal-embeddi
 # qwen2.5-vl-embedding 支持 dimensions 参数：2048, 1024, 768, 512
 # 设置为 1024 确保文本和图像向量在同一维度空间
 MM_EMBED_DIM = 1024  # 统一的向量维度（文本和图像都使用此维度）
+# 两阶段召回的低维前缀向量维度：1024 维向量截取前 512 维并重新归一化（*_embedding_512 列），
+# 用它的 ANN 索引召回较宽的候选集，再用 1024 维向量重排（见 vector_db.PREFIX_RECALL_ENABLED）
+PREFIX_EMBED_DIM = 512
+# 已存储的 embedding 是否都是单位向量：新数据入库时归一化，旧数据要等 backfill_unit_embeddings.py 执行完，
+# 之后才会切换到 VECTOR_DISTANCE_MEASURE=ip（见 vector_db.py）。成立时精排直接用内积，
+# 否则从数据库读出的向量按余弦计算（旧数据可能不是单位向量，内积会偏向范数大的向量）
+STORED_EMBEDDINGS_NORMALIZED = os.getenv("VECTOR_DISTANCE_MEASURE", "cosine").lower() == "ip"
 
 # ---- Pipeline switches ----
 USE_REMOTE_EMBEDDING = True
@@ -41,10 +48,33 @@ DOC_FOCUSED_WEIGHTS = (0.6, 0.4)  # 文本站（博客/文档/知乎）：文本
 IMAGE_EMBEDDING_THRESHOLD = 0.24 # Image embedding 相似度阈值（24%，更宽松，提高召回率）
 # Caption 关键词路径：可能召回不相关结果，使用更严格的阈值
 # ✅ 优化：降低阈值从 0.75 到 0.65，提高召回率（rank 为 0.5 或 1.0，0.65 会保留完全匹配和部分匹配）
-CAPTION_RANK_THRESHOLD = 0.65 # Caption rank 阈值（65%，降低以提高召回率）
+CAPTION_RANK_THRESHOLD = 0.65 # Caption 关键词 token 重叠率阈值（65%，降低以提高召回率）
 # 其他路径（文本向量等）使用通用阈值
 MIN_SIMILARITY_THRESHOLD = 0.28  # 通用相似度阈值（28%，略微降低以提高召回率）
 
+# ---- Designer sites ----
+# 设计师网站的可注册域名（与入库时计算的 site_domain 列精确匹配，可走 btree 索引）
+DESIGNER_SITE_DOMAINS = [
+    "pinterest.com", "pinterest.co.uk", "pinterest.jp", "pinterest.de", "pinterest.fr",
+    "pinterest.ca", "pinterest.com.au",
+    "xiaohongshu.com", "behance.net", "dribbble.com",
+    "zcool.com.cn", "ui.cn", "uisdc.com", "youzhan.com",
+    "unsplash.com", "pexels.com", "pixabay.com", "freepik.com",
+    "shutterstock.com", "gettyimages.com", "deviantart.com",
+    "artstation.com", "500px.com", "flickr.com", "imgur.com",
+    "tumblr.com", "arena.com", "are.na", "muzli.com", "designspiration.com",
+    "awwwards.com", "siteinspire.com", "land-book.com",
+    "onepagelove.com", "collectui.com", "mobbin.com",
+    "pageflows.com", "saaslandingpage.com",
+]
+# 还没有回填 site_domain 的旧数据按 url 子串匹配（LIKE ANY）
+DESIGNER_SITE_URL_PATTERNS = [f"%{domain}%" for domain in DESIGNER_SITE_DOMAINS]
+# site_name 兜底关键词（URL 无法识别时，例如站点名为中文）
+DESIGNER_SITE_NAME_KEYWORDS = [
+    "pinterest", "behance", "dribbble", "xiaohongshu", "小红书",
+    "站酷", "zcool", "优设", "unsplash", "artstation", "deviantart",
+]
+
 
 def get_api_key() -> str:
     return os.getenv("DASHSCOPE_API_KEY", "")
@@ -9,6 +9,7 @@ from typing import Optional, List
 
 from .config import MM_EMBED_ENDPOINT, MM_EMBED_MODEL, MM_EMBED_DIM, get_api_key
 from .preprocess import download_image, process_image
+from .normalize import normalize_embedding
 
 
 async def qwen_embed(input_data: dict) -> Optional[List[float]]:
@@ -26,7 +27,7 @@ async def qwen_embed(input_data: dict) -> Optional[List[float]]:
     """
     api_key = get_api_key()
     if not api_key:
-        print(f"[Embed] ERROR: API key not found")
+        print("[Embed] ERROR: API key not found")
         return None
     
     try:
@@ -65,11 +66,20 @@ async def qwen_embed(input_data: dict) -> Optional[List[float]]:
             
             # 取第一个 embedding（响应格式：output.embeddings[0].embedding）
             if embs and isinstance(embs[0].get("embedding"), list):
-                emb = embs[0]["embedding"]
+                # 归一化为单位向量（相似度计算直接用内积）。
+                # 行为变化：NaN / 零向量现在视为失败返回 None（之前原样返回）；
+                # 维度与 MM_EMBED_DIM 不同时和之前一样只警告，按实际维度归一化后返回
+                raw = embs[0]["embedding"]
+                if len(raw) != MM_EMBED_DIM:
+                    print(f"[Embed] WARNING: Embedding has {len(raw)} dims, expected {MM_EMBED_DIM}")
+                emb = normalize_embedding(raw, dim=len(raw))
+                if emb is None:
+                    print("[Embed] ERROR: Invalid embedding values (NaN or zero vector)")
+                    return None
                 print(f"[Embed] SUCCESS: Generated {len(emb)}-dim vector")
                 return emb
             
-            print(f"[Embed] ERROR: Invalid embedding format")
+            print("[Embed] ERROR: Invalid embedding format")
             return None
             
     except Exception as e:
@@ -90,7 +100,7 @@ async def embed_text(text: str) -> Optional[List[float]]:
         Embedding向量，失败返回None
     """
     if not text or not text.strip():
-        print(f"[Embed] WARNING: Empty text provided")
+        print("[Embed] WARNING: Empty text provided")
         return None
     
     input_data = {
@@ -122,7 +132,7 @@ async def embed_image(image_base64_or_url: str) -> Optional[List[float]]:
         Embedding向量，失败返回None
     """
     if not image_base64_or_url:
-        print(f"[Embed] WARNING: Empty image data provided")
+        print("[Embed] WARNING: Empty image data provided")
         return None
     
     # 检查输入类型
@@ -156,10 +166,10 @@ async def embed_image(image_base64_or_url: str) -> Optional[List[float]]:
                     print(f"[Embed] Calling API with Base64 Data URI (total length: {len(img_b64)})")
                     return await qwen_embed(input_data)
                 else:
-                    print(f"[Embed] ERROR: process_image returned None")
+                    print("[Embed] ERROR: process_image returned None")
                     return None
             else:
-                print(f"[Embed] ERROR: download_image returned None")
+                print("[Embed] ERROR: download_image returned None")
                 return None
         except Exception as e:
             print(f"[Embed] EXCEPTION downloading/processing image: {type(e).__name__}: {str(e)}")
@@ -178,7 +188,7 @@ async def embed_image(image_base64_or_url: str) -> Optional[List[float]]:
     else:
         # 如果是纯 base64 字符串（理论上不应该发生，因为 process_image 总是返回 Data URI）
         # 但为了兼容性，我们添加前缀
-        print(f"[Embed] WARNING: Raw Base64 detected, adding Data URI prefix")
+        print("[Embed] WARNING: Raw Base64 detected, adding Data URI prefix")
         image_data_for_api = f"data:image/jpeg;base64,{image_base64_or_url}"
     
     input_data = {
@@ -0,0 +1,341 @@
+"""
+入库特征计算模块
+在写入数据库时一次性计算可建索引的派生列（host、可注册域名、caption 分词、
+文档/设计师网站标记、标准化标题和 URL、caption/图片哈希），搜索阶段直接读取这些列，
+避免对每个候选重复解析 URL / metadata、分词和跑文档关键词匹配
+"""
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional, Any
+from urllib.parse import urlparse
+
+from .config import DESIGNER_SITE_DOMAINS, DESIGNER_SITE_NAME_KEYWORDS, PREFIX_EMBED_DIM
+
+
+# 需要保留三段的公共后缀（如 zcool.com.cn 的可注册域名是 zcool.com.cn，而不是 com.cn）
+MULTI_PART_SUFFIXES = {
+    "com.cn", "net.cn", "org.cn", "gov.cn", "edu.cn",
+    "com.hk", "com.tw", "com.au", "com.sg",
+    "co.uk", "org.uk", "co.jp", "co.kr", "co.nz",
+}
+
+DESIGNER_SITE_DOMAIN_SET = frozenset(DESIGNER_SITE_DOMAINS)
+# 按 label 拆分的设计师网站域名（label 多的优先，例如 pinterest.co.uk 先于 pinterest.com 匹配）
+_DESIGNER_SITE_LABELS = sorted((tuple(d.split(".")) for d in DESIGNER_SITE_DOMAINS), key=len, reverse=True)
+
+# 分词时丢弃的停用词（中英文常见虚词）
+CAPTION_STOPWORDS = frozenset({
+    "the", "and", "of", "in", "on", "with", "for", "to", "is", "are", "an", "at", "by", "or",
+    "的", "了", "和", "与", "及", "是", "在", "有", "一个", "这", "那",
+})
+
+# 至少包含一个字母、数字或中文字符才算有效 token（过滤标点和空白）
+_TOKEN_CHAR_PATTERN = re.compile(r"[0-9a-z\u4e00-\u9fff]")
+
+# 内容哈希覆盖的字段（请求 item 中的原始键，即生成 embedding 依赖的内容），顺序固定，客户端必须使用同样的顺序；
+# og:title 等备用键不参与计算
+CONTENT_HASH_FIELDS = ["title", "tab_title", "description", "site_name", "image"]
+
+# 标题中的数字 ID 后缀（如 _-1451008、_73823749），标准化标题时移除
+_TITLE_ID_PATTERN = re.compile(r"[_-]\d+")
+
+# 派生列名（入库写入、回填脚本共用）
+FEATURE_COLUMNS = [
+    "host", "site_domain", "caption_tokens",
+    "is_doc", "is_designer_site", "normalized_title", "normalized_url",
+    "caption_hash", "image_hash", "session_id", "content_hash",
+]
+# 计算派生列需要读取的原始列（回填脚本使用，必须包含 url）；
+# session_id 的来源是 upsert 时传入的 session_id（已写入 session_id 列）或 metadata.session_id；
+# content_hash 按原始请求计算，存储的列无法还原，回填时保留已有的值
+FEATURE_SOURCE_COLUMNS = [
+    "url", "title", "tab_title", "description", "site_name", "image", "image_caption", "metadata",
+    "session_id", "content_hash",
+]
+
+
+def extract_host(url: Optional[str]) -> Optional[str]:
+    """
+    提取标准化的 host（小写、去掉端口和 www. 前缀）
+
+    Args:
+        url: 网页 URL
+
+    Returns:
+        host，无法解析时返回 None
+    """
+    if not url:
+        return None
+    try:
+        parsed = urlparse(url.strip())
+        host = (parsed.hostname or "").strip(".").lower()
+    except Exception:
+        return None
+    if host.startswith("www."):
+        host = host[4:]
+    return host or None
+
+
+def registrable_domain(host: Optional[str]) -> Optional[str]:
+    """
+    根据 host 计算可注册域名（eTLD+1 的简化实现）
+
+    例如：
+    - cn.pinterest.com → pinterest.com
+    - www.zcool.com.cn → zcool.com.cn
+    - ui.cn → ui.cn
+    """
+    if not host:
+        return None
+    labels = host.split(".")
+    if len(labels) <= 2:
+        return host
+    if ".".join(labels[-2:]) in MULTI_PART_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def designer_site_domain(host: Optional[str]) -> Optional[str]:
+    """
+    host 所属的设计师网站域名（按完整 label 匹配，与旧的 url LIKE '%site%' 覆盖范围一致，但不会误匹配
+    notpinterest.com 这样的域名）
+
+    例如：
+    - cn.pinterest.com → pinterest.com（子域名）
+    - pinterest.com.mx → pinterest.com（registrable_domain 不认识的国家后缀）
+    - example.com → None
+    """
+    if not host:
+        return None
+    labels = tuple(host.split("."))
+    for domain in _DESIGNER_SITE_LABELS:
+        n = len(domain)
+        if any(labels[i:i + n] == domain for i in range(len(labels) - n + 1)):
+            return ".".join(domain)
+    return None
+
+
+def site_domain_for_host(host: Optional[str]) -> Optional[str]:
+    """
+    site_domain 列的值：设计师网站统一为 DESIGNER_SITE_DOMAINS 中的域名（召回 SQL 用 = ANY 精确匹配），
+    其他网站为可注册域名
+    """
+    return designer_site_domain(host) or registrable_domain(host)
+
+
+def is_designer_domain(site_domain: Optional[str]) -> bool:
+    """判断可注册域名是否属于设计师网站"""
+    return bool(site_domain) and site_domain in DESIGNER_SITE_DOMAIN_SET
+
+
+def is_designer_item(site_domain: Optional[str], site_name: Optional[str]) -> bool:
+    """判断记录是否来自设计师网站（域名优先，站点名兜底，如「小红书」「站酷」）"""
+    if is_designer_domain(site_domain):
+        return True
+    site_name = (site_name or "").lower()
+    return bool(site_name) and any(kw in site_name for kw in DESIGNER_SITE_NAME_KEYWORDS)
+
+
+def is_doc_item(item: Dict[str, Any]) -> bool:
+    """判断记录是否是文档类内容（is_doc_like 规则 + metadata.is_doc_card 标记）"""
+    from .preprocess import is_doc_like
+    if is_doc_like(item):
+        return True
+    metadata = _item_metadata(item)
+    return bool(metadata.get("is_doc_card", False) or item.get("is_doc_card", False))
+
+
+def normalize_title(title: Optional[str]) -> Optional[str]:
+    """
+    标准化标题用于去重（移除数字 ID 和特殊字符，只保留字母、数字、中文、空格、连字符）
+
+    例如：「20251117视觉设计部管理周会_-1451008」→「20251117视觉设计部管理周会_」（与搜索阶段旧的去重规则一致）
+    """
+    title = (title or "").strip()
+    if not title:
+        return None
+    title_clean = _TITLE_ID_PATTERN.sub("", title)
+    normalized = "".join(
+        c for c in title_clean if c.isalnum() or c in (" ", "-", "_", "，", "。")
+    ).strip().lower()
+    return normalized or None
+
+
+def normalize_url(url: Optional[str]) -> Optional[str]:
+    """标准化 URL 用于去重（与入库主键使用同一规则：移除查询参数、锚点、尾随斜杠）"""
+    if not url:
+        return None
+    from vector_db import _normalize_url_for_storage
+    return _normalize_url_for_storage(url)
+
+
+def tokenize_caption(text: Optional[str]) -> List[str]:
+    """
+    Caption 分词（入库和查询共用同一套规则，保证 token 能对上）
+
+    - 中文使用 jieba 搜索模式分词（会同时产出长词和其中的短词）
+    - 英文统一小写
+    - 丢弃标点、停用词和单个英文字母/数字，保留单个中文字（如「猫」）
+
+    Args:
+        text: caption 或查询文本
+
+    Returns:
+        去重后排序的 token 列表（无有效 token 时返回空列表）
+    """
+    if not text:
+        return []
+    text = text.strip().lower()
+    if not text:
+        return []
+
+    try:
+        import jieba
+        raw_tokens = jieba.cut_for_search(text)
+    except ImportError:
+        # jieba 未安装，回退到简单分词
+        raw_tokens = re.split(r"[\s,，。.;；:：!！?？、/|()（）\[\]\"'“”]+", text)
+
+    tokens = set()
+    for token in raw_tokens:
+        token = token.strip()
+        if not token or token in CAPTION_STOPWORDS:
+            continue
+        if not _TOKEN_CHAR_PATTERN.search(token):
+            continue
+        if len(token) == 1 and token.isascii():
+            continue
+        tokens.add(token)
+    return sorted(tokens)
+
+
+def content_hash(value: Optional[str]) -> Optional[str]:
+    """
+    计算字符串的 md5 十六进制哈希（定长 32 字符，可建 btree 索引；
+    image 可能是很长的 data URL，不适合直接建索引或做等值比较）
+    """
+    if not value:
+        return None
+    return hashlib.md5(value.encode("utf-8")).hexdigest()
+
+
+def caption_hash(caption: Optional[str]) -> Optional[str]:
+    """Caption 去重哈希（与重复检测一致：去首尾空白、小写）"""
+    normalized = (caption or "").strip().lower()
+    return content_hash(normalized) if normalized else None
+
+
+def image_hash(image: Optional[str]) -> Optional[str]:
+    """图片去重哈希（图片 URL / data URL 原样比较，只去首尾空白）"""
+    image = (image or "").strip()
+    return content_hash(image) if image else None
+
+
+def compute_content_hash(item: Dict[str, Any]) -> str:
+    """
+    计算内容哈希（上传握手协议使用，客户端需用同样的规则计算）
+
+    对发送给 /api/v1/search/embedding 的原始 item 计算，在任何规范化之前
+    （服务端的 normalize_opengraph_items 会做 title 回退、取 image 数组第一个元素、去空白等处理，
+    规范化之后再算就和客户端对不上）。
+
+    规则：
+    1. 按 CONTENT_HASH_FIELDS 的顺序（title、tab_title、description、site_name、image）取请求中的原始值
+    2. 键不存在或为 null → 空字符串；字符串原样使用（不去空白）；
+       其他类型（例如 image 数组）→ 紧凑 JSON，与 JSON.stringify 一致（无空格，非 ASCII 字符不转义）
+    3. 用 \\x1f（Unit Separator）连接，取 UTF-8 编码的 SHA-256 十六进制摘要
+
+    浏览器端可直接用 crypto.subtle.digest("SHA-256", ...) 计算。
+    """
+    parts = []
+    for field in CONTENT_HASH_FIELDS:
+        value = item.get(field)
+        if value is None:
+            parts.append("")
+        elif isinstance(value, str):
+            parts.append(value)
+        else:
+            parts.append(json.dumps(value, ensure_ascii=False, separators=(",", ":")))
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def compute_caption_features(caption: Optional[str]) -> Dict[str, Any]:
+    """
+    只计算依赖 caption 的派生列（供单独更新 caption 的路径使用）
+
+    Returns:
+        {"caption_tokens": ..., "caption_hash": ...}
+    """
+    return {
+        "caption_tokens": tokenize_caption(caption) or None,
+        "caption_hash": caption_hash(caption),
+    }
+
+
+def prefix_embedding(vec: Optional[List[float]], dim: int = PREFIX_EMBED_DIM) -> Optional[List[float]]:
+    """
+    截取向量的前 dim 维并重新归一化（*_embedding_512 列和两阶段召回的查询向量）
+
+    Returns:
+        长度为 dim 的单位向量；向量为空、维度不足或前缀全为 0 时返回 None
+    """
+    if not vec or len(vec) < dim:
+        return None
+    prefix = [float(x) for x in vec[:dim]]
+    norm = sum(x * x for x in prefix) ** 0.5
+    if norm == 0:
+        return None
+    return [x / norm for x in prefix]
+
+
+def _item_metadata(item: Dict[str, Any]) -> Dict[str, Any]:
+    """读取记录的 metadata（数据库返回的可能是 JSON 字符串）"""
+    metadata = item.get("metadata")
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except (ValueError, TypeError):
+            metadata = None
+    return metadata if isinstance(metadata, dict) else {}
+
+
+def _item_session_id(item: Dict[str, Any]) -> Optional[str]:
+    """读取记录所属的 session_id（优先顶层字段，回退到 metadata.session_id）"""
+    session_id = item.get("session_id") or _item_metadata(item).get("session_id")
+    if session_id is None:
+        return None
+    return str(session_id).strip() or None
+
+
+def _item_caption(item: Dict[str, Any]) -> Optional[str]:
+    """读取记录的 caption（优先 image_caption 列，回退到 metadata.caption）"""
+    return item.get("image_caption") or _item_metadata(item).get("caption")
+
+
+def compute_item_features(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    计算一条记录的所有派生列
+
+    Args:
+        item: 记录字典（至少包含 url）
+
+    Returns:
+        {列名: 值}，键与 FEATURE_COLUMNS 一致
+    """
+    host = extract_host(item.get("url"))
+    domain = site_domain_for_host(host)
+    return {
+        "host": host,
+        "site_domain": domain,
+        "is_doc": is_doc_item(item),
+        "is_designer_site": is_designer_item(domain, item.get("site_name")),
+        "normalized_title": normalize_title(item.get("title") or item.get("tab_title")),
+        "normalized_url": normalize_url(item.get("url")),
+        "image_hash": image_hash(item.get("image")),
+        # session_id 由前端放在 metadata 中，提升为独立列以便按 session 删除/列出
+        "session_id": _item_session_id(item),
+        # 上传接口在规范化之前按原始请求计算（见 normalize_opengraph_items），这里只给其他写入路径兜底
+        "content_hash": item.get("content_hash") or compute_content_hash(item),
+        **compute_caption_features(_item_caption(item)),
+    }
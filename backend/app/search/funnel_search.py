@@ -9,9 +9,10 @@ import asyncio
 from .threshold_filter import FilterMode, filter_by_threshold
 from .smart_filter import smart_filter
 from .embed import embed_text, embed_image
-from .fuse import cosine_similarity, fuse_similarity_scores
+from .fuse import cosine_similarity, inner_product, fuse_similarity_scores
 from .rank import fuzzy_score
 from .query_enhance import enhance_visual_query
+from .features import tokenize_caption
 import sys
 from pathlib import Path
 
@@ -20,28 +21,45 @@ parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
 from vector_db import (
-    search_by_text_embedding,
-    search_by_image_embedding,
-    search_by_caption_embedding,
-    get_pool,
+    get_read_pool,
     ACTIVE_TABLE,
     NAMESPACE,
     _normalize_user_id,
     to_vector_str,
     _row_to_dict,
+    _scope_clause,
+    _scoped_query_name,
+    _doc_clause,
+    _distance_sql,
+    _similarity_from_distance,
+    build_search_scope,
+    SEARCH_FEATURE_COLUMNS,
 )
 import asyncpg
+import query_registry
+from ann_search import ann_search_transaction
+from db_routing import db_route
+from vector_store import get_vector_store
 
 
 # 五路分数权重配置（从 fusion_weights 模块导入，可配置）
 from .fusion_weights import FUSION_WEIGHTS
-from .config import MIN_SIMILARITY_THRESHOLD, IMAGE_EMBEDDING_THRESHOLD, CAPTION_RANK_THRESHOLD
+from .config import (
+    MIN_SIMILARITY_THRESHOLD,
+    IMAGE_EMBEDDING_THRESHOLD,
+    CAPTION_RANK_THRESHOLD,
+    DESIGNER_SITE_DOMAINS,
+    DESIGNER_SITE_URL_PATTERNS,
+    STORED_EMBEDDINGS_NORMALIZED,
+)
 
 
+@db_route("read")
 async def _coarse_recall_text_vector(
     user_id: Optional[str],
     query_text: str,
     top_k: int = 50,
+    scope: Optional[Dict[str, List]] = None,
 ) -> List[Dict]:
     """
     路径1: 文本向量搜索
@@ -50,6 +68,7 @@ async def _coarse_recall_text_vector(
         user_id: 用户ID
         query_text: 查询文本
         top_k: 召回数量
+        scope: 搜索范围（Personal Space 过滤，见 build_search_scope）
     
     Returns:
         搜索结果列表（包含 similarity 字段）
@@ -60,11 +79,13 @@ async def _coarse_recall_text_vector(
         if not query_vec:
             return []
         
-        results = await search_by_text_embedding(
+        results = await get_vector_store().search_by_text_embedding(
             user_id=user_id,
             query_embedding=query_vec,
             top_k=top_k,
             threshold=MIN_SIMILARITY_THRESHOLD,  # 使用配置的最小相似度阈值，过滤完全不相关的结果
+            scope=scope,
+            exclude_docs=True,  # 设计师场景：文档类内容在 SQL 中排除（is_doc 列）
         )
         
         # 添加路径标识
@@ -81,11 +102,13 @@ async def _coarse_recall_text_vector(
         return []
 
 
+@db_route("read")
 async def _coarse_recall_image_vector(
     user_id: Optional[str],
     query_image_url: Optional[str] = None,
     query_image_base64: Optional[str] = None,
     top_k: int = 50,
+    scope: Optional[Dict[str, List]] = None,
 ) -> List[Dict]:
     """
     路径2: 图像向量搜索
@@ -95,6 +118,7 @@ async def _coarse_recall_image_vector(
         query_image_url: 查询图像URL
         query_image_base64: 查询图像Base64
         top_k: 召回数量
+        scope: 搜索范围（Personal Space 过滤，见 build_search_scope）
     
     Returns:
         搜索结果列表（包含 similarity 字段）
@@ -105,11 +129,13 @@ async def _coarse_recall_image_vector(
         if not query_vec:
             return []
         
-        results = await search_by_image_embedding(
+        results = await get_vector_store().search_by_image_embedding(
             user_id=user_id,
             query_embedding=query_vec,
             top_k=top_k,
             threshold=IMAGE_EMBEDDING_THRESHOLD,  # Image embedding 使用更宽松的阈值（15%），因为结果质量好
+            scope=scope,
+            exclude_docs=True,  # 设计师场景：文档类内容在 SQL 中排除（is_doc 列）
         )
         
         # 添加路径标识
@@ -123,10 +149,12 @@ async def _coarse_recall_image_vector(
         return []
 
 
+@db_route("read")
 async def _coarse_recall_text_to_image_vector(
     user_id: Optional[str],
     query_text: str,
     top_k: int = 60,
+    scope: Optional[Dict[str, List]] = None,
 ) -> List[Dict]:
     """
     路径2b: 文本→图像 向量搜索（Multi-modal）
@@ -139,6 +167,7 @@ async def _coarse_recall_text_to_image_vector(
         user_id: 用户ID
         query_text: 文本查询
         top_k: 召回数量
+        scope: 搜索范围（Personal Space 过滤，见 build_search_scope）
     """
     try:
         from .embed import embed_text
@@ -146,11 +175,13 @@ async def _coarse_recall_text_to_image_vector(
         if not query_vec:
             return []
         
-        results = await search_by_image_embedding(
+        results = await get_vector_store().search_by_image_embedding(
             user_id=user_id,
             query_embedding=query_vec,
             top_k=top_k,
             threshold=IMAGE_EMBEDDING_THRESHOLD,  # Text→Image 也使用 image embedding 阈值（15%），更宽松
+            scope=scope,
+            exclude_docs=True,  # 设计师场景：文档类内容在 SQL 中排除（is_doc 列）
         )
         
         for item in results:
@@ -167,10 +198,12 @@ async def _coarse_recall_text_to_image_vector(
         return []
 
 
+@db_route("read")
 async def _coarse_recall_caption_embedding(
     user_id: Optional[str],
     query_text: str,
     top_k: int = 60,
+    scope: Optional[Dict[str, List]] = None,
 ) -> List[Dict]:
     """
     路径2a: Caption Embedding 向量搜索（语义搜索）
@@ -185,6 +218,7 @@ async def _coarse_recall_caption_embedding(
         user_id: 用户ID
         query_text: 文本查询
         top_k: 召回数量
+        scope: 搜索范围（Personal Space 过滤，见 build_search_scope）
     
     Returns:
         搜索结果列表（包含 similarity 字段）
@@ -195,11 +229,13 @@ async def _coarse_recall_caption_embedding(
         if not query_vec:
             return []
         
-        results = await search_by_caption_embedding(
+        results = await get_vector_store().search_by_caption_embedding(
             user_id=user_id,
             query_embedding=query_vec,
             top_k=top_k,
             threshold=IMAGE_EMBEDDING_THRESHOLD,  # 使用 image embedding 阈值（24%），更宽松
+            scope=scope,
+            exclude_docs=True,  # 设计师场景：文档类内容在 SQL 中排除（is_doc 列）
         )
         
         # 添加路径标识
@@ -216,183 +252,58 @@ async def _coarse_recall_caption_embedding(
         return []
 
 
+@db_route("read")
 async def _coarse_recall_caption_keyword(
     user_id: Optional[str],
     query_text: str,
     top_k: int = 50,
+    scope: Optional[Dict[str, List]] = None,
 ) -> List[Dict]:
     """
     路径2b: Caption 关键词搜索（全文搜索）
     
-    ✅ 使用 jieba 分词器优化中文查询
+    ✅ 查询与入库使用同一套 jieba 分词（search/features.tokenize_caption），
+    由存储层按 caption_tokens 召回（ADBPG 走 GIN 索引，见 vector_db.search_by_caption_keyword），
+    rank = 命中的查询 token 数 / 查询 token 总数（token 重叠率）
     
     Args:
         user_id: 用户ID
         query_text: 查询文本
         top_k: 召回数量
+        scope: 搜索范围（Personal Space 过滤，见 build_search_scope）
     
     Returns:
         搜索结果列表
     """
     try:
-        pool = await get_pool()
-        normalized_user = _normalize_user_id(user_id)
-        
-        # ✅ 使用 jieba 分词器处理中文查询
-        keywords = []
-        try:
-            import jieba
-            # 检查是否为中文查询（包含中文字符）
-            has_chinese = any('\u4e00' <= ch <= '\u9fff' for ch in query_text)
-            
-            if has_chinese:
-                # 中文查询：使用 jieba 分词
-                # 搜索模式：适合搜索场景，会分词更细
-                keywords = list(jieba.cut_for_search(query_text))
-                # 过滤掉停用词和单字符（除非是查询本身）
-                keywords = [kw.strip() for kw in keywords if len(kw.strip()) > 1 or kw.strip() == query_text.strip()]
-                keywords = list(set(keywords))  # 去重
-                
-                if keywords:
-                    print(f"[Funnel] Jieba segmented query '{query_text}' → {keywords}")
-                else:
-                    # 如果分词失败，回退到原始查询
-                    keywords = [query_text]
-            else:
-                # 英文查询：使用空格分词
-                keywords = query_text.lower().split()
-        except ImportError:
-            # jieba 未安装，回退到简单分词
-            print("[Funnel] Warning: jieba not installed, falling back to simple tokenization")
-            keywords = query_text.split()
-        
-        # 如果没有关键词，使用原始查询
-        if not keywords:
-            keywords = [query_text]
-        
-        # 判断是否为中文/多语言查询
-        from string import ascii_letters, digits
-        def _has_non_ascii(s: str) -> bool:
-            allowed = set(ascii_letters + digits + " _-")
-            return any(ch not in allowed for ch in s)
+        query_tokens = tokenize_caption(query_text)
+        if not query_tokens:
+            return []
+        print(f"[Funnel] Caption keyword tokens '{query_text}' → {query_tokens}")
         
-        use_simple = _has_non_ascii(query_text)
-        ts_config = "simple" if use_simple else "english"
+        # 文档类内容 / Personal Space 范围过滤下推到存储层
+        rows = await get_vector_store().search_by_caption_keyword(
+            user_id=user_id,
+            query_tokens=query_tokens,
+            top_k=top_k,
+            scope=scope,
+            exclude_docs=True,
+        )
         
-        async with pool.acquire() as conn:
-            # 检查是否有 image_caption 字段
-            has_caption_field = await conn.fetchval(f"""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.columns 
-                    WHERE table_schema = '{NAMESPACE}'
-                      AND table_name = 'opengraph_items_v2'
-                      AND column_name = 'image_caption'
-                );
-            """)
+        results = []
+        for item in rows:
+            caption_similarity = min(float(item.get("rank") or 0.0), 1.0)
             
-            if not has_caption_field:
-                # 降级到 metadata 查询
-                # ✅ 使用 jieba 分词后的关键词进行 ILIKE 查询（参数化，防止 SQL 注入）
-                keyword_conditions_list = []
-                params = [normalized_user]
-                param_idx = 2
-                
-                for kw in keywords:
-                    keyword_conditions_list.append(f"metadata->>'caption' ILIKE '%' || ${param_idx} || '%'")
-                    params.append(kw)
-                    param_idx += 1
-                
-                keyword_conditions_sql = " OR ".join(keyword_conditions_list)
-                
-                # 完全匹配原始查询的优先级更高
-                full_match_idx = param_idx
-                full_match_condition = f"metadata->>'caption' ILIKE '%' || ${full_match_idx} || '%'"
-                params.append(query_text)
-                param_idx += 1
-
-                # LIMIT 使用单独的参数索引
-                limit_idx = param_idx
-                params.append(top_k)
-                param_idx += 1
-                
-                rows = await conn.fetch(f"""
-                    SELECT user_id, url, title, description, image, site_name,
-                           tab_id, tab_title, metadata,
-                           CASE 
-                               WHEN {full_match_condition} THEN 1.0
-                               ELSE 0.5
-                           END AS rank
-                    FROM {ACTIVE_TABLE}
-                    WHERE status = 'active'
-                      AND user_id = $1
-                      AND metadata ? 'caption'
-                      AND metadata->>'caption' IS NOT NULL
-                      AND metadata->>'caption' != ''
-                      AND ({keyword_conditions_sql})
-                    ORDER BY rank DESC, metadata->>'caption'
-                    LIMIT ${limit_idx};
-                """, *params)
-            else:
-                # ✅ 使用 jieba 分词后的关键词进行 ILIKE 查询（参数化，防止 SQL 注入）
-                keyword_conditions_list = []
-                params = [normalized_user]
-                param_idx = 2
-                
-                for kw in keywords:
-                    keyword_conditions_list.append(f"image_caption ILIKE '%' || ${param_idx} || '%'")
-                    params.append(kw)
-                    param_idx += 1
-                
-                keyword_conditions_sql = " OR ".join(keyword_conditions_list)
-                
-                # 完全匹配原始查询的优先级更高
-                full_match_idx = param_idx
-                full_match_condition = f"image_caption ILIKE '%' || ${full_match_idx} || '%'"
-                params.append(query_text)
-                param_idx += 1
-
-                # LIMIT 使用单独的参数索引
-                limit_idx = param_idx
-                params.append(top_k)
-                param_idx += 1
-                
-                rows = await conn.fetch(f"""
-                    SELECT user_id, url, title, description, image, site_name,
-                           tab_id, tab_title, metadata,
-                           image_caption, caption_embedding, dominant_colors, style_tags, object_tags,
-                           CASE 
-                               WHEN {full_match_condition} THEN 1.0
-                               ELSE 0.5
-                           END AS rank
-                    FROM {ACTIVE_TABLE}
-                    WHERE status = 'active'
-                      AND user_id = $1
-                      AND image_caption IS NOT NULL
-                      AND image_caption != ''
-                      AND ({keyword_conditions_sql})
-                    ORDER BY rank DESC, image_caption
-                    LIMIT ${limit_idx};
-                """, *params)
-            
-            # 统一处理两个分支的结果，应用 rank 阈值过滤
-            results = []
-            for row in rows:
-                item = dict(row)
-                # 归一化 rank 到 [0, 1]（确保转换为 float）
-                rank = item.get("rank", 0.0)
-                caption_similarity = min(float(rank), 1.0)
-                
-                # Caption 关键词路径：使用更严格的阈值（60%），过滤掉 rank < 0.6 的结果
-                # rank 为 0.5（部分匹配）或 1.0（完全匹配），所以 0.6 阈值会过滤掉部分匹配的结果
-                if caption_similarity < CAPTION_RANK_THRESHOLD:
-                    continue  # 跳过 rank 太低的结果
-                
-                item["caption_similarity"] = caption_similarity
-                item["recall_path"] = "caption_keyword"
-                results.append(item)
+            # Caption 关键词路径：token 重叠率低于阈值的结果视为弱匹配，直接丢弃
+            if caption_similarity < CAPTION_RANK_THRESHOLD:
+                continue
             
-            print(f"[Funnel] Caption keyword recall: found {len(results)} results (after rank threshold >= {CAPTION_RANK_THRESHOLD}) for user_id={user_id}")
-            return results
+            item["caption_similarity"] = caption_similarity
+            item["recall_path"] = "caption_keyword"
+            results.append(item)
+        
+        print(f"[Funnel] Caption keyword recall: found {len(results)} results (after rank threshold >= {CAPTION_RANK_THRESHOLD}) for user_id={user_id}")
+        return results
     except Exception as e:
         print(f"[Funnel] Error in caption keyword recall: {e}")
         import traceback
@@ -400,10 +311,57 @@ async def _coarse_recall_caption_keyword(
         return []
 
 
+DESIGNER_SITES_COLUMNS = (
+    f"user_id, url, title, description, image, site_name, {SEARCH_FEATURE_COLUMNS}, "
+    "tab_id, tab_title, text_embedding, image_embedding, metadata, "
+    "image_caption, caption_embedding, dominant_colors, style_tags, object_tags"
+)
+
+
+def designer_sites_sql(scope_sql: str, limit_param: int) -> str:
+    """
+    设计师网站召回的 SQL（参数：$1 查询向量、$2 user_id、$3 阈值、$4 网站域名、$5 url 匹配模式，
+    scope_sql 的参数在其后，${limit_param} 为 top_k）
+
+    图像或文本相似度任一达到阈值即召回，返回的相似度优先取图像（没有 image_embedding 时取文本），按它排序。
+    每行的图像 / 文本距离只在内层计算一次，外层只做阈值判断和相似度换算；
+    内层的 OFFSET 0 阻止规划器把子查询展开（展开后距离表达式会被代入外层的每个引用处重新计算）
+    """
+    image_similarity = _similarity_from_distance("candidates.image_distance")
+    text_similarity = _similarity_from_distance("candidates.text_distance")
+    return f"""
+        SELECT {DESIGNER_SITES_COLUMNS},
+               CASE
+                   WHEN image_embedding IS NOT NULL THEN {image_similarity}
+                   ELSE {text_similarity}
+               END AS similarity
+        FROM (
+            SELECT {DESIGNER_SITES_COLUMNS},
+                   {_distance_sql("image_embedding", "$1::vector(1024)")} AS image_distance,
+                   {_distance_sql("text_embedding", "$1::vector(1024)")} AS text_distance
+            FROM {ACTIVE_TABLE}
+            WHERE status = 'active'
+              AND user_id = $2
+              AND (
+                  site_domain = ANY($4::text[])
+                  OR (site_domain IS NULL AND url LIKE ANY($5::text[]))
+              ){scope_sql}
+              AND (image_embedding IS NOT NULL OR text_embedding IS NOT NULL)
+            OFFSET 0
+        ) candidates
+        WHERE (image_embedding IS NOT NULL AND {image_similarity} >= $3)
+           OR (text_embedding IS NOT NULL AND {text_similarity} >= $3)
+        ORDER BY similarity DESC
+        LIMIT ${limit_param};
+    """
+
+
+@db_route("read")
 async def _coarse_recall_designer_sites(
     user_id: Optional[str],
     query_text: str,
     top_k: int = 100,
+    scope: Optional[Dict[str, List]] = None,
 ) -> List[Dict]:
     """
     路径5: 设计师网站专门召回（小红书、Pinterest、Behance等）
@@ -414,73 +372,45 @@ async def _coarse_recall_designer_sites(
         user_id: 用户ID
         query_text: 查询文本
         top_k: 召回数量（默认100，比其他路径更多）
+        scope: 搜索范围（Personal Space 过滤，见 build_search_scope）
     
     Returns:
         搜索结果列表
     """
+    if get_vector_store().name != "adbpg":
+        # 设计师网站召回依赖 site_domain 列和 ADBPG 向量 SQL，本地后端（VECTOR_STORE_BACKEND=sqlite）跳过这一路
+        return []
+    
     try:
         from .embed import embed_text
         query_vec = await embed_text(query_text)
         if not query_vec:
             return []
         
-        pool = await get_pool()
         normalized_user = _normalize_user_id(user_id)
+        pool = await get_read_pool(normalized_user)
         query_vec_str = to_vector_str(query_vec)
         
-        # 设计师网站列表
-        designer_sites = [
-            "pinterest.com", "xiaohongshu.com", "behance.net", "dribbble.com",
-            "zcool.com.cn", "ui.cn", "uisdc.com", "youzhan.com",
-            "unsplash.com", "pexels.com", "pixabay.com", "freepik.com",
-            "shutterstock.com", "gettyimages.com", "deviantart.com",
-            "artstation.com", "500px.com", "flickr.com", "imgur.com",
-            "tumblr.com", "arena.com", "muzli.com", "designspiration.com",
-            "awwwards.com", "siteinspire.com", "land-book.com",
-            "onepagelove.com", "collectui.com", "mobbin.com",
-        ]
-        
         async with pool.acquire() as conn:
             # 优先使用 image_embedding（设计师网站主要是图片）
-            # 使用参数化查询，避免 SQL 注入
-            # 构建 LIKE 条件列表
-            site_like_conditions = []
-            params = [query_vec_str, normalized_user, IMAGE_EMBEDDING_THRESHOLD]  # $1, $2, $3 (设计师网站主要用 image embedding，使用更宽松的阈值)
-            param_idx = 4  # 从 $4 开始
-            
-            for site in designer_sites:
-                site_like_conditions.append(f"url LIKE ${param_idx}")
-                params.append(f"%{site}%")
-                param_idx += 1
-            
-            site_conditions_sql = " OR ".join(site_like_conditions)
+            # ✅ 使用入库时计算的 site_domain 列精确匹配（= ANY，可走 (user_id, site_domain) 索引），
+            # 代替对每一行执行几十个 url LIKE '%site%'；子域名、国家后缀在入库时已归一（见 features.site_domain_for_host）。
+            # 还没有回填派生列的旧数据（site_domain IS NULL）继续按 url 子串匹配
+            params = [
+                query_vec_str, normalized_user, IMAGE_EMBEDDING_THRESHOLD,  # $1-$3 (设计师网站主要用 image embedding，使用更宽松的阈值)
+                DESIGNER_SITE_DOMAINS, DESIGNER_SITE_URL_PATTERNS,          # $4-$5
+            ]
+            scope_sql = _doc_clause(True) + _scope_clause(scope, params)
+            param_idx = len(params) + 1
             
-            query_sql = f"""
-                SELECT user_id, url, title, description, image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata,
-                       image_caption, caption_embedding, dominant_colors, style_tags, object_tags,
-                       CASE 
-                           WHEN image_embedding IS NOT NULL THEN 
-                               1 - (image_embedding <=> $1::vector(1024))
-                           ELSE 
-                               1 - (text_embedding <=> $1::vector(1024))
-                       END AS similarity
-                FROM {ACTIVE_TABLE}
-                WHERE status = 'active'
-                  AND user_id = $2
-                  AND ({site_conditions_sql})
-                  AND (
-                      (image_embedding IS NOT NULL AND 1 - (image_embedding <=> $1::vector(1024)) >= $3)
-                      OR 
-                      (text_embedding IS NOT NULL AND 1 - (text_embedding <=> $1::vector(1024)) >= $3)
-                  )
-                ORDER BY similarity DESC
-                LIMIT ${param_idx};
-            """
+            query_sql = designer_sites_sql(scope_sql, param_idx)
             
             params.append(top_k)  # 添加 LIMIT 参数
             
-            rows = await conn.fetch(query_sql, *params)  # threshold=0.0，尽可能多召回
+            async with ann_search_transaction(conn, "designer_sites", pool):
+                rows = await query_registry.fetch(
+                    conn, _scoped_query_name("funnel.designer_sites", scope, True), query_sql, *params
+                )
             
             results = []
             for row in rows:
@@ -498,10 +428,12 @@ async def _coarse_recall_designer_sites(
         return []
 
 
+@db_route("read")
 async def _coarse_recall_visual_attributes(
     user_id: Optional[str],
     query_text: str,
     top_k: int = 50,
+    scope: Optional[Dict[str, List]] = None,
 ) -> List[Dict]:
     """
     路径4: 颜色/风格标签搜索
@@ -510,10 +442,15 @@ async def _coarse_recall_visual_attributes(
         user_id: 用户ID
         query_text: 查询文本
         top_k: 召回数量
+        scope: 搜索范围（Personal Space 过滤，见 build_search_scope）
     
     Returns:
         搜索结果列表
     """
+    if get_vector_store().name != "adbpg":
+        # 颜色/风格召回依赖 ADBPG 的数组交集查询，本地后端（VECTOR_STORE_BACKEND=sqlite）跳过这一路
+        return []
+    
     try:
         # 提取视觉属性（颜色、风格）
         visual_attrs = enhance_visual_query(query_text)
@@ -523,8 +460,8 @@ async def _coarse_recall_visual_attributes(
         if not colors and not styles:
             return []
         
-        pool = await get_pool()
         normalized_user = _normalize_user_id(user_id)
+        pool = await get_read_pool(normalized_user)
         
         async with pool.acquire() as conn:
             # 检查是否有新字段
@@ -540,15 +477,11 @@ async def _coarse_recall_visual_attributes(
             if not has_new_fields:
                 return []
             
-            # 构建查询条件
-            conditions = []
-            params = [normalized_user]
-            param_idx = 2
-            
+            # 收集查询颜色（包括同义词）和风格，作为数组参数传入（语句文本固定，可预编译复用）
+            all_colors_to_match = set()
             if colors:
                 # ✅ 增强颜色匹配：支持同义词匹配
                 # 例如：查询"黄色"时，应该匹配 "yellow", "gold", "amber", "lemon" 等
-                color_conditions = []
                 
                 # 颜色同义词映射（确保所有同义词都能匹配）
                 COLOR_SYNONYMS = {
@@ -568,69 +501,39 @@ async def _coarse_recall_visual_attributes(
                     "pink": ["pink", "rose", "blush", "magenta"],
                 }
                 
-                # 收集所有需要匹配的颜色（包括同义词）
-                all_colors_to_match = set()
                 for color in colors:
                     color_lower = color.lower()
                     all_colors_to_match.add(color_lower)
                     # 添加同义词
                     if color_lower in COLOR_SYNONYMS:
                         all_colors_to_match.update(COLOR_SYNONYMS[color_lower])
-                
-                # 为每个颜色（包括同义词）创建匹配条件
-                for color_to_match in all_colors_to_match:
-                    color_conditions.append(f"${param_idx} = ANY(dominant_colors)")
-                    params.append(color_to_match)
-                    param_idx += 1
-                
-                if color_conditions:
-                    conditions.append(f"({' OR '.join(color_conditions)})")
-            
-            if styles:
-                # 风格匹配
-                style_conditions = []
-                for style in styles:
-                    style_conditions.append(f"${param_idx} = ANY(style_tags)")
-                    params.append(style.lower())
-                    param_idx += 1
-                conditions.append(f"({' OR '.join(style_conditions)})")
             
-            if not conditions:
-                return []
-            
-            where_clause = " AND ".join(conditions)
-            params.append(top_k)
-            
-            # ✅ 简化：直接使用数组交集操作符计算 visual_score
-            # 如果 dominant_colors 与查询颜色有交集，给高分
-            if colors:
-                # 使用 all_colors_to_match（包含同义词）构建数组
-                color_array_str = ','.join([f"'{c}'" for c in all_colors_to_match])
-                color_score_case = f"WHEN dominant_colors && ARRAY[{color_array_str}]::TEXT[] THEN 0.7 ELSE 0.0"
-            else:
-                color_score_case = "0.0"
+            style_tags = sorted({style.lower() for style in styles})
             
-            if styles:
-                style_array_str = ','.join([f"'{s.lower()}'" for s in styles])
-                style_score_case = f"WHEN style_tags && ARRAY[{style_array_str}]::TEXT[] THEN 0.3 ELSE 0.0"
-            else:
-                style_score_case = "0.0"
+            # 颜色和风格都给出时两者都要命中；空数组表示不限制该维度
+            params = [normalized_user, sorted(all_colors_to_match), style_tags, top_k]
+            scope_sql = _doc_clause(True) + _scope_clause(scope, params)
             
+            # ✅ 使用数组交集操作符（&&，可走 GIN 索引）过滤并计算 visual_score：
+            # 颜色命中 0.7，风格命中 0.3
             query = f"""
-                SELECT user_id, url, title, description, image, site_name,
+                SELECT user_id, url, title, description, image, site_name, {SEARCH_FEATURE_COLUMNS},
                        tab_id, tab_title, metadata,
                        image_caption, caption_embedding, dominant_colors, style_tags, object_tags,
-                       CASE {color_score_case} END +
-                       CASE {style_score_case} END AS visual_score
+                       CASE WHEN dominant_colors && $2::text[] THEN 0.7 ELSE 0.0 END +
+                       CASE WHEN style_tags && $3::text[] THEN 0.3 ELSE 0.0 END AS visual_score
                 FROM {ACTIVE_TABLE}
                 WHERE status = 'active'
                   AND user_id = $1
-                  AND ({where_clause})
+                  AND (array_length($2::text[], 1) IS NULL OR dominant_colors && $2::text[])
+                  AND (array_length($3::text[], 1) IS NULL OR style_tags && $3::text[]){scope_sql}
                 ORDER BY visual_score DESC
-                LIMIT ${param_idx};
+                LIMIT $4;
             """
             
-            rows = await conn.fetch(query, *params)
+            rows = await query_registry.fetch(
+                conn, _scoped_query_name("funnel.visual_attributes", scope, True), query, *params
+            )
             
             results = []
             for row in rows:
@@ -701,6 +604,7 @@ async def _fine_ranking(
             print(f"[Funnel] Error computing query text vector: {e}")
             query_text_vec = None
     
+    # 入库向量和 embed_* 返回的向量都是单位向量，下面补算相似度时直接用内积
     # 合并结果（去重）
     merged = {}  # url -> item
     
@@ -770,6 +674,9 @@ async def _fine_ranking(
         "irrelevant_content": 0,
     }
     
+    # 从数据库读出的向量：backfill_unit_embeddings.py 执行完之前不一定是单位向量，按余弦计算
+    stored_similarity = inner_product if STORED_EMBEDDINGS_NORMALIZED else cosine_similarity
+    
     for url, item in merged.items():
         # 如果缺少向量相似度，尝试计算
         if query_text_vec and item.get("text_embedding") and item["text_similarity"] == 0.0:
@@ -788,7 +695,7 @@ async def _fine_ranking(
                 if isinstance(text_vec, list) and len(text_vec) > 0:
                     item["text_similarity"] = max(
                         item["text_similarity"],
-                        cosine_similarity(query_text_vec, text_vec)
+                        stored_similarity(query_text_vec, text_vec)
                     )
             except Exception as e:
                 print(f"[Funnel] Error computing text similarity for {url}: {e}")
@@ -807,7 +714,7 @@ async def _fine_ranking(
                 if isinstance(image_vec, list) and len(image_vec) > 0:
                     item["image_similarity"] = max(
                         item["image_similarity"],
-                        cosine_similarity(query_image_vec, image_vec)
+                        stored_similarity(query_image_vec, image_vec)
                     )
             except Exception as e:
                 print(f"[Funnel] Error computing image similarity for {url}: {e}")
@@ -920,6 +827,7 @@ async def _fine_ranking(
     return results
 
 
+@db_route("read")
 async def search_with_funnel(
     user_id: Optional[str],
     query_text: str,
@@ -942,12 +850,22 @@ async def search_with_funnel(
         filter_mode: 过滤模式
         max_results: 最大返回数量
         use_caption: 是否使用 Caption 搜索
+        filter_urls: 只搜索这些 URL（Personal Space），在每一路召回 SQL 中过滤
+        filter_tab_ids: 只搜索这些 tab_id（Personal Space），在每一路召回 SQL 中过滤
     
     Returns:
         搜索结果列表（根据质量阈值动态返回，不限制数量）
     """
     print(f"[Funnel] Starting funnel search for query: {query_text[:50]}...")
     
+    # ✅ Personal Space 范围：下推到每一路召回 SQL，后续的意图检测、VL 审阅只处理范围内的候选
+    scope = build_search_scope(filter_urls, filter_tab_ids)
+    if scope is not None:
+        if not scope["urls"] and not scope["tab_ids"]:
+            print("[Funnel] ⚠️  Personal Space filter has no valid URLs / tab_ids, returning empty results")
+            return []
+        print(f"[Funnel] Personal Space scope: {len(scope['urls'])} URLs, {len(scope['tab_ids'])} tab_ids (pushed down to SQL)")
+    
     # ✅ 步骤 0: AI 增强查询（在搜索前就理解用户真实意图）
     enhanced_query = query_text
     ai_enhanced = False
@@ -991,14 +909,14 @@ async def search_with_funnel(
     # ✅ 优先级1: 图像向量搜索（有图像查询时）
     if query_image_url or query_image_base64:
         recall_tasks.append(_coarse_recall_image_vector(
-            user_id, query_image_url, query_image_base64, top_k=80
+            user_id, query_image_url, query_image_base64, top_k=80, scope=scope
         ))
     
     # ✅ 优先级1b: 文本→图像向量搜索（多模态文本搜图，始终开启）
     # 使用AI增强后的查询（如果可用）
     if search_query:
         recall_tasks.append(_coarse_recall_text_to_image_vector(
-            user_id, search_query, top_k=80  # ✅ 使用增强后的查询
+            user_id, search_query, top_k=80, scope=scope  # ✅ 使用增强后的查询
         ))
     
     # ✅ 检测是否是颜色查询
@@ -1010,30 +928,30 @@ async def search_with_funnel(
     if is_color_query:
         print(f"[Funnel] 🎨 Color query detected: {visual_attrs.get('colors')}, prioritizing visual attributes search")
         # ✅ 优先级1c: 视觉属性搜索（颜色查询时优先级最高）
-        recall_tasks.append(_coarse_recall_visual_attributes(user_id, search_query, top_k=100))  # ✅ 颜色查询时提高召回数量
+        recall_tasks.append(_coarse_recall_visual_attributes(user_id, search_query, top_k=100, scope=scope))  # ✅ 颜色查询时提高召回数量
     
     # ✅ 优先级2a: Caption Embedding 向量搜索（语义搜索，更智能）
     # 使用AI增强后的查询（如果可用）
     if use_caption and search_query:
-        recall_tasks.append(_coarse_recall_caption_embedding(user_id, search_query, top_k=60))  # ✅ 使用增强后的查询
+        recall_tasks.append(_coarse_recall_caption_embedding(user_id, search_query, top_k=60, scope=scope))  # ✅ 使用增强后的查询
     
     # ✅ 优先级2b: Caption 关键词搜索（全文搜索，作为补充）
     # 同时使用原始查询和增强查询，提高召回率
     if use_caption:
-        recall_tasks.append(_coarse_recall_caption_keyword(user_id, search_query, top_k=80))  # ✅ 使用增强后的查询
+        recall_tasks.append(_coarse_recall_caption_keyword(user_id, search_query, top_k=80, scope=scope))  # ✅ 使用增强后的查询
         # 如果AI增强成功，也尝试原始查询（可能包含更精确的关键词）
         if ai_enhanced and search_query != query_text:
-            recall_tasks.append(_coarse_recall_caption_keyword(user_id, query_text, top_k=40))  # 原始查询作为补充
+            recall_tasks.append(_coarse_recall_caption_keyword(user_id, query_text, top_k=40, scope=scope))  # 原始查询作为补充
     
     # ✅ 优先级3: 视觉属性搜索（非颜色查询时使用，颜色查询时已在上面处理）
     if not is_color_query:
-        recall_tasks.append(_coarse_recall_visual_attributes(user_id, search_query, top_k=50))  # ✅ 使用增强后的查询
+        recall_tasks.append(_coarse_recall_visual_attributes(user_id, search_query, top_k=50, scope=scope))  # ✅ 使用增强后的查询
     
     # ✅ 优先级4: 设计师网站专门召回（小红书、Pinterest、Behance等）
-    recall_tasks.append(_coarse_recall_designer_sites(user_id, search_query, top_k=100))  # ✅ 使用增强后的查询
+    recall_tasks.append(_coarse_recall_designer_sites(user_id, search_query, top_k=100, scope=scope))  # ✅ 使用增强后的查询
     
     # ✅ 优先级5: 文本向量搜索（最低优先级，作为补充）
-    recall_tasks.append(_coarse_recall_text_vector(user_id, search_query, top_k=80))  # ✅ 使用增强后的查询
+    recall_tasks.append(_coarse_recall_text_vector(user_id, search_query, top_k=80, scope=scope))  # ✅ 使用增强后的查询
     
     # 并发执行所有召回路径
     recall_results = await asyncio.gather(*recall_tasks, return_exceptions=True)
@@ -1048,8 +966,8 @@ async def search_with_funnel(
     
     print(f"[Funnel] Coarse recall: {len(all_candidates)} candidates (before filtering)")
     
-    # ✅ 修复：在粗召回阶段就过滤文档类内容（设计师场景）
-    from .preprocess import is_doc_like
+    # ✅ 文档类内容已在召回 SQL 中排除（is_doc 列），这里只对尚未回填的旧数据兜底
+    from .features import is_doc_item, normalize_title, normalize_url
     from .query_enhance import enhance_visual_query
     
     # 提取查询的视觉属性（颜色、物体、风格），用于标签匹配过滤
@@ -1069,21 +987,12 @@ async def search_with_funnel(
         url = item.get("url", "")
         title = (item.get("title") or item.get("tab_title") or "").strip()
         
-        # 1. 检查是否是文档类内容
-        is_doc = is_doc_like(item)
-        
-        # 检查metadata中的is_doc_card标记
-        metadata = item.get("metadata", {})
-        if isinstance(metadata, str):
-            import json
-            try:
-                metadata = json.loads(metadata)
-            except:
-                metadata = {}
-        
-        is_doc_card = metadata.get("is_doc_card", False) or item.get("is_doc_card", False)
+        # 1. 检查是否是文档类内容（is_doc 为 NULL 说明尚未回填，现场判断）
+        is_doc = item.get("is_doc")
+        if is_doc is None:
+            is_doc = is_doc_item(item)
         
-        if is_doc or is_doc_card:
+        if is_doc:
             doc_count += 1
             continue  # 跳过文档类内容
         
@@ -1280,38 +1189,17 @@ async def search_with_funnel(
                 tag_mismatch_count += 1
                 continue
         
-        # 3. 去重：基于 URL（标准化 URL，移除查询参数和锚点）
-        normalized_url = None
-        if url:
-            # 标准化 URL（移除查询参数、锚点、尾随斜杠）
-            try:
-                from urllib.parse import urlparse, urlunparse
-                parsed = urlparse(url)
-                normalized_url = urlunparse((
-                    parsed.scheme,
-                    parsed.netloc,
-                    parsed.path.rstrip('/'),
-                    '',  # params
-                    '',  # query - 移除查询参数
-                    ''   # fragment - 移除锚点
-                )).lower()
-            except:
-                normalized_url = url.lower()
-            
+        # 3. 去重：基于入库时计算的 normalized_url（移除查询参数和锚点）
+        normalized_url = item.get("normalized_url") or normalize_url(url)
+        if normalized_url:
             if normalized_url in seen_urls:
                 continue  # 跳过重复的 URL
             
             seen_urls.add(normalized_url)
         
-        # 4. 去重：基于标题相似度（过滤重复的周会记录、工作台、小红书主页等）
-        if title:
-            # 标准化标题用于比较（移除特殊字符、空格、数字ID等）
-            import re
-            # 移除数字ID（如 _-1451008, _73823749, _45390241 等）
-            title_clean = re.sub(r'[_-]\d+', '', title)
-            # 移除特殊字符，只保留字母、数字、中文、空格、连字符
-            normalized_title = "".join(c for c in title_clean if c.isalnum() or c in (' ', '-', '_', '，', '。')).strip().lower()
-            
+        # 4. 去重：基于入库时计算的 normalized_title（过滤重复的周会记录、工作台、小红书主页等）
+        normalized_title = item.get("normalized_title") or normalize_title(title)
+        if normalized_title:
             # 特殊处理：小红书主页等通用标题（如"小红书_-_你的生活兴趣社区"）
             # 如果标题是通用标题且URL已存在，跳过
             generic_titles = [
@@ -1396,56 +1284,5 @@ async def search_with_funnel(
     
     print(f"[Funnel] Final results: {len(filtered_results)} items")
     
-    # ✅ 新增：如果提供了 filter_urls 或 filter_tab_ids，只返回 Personal Space 中的结果
-    if filter_urls or filter_tab_ids:
-        original_count = len(filtered_results)
-        filter_urls_set = set(filter_urls or [])
-        filter_tab_ids_set = set(filter_tab_ids or [])
-        
-        # 规范化 URL（移除尾随斜杠和查询参数）
-        def normalize_url_for_filter(url: str) -> str:
-            if not url:
-                return ""
-            try:
-                from urllib.parse import urlparse
-                parsed = urlparse(url)
-                normalized = f"{parsed.scheme}://{parsed.netloc}{parsed.path.rstrip('/')}"
-                return normalized
-            except:
-                return url
-        
-        # 创建规范化 URL 集合
-        normalized_filter_urls = set()
-        for url in filter_urls_set:
-            normalized_filter_urls.add(url)
-            normalized = normalize_url_for_filter(url)
-            if normalized:
-                normalized_filter_urls.add(normalized)
-        
-        filtered_by_personal_space = []
-        for item in filtered_results:
-            # 优先使用 tab_id 匹配
-            if filter_tab_ids_set and item.get("tab_id"):
-                if str(item.get("tab_id")) in filter_tab_ids_set:
-                    filtered_by_personal_space.append(item)
-                    continue
-            
-            # 使用 URL 匹配
-            item_url = item.get("url", "")
-            if item_url:
-                if item_url in filter_urls_set or item_url in normalized_filter_urls:
-                    filtered_by_personal_space.append(item)
-                    continue
-                # 尝试规范化 URL 匹配
-                normalized_item_url = normalize_url_for_filter(item_url)
-                if normalized_item_url in normalized_filter_urls:
-                    filtered_by_personal_space.append(item)
-                    continue
-        
-        filtered_results = filtered_by_personal_space
-        removed_count = original_count - len(filtered_results)
-        if removed_count > 0:
-            print(f"[Funnel] ✅ Filtered by Personal Space: {removed_count} items removed, {len(filtered_results)} items remain")
-    
     return filtered_results
 
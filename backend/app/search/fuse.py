@@ -86,6 +86,18 @@ def fuse_similarity_scores(
     return wt * text_sim + wi * image_sim
 
 
+def inner_product(a: List[float], b: List[float]) -> float:
+    """
+    单位向量的相似度（= 余弦相似度，不计算范数）
+    
+    入库的 embedding（search/normalize.normalize_opengraph_items）和 embed_* 返回的向量都是单位向量；
+    来源不确定的向量先用 normalize_embeddings 批量归一化，或使用 cosine_similarity
+    """
+    if len(a) != len(b):
+        return 0.0
+    return float(np.dot(np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)))
+
+
 def cosine_similarity(a: List[float], b: List[float], verbose: bool = False) -> float:
     """
     计算两个向量的余弦相似度
@@ -4,8 +4,72 @@ OpenGraph 数据规范化模块
 """
 from typing import Dict, List, Optional, Any, Union
 
+import numpy as np
+
+# 入库时归一化为单位向量的 embedding 列（归一化后余弦相似度 = 内积）
+EMBEDDING_FIELDS = ["text_embedding", "image_embedding", "caption_embedding"]
+EMBEDDING_DIM = 1024
+
+
+def normalize_embeddings(
+    vectors: List[Optional[List[float]]],
+    dim: int = EMBEDDING_DIM,
+) -> List[Optional[List[float]]]:
+    """
+    批量校验并归一化 embedding（一次矩阵运算，不逐个计算范数）
+
+    维度不对、包含 NaN / Inf、或范数为 0 的向量无法参与相似度计算，返回 None
+
+    Args:
+        vectors: 向量列表（元素可以为 None）
+        dim: 期望维度
+
+    Returns:
+        与输入等长的列表：合法向量为单位向量，其他为 None
+    """
+    results: List[Optional[List[float]]] = [None] * len(vectors)
+    positions = [i for i, vec in enumerate(vectors) if vec is not None and len(vec) == dim]
+    if not positions:
+        return results
+
+    try:
+        matrix = np.asarray([vectors[i] for i in positions], dtype=np.float64)
+    except (ValueError, TypeError):
+        # 包含非数字元素：逐个转换，无法转换的记为 NaN（下面会被拒绝）
+        matrix = np.full((len(positions), dim), np.nan)
+        for row, i in enumerate(positions):
+            try:
+                matrix[row] = np.asarray(vectors[i], dtype=np.float64)
+            except (ValueError, TypeError):
+                pass
+
+    norms = np.linalg.norm(matrix, axis=1)
+    valid = np.isfinite(matrix).all(axis=1) & np.isfinite(norms) & (norms > 0)
+    unit = matrix[valid] / norms[valid][:, None]
+    for row, vec in zip(np.flatnonzero(valid), unit):
+        results[positions[row]] = vec.tolist()
+
+    rejected = sum(1 for vec in vectors if vec is not None) - int(valid.sum())
+    if rejected:
+        print(f"[Normalize] Rejected {rejected} invalid embeddings (wrong dims / NaN / zero vector)")
+    return results
+
+
+def normalize_embedding(vec: Optional[List[float]], dim: int = EMBEDDING_DIM) -> Optional[List[float]]:
+    """单个向量的 normalize_embeddings"""
+    if vec is None:
+        return None
+    return normalize_embeddings([vec], dim)[0]
+
 
 def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    规范化单个 OpenGraph 项，确保所有字段类型正确（字段规则见 _normalize_opengraph_item_fields）
+    """
+    return _normalize_item_embeddings([_normalize_opengraph_item_fields(item)])[0]
+
+
+def _normalize_opengraph_item_fields(item: Dict[str, Any]) -> Dict[str, Any]:
     """
     规范化单个 OpenGraph 项，确保所有字段类型正确
     
@@ -17,8 +81,8 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     - site_name: str | None
     - tab_id: int | None
     - tab_title: str | None
-    - text_embedding: List[float] | None (1024维)
-    - image_embedding: List[float] | None (1024维)
+    - text_embedding: List[float] | None (1024维单位向量)
+    - image_embedding: List[float] | None (1024维单位向量)
     - metadata: Dict | None
     - is_doc_card: bool
     - is_screenshot: bool
@@ -28,12 +92,15 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     - 将 undefined/None 转换为 None
     - 将数组转换为字符串（对于 image 字段）
     - 确保字符串字段不是数组
-    - 验证向量维度
+    - 验证向量维度（维度不对、NaN、零向量的 embedding 在归一化时置为 None）
+    - content_hash：在规范化之前按原始字段计算（规则见 features.compute_content_hash），
+      已经带有 content_hash 的项（例如 batch_upsert_items 再次规范化）保留原值
     """
     if not item or not isinstance(item, dict):
         raise ValueError("Item must be a non-empty dictionary")
     
-    normalized = {}
+    from .features import compute_content_hash
+    normalized = {"content_hash": item.get("content_hash") or compute_content_hash(item)}
     
     # 1. url (required, string)
     url = item.get("url")
@@ -87,31 +154,18 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     tab_title = item.get("tab_title")
     normalized["tab_title"] = str(tab_title).strip() if tab_title else None
     
-    # 8. text_embedding (List[float] | None)
-    text_embedding = item.get("text_embedding")
-    if text_embedding and isinstance(text_embedding, list) and len(text_embedding) > 0:
-        try:
-            # 验证是数字列表
-            normalized["text_embedding"] = [float(x) for x in text_embedding]
-            # 验证维度（应该是1024）
-            if len(normalized["text_embedding"]) != 1024:
-                print(f"[Normalize] Warning: text_embedding has {len(normalized['text_embedding'])} dims, expected 1024")
-        except (ValueError, TypeError):
-            normalized["text_embedding"] = None
-    else:
-        normalized["text_embedding"] = None
-    
-    # 9. image_embedding (List[float] | None)
-    image_embedding = item.get("image_embedding")
-    if image_embedding and isinstance(image_embedding, list) and len(image_embedding) > 0:
-        try:
-            normalized["image_embedding"] = [float(x) for x in image_embedding]
-            if len(normalized["image_embedding"]) != 1024:
-                print(f"[Normalize] Warning: image_embedding has {len(normalized['image_embedding'])} dims, expected 1024")
-        except (ValueError, TypeError):
-            normalized["image_embedding"] = None
-    else:
-        normalized["image_embedding"] = None
+    # 8-9. text_embedding / image_embedding (List[float] | None)
+    # 原样保留列表，由 _normalize_item_embeddings 统一校验并归一化为单位向量。
+    # 行为变化：维度不对的向量现在置为 None，其余字段照常写入
+    # （之前只警告、原样保留，写入 vector(1024) 列时整条 upsert 失败）
+    for field in ("text_embedding", "image_embedding"):
+        embedding = item.get(field)
+        if embedding and isinstance(embedding, list) and len(embedding) > 0:
+            if len(embedding) != EMBEDDING_DIM:
+                print(f"[Normalize] Warning: {field} has {len(embedding)} dims, expected {EMBEDDING_DIM}; dropping it")
+            normalized[field] = embedding
+        else:
+            normalized[field] = None
     
     # 10. metadata (Dict | None)
     metadata = item.get("metadata")
@@ -141,19 +195,35 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     return normalized
 
 
+def _normalize_item_embeddings(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    把 items 中的 embedding 列（按列批量）归一化为单位向量，非法向量置为 None
+    
+    入库的向量都是单位向量，相似度计算可以直接用内积代替余弦（见 vector_db.VECTOR_DISTANCE_MEASURE）
+    """
+    for field in EMBEDDING_FIELDS:
+        if any(item.get(field) is not None for item in items):
+            for item, vec in zip(items, normalize_embeddings([item.get(field) for item in items])):
+                if field in item or vec is not None:
+                    item[field] = vec
+    return items
+
+
 def normalize_opengraph_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     批量规范化 OpenGraph 项列表
+    
+    embedding 的校验和归一化对整批数据按列一次完成
     """
     normalized = []
     for item in items:
         try:
-            normalized.append(normalize_opengraph_item(item))
+            normalized.append(_normalize_opengraph_item_fields(item))
         except Exception as e:
             print(f"[Normalize] Failed to normalize item: {e}")
             # 跳过无效项，继续处理其他项
             continue
-    return normalized
+    return _normalize_item_embeddings(normalized)
 
 
 
@@ -5,8 +5,9 @@
 from __future__ import annotations
 
 from typing import List, Dict, Tuple
-from .fuse import cosine_similarity, fuse_similarity_scores
-from .config import DEFAULT_WEIGHTS, IMAGE_FOCUSED_WEIGHTS, DOC_FOCUSED_WEIGHTS
+from .fuse import inner_product, fuse_similarity_scores
+from .normalize import normalize_embedding, normalize_embeddings
+from .config import DEFAULT_WEIGHTS, IMAGE_FOCUSED_WEIGHTS, DOC_FOCUSED_WEIGHTS, STORED_EMBEDDINGS_NORMALIZED
 
 
 def fuzzy_score(query: str, title: str, description: str) -> float:
@@ -81,6 +82,25 @@ def sort_by_vector_similarity(
     
     print(f"[Rank] Computing similarity for {len(docs)} documents (same vector space, direct comparison)")
     
+    # 查询向量归一化一次，之后相似度 = 内积
+    query_unit = normalize_embedding(query_vec, dim=len(query_vec))
+    if query_unit is None:
+        print("[Rank] Warning: query_vec is invalid (NaN or zero vector)")
+        for d in docs:
+            d["similarity"] = 0.0
+        return docs
+    
+    def _list_or_none(value):
+        return value if isinstance(value, list) and len(value) > 0 else None
+    
+    text_units = [_list_or_none(d.get("text_embedding")) for d in docs]
+    image_units = [_list_or_none(d.get("image_embedding")) for d in docs]
+    if not STORED_EMBEDDINGS_NORMALIZED:
+        # 旧数据还没有回填为单位向量：文档向量按列批量归一化（维度不对 / NaN / 零向量置为 None）；
+        # 回填完成后文档向量直接使用（维度不同时 inner_product 返回 0）
+        text_units = normalize_embeddings(text_units, dim=len(query_vec))
+        image_units = normalize_embeddings(image_units, dim=len(query_vec))
+    
     for idx, d in enumerate(docs):
         text_emb = d.get("text_embedding")
         image_emb = d.get("image_embedding")
@@ -95,14 +115,12 @@ def sort_by_vector_similarity(
         image_sim = 0.0
         
         # 计算文本相似度（同一向量空间，直接比较）
-        if text_emb and isinstance(text_emb, list) and len(text_emb) > 0:
-            verbose = idx == 0
-            text_sim = cosine_similarity(query_vec, text_emb, verbose=verbose)
+        if text_units[idx] is not None:
+            text_sim = inner_product(query_unit, text_units[idx])
         
         # 计算图像相似度（同一向量空间，直接比较）
-        if image_emb and isinstance(image_emb, list) and len(image_emb) > 0:
-            verbose = idx == 0
-            image_sim = cosine_similarity(query_vec, image_emb, verbose=verbose)
+        if image_units[idx] is not None:
+            image_sim = inner_product(query_unit, image_units[idx])
         
         # 选择权重（自适应或使用传入的权重）
         if weights is None:
@@ -7,7 +7,7 @@ AI监督筛选模块
 from typing import List, Dict, Optional
 from .threshold_filter import FilterMode, filter_by_threshold, QUALITY_THRESHOLDS
 from .query_enhance import enhance_visual_query
-from .preprocess import is_doc_like
+from .features import extract_host, site_domain_for_host, is_designer_item, is_doc_item
 
 
 def detect_query_intent(query: str) -> Dict[str, any]:
@@ -209,22 +209,16 @@ def smart_filter_by_visual_attributes(
 def is_designer_site(item: Dict) -> bool:
     """
     判断是否是设计师相关网站
-    """
-    url = (item.get("url") or "").lower()
-    site_name = (item.get("site_name") or "").lower()
-    
-    # 设计师网站列表（扩展）
-    designer_sites = [
-        "pinterest", "behance", "dribbble", "xiaohongshu", "小红书",
-        "站酷", "zcool", "ui.cn", "uisdc", "优设", "youzhan",
-        "unsplash", "pexels", "pixabay", "freepik", "shutterstock",
-        "getty", "deviantart", "artstation", "500px", "flickr",
-        "imgur", "tumblr", "arena", "muzli", "designspiration",
-        "awwwards", "siteinspire", "land-book", "onepagelove",
-        "collectui", "mobbin", "pageflows", "saaslandingpage",
-    ]
     
-    return any(site in url or site in site_name for site in designer_sites)
+    优先使用入库时计算的 is_designer_site / site_domain 列（召回 SQL 已返回），
+    只有旧数据缺少这些列时才解析 URL
+    """
+    if item.get("is_designer_site") is not None:
+        return item["is_designer_site"]
+    site_domain = item.get("site_domain")
+    if not site_domain:
+        site_domain = site_domain_for_host(extract_host(item.get("url")))
+    return is_designer_item(site_domain, item.get("site_name"))
 
 
 def boost_designer_sites(results: List[Dict], boost_factor: float = 0.15) -> List[Dict]:
@@ -282,21 +276,12 @@ def filter_doc_items(results: List[Dict], filter_docs: bool = True) -> List[Dict
     doc_count = 0
     
     for item in results:
-        # 检查是否是文档类内容
-        is_doc = is_doc_like(item)
-        
-        # 检查metadata中的is_doc_card标记
-        metadata = item.get("metadata", {})
-        if isinstance(metadata, str):
-            import json
-            try:
-                metadata = json.loads(metadata)
-            except:
-                metadata = {}
-        
-        is_doc_card = metadata.get("is_doc_card", False) or item.get("is_doc_card", False)
+        # 优先使用入库时计算的 is_doc 列，旧数据（未回填）才现场判断
+        is_doc = item.get("is_doc")
+        if is_doc is None:
+            is_doc = is_doc_item(item)
         
-        if is_doc or is_doc_card:
+        if is_doc:
             doc_count += 1
             item["filtered_reason"] = "doc_content"  # 标记过滤原因
             continue  # 跳过文档类内容
@@ -0,0 +1,625 @@
+"""
+本地 SQLite 向量存储（VECTOR_STORE_BACKEND=sqlite）
+
+不依赖 AnalyticDB，用于在笔记本上跑完整服务、离线测试和压测：
+- 数据存放在一个 SQLite 文件中（SQLITE_VECTOR_DB_PATH，默认 ./local_vectors.db）
+- embedding 以 float32 BLOB 存储，数组 / JSON 列以 JSON 文本存储
+- 向量搜索为 numpy 暴力检索：按用户加载为矩阵（复用 vector_cache.UserVectorIndex），写入时失效；
+  VECTOR_CACHE_QUANTIZATION=int8 时同样在 int8 矩阵上粗召回，再读取候选的 float 向量重排
+- 派生列、URL 标准化、行指纹与 ADBPG 后端一致，搜索结果字段也一致
+
+只实现 VectorStore 接口；设计师网站 / 视觉属性召回依赖 ADBPG 的数组索引，截图二进制只存储在 ADBPG 中，
+本地后端都不提供
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_cache import MODALITY_COLUMNS, UserVectorIndex, search_index
+
+SQLITE_VECTOR_DB_PATH = os.getenv("SQLITE_VECTOR_DB_PATH", "local_vectors.db")
+TABLE = "opengraph_items"
+
+# 以 JSON 文本存储的列（读出时解析）
+JSON_COLUMNS = ["metadata", "dominant_colors", "style_tags", "object_tags", "caption_tokens"]
+# 以 float32 BLOB 存储的列
+VECTOR_COLUMNS = list(MODALITY_COLUMNS.values())
+# 以 0/1 存储的布尔列
+BOOL_COLUMNS = ["is_doc", "is_designer_site"]
+
+# 搜索 / 查询返回的列（不包含 row_fingerprint 等内部列）
+RESULT_COLUMNS = [
+    "user_id", "url", "title", "description", "image", "site_name",
+    "site_domain", "is_doc", "is_designer_site", "normalized_title", "normalized_url",
+    "tab_id", "tab_title", "text_embedding", "image_embedding", "metadata",
+    "image_caption", "caption_embedding", "dominant_colors", "style_tags", "object_tags",
+    "caption_tokens", "content_hash", "session_id", "status", "created_at", "updated_at",
+]
+# 列表 / 增量同步可以返回的列（vector_db.LISTABLE_COLUMNS 中本地存在的列，没有截图列）
+LISTABLE_COLUMNS = RESULT_COLUMNS + ["deleted_at"]
+
+# 与 vector_db.LIST_SORT_KEY 相同：updated_at 为 NULL 的旧数据回退到 created_at
+LIST_SORT_KEY = "COALESCE(updated_at, created_at, '1970-01-01 00:00:00')"
+
+
+def _vector_blob(vec: Optional[List[float]]) -> Optional[bytes]:
+    if not vec:
+        return None
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+
+def _json_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _row_to_dict(row: sqlite3.Row, columns: Optional[List[str]] = None) -> Dict:
+    item = {}
+    for column in columns or row.keys():
+        value = row[column]
+        if value is not None:
+            if column in VECTOR_COLUMNS:
+                value = np.frombuffer(value, dtype=np.float32).tolist()
+            elif column in JSON_COLUMNS:
+                value = json.loads(value)
+            elif column in BOOL_COLUMNS:
+                value = bool(value)
+        item[column] = value
+    return item
+
+
+def _list_columns(fields: Optional[List[str]], default: List[str]) -> List[str]:
+    """列表 / 增量同步的返回列（游标依赖 url 和 updated_at，总是返回）"""
+    from vector_db import LISTABLE_COLUMNS as ADBPG_LISTABLE_COLUMNS
+    columns = [f for f in (fields or default) if f in ADBPG_LISTABLE_COLUMNS and f in LISTABLE_COLUMNS]
+    for required in ("url", "updated_at"):
+        if required not in columns:
+            columns.append(required)
+    return columns
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    """解析 vector_db 格式的游标，时间转为 SQLite 的 TEXT 时间格式（'YYYY-MM-DD HH:MM:SS'）"""
+    from vector_db import decode_list_cursor
+    sort_key, url = decode_list_cursor(cursor)
+    return sort_key.isoformat(sep=" "), url
+
+
+def _encode_cursor(sort_key: str, url: str) -> str:
+    from vector_db import encode_list_cursor
+    return encode_list_cursor(datetime.fromisoformat(sort_key), url)
+
+
+def _session_clause() -> str:
+    """同 vector_db._session_clause：session_id 为 NULL 的旧数据回退到 metadata.session_id（两个参数）"""
+    return "(session_id = ? OR (session_id IS NULL AND json_extract(metadata, '$.session_id') = ?))"
+
+
+def _in_scope(item: Dict, scope: Optional[Dict[str, List]]) -> bool:
+    if scope is None:
+        return True
+    return item.get("url") in set(scope.get("urls") or []) or item.get("tab_id") in set(scope.get("tab_ids") or [])
+
+
+class SQLiteVectorStore:
+    """SQLite + numpy 暴力检索后端（单文件、单进程）"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_VECTOR_DB_PATH):
+        self.path = path
+        # sqlite3 连接不是线程安全的，所有操作在线程池中串行执行
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._init_schema()
+        # user_id -> UserVectorIndex（写入 / 删除时失效）
+        self._indexes: Dict[str, UserVectorIndex] = {}
+        # 加载期间发生的失效（同 vector_cache：加载完成后不缓存旧数据）
+        self._generation: Dict[str, int] = {}
+        print(f"[SQLiteVectorStore] Using {os.path.abspath(path)}")
+
+    def _init_schema(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {TABLE} (
+                    user_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    description TEXT,
+                    image TEXT,
+                    site_name TEXT,
+                    tab_id INTEGER,
+                    tab_title TEXT,
+                    text_embedding BLOB,
+                    image_embedding BLOB,
+                    metadata TEXT,
+                    image_caption TEXT,
+                    caption_embedding BLOB,
+                    dominant_colors TEXT,
+                    style_tags TEXT,
+                    object_tags TEXT,
+                    host TEXT,
+                    site_domain TEXT,
+                    caption_tokens TEXT,
+                    is_doc INTEGER,
+                    is_designer_site INTEGER,
+                    normalized_title TEXT,
+                    normalized_url TEXT,
+                    caption_hash TEXT,
+                    image_hash TEXT,
+                    session_id TEXT,
+                    content_hash TEXT,
+                    row_fingerprint TEXT,
+                    status TEXT NOT NULL DEFAULT 'active',
+                    deleted_at TEXT,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, url)
+                );
+            """)
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_user_status ON {TABLE} (user_id, status);")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_caption_hash ON {TABLE} (user_id, caption_hash);")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_image_hash ON {TABLE} (user_id, image_hash);")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_session ON {TABLE} (user_id, session_id);")
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_list_key ON {TABLE} (user_id, {LIST_SORT_KEY}, url);"
+            )
+
+    def _invalidate(self, user_id: str) -> None:
+        self._indexes.pop(user_id, None)
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    async def _run(self, func, *args):
+        def locked():
+            with self._lock:
+                return func(*args)
+        return await asyncio.to_thread(locked)
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def _upsert_sync(self, user_id: str, item: Dict) -> Optional[bool]:
+        """返回 True（写入）/ False（指纹一致跳过）/ None（失败）"""
+        from search.features import FEATURE_COLUMNS, compute_item_features
+        from search.normalize import EMBEDDING_FIELDS, normalize_embeddings
+        from vector_db import _normalize_url_for_storage, _row_fingerprint
+
+        url = item.get("url")
+        normalized_url = _normalize_url_for_storage(url)
+        if not normalized_url:
+            return None
+        # 与 ADBPG 一致：向量存为单位向量，非法向量置为 None
+        item = {**item, **dict(zip(EMBEDDING_FIELDS, normalize_embeddings([item.get(f) for f in EMBEDDING_FIELDS])))}
+
+        metadata_json = json.dumps(item.get("metadata") or {})
+        features = compute_item_features({**item, "url": normalized_url, "metadata": item.get("metadata")})
+        feature_values = [features[col] for col in FEATURE_COLUMNS]
+        row_fingerprint = _row_fingerprint(
+            item.get("title"), item.get("description"), item.get("image"), item.get("site_name"),
+            item.get("tab_id"), item.get("tab_title"), metadata_json,
+            item.get("text_embedding"), item.get("image_embedding"),
+            item.get("image_caption"), item.get("caption_embedding"),
+            item.get("dominant_colors"), item.get("style_tags"), item.get("object_tags"), feature_values,
+        )
+
+        columns = [
+            "user_id", "url", "title", "description", "image", "site_name", "tab_id", "tab_title",
+            "text_embedding", "image_embedding", "metadata",
+            "image_caption", "caption_embedding", "dominant_colors", "style_tags", "object_tags",
+            *FEATURE_COLUMNS, "row_fingerprint",
+        ]
+        values = [
+            user_id, normalized_url, item.get("title"), item.get("description"), item.get("image"),
+            item.get("site_name"), item.get("tab_id"), item.get("tab_title"),
+            _vector_blob(item.get("text_embedding")), _vector_blob(item.get("image_embedding")), metadata_json,
+            item.get("image_caption"), _vector_blob(item.get("caption_embedding")),
+            _json_text(item.get("dominant_colors")), _json_text(item.get("style_tags")),
+            _json_text(item.get("object_tags")),
+            *[_json_text(features[col]) if col in JSON_COLUMNS else features[col] for col in FEATURE_COLUMNS],
+            row_fingerprint,
+        ]
+        updates = ",\n".join(f"{col} = excluded.{col}" for col in columns[2:])
+        with self._conn:
+            cursor = self._conn.execute(f"""
+                INSERT INTO {TABLE} ({", ".join(columns)}, status, updated_at)
+                VALUES ({", ".join("?" for _ in columns)}, 'active', CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id, url) DO UPDATE SET
+                    {updates},
+                    status = 'active',
+                    deleted_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE {TABLE}.row_fingerprint IS NOT excluded.row_fingerprint
+                   OR {TABLE}.status <> 'active';
+            """, values)
+        written = cursor.rowcount > 0
+        if written:
+            self._invalidate(user_id)
+        return written
+
+    async def upsert_item(self, user_id: Optional[str], item: Dict, stats: Optional[Dict[str, int]] = None) -> bool:
+        from vector_db import _normalize_user_id
+        user_id = _normalize_user_id(user_id)
+        try:
+            written = await self._run(self._upsert_sync, user_id, item)
+        except Exception as e:
+            print(f"[SQLiteVectorStore] Error upserting item {str(item.get('url'))[:50]}...: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        if written is None:
+            return False
+        if stats is not None:
+            key = "written" if written else "skipped"
+            stats[key] = stats.get(key, 0) + 1
+        return True
+
+    def _existing_hashes_sync(self, user_id: str, column: str, hashes: List[str]) -> set:
+        rows = self._conn.execute(f"""
+            SELECT DISTINCT {column} FROM {TABLE}
+            WHERE user_id = ? AND status = 'active' AND {column} IN (SELECT value FROM json_each(?));
+        """, (user_id, json.dumps(hashes))).fetchall()
+        return {row[0] for row in rows}
+
+    async def batch_upsert_items(
+        self,
+        items: List[Dict],
+        user_id: Optional[str],
+        batch_size: int = 20,
+        stats: Optional[Dict[str, int]] = None,
+    ) -> int:
+        """与 vector_db.batch_upsert_items 相同的过滤规则（文档类内容、重复 caption / image）"""
+        if not items:
+            return 0
+
+        from search.normalize import normalize_opengraph_items
+        from search.preprocess import is_doc_like
+        from search.features import caption_hash as compute_caption_hash, image_hash as compute_image_hash
+        from vector_db import _normalize_user_id
+
+        normalized_user = _normalize_user_id(user_id)
+        candidates = [item for item in normalize_opengraph_items(items) if not is_doc_like(item)]
+        if not candidates:
+            return 0
+
+        def caption_of(item: Dict) -> Optional[str]:
+            return item.get("image_caption") or (item.get("metadata") or {}).get("caption")
+
+        caption_keys = [key for key in (compute_caption_hash(caption_of(item)) for item in candidates) if key]
+        image_keys = [key for key in (compute_image_hash(item.get("image")) for item in candidates) if key]
+        existing_captions = await self._run(self._existing_hashes_sync, normalized_user, "caption_hash", caption_keys)
+        existing_images = await self._run(self._existing_hashes_sync, normalized_user, "image_hash", image_keys)
+
+        final_items = [
+            item for item in candidates
+            if compute_caption_hash(caption_of(item)) not in existing_captions
+            and compute_image_hash(item.get("image")) not in existing_images
+        ]
+        if len(final_items) < len(candidates):
+            print(f"[SQLiteVectorStore] 🚫 过滤重复 Caption / Image: {len(candidates) - len(final_items)} 项")
+
+        success_count = 0
+        for item in final_items:
+            if await self.upsert_item(normalized_user, item, stats=stats):
+                success_count += 1
+        print(f"[SQLiteVectorStore] ✅ Batch upsert: {success_count}/{len(items)} items")
+        return success_count
+
+    async def soft_delete_tab(self, user_id: Optional[str], url: str) -> bool:
+        from vector_db import _normalize_user_id, _normalize_url_for_storage
+        user_id = _normalize_user_id(user_id)
+
+        def delete() -> int:
+            with self._conn:
+                return self._conn.execute(f"""
+                    UPDATE {TABLE}
+                    SET status = 'deleted', deleted_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = ? AND url = ? AND status = 'active';
+                """, (user_id, _normalize_url_for_storage(url))).rowcount
+
+        deleted = await self._run(delete) > 0
+        if deleted:
+            self._invalidate(user_id)
+        return deleted
+
+    async def batch_set_tabs_status(
+        self,
+        user_id: Optional[str],
+        status: str,
+        urls: Optional[List[str]] = None,
+        tab_ids: Optional[List[str]] = None,
+    ) -> Dict[str, List[Dict]]:
+        """同 vector_db.batch_set_tabs_status（一次集合 UPDATE，结果格式一致）"""
+        if status not in ("deleted", "active"):
+            raise ValueError(f"Invalid status: {status}")
+        from vector_db import _batch_status_outcome, _normalize_user_id, build_search_scope
+
+        user_id = _normalize_user_id(user_id)
+        urls = [str(u).strip() for u in (urls or []) if u and str(u).strip()]
+        tab_ids = [str(t).strip() for t in (tab_ids or []) if t is not None and str(t).strip()]
+        outcome = {"updated": 0, "urls": [], "tab_ids": []}
+
+        scope = build_search_scope(urls, tab_ids)
+        matched = []
+        if scope and (scope["urls"] or scope["tab_ids"]):
+            scope_sql = "(url IN (SELECT value FROM json_each(?)) OR tab_id IN (SELECT value FROM json_each(?)))"
+            scope_params = (json.dumps(scope["urls"]), json.dumps(scope["tab_ids"]))
+
+            def update():
+                with self._conn:
+                    updated_rows = self._conn.execute(f"""
+                        UPDATE {TABLE}
+                        SET status = ?,
+                            deleted_at = CASE WHEN ? = 'deleted' THEN CURRENT_TIMESTAMP ELSE NULL END,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE user_id = ? AND status <> ? AND {scope_sql}
+                        RETURNING url, tab_id;
+                    """, (status, status, user_id, status, *scope_params)).fetchall()
+                    unchanged_rows = self._conn.execute(f"""
+                        SELECT url, tab_id FROM {TABLE}
+                        WHERE user_id = ? AND status = ? AND {scope_sql};
+                    """, (user_id, status, *scope_params)).fetchall()
+                return updated_rows, unchanged_rows
+
+            updated_rows, unchanged_rows = await self._run(update)
+            outcome["updated"] = len(updated_rows)
+            if updated_rows:
+                self._invalidate(user_id)
+            updated_keys = {(row["url"], row["tab_id"]) for row in updated_rows}
+            matched = [(row["url"], row["tab_id"], True) for row in updated_rows]
+            matched += [
+                (row["url"], row["tab_id"], False)
+                for row in unchanged_rows
+                if (row["url"], row["tab_id"]) not in updated_keys
+            ]
+
+        return _batch_status_outcome(outcome, urls, tab_ids, matched)
+
+    async def soft_delete_session_tabs(self, user_id: Optional[str], session_id: str) -> int:
+        from vector_db import _normalize_user_id
+        user_id = _normalize_user_id(user_id)
+
+        def delete() -> int:
+            with self._conn:
+                return self._conn.execute(f"""
+                    UPDATE {TABLE}
+                    SET status = 'deleted', deleted_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = ? AND {_session_clause()} AND status = 'active';
+                """, (user_id, session_id, session_id)).rowcount
+
+        try:
+            count = await self._run(delete)
+        except Exception as e:
+            print(f"[SQLiteVectorStore] Error soft deleting session {session_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            return 0
+        if count:
+            self._invalidate(user_id)
+        return count
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    async def get_items_by_urls(
+        self,
+        user_id: Optional[str],
+        urls: List[str],
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        if not urls:
+            return []
+        from vector_db import _normalize_user_id
+        columns = [col for col in (fields or RESULT_COLUMNS) if col in RESULT_COLUMNS] or ["url"]
+
+        def fetch() -> List[Dict]:
+            rows = self._conn.execute(f"""
+                SELECT {", ".join(columns)} FROM {TABLE}
+                WHERE user_id = ? AND status = 'active' AND url IN (SELECT value FROM json_each(?));
+            """, (_normalize_user_id(user_id), json.dumps(list(dict.fromkeys(urls))))).fetchall()
+            return [_row_to_dict(row) for row in rows]
+
+        return await self._run(fetch)
+
+    async def find_items_needing_upload(self, user_id: Optional[str], items: List[Dict]) -> Tuple[List[str], List[str]]:
+        """同 vector_db.find_items_needing_upload"""
+        from vector_db import _normalize_user_id, _normalize_url_for_storage
+        user_id = _normalize_user_id(user_id)
+        pairs = []
+        for item in items:
+            url = (item.get("url") or "").strip()
+            if url:
+                pairs.append((url, _normalize_url_for_storage(url), item.get("content_hash")))
+        if not pairs:
+            return [], []
+
+        def fetch():
+            return self._conn.execute(f"""
+                SELECT url, content_hash, status,
+                       (text_embedding IS NOT NULL AND image_embedding IS NOT NULL) AS has_embeddings
+                FROM {TABLE}
+                WHERE user_id = ? AND url IN (SELECT value FROM json_each(?));
+            """, (user_id, json.dumps(list({normalized for _, normalized, _ in pairs})))).fetchall()
+
+        stored = {row["url"]: row for row in await self._run(fetch)}
+        needed, unchanged = [], []
+        for url, normalized, client_hash in pairs:
+            row = stored.get(normalized)
+            if (
+                row is not None
+                and client_hash
+                and row["status"] == "active"
+                and row["has_embeddings"]
+                and row["content_hash"] == client_hash
+            ):
+                unchanged.append(url)
+            else:
+                needed.append(url)
+        return needed, unchanged
+
+    async def list_user_items(
+        self,
+        user_id: Optional[str],
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        fields: Optional[List[str]] = None,
+    ) -> Dict:
+        """同 vector_db.list_user_items：按 (LIST_SORT_KEY, url) 倒序 keyset 分页，游标格式一致"""
+        from vector_db import DEFAULT_LIST_COLUMNS, _normalize_user_id
+        user_id = _normalize_user_id(user_id)
+        columns = _list_columns(fields, DEFAULT_LIST_COLUMNS)
+        params = [user_id]
+        cursor_sql = ""
+        if cursor:
+            params.extend(_decode_cursor(cursor))
+            cursor_sql = f" AND ({LIST_SORT_KEY}, url) < (?, ?)"
+        params.append(limit + 1)
+
+        def fetch():
+            return self._conn.execute(f"""
+                SELECT {", ".join(columns)}, {LIST_SORT_KEY} AS list_sort_key
+                FROM {TABLE}
+                WHERE user_id = ? AND status = 'active'{cursor_sql}
+                ORDER BY {LIST_SORT_KEY} DESC, url DESC
+                LIMIT ?;
+            """, params).fetchall()
+
+        rows = await self._run(fetch)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = _encode_cursor(rows[-1]["list_sort_key"], rows[-1]["url"])
+        return {"items": [_row_to_dict(row, columns) for row in rows], "next_cursor": next_cursor}
+
+    async def get_user_changes(
+        self,
+        user_id: Optional[str],
+        since: Optional[str] = None,
+        limit: int = 500,
+        fields: Optional[List[str]] = None,
+    ) -> Dict:
+        """同 vector_db.get_user_changes：按 (LIST_SORT_KEY, url) 正序，带 SYNC_SAFETY_LAG_SECONDS 安全延迟"""
+        from vector_db import SYNC_COLUMNS, SYNC_SAFETY_LAG_SECONDS, _normalize_user_id
+        user_id = _normalize_user_id(user_id)
+        columns = _list_columns(fields or SYNC_COLUMNS, SYNC_COLUMNS)
+        params = [user_id, f"-{SYNC_SAFETY_LAG_SECONDS} seconds"]
+        since_sql = ""
+        if since:
+            params.extend(_decode_cursor(since))
+            since_sql = f" AND ({LIST_SORT_KEY}, url) > (?, ?)"
+        params.append(limit + 1)
+
+        def fetch():
+            return self._conn.execute(f"""
+                SELECT {", ".join(columns)}, {LIST_SORT_KEY} AS list_sort_key
+                FROM {TABLE}
+                WHERE user_id = ?
+                  AND {LIST_SORT_KEY} < datetime('now', ?){since_sql}
+                ORDER BY {LIST_SORT_KEY}, url
+                LIMIT ?;
+            """, params).fetchall()
+
+        rows = await self._run(fetch)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = since
+        if rows:
+            cursor = _encode_cursor(rows[-1]["list_sort_key"], rows[-1]["url"])
+        return {"changes": [_row_to_dict(row, columns) for row in rows], "cursor": cursor, "has_more": has_more}
+
+    async def get_session_tabs(self, user_id: Optional[str], session_id: str) -> List[Dict]:
+        from vector_db import _normalize_user_id
+        columns = [
+            "user_id", "url", "title", "description", "image", "site_name",
+            "tab_id", "tab_title", "session_id", "metadata", "created_at", "updated_at",
+        ]
+
+        def fetch() -> List[Dict]:
+            rows = self._conn.execute(f"""
+                SELECT {", ".join(columns)} FROM {TABLE}
+                WHERE user_id = ? AND {_session_clause()} AND status = 'active'
+                ORDER BY created_at DESC;
+            """, (_normalize_user_id(user_id), session_id, session_id)).fetchall()
+            return [_row_to_dict(row) for row in rows]
+
+        return await self._run(fetch)
+
+    async def get_screenshot_blob(self, user_id: Optional[str], screenshot_hash: str) -> Optional[Dict]:
+        """本地后端不存储截图二进制"""
+        return None
+
+    async def _get_index(self, user_id: str) -> UserVectorIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            return index
+
+        def load() -> List[Dict]:
+            rows = self._conn.execute(f"""
+                SELECT {", ".join(RESULT_COLUMNS)} FROM {TABLE}
+                WHERE user_id = ? AND status = 'active';
+            """, (user_id,)).fetchall()
+            return [_row_to_dict(row) for row in rows]
+
+        generation = self._generation.get(user_id, 0)
+        index = UserVectorIndex(await self._run(load))
+        if self._generation.get(user_id, 0) == generation:
+            self._indexes[user_id] = index
+        # 否则加载期间有写入：本次使用加载结果，但不放入缓存
+        return index
+
+    async def _search(self, modality, user_id, query_embedding, top_k, threshold, scope, exclude_docs) -> List[Dict]:
+        from vector_db import _normalize_user_id
+        if not query_embedding:
+            return []
+        user_id = _normalize_user_id(user_id)
+        index = await self._get_index(user_id)
+
+        async def fetch_vectors(urls: List[str]) -> Dict[str, Dict]:
+            rows = await self.get_items_by_urls(user_id, urls, fields=["url", *VECTOR_COLUMNS])
+            return {row["url"]: row for row in rows}
+
+        return await search_index(
+            index, modality, query_embedding, top_k, threshold, scope, exclude_docs, fetch_vectors=fetch_vectors
+        )
+
+    async def search_by_text_embedding(self, user_id, query_embedding, top_k=20, threshold=0.0, scope=None, exclude_docs=False):
+        return await self._search("text", user_id, query_embedding, top_k, threshold, scope, exclude_docs)
+
+    async def search_by_image_embedding(self, user_id, query_embedding, top_k=20, threshold=0.0, scope=None, exclude_docs=False):
+        return await self._search("image", user_id, query_embedding, top_k, threshold, scope, exclude_docs)
+
+    async def search_by_caption_embedding(self, user_id, query_embedding, top_k=20, threshold=0.0, scope=None, exclude_docs=False):
+        return await self._search("caption", user_id, query_embedding, top_k, threshold, scope, exclude_docs)
+
+    async def search_by_caption_keyword(self, user_id, query_tokens, top_k=50, scope=None, exclude_docs=False):
+        """rank = 命中的查询 token 数 / 查询 token 总数（与 ADBPG 后端一致）"""
+        if not query_tokens:
+            return []
+        from vector_db import _normalize_user_id
+        index = await self._get_index(_normalize_user_id(user_id))
+        query_set = set(query_tokens)
+
+        results = []
+        for item in index.rows:
+            if exclude_docs and item.get("is_doc") is True:
+                continue
+            hits = len(query_set.intersection(item.get("caption_tokens") or []))
+            if hits == 0 or not _in_scope(item, scope):
+                continue
+            result = dict(item)
+            result["rank"] = hits / len(query_tokens)
+            results.append(result)
+
+        results.sort(key=lambda r: (-r["rank"], r.get("url") or ""))
+        return results[:top_k]
@@ -0,0 +1,108 @@
+"""
+ANN 搜索参数（ann_search.py）
+
+按召回路径和档位取 ef_search / candidate_factor；召回事务内 SET LOCAL，
+服务端是否支持该参数按连接池查询一次，不支持时不开事务
+"""
+import asyncio
+
+import pytest
+
+import ann_search
+
+
+class FakeConnection:
+    def __init__(self, supported=True):
+        self.supported = supported
+        self.calls = []
+
+    async def fetchval(self, sql, *args):
+        self.calls.append(("fetchval", args))
+        return self.supported
+
+    async def execute(self, sql, *args):
+        self.calls.append(("execute", sql))
+
+    def transaction(self):
+        conn = self
+
+        class Transaction:
+            async def __aenter__(self):
+                conn.calls.append(("begin", None))
+                return self
+
+            async def __aexit__(self, *exc):
+                conn.calls.append(("end", None))
+                return False
+
+        return Transaction()
+
+
+class FakePool:
+    pass
+
+
+def test_settings_per_path_and_profile():
+    assert ann_search.settings("image")["ef_search"] == 200
+    assert ann_search.settings("text")["ef_search"] == 100
+    with ann_search.ann_search_profile("offline"):
+        assert ann_search.settings("image") == {"ef_search": 400, "candidate_factor": 8}
+        with ann_search.ann_search_profile("interactive", ef_search=32):
+            assert ann_search.settings("image")["ef_search"] == 32
+
+        # 档位对其中创建的任务同样生效
+        async def in_task():
+            return ann_search.settings("text")["ef_search"]
+
+        assert asyncio.run(in_task()) == 400
+    assert ann_search.settings("text")["ef_search"] == 100
+
+    with pytest.raises(ValueError):
+        with ann_search.ann_search_profile("turbo"):
+            pass
+
+
+def test_env_overrides_merge_per_path(monkeypatch):
+    monkeypatch.setenv(
+        "ANN_SEARCH_PROFILES",
+        '{"interactive": {"image": {"ef_search": "160"}}, "batch": {"default": {"ef_search": 800}}}',
+    )
+    profiles = ann_search._load_profiles()
+    assert profiles["interactive"]["image"] == {"ef_search": 160, "candidate_factor": ann_search.DEFAULT_CANDIDATE_FACTOR}
+    assert profiles["interactive"]["default"]["ef_search"] == 100
+    assert profiles["batch"]["default"] == {"ef_search": 800}
+
+    monkeypatch.setenv("ANN_SEARCH_PROFILES", "not json")
+    assert ann_search._load_profiles() == ann_search.DEFAULT_PROFILES
+
+
+def test_transaction_sets_ef_search_locally(monkeypatch):
+    monkeypatch.setattr(ann_search, "EF_SEARCH_SETTING", "fastann.hnsw_ef_search")
+    pool, conn = FakePool(), FakeConnection()
+
+    async def run(path):
+        async with ann_search.ann_search_transaction(conn, path, pool) as path_settings:
+            conn.calls.append(("query", path_settings["ef_search"]))
+
+    asyncio.run(run("image"))
+    asyncio.run(run("text"))
+    assert conn.calls == [
+        ("fetchval", ("fastann.hnsw_ef_search",)),
+        ("begin", None), ("execute", "SET LOCAL fastann.hnsw_ef_search = 200"), ("query", 200), ("end", None),
+        # 同一个连接池不再查询 pg_settings
+        ("begin", None), ("execute", "SET LOCAL fastann.hnsw_ef_search = 100"), ("query", 100), ("end", None),
+    ]
+
+
+def test_unsupported_server_skips_transaction(monkeypatch):
+    monkeypatch.setattr(ann_search, "EF_SEARCH_SETTING", "fastann.hnsw_ef_search")
+    pool, conn = FakePool(), FakeConnection(supported=False)
+
+    async def run():
+        async with ann_search.ann_search_transaction(conn, "image", pool) as path_settings:
+            return path_settings
+
+    assert asyncio.run(run())["candidate_factor"] == ann_search.DEFAULT_CANDIDATE_FACTOR
+    assert asyncio.run(run())["ef_search"] == 200
+    assert conn.calls == [("fetchval", ("fastann.hnsw_ef_search",))]
+    assert ann_search.stats()["unsupported_pools"] >= 1
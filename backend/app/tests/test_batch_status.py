@@ -0,0 +1,125 @@
+"""
+批量软删除 / 恢复（vector_db.batch_set_tabs_status）
+
+一次集合 UPDATE 处理所有 URL 和 tab_id，按请求中的每个值返回结果：
+updated（已修改）/ unchanged（已经是目标状态）/ not_found（不存在）/ invalid（tab_id 不是整数）
+"""
+import asyncio
+
+import pytest
+
+import data_version
+import vector_cache
+import vector_db
+
+USER_ID = "batch-status-test"
+
+
+class FakeConnection:
+    def __init__(self, updated_rows, unchanged_rows):
+        self.updated_rows = updated_rows
+        self.unchanged_rows = unchanged_rows
+        self.queries = []
+
+    def transaction(self):
+        class Transaction:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Transaction()
+
+    async def fetch(self, sql, *args):
+        self.queries.append((sql, args))
+        return self.updated_rows if "UPDATE" in sql else self.unchanged_rows
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def bumped(monkeypatch):
+    bumped = []
+
+    async def bump(conn, user_id):
+        bumped.append(user_id)
+        return 1
+
+    monkeypatch.setattr(data_version, "bump", bump)
+    monkeypatch.setattr(vector_cache, "invalidate_user", lambda user_id: bumped.append(("invalidate", user_id)))
+    return bumped
+
+
+def _use_connection(monkeypatch, conn):
+    async def get_pool(user_id=None):
+        return FakePool(conn)
+
+    monkeypatch.setattr(vector_db, "get_pool", get_pool)
+
+
+def test_per_value_outcome(monkeypatch, bumped):
+    conn = FakeConnection(
+        updated_rows=[{"url": "https://a.example/post", "tab_id": 1}],
+        unchanged_rows=[{"url": "https://b.example/post", "tab_id": 2}],
+    )
+    _use_connection(monkeypatch, conn)
+
+    outcome = asyncio.run(vector_db.batch_set_tabs_status(
+        USER_ID, "deleted",
+        # 请求中的 URL 按存储规则标准化后匹配
+        urls=["https://a.example/post/?utm=1", "https://b.example/post", "https://z.example/", " "],
+        tab_ids=["1", "2", "9", "x"],
+    ))
+
+    assert outcome["updated"] == 1
+    assert outcome["urls"] == [
+        {"url": "https://a.example/post/?utm=1", "result": "updated"},
+        {"url": "https://b.example/post", "result": "unchanged"},
+        {"url": "https://z.example/", "result": "not_found"},
+    ]
+    assert outcome["tab_ids"] == [
+        {"tab_id": "1", "result": "updated", "count": 1},
+        {"tab_id": "2", "result": "unchanged", "count": 0},
+        {"tab_id": "9", "result": "not_found", "count": 0},
+        {"tab_id": "x", "result": "invalid", "count": 0},
+    ]
+    # 一次 UPDATE + 一次 SELECT，不逐个处理
+    assert len(conn.queries) == 2
+    assert bumped == [USER_ID, ("invalidate", USER_ID)]
+
+
+def test_nothing_changed_keeps_caches(monkeypatch, bumped):
+    conn = FakeConnection(updated_rows=[], unchanged_rows=[{"url": "https://a.example/post", "tab_id": 1}])
+    _use_connection(monkeypatch, conn)
+
+    outcome = asyncio.run(vector_db.batch_set_tabs_status(USER_ID, "active", urls=["https://a.example/post"]))
+    assert outcome == {"updated": 0, "urls": [{"url": "https://a.example/post", "result": "unchanged"}], "tab_ids": []}
+    assert bumped == []
+
+
+def test_only_invalid_values_skip_the_database(monkeypatch, bumped):
+    conn = FakeConnection(updated_rows=[], unchanged_rows=[])
+    _use_connection(monkeypatch, conn)
+
+    outcome = asyncio.run(vector_db.batch_set_tabs_status(USER_ID, "deleted", tab_ids=["x"]))
+    assert outcome["tab_ids"] == [{"tab_id": "x", "result": "invalid", "count": 0}]
+    assert conn.queries == []
+
+    with pytest.raises(ValueError):
+        asyncio.run(vector_db.batch_set_tabs_status(USER_ID, "archived", urls=["https://a.example/post"]))
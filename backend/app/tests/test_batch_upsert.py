@@ -0,0 +1,119 @@
+"""
+批量写入（vector_db.batch_upsert_items）
+
+- 重复 caption / image 按哈希列过滤；还没有回填哈希的旧数据（哈希为 NULL）按原始值比较
+- 数据提交之后的数据版本号递增失败只记录日志，返回的成功数量不变
+"""
+import asyncio
+
+import pytest
+
+import data_version
+import vector_db
+
+USER_ID = "upsert-test"
+
+
+class FakeConnection:
+    def __init__(self, captions=(), images=()):
+        self.captions = list(captions)
+        self.images = list(images)
+
+    async def fetch(self, sql, *args):
+        if "caption_hash" in sql:
+            return self.captions
+        if "image_hash" in sql:
+            return self.images
+        return []
+
+
+class FakePool:
+    def __init__(self, conn=None):
+        self.conn = conn or FakeConnection()
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def pool():
+    return FakePool()
+
+
+@pytest.fixture
+def written(monkeypatch, pool):
+    written = []
+
+    async def get_pool(user_id=None):
+        return pool
+
+    async def upsert_opengraph_item(user_id, url, stats=None, **kwargs):
+        written.append(url)
+        stats["written"] += 1
+        return True
+
+    monkeypatch.setattr(vector_db, "get_pool", get_pool)
+    monkeypatch.setattr(vector_db, "upsert_opengraph_item", upsert_opengraph_item)
+    return written
+
+
+def _items():
+    return [
+        {"url": "https://a.example/post", "title": "A"},
+        {"url": "https://b.example/post", "title": "B"},
+    ]
+
+
+def test_bump_failure_keeps_saved_count(monkeypatch, written):
+    async def bump_user(user_id):
+        raise ConnectionError("version table unavailable")
+
+    monkeypatch.setattr(data_version, "bump_user", bump_user)
+    stats = {}
+
+    assert asyncio.run(vector_db.batch_upsert_items(_items(), USER_ID, stats=stats)) == 2
+    assert stats == {"written": 2, "skipped": 0}
+    assert len(written) == 2
+
+
+def test_bumps_once_per_batch(monkeypatch, written):
+    bumped = []
+
+    async def bump_user(user_id):
+        bumped.append(user_id)
+        return 1
+
+    monkeypatch.setattr(data_version, "bump_user", bump_user)
+
+    assert asyncio.run(vector_db.batch_upsert_items(_items(), USER_ID)) == 2
+    assert bumped == [USER_ID]
+
+
+def test_legacy_rows_without_hashes_are_still_duplicates(monkeypatch, pool, written):
+    async def bump_user(user_id):
+        return 1
+
+    monkeypatch.setattr(data_version, "bump_user", bump_user)
+    # 旧数据：哈希列为 NULL，查询返回规范化后的原始值
+    pool.conn = FakeConnection(
+        captions=[{"caption_hash": None, "legacy_caption": "a red sunset"}],
+        images=[{"image_hash": None, "legacy_image": "https://img.example/1.jpg"}],
+    )
+    tags = {"dominant_colors": ["red"], "style_tags": ["photo"], "object_tags": ["sky"]}
+    items = [
+        {"url": "https://a.example/caption-dup", "metadata": {"caption": "  A Red Sunset "}},
+        {"url": "https://b.example/image-dup", "image": "https://img.example/1.jpg", "metadata": {"caption": "new"}, **tags},
+        {"url": "https://c.example/new", "metadata": {"caption": "something else"}},
+    ]
+
+    assert asyncio.run(vector_db.batch_upsert_items(items, USER_ID)) == 1
+    assert written == ["https://c.example/new"]
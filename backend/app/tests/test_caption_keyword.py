@@ -0,0 +1,45 @@
+"""
+Caption 关键词召回（search/features.tokenize_caption + caption_tokens 列）
+
+入库和查询共用同一套分词规则：中文按 jieba 搜索模式分词，查询「橘猫」「窗台」也能命中
+「一只橘色的猫趴在窗台上」，rank 为命中的查询 token 占比
+"""
+import asyncio
+
+import pytest
+
+from search.features import tokenize_caption
+from sqlite_vector_store import SQLiteVectorStore
+
+USER_ID = "caption-test"
+
+
+def test_tokenize_caption_segments_chinese():
+    tokens = tokenize_caption("一只橘色的猫趴在窗台上, The Cat!")
+    assert {"橘色", "猫", "窗台", "cat"} <= set(tokens)
+    # 停用词、标点和单个英文字母被丢弃，结果去重排序
+    assert "的" not in tokens and "the" not in tokens and "," not in tokens
+    assert tokens == sorted(set(tokens))
+    assert tokenize_caption("A 的 , 。") == []
+    assert tokenize_caption(None) == []
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteVectorStore(str(tmp_path / "vectors.db"))
+    for url, caption in [
+        ("https://a.example/cat", "一只橘色的猫趴在窗台上"),
+        ("https://b.example/dog", "草地上奔跑的小狗"),
+        ("https://c.example/window", "阳光照进窗台"),
+    ]:
+        assert asyncio.run(store.upsert_item(USER_ID, {"url": url, "image_caption": caption}))
+    return store
+
+
+def test_chinese_query_matches_stored_tokens(store):
+    results = asyncio.run(store.search_by_caption_keyword(USER_ID, tokenize_caption("猫 窗台")))
+    assert [(r["url"], r["rank"]) for r in results] == [
+        ("https://a.example/cat", 1.0),
+        ("https://c.example/window", 0.5),
+    ]
+    assert asyncio.run(store.search_by_caption_keyword(USER_ID, tokenize_caption("汽车"))) == []
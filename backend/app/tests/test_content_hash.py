@@ -0,0 +1,38 @@
+"""
+上传握手的内容哈希（search/features.compute_content_hash）
+
+客户端按同样的规则对原始 item 计算哈希，这里固定输入和期望的哈希值，规则变化时测试会失败
+"""
+import hashlib
+
+from search.features import compute_content_hash
+from search.normalize import normalize_opengraph_items
+
+RAW_ITEM = {
+    "url": "https://example.com/a?x=1",
+    "title": "  Hello 世界 ",
+    "tab_title": None,
+    "description": "",
+    "site_name": "Example",
+    "image": ["https://example.com/a.png", "https://example.com/b.png"],
+}
+# "  Hello 世界 " \x1f "" \x1f "" \x1f "Example" \x1f '["https://example.com/a.png","https://example.com/b.png"]'
+RAW_ITEM_HASH = "8a69419851c67aa7c833eedce887ea61e670f0f0d166e45653df9fdb9ab69450"
+
+
+def test_fixed_input_hash():
+    assert compute_content_hash(RAW_ITEM) == RAW_ITEM_HASH
+
+
+def test_missing_fields_hash_as_empty_strings():
+    assert compute_content_hash({"url": "https://example.com"}) == hashlib.sha256(("\x1f" * 4).encode("utf-8")).hexdigest()
+
+
+def test_normalization_keeps_raw_hash():
+    normalized = normalize_opengraph_items([RAW_ITEM])[0]
+    # 规范化改变了字段（去空白、取 image 数组第一个元素、空字符串变为 None），哈希仍然是原始请求的
+    assert normalized["title"] == "Hello 世界"
+    assert normalized["image"] == "https://example.com/a.png"
+    assert normalized["content_hash"] == RAW_ITEM_HASH
+    # batch_upsert_items 会再次规范化，哈希保持不变
+    assert normalize_opengraph_items([normalized])[0]["content_hash"] == RAW_ITEM_HASH
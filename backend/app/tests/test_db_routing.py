@@ -0,0 +1,71 @@
+"""
+读写连接池路由（db_routing）
+
+- 获取写连接池本身不记录写入时间：写入提交之后才记录，read-your-writes 窗口从数据可见时开始
+- 增量同步的水位线依赖主库的提交顺序，始终读主库
+"""
+import asyncio
+
+import db_routing
+import vector_db
+
+USER_ID = "routing-test"
+
+
+class FakeConnection:
+    async def fetch(self, sql, *args):
+        return []
+
+
+class FakeAcquire:
+    async def __aenter__(self):
+        return FakeConnection()
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakePool:
+    def __init__(self, name):
+        self.name = name
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        return FakeAcquire()
+
+
+def _patch_pools(monkeypatch):
+    primary, replica = FakePool("primary"), FakePool("replica")
+
+    async def get_shard_pool(shard):
+        return primary
+
+    async def get_shard_read_pool(shard):
+        return replica
+
+    monkeypatch.setattr(db_routing, "READ_FROM_REPLICA", True)
+    monkeypatch.setattr(db_routing, "_last_write", {})
+    monkeypatch.setattr(vector_db, "get_shard_pool", get_shard_pool)
+    monkeypatch.setattr(vector_db, "get_shard_read_pool", get_shard_read_pool)
+    return primary, replica
+
+
+def test_get_pool_does_not_mark_write(monkeypatch):
+    primary, replica = _patch_pools(monkeypatch)
+
+    assert asyncio.run(vector_db.get_pool(USER_ID)) is primary
+    assert not db_routing.read_from_primary(USER_ID)
+    assert asyncio.run(vector_db.get_read_pool(USER_ID)) is replica
+
+    db_routing.mark_write(USER_ID)
+    assert asyncio.run(vector_db.get_read_pool(USER_ID)) is primary
+
+
+def test_user_changes_read_from_primary(monkeypatch):
+    primary, replica = _patch_pools(monkeypatch)
+
+    result = asyncio.run(vector_db.get_user_changes(USER_ID))
+
+    assert result == {"changes": [], "cursor": None, "has_more": False}
+    assert (primary.acquired, replica.acquired) == (1, 0)
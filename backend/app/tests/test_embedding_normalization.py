@@ -0,0 +1,39 @@
+"""
+embedding 归一化（search/normalize.py）与相似度计算
+
+入库时向量归一化为单位向量；回填完成（VECTOR_DISTANCE_MEASURE=ip）之前，
+从数据库读出的旧向量可能不是单位向量，排序时必须按余弦计算
+"""
+import math
+
+import pytest
+
+from search import rank
+from search.normalize import EMBEDDING_DIM, normalize_embeddings, normalize_opengraph_items
+
+
+def test_normalize_embeddings_rejects_invalid_vectors():
+    units = normalize_embeddings([[3.0, 4.0], [0.0, 0.0], [1.0, float("nan")], [1.0, 2.0, 3.0], None], dim=2)
+    assert units[0] == pytest.approx([0.6, 0.8])
+    assert units[1:] == [None, None, None, None]
+
+
+def test_ingest_drops_wrong_dimension_but_keeps_item():
+    items = normalize_opengraph_items([{
+        "url": "https://a.example/",
+        "text_embedding": [1.0] * 512,
+        "image_embedding": [2.0] * EMBEDDING_DIM,
+    }])
+    assert items[0]["url"] == "https://a.example/"
+    assert items[0]["text_embedding"] is None
+    assert math.isclose(sum(x * x for x in items[0]["image_embedding"]), 1.0, rel_tol=1e-6)
+
+
+@pytest.mark.parametrize("stored_normalized", [False, True])
+def test_rank_uses_cosine_until_backfilled(monkeypatch, stored_normalized):
+    monkeypatch.setattr(rank, "STORED_EMBEDDINGS_NORMALIZED", stored_normalized)
+    # 旧数据：范数为 10 的向量
+    docs = [{"url": "https://a.example/", "text_embedding": [10.0, 0.0], "image_embedding": [0.0, 10.0]}]
+    ranked = rank.sort_by_vector_similarity([1.0, 0.0], docs, weights=(1.0, 0.0))
+    expected = 10.0 if stored_normalized else 1.0
+    assert ranked[0]["similarity"] == pytest.approx(expected)
@@ -0,0 +1,77 @@
+"""
+入库派生列（search/features.py）
+
+设计师网站召回按 site_domain 列精确匹配，替代旧的 url LIKE '%site%'：
+子域名和国家后缀归到同一个设计师域名，不会误匹配只是包含站点名的域名；
+is_doc / is_designer_site / normalized_title / normalized_url 入库时计算，与搜索阶段旧的规则一致
+"""
+import pytest
+
+from search.features import (
+    FEATURE_COLUMNS, compute_item_features, extract_host, is_designer_item, registrable_domain, site_domain_for_host,
+)
+
+
+@pytest.mark.parametrize("url, host", [
+    ("https://www.Pinterest.com:443/pin/1/", "pinterest.com"),
+    ("http://cn.dribbble.com/shots", "cn.dribbble.com"),
+    ("not a url", None),
+    (None, None),
+])
+def test_extract_host(url, host):
+    assert extract_host(url) == host
+
+
+@pytest.mark.parametrize("host, domain", [
+    ("a.b.example.com", "example.com"),
+    ("www.zcool.com.cn", "zcool.com.cn"),
+    ("shop.example.co.uk", "example.co.uk"),
+    ("ui.cn", "ui.cn"),
+])
+def test_registrable_domain(host, domain):
+    assert registrable_domain(host) == domain
+
+
+@pytest.mark.parametrize("host, domain", [
+    ("cn.dribbble.com", "dribbble.com"),
+    ("uk.pinterest.co.uk", "pinterest.co.uk"),
+    # registrable_domain 不认识的国家后缀仍归到设计师域名
+    ("pinterest.com.mx", "pinterest.com"),
+    # 旧的 LIKE '%pinterest.com%' 会误匹配
+    ("notpinterest.com", "notpinterest.com"),
+    ("blog.example.com", "example.com"),
+])
+def test_site_domain_for_host(host, domain):
+    assert site_domain_for_host(host) == domain
+
+
+def test_is_designer_item():
+    assert is_designer_item(site_domain_for_host("cn.dribbble.com"), None)
+    assert not is_designer_item(site_domain_for_host("notpinterest.com"), None)
+    # 域名无法识别时按站点名兜底
+    assert is_designer_item("example.com", "站酷 ZCOOL")
+    assert not is_designer_item(None, None)
+
+
+def test_compute_item_features_materializes_classification_columns():
+    doc = compute_item_features({
+        "url": "https://github.com/a/b/?x=1#y",
+        "title": "20251117视觉设计部管理周会_-1451008",
+        "metadata": '{"session_id": 7}',
+    })
+    assert set(doc) == set(FEATURE_COLUMNS)
+    assert doc["is_doc"] is True and doc["is_designer_site"] is False
+    # 与搜索阶段旧的去重规则一致：只移除数字 ID 后缀
+    assert doc["normalized_title"] == "20251117视觉设计部管理周会_"
+    assert doc["normalized_url"] == "https://github.com/a/b"
+    assert doc["session_id"] == "7"
+
+    pin = compute_item_features({
+        "url": "https://cn.pinterest.com/pin/1/",
+        "tab_title": "Blue Poster",
+        "metadata": {"is_doc_card": True},
+    })
+    assert pin["is_designer_site"] is True
+    assert pin["is_doc"] is True
+    assert pin["normalized_title"] == "blue poster"
+    assert compute_item_features({"url": "https://example.com/"})["normalized_title"] is None
@@ -0,0 +1,77 @@
+"""
+按 URL 批量读取（vector_db.get_items_by_urls）
+
+URL 去重后分块，每块一条 url = ANY($2::text[]) 语句（文本相同，可预编译复用），
+各块并发执行但不超过 ITEM_LOOKUP_MAX_CONCURRENCY 个连接
+"""
+import asyncio
+
+import pytest
+
+import vector_db
+
+USER_ID = "lookup-test"
+STORED = {f"https://a.example/{i}" for i in range(0, 10, 2)}
+
+
+class FakePool:
+    def __init__(self):
+        self.chunks = []
+        self.statements = set()
+        self.active = 0
+        self.max_active = 0
+
+    def acquire(self):
+        pool = self
+
+        class Connection:
+            async def fetch(self, sql, user_id, urls):
+                pool.chunks.append(list(urls))
+                pool.statements.add(sql)
+                # 让出事件循环，使并发的块真正重叠
+                await asyncio.sleep(0.01)
+                return [{"url": url} for url in urls if url in STORED]
+
+        class Acquire:
+            async def __aenter__(self):
+                pool.active += 1
+                pool.max_active = max(pool.max_active, pool.active)
+                return Connection()
+
+            async def __aexit__(self, *exc):
+                pool.active -= 1
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+
+    async def get_read_pool(user_id=None):
+        return pool
+
+    monkeypatch.setattr(vector_db, "get_read_pool", get_read_pool)
+    monkeypatch.setattr(vector_db, "ITEM_LOOKUP_MAX_CONCURRENCY", 2)
+    return pool
+
+
+def test_chunks_share_one_statement(pool, monkeypatch):
+    monkeypatch.setattr(vector_db, "ITEM_LOOKUP_CHUNK_SIZE", 3)
+    urls = [f"https://a.example/{i}" for i in range(10)]
+    # 重复和空 URL 在分块之前去掉
+    items = asyncio.run(vector_db.get_items_by_urls(USER_ID, urls + urls[:4] + ["", None]))
+
+    assert sorted(item["url"] for item in items) == sorted(STORED)
+    assert sorted(pool.chunks, key=lambda c: c[0]) == [urls[0:3], urls[3:6], urls[6:9], urls[9:]]
+    assert len(pool.statements) == 1
+    assert pool.max_active == 2
+
+
+def test_explicit_chunk_size_and_single_chunk(pool):
+    urls = [f"https://a.example/{i}" for i in range(4)]
+    asyncio.run(vector_db.get_items_by_urls(USER_ID, urls, chunk_size=100))
+    assert pool.chunks == [urls]
+    assert asyncio.run(vector_db.get_items_by_urls(USER_ID, [])) == []
+    assert len(pool.chunks) == 1
@@ -0,0 +1,145 @@
+"""
+keyset 分页列表（vector_db.list_user_items）
+
+按 (LIST_SORT_KEY, url) 倒序翻页：排序时间相同的行按 url 区分，不重复也不遗漏；
+updated_at 为 NULL 的旧数据回退到 created_at；最后一页（恰好取完）不返回游标
+"""
+import asyncio
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import vector_db
+from vector_db import ACTIVE_TABLE
+
+USER_ID = "list-test"
+TIMESTAMP_COLUMNS = ("updated_at", "created_at", "list_sort_key")
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def _ts(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def to_sqlite(sql: str) -> str:
+    """把列表 SQL 翻译成 SQLite 方言（时间统一为 'YYYY-MM-DD HH:MM:SS.ffffff' 文本）"""
+    sql = sql.replace("TIMESTAMP '1970-01-01'", f"'{_ts(datetime(1970, 1, 1))}'")
+    return re.sub(r"\$(\d+)", r"?\1", sql)
+
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def fetch(self, sql, *args):
+        params = [_ts(arg) if isinstance(arg, datetime) else arg for arg in args]
+        rows = []
+        for row in self._conn.execute(to_sqlite(sql), params):
+            item = dict(row)
+            for column in TIMESTAMP_COLUMNS:
+                if isinstance(item.get(column), str):
+                    item[column] = datetime.fromisoformat(item[column])
+            rows.append(item)
+        return rows
+
+
+class SQLitePool:
+    def __init__(self, conn):
+        self._conn = SQLiteConnection(conn)
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool._conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    schema, _ = ACTIVE_TABLE.split(".")
+    conn.execute(f"ATTACH DATABASE ':memory:' AS {schema}")
+    conn.execute(f"""
+        CREATE TABLE {ACTIVE_TABLE} (
+            user_id, url, title, description, image, site_name, tab_id, tab_title, session_id, metadata,
+            image_caption, dominant_colors, style_tags, object_tags, status, created_at, updated_at
+        )
+    """)
+    rows = [
+        # (url, status, created_at, updated_at)
+        ("https://a.example/tie", "active", T0, T0),
+        ("https://b.example/tie", "active", T0, T0),
+        ("https://c.example/tie", "active", T0, T0),
+        ("https://d.example/newest", "active", T0, T0 + timedelta(hours=1)),
+        # 旧数据：updated_at 为 NULL，按 created_at 排序
+        ("https://e.example/legacy", "active", T0 - timedelta(days=1), None),
+        ("https://f.example/deleted", "deleted", T0, T0 + timedelta(hours=2)),
+    ]
+    conn.executemany(
+        f"INSERT INTO {ACTIVE_TABLE} (user_id, url, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [(USER_ID, url, status, _ts(created), updated and _ts(updated)) for url, status, created, updated in rows],
+    )
+    conn.execute(
+        f"INSERT INTO {ACTIVE_TABLE} (user_id, url, status, created_at) VALUES ('other', 'https://x.example/', 'active', ?)",
+        (_ts(T0),),
+    )
+    pool = SQLitePool(conn)
+
+    async def get_read_pool(user_id=None):
+        return pool
+
+    monkeypatch.setattr(vector_db, "get_read_pool", get_read_pool)
+    yield conn
+    conn.close()
+
+
+EXPECTED_ORDER = [
+    "https://d.example/newest",
+    "https://c.example/tie",
+    "https://b.example/tie",
+    "https://a.example/tie",
+    "https://e.example/legacy",
+]
+
+
+def _list(cursor=None, limit=100):
+    return asyncio.run(vector_db.list_user_items(USER_ID, cursor=cursor, limit=limit))
+
+
+@pytest.mark.parametrize("limit", [1, 2, 5])
+def test_pages_cover_all_rows_once(db, limit):
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = _list(cursor, limit)
+        pages += 1
+        assert len(page["items"]) <= limit
+        seen += [item["url"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == EXPECTED_ORDER
+    # 总数恰好是 limit 的整数倍时，最后一页就不再返回游标（多查一行判断）
+    assert pages == -(-len(EXPECTED_ORDER) // limit)
+
+
+def test_page_boundary_inside_tie(db):
+    first = _list(limit=2)
+    assert [item["url"] for item in first["items"]] == EXPECTED_ORDER[:2]
+    # 游标落在排序时间相同的一组行中间，下一页从同一时间的下一个 url 继续
+    assert vector_db.decode_list_cursor(first["next_cursor"]) == (T0, "https://c.example/tie")
+    assert [item["url"] for item in _list(first["next_cursor"], limit=2)["items"]] == EXPECTED_ORDER[2:4]
+    assert all("list_sort_key" not in item for item in first["items"])
+
+
+def test_invalid_cursor(db):
+    with pytest.raises(ValueError):
+        _list("not-a-cursor")
@@ -0,0 +1,90 @@
+"""
+连接池可观测性（pool_metrics.py）
+
+InstrumentedPool.acquire() 记录等待时间、等待中的协程数和获取超时；
+SQL 耗时按语句（合并空白）分别统计，语句种类超过上限时合并到 "<other>"
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import pool_metrics
+from pool_metrics import InstrumentedPool, metrics
+
+
+class FakeRawPool:
+    """asyncpg.Pool 的最小替身：只有一个连接"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.timeouts = []
+
+    async def acquire(self, timeout=None):
+        self.timeouts.append(timeout)
+        await asyncio.wait_for(self.lock.acquire(), timeout)
+        return object()
+
+    async def release(self, conn):
+        self.lock.release()
+
+    def get_size(self):
+        return 1
+
+    def get_idle_size(self):
+        return 0 if self.lock.locked() else 1
+
+    def get_min_size(self):
+        return 1
+
+    def get_max_size(self):
+        return 1
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_acquire_records_wait_and_timeouts():
+    raw = FakeRawPool()
+    pool = InstrumentedPool(raw, acquire_timeout=0.05)
+
+    async def scenario():
+        async with pool.acquire():
+            assert pool.get_idle_size() == 0
+            assert metrics.snapshot(pool)["pool"]["in_use"] == 1
+            # 唯一的连接被占用：第二次获取等待到超时
+            with pytest.raises(asyncio.TimeoutError):
+                async with pool.acquire():
+                    pass
+        async with pool.acquire(timeout=1.0):
+            pass
+
+    asyncio.run(scenario())
+    snapshot = metrics.snapshot(pool)
+    assert raw.timeouts == [0.05, 0.05, 1.0]
+    assert snapshot["acquire_wait"]["count"] == 3
+    assert snapshot["acquire_timeouts"] == 1
+    assert snapshot["pool"] == {
+        "waiting": 0, "max_waiting": 1, "size": 1, "idle": 1, "in_use": 0, "min_size": 1, "max_size": 1,
+    }
+
+
+def test_statement_timings(monkeypatch):
+    monkeypatch.setattr(pool_metrics, "MAX_TRACKED_STATEMENTS", 2)
+    pool_metrics.query_logger(SimpleNamespace(query="SELECT 1\n  FROM t", elapsed=0.003, exception=None))
+    metrics.observe_query("SELECT 1 FROM t", 20.0)
+    metrics.observe_query("SELECT 2", 2000.0, failed=True)
+    metrics.observe_query("SELECT 3", 1.0)
+
+    snapshot = metrics.snapshot()
+    statements = {s["statement"]: s for s in snapshot["statements"]}
+    assert list(statements) == ["SELECT 2", "SELECT 1 FROM t", "<other>"]
+    assert statements["SELECT 1 FROM t"]["count"] == 2
+    assert statements["SELECT 1 FROM t"]["buckets"]["<=5ms"] == 1
+    assert statements["SELECT 1 FROM t"]["buckets"]["<=25ms"] == 1
+    assert statements["SELECT 2"]["max_ms"] == 2000.0
+    assert snapshot["query_errors"] == 1
@@ -0,0 +1,130 @@
+"""
+两阶段召回（PREFIX_RECALL_ENABLED，512 维前缀向量）
+
+第一阶段按 *_embedding_512 取 top_k * candidate_factor 个候选，第二阶段用 1024 维向量计算相似度和排序：
+返回的相似度是全精度余弦；候选足够多时结果与单阶段一致；没有回填前缀向量的行不会被召回
+"""
+import asyncio
+import json
+import random
+import sqlite3
+
+import pytest
+
+import ann_search
+import vector_cache
+import vector_db
+from search.config import PREFIX_EMBED_DIM
+from search.features import prefix_embedding
+from test_recall_sql import TABLE_COLUMNS, _cosine_distance, to_sqlite
+from vector_db import ACTIVE_TABLE
+
+pytestmark = pytest.mark.skipif(
+    vector_db.VECTOR_DISTANCE_MEASURE != "cosine", reason="SQLite 翻译只实现了余弦距离"
+)
+
+USER_ID = "prefix-recall-test"
+DIM = 1024
+
+
+def test_prefix_embedding_is_unit_prefix():
+    vec = [3.0, 4.0] + [1.0] * (DIM - 2)
+    prefix = prefix_embedding(vec, dim=2)
+    assert prefix == pytest.approx([0.6, 0.8])
+    assert len(prefix_embedding(vec)) == PREFIX_EMBED_DIM
+    assert prefix_embedding([1.0] * 10) is None
+    assert prefix_embedding([0.0] * PREFIX_EMBED_DIM + [1.0]) is None
+    assert prefix_embedding(None) is None
+
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+        self.params = []
+
+    async def fetchval(self, sql, *args):
+        # pg_settings 查询：没有 ef_search 参数，不开事务
+        return False
+
+    async def fetch(self, sql, *args):
+        self.params.append(args)
+        return [dict(row) for row in self._conn.execute(to_sqlite(sql), args)]
+
+
+class SQLitePool:
+    def __init__(self, conn):
+        self.conn = SQLiteConnection(conn)
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    rng = random.Random(44)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.create_function("vector_distance", 2, _cosine_distance, deterministic=True)
+    schema, _ = ACTIVE_TABLE.split(".")
+    conn.execute(f"ATTACH DATABASE ':memory:' AS {schema}")
+    conn.execute(f"CREATE TABLE {ACTIVE_TABLE} ({', '.join(TABLE_COLUMNS)})")
+    query = [rng.uniform(-1, 1) for _ in range(DIM)]
+    rows = []
+    for i in range(30):
+        vec = query if i == 0 else [q + rng.uniform(-1, 1) * i / 10 for q in query]
+        # 第 0 行与查询完全相同，但还没有回填前缀向量
+        prefix = None if i == 0 else json.dumps(prefix_embedding(vec))
+        rows.append((USER_ID, f"https://a.example/{i}", json.dumps(vec), prefix))
+    conn.executemany(
+        f"INSERT INTO {ACTIVE_TABLE} (user_id, url, text_embedding, text_embedding_512, status) "
+        "VALUES (?, ?, ?, ?, 'active')",
+        rows,
+    )
+    pool = SQLitePool(conn)
+
+    async def get_read_pool(user_id=None):
+        return pool
+
+    monkeypatch.setattr(vector_db, "get_read_pool", get_read_pool)
+    monkeypatch.setattr(vector_cache, "ENABLED", False)
+    yield pool, query, {url: json.loads(vec) for _, url, vec, _ in rows}
+    conn.close()
+
+
+def _search(query, top_k=5):
+    return asyncio.run(vector_db.search_by_text_embedding(USER_ID, query, top_k=top_k))
+
+
+def test_two_stage_reranks_with_full_vectors(db, monkeypatch):
+    pool, query, vectors = db
+    single = _search(query, top_k=6)
+    assert single[0]["url"] == "https://a.example/0"
+
+    monkeypatch.setattr(vector_db, "PREFIX_RECALL_ENABLED", True)
+    with ann_search.ann_search_profile("interactive", candidate_factor=6):
+        two_stage = _search(query)
+    # 第一阶段的候选数 = top_k * candidate_factor
+    assert pool.conn.params[-1][-1] == 30
+
+    # 除了没有前缀向量的第 0 行，与单阶段结果一致
+    assert [r["url"] for r in two_stage] == [r["url"] for r in single[1:]]
+    for r in two_stage:
+        expected = 1 - _cosine_distance(json.dumps(query), json.dumps(vectors[r["url"]]))
+        assert r["similarity"] == pytest.approx(expected)
+
+
+def test_short_query_uses_single_stage(db, monkeypatch):
+    _, query, _ = db
+    monkeypatch.setattr(vector_db, "PREFIX_RECALL_ENABLED", True)
+    # 维度不超过前缀维度的查询无法截取前缀，退回单阶段
+    assert not vector_db._use_prefix_recall(query[:PREFIX_EMBED_DIM])
+    assert vector_db._use_prefix_recall(query)
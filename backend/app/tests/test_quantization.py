@@ -0,0 +1,76 @@
+"""
+int8 量化向量缓存（quantization.py + vector_cache.search_index）
+
+int8 矩阵只用于粗召回（近似内积），最终结果用取回的原始 float 向量重排：
+相似度和排序与 float 缓存一致，取回过的向量留在缓存中，下次查询不再取回
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from quantization import Int8Matrix, dequantize_int8, quantize_int8
+from vector_cache import UserVectorIndex, search_index
+
+DIM = 64
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(200, DIM)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def _rows(vectors):
+    return [{"url": f"https://a.example/{i}", "text_embedding": vec.tolist()} for i, vec in enumerate(vectors)]
+
+
+def test_int8_dot_approximates_float(vectors):
+    codes, scale, offset = quantize_int8(vectors)
+    assert codes.dtype == np.int8
+    assert np.abs(dequantize_int8(codes, scale, offset) - vectors).max() <= scale.max() / 2 + 1e-6
+
+    query = vectors[0]
+    quantized = Int8Matrix(vectors)
+    assert np.abs(quantized.dot(query) - vectors @ query).max() < 0.02
+    assert quantized.nbytes < vectors.nbytes / 3
+    # 常数向量反量化后等于原值
+    constant = Int8Matrix(np.full((1, DIM), 0.25, dtype=np.float32))
+    assert constant.row(0) == pytest.approx(np.full(DIM, 0.25))
+
+
+def test_rerank_matches_float_index(vectors):
+    float_index = UserVectorIndex(_rows(vectors), quantize=False)
+    int8_index = UserVectorIndex(_rows(vectors), quantize=True)
+    assert int8_index.nbytes < float_index.nbytes
+
+    fetched = []
+
+    async def fetch_vectors(urls):
+        fetched.append(len(urls))
+        return {url: {"text_embedding": vectors[int(url.rsplit("/", 1)[1])].tolist()} for url in urls}
+
+    query = (vectors[3] + 0.1 * vectors[7]).tolist()
+    expected = float_index.search("text", query, top_k=10)
+    results = asyncio.run(search_index(int8_index, "text", query, top_k=10, fetch_vectors=fetch_vectors))
+
+    assert [r["url"] for r in results] == [r["url"] for r in expected]
+    assert [r["similarity"] for r in results] == pytest.approx([r["similarity"] for r in expected], abs=1e-5)
+    # 返回的是全精度向量，不是反量化的近似值
+    assert results[0]["text_embedding"] == pytest.approx(vectors[3].tolist(), abs=1e-6)
+
+    asyncio.run(search_index(int8_index, "text", query, top_k=10, fetch_vectors=fetch_vectors))
+    assert len(fetched) == 1
+
+
+def test_rows_missing_from_fetch_keep_approximate_similarity(vectors):
+    index = UserVectorIndex(_rows(vectors[:5]), quantize=True)
+
+    async def fetch_vectors(urls):
+        return {}
+
+    results = asyncio.run(search_index(index, "text", vectors[2].tolist(), top_k=1, fetch_vectors=fetch_vectors))
+    assert results[0]["url"] == "https://a.example/2"
+    assert results[0]["similarity"] == pytest.approx(1.0, abs=0.02)
+    assert index.float_rows == {}
@@ -0,0 +1,111 @@
+"""
+热点 SQL 注册表（query_registry）
+
+连接池把同一个原始连接多次借出；上一次 acquire 里 PREPARE 的语句在归还后不能再用
+（asyncpg 按 _pool_release_ctr 检查，报 InterfaceError），注册表不能跨 acquire 复用它们
+"""
+import asyncio
+
+import asyncpg
+import pytest
+
+import query_registry
+
+SQL = "SELECT url FROM items WHERE user_id = $1;"
+
+
+class FakeStatement:
+    def __init__(self, raw, release_ctr):
+        self._raw = raw
+        self._release_ctr = release_ctr
+
+    async def fetch(self, *args):
+        if self._release_ctr != self._raw.release_ctr:
+            raise asyncpg.InterfaceError("cannot call PreparedStatement.fetch(): the underlying connection has been released back to the pool")
+        return [{"url": "https://example.com"}]
+
+
+class FakeRawConnection:
+    """原始连接：自带按语句文本的缓存，每条文本只 PREPARE 一次"""
+
+    def __init__(self):
+        self.release_ctr = 0
+        self.statement_cache = {}
+        self.prepare_count = 0
+
+    async def fetch(self, sql, *args):
+        if sql not in self.statement_cache:
+            self.prepare_count += 1
+            self.statement_cache[sql] = args
+        return [{"url": "https://example.com"}]
+
+
+class FakeProxy:
+    """pool.acquire() 返回的连接代理，预编译语句绑定在这一次 acquire 上"""
+
+    def __init__(self, raw):
+        self._con = raw
+
+    async def prepare(self, sql):
+        return FakeStatement(self._con, self._con.release_ctr)
+
+    async def fetch(self, sql, *args):
+        return await self._con.fetch(sql, *args)
+
+
+class FakePool:
+    def __init__(self):
+        self.raw = FakeRawConnection()
+
+    async def acquire(self):
+        return FakeProxy(self.raw)
+
+    async def release(self, proxy):
+        self.raw.release_ctr += 1
+
+
+def test_same_connection_acquired_twice():
+    pool = FakePool()
+
+    async def run():
+        results = []
+        for _ in range(2):
+            conn = await pool.acquire()
+            try:
+                results.append(await query_registry.fetch(conn, "test.same_connection", SQL, "u1"))
+            finally:
+                await pool.release(conn)
+        return results
+
+    first, second = asyncio.run(run())
+    assert first == second == [{"url": "https://example.com"}]
+    # 同一条语句文本在这个连接上只 PREPARE 一次
+    assert pool.raw.prepare_count == 1
+
+
+def test_name_bound_to_one_statement_text():
+    query_registry.register_query("test.fixed_text", SQL)
+    with pytest.raises(ValueError):
+        query_registry.register_query("test.fixed_text", SQL.replace("url", "title"))
+
+
+def test_hit_ratio_counts_reuse_per_connection():
+    query_registry.reset_stats()
+    first_pool, second_pool = FakePool(), FakePool()
+
+    async def run(pool, times):
+        for _ in range(times):
+            conn = await pool.acquire()
+            try:
+                await query_registry.fetch(conn, "test.hit_ratio", SQL, "u1")
+            finally:
+                await pool.release(conn)
+
+    asyncio.run(run(first_pool, 3))
+    asyncio.run(run(second_pool, 1))
+
+    stats = query_registry.stats()
+    # 每个原始连接第一次执行算一次 PREPARE，之后的 acquire 复用
+    assert stats["queries"]["test.hit_ratio"] == {"calls": 4, "prepares": 2, "reuses": 2}
+    assert stats["hit_ratio"] == 0.5
+    assert stats["prepares"] == first_pool.raw.prepare_count + second_pool.raw.prepare_count
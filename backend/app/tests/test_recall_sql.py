@@ -0,0 +1,219 @@
+"""
+召回 SQL：每行距离只计算一次的写法与旧写法结果一致
+
+旧写法在 SELECT / WHERE / ORDER BY（设计师网站召回还有 CASE 分支）里重复计算同一个距离表达式。
+这里把生成的 SQL 和旧写法翻译成 SQLite 方言（<=> 换成 Python 实现的余弦距离函数），
+在同一份固定数据上执行，比较返回的 url 顺序和相似度
+"""
+import json
+import random
+import re
+import sqlite3
+
+import pytest
+
+import vector_db
+from vector_db import (
+    ACTIVE_TABLE,
+    CAPTION_EMBEDDING_SEARCH_COLUMNS,
+    EMBEDDING_SEARCH_COLUMNS,
+    PREFIX_EMBEDDING_COLUMNS,
+    _distance_sql,
+    _doc_clause,
+    _embedding_search_params,
+    _embedding_search_sql,
+    _similarity_sql,
+)
+from search.config import DESIGNER_SITE_DOMAINS, DESIGNER_SITE_URL_PATTERNS, PREFIX_EMBED_DIM
+from search.features import prefix_embedding
+from search.funnel_search import DESIGNER_SITES_COLUMNS, designer_sites_sql
+
+pytestmark = pytest.mark.skipif(
+    vector_db.VECTOR_DISTANCE_MEASURE != "cosine", reason="SQLite 翻译只实现了余弦距离"
+)
+
+USER_ID = "recall-sql-test"
+DIM = 1024
+TOP_K = 10
+THRESHOLD = 0.0
+
+TABLE_COLUMNS = [
+    "user_id", "url", "title", "description", "image", "site_name",
+    "site_domain", "is_doc", "is_designer_site", "normalized_title", "normalized_url",
+    "tab_id", "tab_title", "text_embedding", "image_embedding", "metadata",
+    "image_caption", "caption_embedding", "dominant_colors", "style_tags", "object_tags",
+    *PREFIX_EMBEDDING_COLUMNS.values(), "status",
+]
+
+
+def legacy_embedding_search_sql(column: str, select_columns: str, two_stage: bool) -> str:
+    """旧写法（距离表达式在 SELECT / WHERE / ORDER BY 中各算一次）"""
+    if not two_stage:
+        return f"""
+            SELECT {select_columns},
+                   {_similarity_sql(column, "$1::vector(1024)")} AS similarity
+            FROM {ACTIVE_TABLE}
+            WHERE status = 'active'
+              AND user_id = $2
+              AND {column} IS NOT NULL
+              AND ({_similarity_sql(column, "$1::vector(1024)")}) >= $3
+            ORDER BY {_distance_sql(column, "$1::vector(1024)")}
+            LIMIT $4;
+        """
+    prefix_column = PREFIX_EMBEDDING_COLUMNS[column]
+    return f"""
+            SELECT candidates.*,
+                   {_similarity_sql("candidates." + column, "$1::vector(1024)")} AS similarity
+            FROM (
+                SELECT {select_columns}
+                FROM {ACTIVE_TABLE}
+                WHERE status = 'active'
+                  AND user_id = $2
+                  AND {prefix_column} IS NOT NULL
+                  AND {column} IS NOT NULL
+                ORDER BY {_distance_sql(prefix_column, f"$5::vector({PREFIX_EMBED_DIM})")}
+                LIMIT $6
+            ) candidates
+            WHERE ({_similarity_sql("candidates." + column, "$1::vector(1024)")}) >= $3
+            ORDER BY {_distance_sql("candidates." + column, "$1::vector(1024)")}
+            LIMIT $4;
+        """
+
+
+def legacy_designer_sites_sql() -> str:
+    """旧写法（CASE 分支和 OR 条件里共 4 次距离计算）"""
+    return f"""
+        SELECT {DESIGNER_SITES_COLUMNS},
+               CASE
+                   WHEN image_embedding IS NOT NULL THEN
+                       {_similarity_sql("image_embedding", "$1::vector(1024)")}
+                   ELSE
+                       {_similarity_sql("text_embedding", "$1::vector(1024)")}
+               END AS similarity
+        FROM {ACTIVE_TABLE}
+        WHERE status = 'active'
+          AND user_id = $2
+          AND (
+              site_domain = ANY($4::text[])
+              OR (site_domain IS NULL AND url LIKE ANY($5::text[]))
+          ){_doc_clause(True)}
+          AND (
+              (image_embedding IS NOT NULL AND {_similarity_sql("image_embedding", "$1::vector(1024)")} >= $3)
+              OR
+              (text_embedding IS NOT NULL AND {_similarity_sql("text_embedding", "$1::vector(1024)")} >= $3)
+          )
+        ORDER BY similarity DESC
+        LIMIT $6;
+    """
+
+
+def to_sqlite(sql: str) -> str:
+    """把召回 SQL 翻译成 SQLite 方言（只覆盖召回 SQL 用到的语法）"""
+    sql = re.sub(r"\$(\d+)::\w+(\(\d+\)|\[\])?", r"?\1", sql)
+    sql = re.sub(r"\$(\d+)", r"?\1", sql)
+    sql = re.sub(r"([\w.]+) <=> (\?\d+)", r"vector_distance(\1, \2)", sql)
+    sql = re.sub(r"= ANY\((\?\d+)\)", r"IN (SELECT value FROM json_each(\1))", sql)
+    sql = re.sub(r"([\w.]+) LIKE ANY\((\?\d+)\)", r"EXISTS (SELECT 1 FROM json_each(\2) p WHERE \1 LIKE p.value)", sql)
+    # SQLite 的 OFFSET 必须跟在 LIMIT 后面
+    sql = sql.replace("OFFSET 0", "LIMIT -1 OFFSET 0")
+    return sql
+
+
+def _cosine_distance(a, b):
+    if a is None or b is None:
+        return None
+    a, b = json.loads(a), json.loads(b)
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+    return 1 - dot / norm if norm else None
+
+
+def _random_vector(rng):
+    return [rng.uniform(-1, 1) for _ in range(DIM)]
+
+
+@pytest.fixture(scope="module")
+def db():
+    rng = random.Random(47)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.create_function("vector_distance", 2, _cosine_distance, deterministic=True)
+    schema, table = ACTIVE_TABLE.split(".")
+    conn.execute(f"ATTACH DATABASE ':memory:' AS {schema}")
+    conn.execute(f"CREATE TABLE {schema}.{table} ({', '.join(TABLE_COLUMNS)})")
+
+    domains = [*DESIGNER_SITE_DOMAINS[:3], "example.com", None]
+    rows = []
+    for i in range(80):
+        text_vec = _random_vector(rng) if i % 7 else None
+        image_vec = _random_vector(rng) if i % 5 else None
+        caption_vec = _random_vector(rng) if i % 3 else None
+        domain = domains[i % len(domains)]
+        url = f"https://{domain or DESIGNER_SITE_DOMAINS[0]}/item/{i}"
+        row = {
+            "user_id": USER_ID if i % 10 else "someone-else",
+            "url": url,
+            "title": f"item {i}",
+            "site_domain": domain,
+            "is_doc": i % 11 == 0,
+            "text_embedding": json.dumps(text_vec) if text_vec else None,
+            "image_embedding": json.dumps(image_vec) if image_vec else None,
+            "caption_embedding": json.dumps(caption_vec) if caption_vec else None,
+            "status": "deleted" if i % 13 == 0 else "active",
+        }
+        for column, prefix_column in PREFIX_EMBEDDING_COLUMNS.items():
+            vec = {"text_embedding": text_vec, "image_embedding": image_vec, "caption_embedding": caption_vec}[column]
+            row[prefix_column] = json.dumps(prefix_embedding(vec)) if vec else None
+        rows.append(row)
+    conn.executemany(
+        f"INSERT INTO {ACTIVE_TABLE} ({', '.join(TABLE_COLUMNS)}) VALUES ({', '.join('?' for _ in TABLE_COLUMNS)})",
+        [tuple(row.get(column) for column in TABLE_COLUMNS) for row in rows],
+    )
+    yield conn, rows
+    conn.close()
+
+
+def _run(conn, sql: str, params):
+    values = [json.dumps(p) if isinstance(p, list) else p for p in params]
+    return [(row["url"], round(row["similarity"], 9)) for row in conn.execute(to_sqlite(sql), values)]
+
+
+def _query_vector(rows, column: str):
+    return json.loads(next(row[column] for row in rows if row[column] and row["user_id"] == USER_ID))
+
+
+@pytest.mark.parametrize("two_stage", [False, True], ids=["single_stage", "two_stage"])
+@pytest.mark.parametrize("column, select_columns", [
+    ("text_embedding", EMBEDDING_SEARCH_COLUMNS),
+    ("image_embedding", EMBEDDING_SEARCH_COLUMNS),
+    ("caption_embedding", CAPTION_EMBEDDING_SEARCH_COLUMNS),
+], ids=["text", "image", "caption"])
+def test_embedding_search_matches_legacy(db, column, select_columns, two_stage):
+    conn, rows = db
+    params = _embedding_search_params(
+        _query_vector(rows, column), USER_ID, THRESHOLD, TOP_K, two_stage, candidate_factor=2
+    )
+    new_sql = _embedding_search_sql(column, select_columns, "", two_stage)
+
+    new = _run(conn, new_sql, params)
+    assert new == _run(conn, legacy_embedding_search_sql(column, select_columns, two_stage), params)
+    assert len(new) == TOP_K
+    # 1024 维距离只计算一次
+    assert new_sql.count(_distance_sql(("candidates." if two_stage else "") + column, "$1::vector(1024)")) == 1
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.03])
+def test_designer_sites_matches_legacy(db, threshold):
+    conn, rows = db
+    params = [
+        _query_vector(rows, "image_embedding"), USER_ID, threshold,
+        DESIGNER_SITE_DOMAINS, DESIGNER_SITE_URL_PATTERNS, TOP_K,
+    ]
+    new_sql = designer_sites_sql(_doc_clause(True), 6)
+
+    new = _run(conn, new_sql, params)
+    assert new == _run(conn, legacy_designer_sites_sql(), params)
+    assert new
+    # 图像 / 文本距离各计算一次
+    assert new_sql.count(_distance_sql("image_embedding", "$1::vector(1024)")) == 1
+    assert new_sql.count(_distance_sql("text_embedding", "$1::vector(1024)")) == 1
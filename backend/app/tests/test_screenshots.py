@@ -0,0 +1,75 @@
+"""
+截图读取（vector_db.get_screenshot_blob）
+
+截图按内容去重、多个用户共用一份：只返回请求用户自己的记录引用的截图，只查该用户所在分片的连接池
+"""
+import asyncio
+import re
+import sqlite3
+
+import pytest
+
+import vector_db
+from vector_db import ACTIVE_TABLE, SCREENSHOT_BLOB_TABLE
+
+HASH = "a" * 64
+
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def fetchrow(self, sql, *args):
+        row = self._conn.execute(re.sub(r"\$(\d+)", r"?\1", sql), args).fetchone()
+        return dict(row) if row else None
+
+
+class SQLitePool:
+    def __init__(self, conn):
+        self._conn = SQLiteConnection(conn)
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool._conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"ATTACH DATABASE ':memory:' AS {ACTIVE_TABLE.split('.')[0]}")
+    conn.execute(f"CREATE TABLE {ACTIVE_TABLE} (user_id, url, screenshot_hash)")
+    conn.execute(f"CREATE TABLE {SCREENSHOT_BLOB_TABLE} (hash, content_type, data)")
+    conn.execute(f"INSERT INTO {ACTIVE_TABLE} VALUES ('owner', 'https://a.example/', ?)", (HASH,))
+    conn.execute(f"INSERT INTO {SCREENSHOT_BLOB_TABLE} VALUES (?, 'image/png', x'89504e47')", (HASH,))
+    requested = []
+
+    async def get_read_pool(user_id=None):
+        requested.append(user_id)
+        return SQLitePool(conn)
+
+    monkeypatch.setattr(vector_db, "get_read_pool", get_read_pool)
+    yield requested
+    conn.close()
+
+
+def test_only_owner_can_read_screenshot(pools):
+    blob = asyncio.run(vector_db.get_screenshot_blob("owner", HASH))
+    assert blob == {"content_type": "image/png", "data": b"\x89PNG"}
+    assert asyncio.run(vector_db.get_screenshot_blob("someone-else", HASH)) is None
+    # 只查请求用户所在分片的连接池，不遍历所有分片
+    assert pools == ["owner", "someone-else"]
+
+
+def test_screenshot_url_carries_user_id():
+    assert vector_db.screenshot_url(HASH, "a b@c") == f"/api/v1/screenshots/{HASH}?user_id=a%20b%40c"
+    assert vector_db.screenshot_url(HASH) == f"/api/v1/screenshots/{HASH}"
+    assert vector_db.screenshot_url(None, "owner") is None
@@ -0,0 +1,56 @@
+"""
+Personal Space 的搜索范围（filter_urls / filter_tab_ids）下推到 SQL
+
+URL 同时匹配原始值和存储时的标准化值；tab_id 转为整数，无法转换的忽略；
+指定了范围但两个列表都为空时不召回任何结果
+"""
+import json
+import re
+import sqlite3
+
+import pytest
+
+from vector_db import _scope_clause, build_search_scope
+
+ROWS = [
+    ("https://a.example/post", 1),
+    ("https://b.example/legacy/?utm=1", 2),
+    ("https://c.example/other", 3),
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE items (user_id, url, tab_id)")
+    conn.executemany("INSERT INTO items VALUES ('u1', ?, ?)", ROWS)
+    yield conn
+    conn.close()
+
+
+def _select(conn, scope):
+    params = ["u1"]
+    sql = f"SELECT url FROM items WHERE user_id = $1{_scope_clause(scope, params)} ORDER BY url"
+    sql = re.sub(r"= ANY\(\$(\d+)::\w+\[\]\)", r"IN (SELECT value FROM json_each(?\1))", sql)
+    sql = re.sub(r"\$(\d+)", r"?\1", sql)
+    values = [json.dumps(p) if isinstance(p, list) else p for p in params]
+    return [row[0] for row in conn.execute(sql, values)]
+
+
+def test_build_search_scope():
+    assert build_search_scope(None, []) is None
+    scope = build_search_scope(["https://A.example/post/?q=1#top", ""], ["3", "x", 4])
+    assert scope == {
+        "urls": ["https://A.example/post/?q=1#top", "https://a.example/post"],
+        "tab_ids": [3, 4],
+    }
+
+
+def test_scope_clause_filters_in_sql(db):
+    assert _select(db, None) == [url for url, _ in sorted(ROWS)]
+    # 标准化后的 URL 命中新数据，原始 URL 命中标准化之前写入的旧数据
+    scope = build_search_scope(["https://A.example/post/#top", "https://b.example/legacy/?utm=1"], ["3"])
+    assert _select(db, scope) == [url for url, _ in sorted(ROWS)]
+    assert _select(db, build_search_scope([], ["2"])) == ["https://b.example/legacy/?utm=1"]
+    # 指定了范围但都无效：不召回任何结果
+    assert _select(db, build_search_scope([], ["x"])) == []
@@ -0,0 +1,41 @@
+"""
+按 session 过滤（vector_db._session_clause）
+
+优先使用 session_id 列；还没有回填 session_id 的旧数据（列为 NULL）回退到 metadata->>'session_id'，
+列已有值时以列为准，不再看 metadata
+"""
+import sqlite3
+
+import pytest
+
+from vector_db import _session_clause
+
+ROWS = [
+    # (url, session_id 列, metadata)
+    ("https://a.example/column", "s1", "{}"),
+    ("https://b.example/legacy", None, '{"session_id": "s1"}'),
+    ("https://c.example/moved", "s2", '{"session_id": "s1"}'),
+    ("https://d.example/none", None, "{}"),
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE items (user_id, url, session_id, metadata)")
+    conn.executemany("INSERT INTO items VALUES ('u1', ?, ?, ?)", ROWS)
+    yield conn
+    conn.close()
+
+
+def _select(conn, session_id):
+    # SQLite 3.38+ 支持与 PostgreSQL 相同的 ->> 运算符
+    sql = f"SELECT url FROM items WHERE user_id = ?1 AND {_session_clause('?2')} ORDER BY url"
+    return [row[0] for row in conn.execute(sql, ("u1", session_id))]
+
+
+@pytest.mark.skipif(sqlite3.sqlite_version_info < (3, 38), reason="需要 SQLite 3.38+ 的 ->> 运算符")
+def test_session_clause_falls_back_to_metadata(db):
+    assert _select(db, "s1") == ["https://a.example/column", "https://b.example/legacy"]
+    assert _select(db, "s2") == ["https://c.example/moved"]
+    assert _select(db, "missing") == []
@@ -0,0 +1,41 @@
+"""
+分片目录表（shard_router.ShardDirectory）
+
+目录表第一次加载成功之前不能按哈希猜测分片（迁移过的用户会被路由到旧分片），必须拒绝路由；
+加载成功过之后重新加载失败时继续使用上次的结果
+"""
+import asyncio
+
+import pytest
+
+import shard_router
+
+
+class FlakyDirectory(shard_router.ShardDirectory):
+    def __init__(self, results):
+        super().__init__(ttl=0)
+        self._results = list(results)
+
+    async def _load(self):
+        result = self._results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        self._overrides = result
+        self._loaded_at = 0.0
+        self._loaded = True
+
+
+def test_refuses_to_route_until_first_load():
+    directory = FlakyDirectory([ConnectionError("shard 0 down"), {"u1": 1}])
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(directory.overrides())
+    # 下一次调用重新加载
+    assert asyncio.run(directory.overrides()) == {"u1": 1}
+
+
+def test_keeps_last_result_after_failed_reload():
+    directory = FlakyDirectory([{"u1": 1}, ConnectionError("shard 0 down")])
+
+    assert asyncio.run(directory.overrides()) == {"u1": 1}
+    assert asyncio.run(directory.overrides()) == {"u1": 1}
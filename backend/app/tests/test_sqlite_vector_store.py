@@ -0,0 +1,106 @@
+"""
+本地 SQLite 向量存储（VECTOR_STORE_BACKEND=sqlite）
+
+列表、增量同步、批量删除 / 恢复、session、上传握手与 ADBPG 后端的语义和游标格式一致
+"""
+import asyncio
+
+import pytest
+
+import vector_db
+from sqlite_vector_store import TABLE, SQLiteVectorStore
+
+USER_ID = "sqlite-test"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteVectorStore(str(tmp_path / "vectors.db"))
+    rows = [
+        # (url, tab_id, session_id, created_at, updated_at)；a 没有 session_id 列，只在 metadata 中
+        ("https://a.example/legacy", 1, None, "2024-01-01 00:00:00", "2024-01-01 00:00:00"),
+        ("https://b.example/old", 2, "s1", "2024-01-02 00:00:00", "2024-02-01 00:00:00"),
+        ("https://c.example/new", 3, "s1", "2024-01-03 00:00:00", "2024-03-01 00:00:00"),
+    ]
+    with store._conn:
+        store._conn.executemany(
+            f"""INSERT INTO {TABLE} (user_id, url, tab_id, session_id, metadata, content_hash,
+                                     text_embedding, image_embedding, created_at, updated_at)
+                VALUES (?, ?, ?, ?, '{{"session_id": "s1"}}', 'h', x'0000803f', x'0000803f', ?, ?)""",
+            [(USER_ID, *row) for row in rows],
+        )
+    return store
+
+
+def test_list_pages_with_adbpg_cursor(store):
+    first = asyncio.run(store.list_user_items(USER_ID, limit=2))
+    assert [item["url"] for item in first["items"]] == ["https://c.example/new", "https://b.example/old"]
+    # 游标与 ADBPG 后端同一格式
+    assert vector_db.decode_list_cursor(first["next_cursor"])[1] == "https://b.example/old"
+
+    second = asyncio.run(store.list_user_items(USER_ID, cursor=first["next_cursor"], limit=2))
+    assert [item["url"] for item in second["items"]] == ["https://a.example/legacy"]
+    assert second["next_cursor"] is None
+
+    with pytest.raises(ValueError):
+        asyncio.run(store.list_user_items(USER_ID, cursor="not-a-cursor"))
+
+
+def test_changes_include_deletes_after_safety_lag(store):
+    result = asyncio.run(store.get_user_changes(USER_ID))
+    assert [item["url"] for item in result["changes"]] == [
+        "https://a.example/legacy", "https://b.example/old", "https://c.example/new",
+    ]
+
+    outcome = asyncio.run(store.batch_set_tabs_status(USER_ID, "deleted", urls=["https://b.example/old"], tab_ids=["x"]))
+    assert outcome["updated"] == 1
+    assert outcome["urls"] == [{"url": "https://b.example/old", "result": "updated"}]
+    assert outcome["tab_ids"] == [{"tab_id": "x", "result": "invalid", "count": 0}]
+
+    # 刚删除的行在安全延迟内，下一次轮询才返回
+    assert asyncio.run(store.get_user_changes(USER_ID, since=result["cursor"]))["changes"] == []
+    with store._conn:
+        store._conn.execute(f"UPDATE {TABLE} SET updated_at = '2025-01-01 00:00:00' WHERE url = 'https://b.example/old'")
+    changes = asyncio.run(store.get_user_changes(USER_ID, since=result["cursor"]))["changes"]
+    assert [(item["url"], item["status"]) for item in changes] == [("https://b.example/old", "deleted")]
+
+
+def test_sessions_fall_back_to_metadata(store):
+    tabs = asyncio.run(store.get_session_tabs(USER_ID, "s1"))
+    assert [tab["url"] for tab in tabs] == ["https://c.example/new", "https://b.example/old", "https://a.example/legacy"]
+    assert asyncio.run(store.soft_delete_session_tabs(USER_ID, "s1")) == 3
+    assert asyncio.run(store.get_session_tabs(USER_ID, "s1")) == []
+
+    outcome = asyncio.run(store.batch_set_tabs_status(USER_ID, "active", tab_ids=["1", "9"]))
+    assert outcome["tab_ids"] == [
+        {"tab_id": "1", "result": "updated", "count": 1},
+        {"tab_id": "9", "result": "not_found", "count": 0},
+    ]
+
+
+def test_upload_handshake(store):
+    needed, unchanged = asyncio.run(store.find_items_needing_upload(USER_ID, [
+        {"url": "https://a.example/legacy", "content_hash": "h"},
+        {"url": "https://b.example/old", "content_hash": "other"},
+        {"url": "https://z.example/missing", "content_hash": "h"},
+    ]))
+    assert unchanged == ["https://a.example/legacy"]
+    assert needed == ["https://b.example/old", "https://z.example/missing"]
+
+
+def test_index_loaded_during_write_is_not_cached(store):
+    run = store._run
+
+    async def run_with_concurrent_write(func, *args):
+        result = await run(func, *args)
+        # 加载完成、放入缓存之前发生了一次写入
+        store._invalidate(USER_ID)
+        return result
+
+    store._run = run_with_concurrent_write
+    index = asyncio.run(store._get_index(USER_ID))
+    assert len(index.rows) == 3
+    assert USER_ID not in store._indexes
+
+    store._run = run
+    assert asyncio.run(store._get_index(USER_ID)) is store._indexes[USER_ID]
@@ -0,0 +1,118 @@
+"""
+跳过未变化的写入（vector_db.upsert_opengraph_item + row_fingerprint）
+
+写入内容的指纹与已存储的一致且记录为 active 时 ON CONFLICT 不做更新（"INSERT 0 0"）：
+计入 skipped，不递增数据版本号、不清空向量缓存；内容变化或记录已删除时照常写入
+"""
+import asyncio
+
+import pytest
+
+import data_version
+import vector_cache
+import vector_db
+from search.features import FEATURE_COLUMNS
+
+USER_ID = "fingerprint-test"
+# 有 caption 字段时 row_fingerprint 的参数位置（$17 之后是派生列）
+FINGERPRINT_ARG = 16 + len(FEATURE_COLUMNS)
+
+
+class FakeConnection:
+    """按 ON CONFLICT ... WHERE row_fingerprint IS DISTINCT FROM ... OR status <> 'active' 的语义模拟写入"""
+
+    def __init__(self):
+        self.rows = {}   # url -> {"fingerprint", "status"}
+
+    def transaction(self):
+        class Transaction:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Transaction()
+
+    async def fetchval(self, sql, *args):
+        return True
+
+    async def execute(self, sql, *args):
+        url, fingerprint = args[1], args[FINGERPRINT_ARG]
+        row = self.rows.get(url)
+        if row and row["fingerprint"] == fingerprint and row["status"] == "active":
+            return "INSERT 0 0"
+        self.rows[url] = {"fingerprint": fingerprint, "status": "active"}
+        return "INSERT 0 1"
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+
+    async def get_pool(user_id=None):
+        return pool
+
+    monkeypatch.setattr(vector_db, "get_pool", get_pool)
+    return pool
+
+
+@pytest.fixture
+def events(monkeypatch):
+    events = []
+
+    async def bump(conn, user_id):
+        events.append("bump")
+        return 1
+
+    monkeypatch.setattr(data_version, "bump", bump)
+    monkeypatch.setattr(vector_cache, "invalidate_user", lambda user_id: events.append("invalidate"))
+    return events
+
+
+def _upsert(stats, **fields):
+    item = {"url": "https://a.example/post?utm=1", "title": "Poster", "image": ["https://img.example/1.jpg"],
+            "text_embedding": [1.0] * 1024, "metadata": {"session_id": "s1"}, **fields}
+    return asyncio.run(vector_db.upsert_opengraph_item(user_id=USER_ID, stats=stats, **item))
+
+
+def test_unchanged_upsert_is_skipped(pool, events):
+    stats = {}
+    assert _upsert(stats)
+    # 同一内容再写一次：URL 标准化后相同、向量归一化后相同，指纹一致
+    assert _upsert(stats, url="https://a.example/post/#top", image="https://img.example/1.jpg")
+    assert stats == {"written": 1, "skipped": 1}
+    assert events == ["bump", "invalidate"]
+
+
+def test_changed_or_deleted_rows_are_written(pool, events):
+    stats = {}
+    assert _upsert(stats)
+    assert _upsert(stats, title="Poster v2")
+    # 指纹一致但记录已软删除：恢复为 active
+    pool.conn.rows["https://a.example/post"]["status"] = "deleted"
+    assert _upsert(stats, title="Poster v2")
+    assert stats == {"written": 3}
+    assert events.count("bump") == 3
+
+
+def test_fingerprint_is_order_independent_for_dict_values():
+    assert vector_db._row_fingerprint({"a": 1, "b": 2}, [1.0]) == vector_db._row_fingerprint({"b": 2, "a": 1}, [1.0])
+    assert vector_db._row_fingerprint("title", None) != vector_db._row_fingerprint("title", "")
@@ -0,0 +1,132 @@
+"""
+增量同步（get_user_changes）
+
+旧数据的 updated_at 为 NULL：按 LIST_SORT_KEY（回退到 created_at）排序，全量同步时必须返回，
+游标翻页跨过这些行时不能重复或遗漏；安全延迟内的行留到下一次轮询
+"""
+import asyncio
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import vector_db
+from vector_db import ACTIVE_TABLE
+
+USER_ID = "changes-test"
+TIMESTAMP_COLUMNS = ("updated_at", "created_at", "deleted_at", "list_sort_key")
+
+
+def _ts(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def to_sqlite(sql: str) -> str:
+    """把增量同步 SQL 翻译成 SQLite 方言（时间统一为 'YYYY-MM-DD HH:MM:SS.ffffff' 文本）"""
+    sql = sql.replace("TIMESTAMP '1970-01-01'", f"'{_ts(datetime(1970, 1, 1))}'")
+    sql = re.sub(
+        r"NOW\(\) - \$(\d+) \* INTERVAL '1 second'",
+        r"strftime('%Y-%m-%d %H:%M:%f000', 'now', '-' || ?\1 || ' seconds')",
+        sql,
+    )
+    return re.sub(r"\$(\d+)", r"?\1", sql)
+
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def fetch(self, sql, *args):
+        params = [_ts(arg) if isinstance(arg, datetime) else arg for arg in args]
+        rows = []
+        for row in self._conn.execute(to_sqlite(sql), params):
+            item = dict(row)
+            for column in TIMESTAMP_COLUMNS:
+                if isinstance(item.get(column), str):
+                    item[column] = datetime.fromisoformat(item[column])
+            rows.append(item)
+        return rows
+
+
+class SQLitePool:
+    def __init__(self, conn):
+        self._conn = SQLiteConnection(conn)
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool._conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    schema, table = ACTIVE_TABLE.split(".")
+    conn.execute(f"ATTACH DATABASE ':memory:' AS {schema}")
+    conn.execute(f"""
+        CREATE TABLE {ACTIVE_TABLE} (
+            user_id, url, title, description, image, site_name, tab_id, tab_title, session_id,
+            image_caption, dominant_colors, style_tags, object_tags, status, deleted_at, created_at, updated_at
+        )
+    """)
+    now = datetime.utcnow()
+    rows = [
+        # 旧数据：updated_at 为 NULL
+        ("https://a.example/legacy", now - timedelta(days=30), None),
+        ("https://b.example/legacy-no-dates", None, None),
+        ("https://c.example/old", now - timedelta(days=20), now - timedelta(days=10)),
+        ("https://d.example/new", now - timedelta(days=1), now - timedelta(hours=1)),
+        # 还在安全延迟内
+        ("https://e.example/just-written", now, now),
+    ]
+    conn.executemany(
+        f"INSERT INTO {ACTIVE_TABLE} (user_id, url, status, created_at, updated_at) VALUES (?, ?, 'active', ?, ?)",
+        [(USER_ID, url, created and _ts(created), updated and _ts(updated)) for url, created, updated in rows],
+    )
+    pool = SQLitePool(conn)
+
+    async def get_pool(user_id=None):
+        return pool
+
+    monkeypatch.setattr(vector_db, "get_pool", get_pool)
+    yield conn
+    conn.close()
+
+
+def _sync(since=None, limit=500):
+    return asyncio.run(vector_db.get_user_changes(USER_ID, since=since, limit=limit))
+
+
+def test_full_sync_includes_null_updated_at(db):
+    result = _sync()
+    assert [item["url"] for item in result["changes"]] == [
+        "https://b.example/legacy-no-dates",
+        "https://a.example/legacy",
+        "https://c.example/old",
+        "https://d.example/new",
+    ]
+    assert all("list_sort_key" not in item for item in result["changes"])
+    assert not result["has_more"]
+
+
+def test_paging_across_null_updated_at(db):
+    seen, cursor = [], None
+    while True:
+        result = _sync(since=cursor, limit=1)
+        seen += [item["url"] for item in result["changes"]]
+        cursor = result["cursor"]
+        if not result["has_more"]:
+            break
+    assert seen == [item["url"] for item in _sync()["changes"]]
+    # 游标之后没有新变更时返回同一个游标
+    assert _sync(since=cursor)["changes"] == []
+    assert _sync(since=cursor)["cursor"] == cursor
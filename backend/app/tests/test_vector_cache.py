@@ -0,0 +1,80 @@
+"""
+进程内向量缓存（vector_cache）以 (user_id, 数据版本号) 为 key
+
+其他进程的写入无法调用本进程的 invalidate_user，只会递增数据库里的版本号；版本号变化后缓存必须重新加载
+"""
+import asyncio
+
+import vector_cache
+
+USER_ID = "vector-cache-test"
+
+
+class Loader:
+    def __init__(self, rows=1):
+        self.rows = rows
+        self.loads = 0
+        self.counts = 0
+
+    async def load(self):
+        self.loads += 1
+        return [{"url": f"https://example.com/{i}", "text_embedding": [1.0, 0.0]} for i in range(self.rows)]
+
+    async def count(self):
+        self.counts += 1
+        return self.rows
+
+
+def test_reloads_when_version_changes():
+    cache = vector_cache.VectorCache()
+    loader = Loader()
+
+    async def run():
+        first = await cache.get_index(USER_ID, 1, loader.load, loader.count)
+        again = await cache.get_index(USER_ID, 1, loader.load, loader.count)
+        bumped = await cache.get_index(USER_ID, 2, loader.load, loader.count)
+        return first, again, bumped
+
+    first, again, bumped = asyncio.run(run())
+    assert again is first
+    assert bumped is not first and bumped.version == 2
+    assert loader.loads == 2
+
+
+def test_oversized_user_rechecked_after_version_change():
+    cache = vector_cache.VectorCache(max_items_per_user=1)
+    loader = Loader(rows=2)
+
+    async def run():
+        for version in (1, 1, 2):
+            assert await cache.get_index(USER_ID, version, loader.load, loader.count) is None
+
+    asyncio.run(run())
+    assert (loader.counts, loader.loads) == (2, 0)
+
+
+def test_invalidate_keeps_lock_held_by_loader():
+    cache = vector_cache.VectorCache()
+    loader = Loader()
+    running, peak = 0, 0
+
+    async def slow_load():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return await loader.load()
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_index(USER_ID, 1, slow_load, loader.count))
+        await asyncio.sleep(0)
+        # 加载期间发生写入：正在加载的结果作废，但锁不能被删掉
+        cache.invalidate_user(USER_ID)
+        second = await cache.get_index(USER_ID, 2, slow_load, loader.count)
+        return await first, second
+
+    first, second = asyncio.run(run())
+    assert peak == 1
+    assert first.version == 1 and second.version == 2
+    assert USER_ID in cache._locks
@@ -0,0 +1,175 @@
+"""
+ANN 搜索参数调优（延迟 / recall，见 ann_search.py）
+
+在某个用户的真实数据上，对每个召回路径（text / image / caption）扫描 ef_search（两阶段召回开启时同时扫描
+candidate_factor）：
+- 查询：随机抽取该用户已存储的向量
+- 基准答案：在内存中暴力计算的精确 top_k（单位向量内积）
+- 实际结果：vector_db.search_by_*_embedding（threshold=0，关闭进程内向量缓存，走 ADBPG ANN 索引）
+
+输出每组参数的 recall@k 和 p50 / p95 延迟，并给出达到 --target-recall 的最小 ef_search，
+可直接填入 ANN_SEARCH_PROFILES 环境变量。
+
+用法：
+
+   python tune_ann_search.py --user-id anonymous
+   python tune_ann_search.py --user-id anonymous --paths image --ef-search 40,80,160,320 --top-k 60 --queries 100
+   python tune_ann_search.py --user-id anonymous --profile offline --target-recall 0.99
+"""
+import asyncio
+import argparse
+import json
+import statistics
+import sys
+import os
+import time
+from typing import Dict, List
+from dotenv import load_dotenv
+
+import numpy as np
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import vector_cache
+import vector_db
+from vector_db import get_read_pool, close_pool, ACTIVE_TABLE, _normalize_user_id
+from vector_cache import _as_vector
+import ann_search
+from ann_search import ann_search_profile
+
+# 召回路径 -> (embedding 列, 搜索函数)
+PATH_SEARCHES = {
+    "text": ("text_embedding", vector_db.search_by_text_embedding),
+    "image": ("image_embedding", vector_db.search_by_image_embedding),
+    "caption": ("caption_embedding", vector_db.search_by_caption_embedding),
+}
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+async def _load_vectors(user_id: str, column: str) -> Dict[str, np.ndarray]:
+    pool = await get_read_pool(user_id)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT url, {column}
+            FROM {ACTIVE_TABLE}
+            WHERE user_id = $1 AND status = 'active' AND {column} IS NOT NULL;
+        """, user_id)
+    vectors = {}
+    for row in rows:
+        vec = _as_vector(row[column])
+        if vec is not None:
+            vectors[row["url"]] = vec
+    return vectors
+
+
+async def tune_path(
+    path: str,
+    user_id: str,
+    profile: str,
+    ef_values: List[int],
+    factor_values: List[int],
+    top_k: int,
+    queries: int,
+    target_recall: float,
+) -> Dict:
+    """扫描一个召回路径的参数，返回达到目标 recall 的最快参数（没有达到时返回 recall 最高的参数）"""
+    column, search = PATH_SEARCHES[path]
+    vectors = await _load_vectors(user_id, column)
+    if len(vectors) <= top_k:
+        print(f"{path}: 只有 {len(vectors)} 条向量，跳过")
+        return {}
+
+    urls = list(vectors)
+    matrix = np.vstack([vectors[url] for url in urls]).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    rng = np.random.default_rng(0)
+    query_ids = rng.choice(len(urls), size=min(queries, len(urls)), replace=False)
+    truths = [{urls[i] for i in np.argsort(-(matrix @ matrix[qi]))[:top_k]} for qi in query_ids]
+
+    print("-" * 80)
+    print(f"{path} ({column}): {len(urls)} 条, {len(query_ids)} 个查询, top_k={top_k}")
+    print(f"{'ef_search':>10} | {'factor':>6} | {'recall@' + str(top_k):>10} | {'min':>6} | {'p50 ms':>8} | {'p95 ms':>8}")
+
+    rows = []
+    for ef_search in ef_values:
+        for factor in factor_values:
+            recalls, timings = [], []
+            with ann_search_profile(profile, ef_search=ef_search, candidate_factor=factor):
+                for qi, truth in zip(query_ids, truths):
+                    start = time.perf_counter()
+                    results = await search(user_id, matrix[qi].tolist(), top_k=top_k, threshold=0.0)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    recalls.append(len({r["url"] for r in results} & truth) / top_k)
+            timings.sort()
+            row = {
+                "ef_search": ef_search,
+                "candidate_factor": factor,
+                "recall": statistics.mean(recalls),
+                "p50": statistics.median(timings),
+                "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            }
+            rows.append(row)
+            print(
+                f"{ef_search:>10} | {factor:>6} | {row['recall']:>10.4f} | {min(recalls):>6.2f} | "
+                f"{row['p50']:>8.2f} | {row['p95']:>8.2f}"
+            )
+
+    passing = [row for row in rows if row["recall"] >= target_recall]
+    best = min(passing, key=lambda r: r["p50"]) if passing else max(rows, key=lambda r: r["recall"])
+    print(
+        f"→ {path}: ef_search={best['ef_search']}, candidate_factor={best['candidate_factor']} "
+        f"(recall {best['recall']:.4f}, p50 {best['p50']:.2f} ms"
+        f"{'' if passing else f', 未达到目标 {target_recall}'})"
+    )
+    return {"ef_search": best["ef_search"], "candidate_factor": best["candidate_factor"]}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="ANN 搜索参数调优（延迟 / recall）")
+    parser.add_argument("--user-id", type=str, default="anonymous", help="用户 ID（默认: anonymous）")
+    parser.add_argument("--paths", type=str, default="text,image,caption", help="召回路径，逗号分隔（默认: text,image,caption）")
+    parser.add_argument("--profile", type=str, default="interactive", help="调优的档位（默认: interactive）")
+    parser.add_argument("--ef-search", type=str, default="40,80,160,320,640", help="ef_search 取值，逗号分隔")
+    parser.add_argument("--factors", type=str, default="2,4,8", help="candidate_factor 取值（仅两阶段召回开启时扫描）")
+    parser.add_argument("--top-k", type=int, default=50, help="top_k（默认: 50）")
+    parser.add_argument("--queries", type=int, default=50, help="每个路径的查询数（默认: 50）")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="目标 recall@k（默认: 0.95）")
+    args = parser.parse_args()
+
+    # 只测 SQL 路径
+    vector_cache.ENABLED = False
+    user_id = _normalize_user_id(args.user_id)
+    factor_values = _int_list(args.factors) if vector_db.PREFIX_RECALL_ENABLED else [ann_search.DEFAULT_CANDIDATE_FACTOR]
+
+    print("=" * 80)
+    print(f"ANN 搜索参数调优（user_id={user_id}, profile={args.profile}, target_recall={args.target_recall}）")
+    print("=" * 80)
+
+    try:
+        recommended = {}
+        for path in [p.strip() for p in args.paths.split(",") if p.strip()]:
+            if path not in PATH_SEARCHES:
+                print(f"未知路径: {path}（可选: {', '.join(PATH_SEARCHES)}）")
+                continue
+            best = await tune_path(
+                path, user_id, args.profile, _int_list(args.ef_search), factor_values,
+                args.top_k, args.queries, args.target_recall,
+            )
+            if best:
+                recommended[path] = best
+        print("=" * 80)
+        if recommended:
+            print("建议配置：")
+            print(f"ANN_SEARCH_PROFILES='{json.dumps({args.profile: recommended})}'")
+        print("=" * 80)
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,421 @@
+"""
+进程内按用户的向量缓存（可选，VECTOR_CACHE_ENABLED=1 开启）
+
+大多数用户的数据量不到 2 万条，每次搜索却要向 AnalyticDB 发 4 条以上的 ANN 查询。
+开启后，第一次搜索时把该用户所有 active 记录的 text / image / caption embedding
+加载为连续的 float32 numpy 矩阵，之后的向量召回在进程内完成：一次矩阵乘法 + argpartition 取 top-k。
+
+- 数据量超过 VECTOR_CACHE_MAX_ITEMS_PER_USER 的用户不缓存，继续走 SQL
+- 所有用户缓存的总内存不超过 VECTOR_CACHE_MEMORY_BUDGET_MB，超出时按 LRU 淘汰
+- 缓存以 (user_id, 数据版本号) 为 key（见 data_version.py）：任何进程的写入递增版本号后旧缓存不再命中，
+  不依赖 TTL；本进程写入 / 删除 / 更新 caption 时还会调用 invalidate_user 立即释放旧缓存的内存
+- VECTOR_CACHE_QUANTIZATION=int8 时矩阵以 int8 存储（内存约为 float32 的 1/4，见 quantization.py）：
+  在 int8 上粗召回 top_k * VECTOR_CACHE_RERANK_FACTOR 个候选，再取回这些候选的原始 float 向量重排
+  （search_index 的 fetch_vectors 回调），返回结果中的 embedding 和 similarity 都是全精度的；
+  取回的 float 向量保存在该用户的缓存里（计入内存预算），之后的查询只取回还没有的行
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from quantization import Int8Matrix
+
+ENABLED = os.getenv("VECTOR_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+MAX_ITEMS_PER_USER = int(os.getenv("VECTOR_CACHE_MAX_ITEMS_PER_USER", "20000"))
+MEMORY_BUDGET_BYTES = int(float(os.getenv("VECTOR_CACHE_MEMORY_BUDGET_MB", "512")) * 1024 * 1024)
+# none（float32）或 int8
+QUANTIZATION = os.getenv("VECTOR_CACHE_QUANTIZATION", "none").lower()
+# int8 粗召回的候选数 = top_k * RERANK_FACTOR
+RERANK_FACTOR = max(1, int(os.getenv("VECTOR_CACHE_RERANK_FACTOR", "4")))
+# int8 粗召回时阈值放宽的余量（量化误差可能让真实相似度刚好过阈值的行低于阈值）
+QUANTIZED_THRESHOLD_MARGIN = float(os.getenv("VECTOR_CACHE_QUANTIZED_THRESHOLD_MARGIN", "0.02"))
+
+# 缓存的模态 -> embedding 列
+MODALITY_COLUMNS = {
+    "text": "text_embedding",
+    "image": "image_embedding",
+    "caption": "caption_embedding",
+}
+
+# 每行非向量字段的估算内存（标题、描述、metadata 等），用于内存预算
+_ROW_OVERHEAD_BYTES = 2048
+
+
+def _as_vector(value) -> Optional[np.ndarray]:
+    """数据库返回的向量可能是数组，也可能是 "[0.1,0.2]" / "{0.1,0.2}" 形式的字符串"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        text = value.strip().strip("[]{}")
+        if not text:
+            return None
+        return np.array(text.split(","), dtype=np.float32)
+    vec = np.asarray(value, dtype=np.float32)
+    return vec if vec.size else None
+
+
+class _ModalityIndex:
+    """一个模态的向量矩阵（只包含有该 embedding 的行；quantize=True 时只保留 int8 矩阵）"""
+
+    def __init__(self, row_ids: np.ndarray, matrix: np.ndarray, is_doc: np.ndarray, quantize: bool = False):
+        self.row_ids = row_ids
+        self.is_doc = is_doc
+        self.dim = matrix.shape[1] if matrix.ndim == 2 else 0
+        # 范数用原始 float 向量计算（量化后的向量只用于内积）
+        norms = np.linalg.norm(matrix, axis=1) if len(matrix) else np.zeros(0, dtype=np.float32)
+        # 零向量的范数记为 1，相似度为 0
+        self.norms = np.where(norms > 0, norms, 1.0).astype(np.float32)
+        self.quantized: Optional[Int8Matrix] = Int8Matrix(matrix) if quantize and len(matrix) else None
+        self.matrix: Optional[np.ndarray] = None if self.quantized is not None else matrix
+
+    @property
+    def nbytes(self) -> int:
+        vectors = self.quantized.nbytes if self.quantized is not None else self.matrix.nbytes
+        return vectors + self.norms.nbytes + self.row_ids.nbytes + self.is_doc.nbytes
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        if self.quantized is not None:
+            return self.quantized.dot(query)
+        return self.matrix @ query
+
+    def vector(self, pos: int) -> np.ndarray:
+        if self.quantized is not None:
+            return self.quantized.row(pos)
+        return self.matrix[pos]
+
+
+class UserVectorIndex:
+    """一个用户的缓存：行数据（不含向量）+ 各模态的向量矩阵"""
+
+    def __init__(self, rows: List[Dict], quantize: Optional[bool] = None, version: Optional[int] = None):
+        # 加载前读取的数据版本号（见 data_version.py）；版本号变化后缓存不再命中
+        self.version = version
+        self.quantized = QUANTIZATION == "int8" if quantize is None else quantize
+        self.rows = []
+        self.modalities: Dict[str, _ModalityIndex] = {}
+        # int8 重排取回过的原始 float 向量：row_id -> {embedding 列: float32 向量}
+        self.float_rows: Dict[int, Dict[str, np.ndarray]] = {}
+        self._float_rows_nbytes = 0
+
+        vectors: Dict[str, List] = {modality: [] for modality in MODALITY_COLUMNS}
+        row_ids: Dict[str, List[int]] = {modality: [] for modality in MODALITY_COLUMNS}
+        for i, row in enumerate(rows):
+            for modality, column in MODALITY_COLUMNS.items():
+                vec = _as_vector(row.pop(column, None))
+                if vec is not None:
+                    vectors[modality].append(vec)
+                    row_ids[modality].append(i)
+            self.rows.append(row)
+
+        for modality in MODALITY_COLUMNS:
+            if vectors[modality]:
+                matrix = np.ascontiguousarray(np.vstack(vectors[modality]), dtype=np.float32)
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            ids = np.asarray(row_ids[modality], dtype=np.int32)
+            is_doc = np.array([self.rows[i].get("is_doc") is True for i in ids], dtype=bool)
+            self.modalities[modality] = _ModalityIndex(ids, matrix, is_doc, quantize=self.quantized)
+
+    @property
+    def nbytes(self) -> int:
+        vectors = sum(index.nbytes for index in self.modalities.values()) + self._float_rows_nbytes
+        return vectors + len(self.rows) * _ROW_OVERHEAD_BYTES
+
+    def add_float_rows(self, vectors_by_row: Dict[int, Dict]) -> None:
+        """保存 int8 重排取回的原始 float 向量"""
+        for row_id, vectors in vectors_by_row.items():
+            if row_id in self.float_rows:
+                continue
+            converted = {}
+            for column in MODALITY_COLUMNS.values():
+                vec = _as_vector(vectors.get(column)) if vectors else None
+                if vec is not None:
+                    converted[column] = vec
+            self.float_rows[row_id] = converted
+            self._float_rows_nbytes += sum(vec.nbytes for vec in converted.values())
+
+    def vector_of(self, modality: str, row_id: int) -> Optional[List[float]]:
+        """该行某个模态的向量（int8 模式下为反量化后的近似值）"""
+        index = self.modalities[modality]
+        pos = np.searchsorted(index.row_ids, row_id)
+        if pos < len(index.row_ids) and index.row_ids[pos] == row_id:
+            return index.vector(pos).tolist()
+        return None
+
+    def candidates(
+        self,
+        modality: str,
+        query_embedding: List[float],
+        limit: int,
+        threshold: float = 0.0,
+        scope: Optional[Dict[str, List]] = None,
+        exclude_docs: bool = False,
+    ) -> List[Tuple[int, float]]:
+        """
+        余弦相似度最高的 limit 行（int8 模式下为近似相似度）
+
+        Returns:
+            [(row_id, similarity)]，按相似度降序
+        """
+        index = self.modalities[modality]
+        if len(index.row_ids) == 0 or limit <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = float(np.linalg.norm(query))
+        if query_norm == 0 or query.shape[0] != index.dim:
+            return []
+        similarities = index.dot(query) / (index.norms * query_norm)
+
+        mask = similarities >= threshold
+        if exclude_docs:
+            mask &= ~index.is_doc
+        if scope is not None:
+            scope_urls = set(scope.get("urls") or [])
+            scope_tab_ids = set(scope.get("tab_ids") or [])
+            for pos in np.flatnonzero(mask):
+                row = self.rows[index.row_ids[pos]]
+                if row.get("url") not in scope_urls and row.get("tab_id") not in scope_tab_ids:
+                    mask[pos] = False
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > limit:
+            top = np.argpartition(-similarities[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return [(int(index.row_ids[pos]), float(similarities[pos])) for pos in candidates]
+
+    def result_row(self, modality: str, row_id: int, similarity: float, vectors: Optional[Dict] = None) -> Dict:
+        """
+        组装一条搜索结果（字段与 vector_db.search_by_*_embedding 的 SQL 结果一致）
+
+        Args:
+            vectors: 该行的原始 embedding 列（int8 重排时取回的全精度向量）；为 None 时使用缓存中的向量
+        """
+        item = dict(self.rows[row_id])
+        for other, column in MODALITY_COLUMNS.items():
+            if modality == "caption" or other != "caption":
+                value = _as_vector(vectors.get(column)) if vectors is not None else None
+                item[column] = value.tolist() if value is not None else self.vector_of(other, row_id)
+        item["similarity"] = similarity
+        return item
+
+    def search(
+        self,
+        modality: str,
+        query_embedding: List[float],
+        top_k: int,
+        threshold: float = 0.0,
+        scope: Optional[Dict[str, List]] = None,
+        exclude_docs: bool = False,
+    ) -> List[Dict]:
+        """
+        余弦相似度 top-k（与 SQL 的 1 - (embedding <=> query) 一致）
+
+        返回字段与 vector_db.search_by_*_embedding 的 SQL 结果一致（包含 similarity）；
+        int8 模式下相似度为近似值，需要全精度结果时使用 search_index
+        """
+        return [
+            self.result_row(modality, row_id, similarity)
+            for row_id, similarity in self.candidates(modality, query_embedding, top_k, threshold, scope, exclude_docs)
+        ]
+
+
+async def search_index(
+    index: UserVectorIndex,
+    modality: str,
+    query_embedding: List[float],
+    top_k: int,
+    threshold: float = 0.0,
+    scope: Optional[Dict[str, List]] = None,
+    exclude_docs: bool = False,
+    fetch_vectors: Optional[Callable[[List[str]], Awaitable[Dict[str, Dict]]]] = None,
+) -> List[Dict]:
+    """
+    在用户缓存中搜索；int8 模式下先粗召回再用全精度向量重排
+
+    Args:
+        fetch_vectors: async (urls) -> {url: {text_embedding, image_embedding, caption_embedding}}，
+                       取回候选的原始 float 向量（int8 模式必需；未提供时返回近似结果）
+    """
+    if not index.quantized or fetch_vectors is None:
+        return index.search(modality, query_embedding, top_k, threshold, scope, exclude_docs)
+
+    coarse = index.candidates(
+        modality, query_embedding, top_k * RERANK_FACTOR,
+        threshold - QUANTIZED_THRESHOLD_MARGIN, scope, exclude_docs,
+    )
+    if not coarse:
+        return []
+
+    missing = [row_id for row_id, _ in coarse if row_id not in index.float_rows]
+    if missing:
+        urls = [index.rows[row_id].get("url") for row_id in missing]
+        vectors_by_url = await fetch_vectors(urls)
+        # 只保存取回成功的行（取回失败的行下次查询再取）
+        index.add_float_rows({
+            row_id: vectors_by_url[url] for row_id, url in zip(missing, urls) if vectors_by_url.get(url)
+        })
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = float(np.linalg.norm(query))
+    column = MODALITY_COLUMNS[modality]
+    reranked = []
+    for row_id, approx in coarse:
+        vectors = index.float_rows.get(row_id)
+        vec = vectors.get(column) if vectors else None
+        if vec is not None and vec.shape == query.shape:
+            norm = float(np.linalg.norm(vec))
+            similarity = float(vec @ query) / (norm * query_norm) if norm > 0 else 0.0
+        else:
+            # 取回失败（行刚被删除等）：保留近似相似度
+            similarity = approx
+        if similarity >= threshold:
+            reranked.append((similarity, row_id, vectors))
+
+    reranked.sort(key=lambda r: -r[0])
+    return [index.result_row(modality, row_id, similarity, vectors) for similarity, row_id, vectors in reranked[:top_k]]
+
+
+class VectorCache:
+    """按用户的 LRU 缓存（总内存不超过 MEMORY_BUDGET_BYTES）"""
+
+    def __init__(self, memory_budget_bytes: int = MEMORY_BUDGET_BYTES, max_items_per_user: int = MAX_ITEMS_PER_USER):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_items_per_user = max_items_per_user
+        self._entries: "OrderedDict[str, UserVectorIndex]" = OrderedDict()
+        # 数据量超过阈值的用户 -> 当时的数据版本号（版本号不变时直接走 SQL，不重复 COUNT）
+        self._oversized: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # 持有或等待该用户锁的请求数（为 0 时才能删除锁）
+        self._lock_users: Dict[str, int] = {}
+        # 加载期间发生的失效（加载完成后丢弃结果，避免缓存旧数据）
+        self._generation: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def invalidate_user(self, user_id: str) -> None:
+        """该用户的数据发生变化（写入、删除、恢复、更新 caption）"""
+        self._entries.pop(user_id, None)
+        self._release_lock(user_id)
+        self._oversized.pop(user_id, None)
+        # 正在加载的请求按 generation 丢弃结果，锁保留给它和排队的请求
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    def _release_lock(self, user_id: str) -> None:
+        """
+        删除没有请求持有或等待的锁（持有中的锁被删掉后，新请求会拿到另一把锁，和正在加载的请求并发重复加载；
+        只看 lock.locked() 不够：释放之后、等待者被唤醒之前锁也是未锁定状态）
+        """
+        if not self._lock_users.get(user_id):
+            self._locks.pop(user_id, None)
+
+    def clear(self) -> None:
+        for user_id in list(self._entries):
+            self.invalidate_user(user_id)
+        self._oversized.clear()
+
+    def _evict_until_fits(self, incoming_bytes: int) -> bool:
+        if incoming_bytes > self.memory_budget_bytes:
+            return False
+        while self._entries and self.nbytes + incoming_bytes > self.memory_budget_bytes:
+            evicted, _ = self._entries.popitem(last=False)
+            self._release_lock(evicted)
+            self.evictions += 1
+        return True
+
+    async def get_index(self, user_id: str, version: int, loader, counter) -> Optional[UserVectorIndex]:
+        """
+        获取用户的缓存（不存在或数据版本号不同时加载）
+
+        Args:
+            version: 该用户当前的数据版本号（data_version.get_version，在加载数据之前读取）
+            loader: async () -> List[Dict]，加载该用户所有 active 行（包含 embedding 列）
+            counter: async () -> int，该用户 active 行数
+
+        Returns:
+            UserVectorIndex；用户数据量超过阈值或超出内存预算时返回 None（调用方走 SQL）
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.version == version:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+        if self._oversized.get(user_id) == version:
+            self.fallbacks += 1
+            return None
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._lock_users[user_id] = self._lock_users.get(user_id, 0) + 1
+        try:
+            async with lock:
+                return await self._load_index(user_id, version, loader, counter)
+        finally:
+            self._lock_users[user_id] -= 1
+            if not self._lock_users[user_id]:
+                del self._lock_users[user_id]
+                # 锁随缓存项一起释放：没有缓存下来的用户（数据量超限、超出预算等）不保留锁
+                if user_id not in self._entries:
+                    self._locks.pop(user_id, None)
+
+    async def _load_index(self, user_id: str, version: int, loader, counter) -> Optional[UserVectorIndex]:
+        """get_index 持有该用户的锁时调用"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.version == version:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        generation = self._generation.get(user_id, 0)
+        if await counter() > self.max_items_per_user:
+            self._oversized[user_id] = version
+            self.fallbacks += 1
+            return None
+
+        entry = UserVectorIndex(await loader(), version=version)
+        if self._generation.get(user_id, 0) != generation:
+            # 加载期间数据发生变化：本次使用加载结果，但不放入缓存
+            return entry
+        self._entries.pop(user_id, None)
+        if not self._evict_until_fits(entry.nbytes):
+            self.fallbacks += 1
+            return None
+        self._entries[user_id] = entry
+        print(f"[VectorCache] Loaded user {user_id}: {len(entry.rows)} rows, {entry.nbytes / 1024 / 1024:.1f} MB (total {self.nbytes / 1024 / 1024:.1f} MB)")
+        return entry
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": ENABLED,
+            "quantization": QUANTIZATION,
+            "users": len(self._entries),
+            "locks": len(self._locks),
+            "memory_mb": round(self.nbytes / 1024 / 1024, 1),
+            "memory_budget_mb": round(self.memory_budget_bytes / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "fallbacks": self.fallbacks,
+            "evictions": self.evictions,
+        }
+
+
+cache = VectorCache()
+
+
+def invalidate_user(user_id: str) -> None:
+    """使该用户的缓存失效（未开启缓存时什么也不做）"""
+    if ENABLED:
+        cache.invalidate_user(user_id)
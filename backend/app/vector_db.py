@@ -10,6 +10,14 @@ from typing import Dict, List, Optional, Tuple
 import numpy as np
 from datetime import datetime
 
+import query_registry
+import vector_cache
+import ann_search
+import shard_router
+import db_routing
+import data_version
+from db_routing import db_route
+
 
 def to_vector_str(vec: Optional[List[float]]) -> Optional[str]:
     """
@@ -43,8 +51,70 @@ def _qualified(table_name: str) -> str:
 ACTIVE_TABLE = _qualified(ACTIVE_TABLE_NAME)
 LEGACY_TABLE = _qualified(LEGACY_TABLE_NAME)
 
-# 连接池
-_pool: Optional[asyncpg.Pool] = None
+# 截图二进制单独存放（按内容 SHA-256 寻址），主表只保存 screenshot_hash
+SCREENSHOT_BLOB_TABLE_NAME = os.getenv("VECTOR_DB_SCREENSHOT_TABLE", "screenshot_blobs")
+SCREENSHOT_BLOB_TABLE = _qualified(SCREENSHOT_BLOB_TABLE_NAME)
+
+# 两阶段召回：先用 512 维前缀向量（*_embedding_512 列，维度见 search/config.PREFIX_EMBED_DIM）的 ANN 索引
+# 召回 top_k * candidate_factor 个候选（按召回路径配置，见 ann_search.py），再用 1024 维向量计算相似度、过滤和排序。
+# 需要先用 backfill_prefix_embeddings.py 回填旧数据再开启（未回填的行不会被召回）
+PREFIX_RECALL_ENABLED = os.getenv("PREFIX_RECALL_ENABLED", "0").lower() in ("1", "true", "yes")
+# 向量距离：cosine（默认）或 ip（内积）。入库向量都是单位向量（search/normalize.py），两者排序一致；
+# ip 省去每次比较时的范数计算。切换后需要用 backfill_unit_embeddings.py 归一化旧数据并重建 ANN 索引
+VECTOR_DISTANCE_MEASURE = os.getenv("VECTOR_DISTANCE_MEASURE", "cosine").lower()
+if VECTOR_DISTANCE_MEASURE not in ("cosine", "ip"):
+    raise ValueError(f"Unknown VECTOR_DISTANCE_MEASURE: {VECTOR_DISTANCE_MEASURE} (expected 'cosine' or 'ip')")
+# cosine: <=> 返回 1 - 余弦相似度；ip: <#> 返回负内积（两者都是越小越相似，可直接 ORDER BY）
+_DISTANCE_OPERATOR = "<=>" if VECTOR_DISTANCE_MEASURE == "cosine" else "<#>"
+
+
+def _distance_sql(column: str, vector_param: str) -> str:
+    """向量距离表达式（越小越相似，ORDER BY 用这个表达式才能走 ANN 索引）"""
+    return f"{column} {_DISTANCE_OPERATOR} {vector_param}"
+
+
+def _similarity_from_distance(distance_sql: str) -> str:
+    """把距离（_distance_sql 的结果或其别名）换算为相似度（单位向量下 cosine 和 ip 的值相同）"""
+    if VECTOR_DISTANCE_MEASURE == "cosine":
+        return f"1 - ({distance_sql})"
+    return f"-({distance_sql})"
+
+
+def _similarity_sql(column: str, vector_param: str) -> str:
+    """相似度表达式"""
+    return _similarity_from_distance(_distance_sql(column, vector_param))
+
+
+# 1024 维 text / image 向量的 ANN 索引。开启两阶段召回后第一阶段走 512 维前缀索引，1024 维只在候选行上精算，
+# 两套索引同时存在会让索引内存翻倍，因此默认不建（已有的在 init_schema 时删除）；
+# 其他按 1024 维排序的查询（VectorDBClient、设计师网站召回等）仍需要时设置 FULL_DIM_ANN_INDEX=1 保留
+FULL_DIM_ANN_INDEX_ENABLED = os.getenv(
+    "FULL_DIM_ANN_INDEX", "0" if PREFIX_RECALL_ENABLED else "1"
+).lower() in ("1", "true", "yes")
+PREFIX_EMBEDDING_COLUMNS = {
+    "text_embedding": "text_embedding_512",
+    "image_embedding": "image_embedding_512",
+    "caption_embedding": "caption_embedding_512",
+}
+
+# 连接池配置（一次漏斗搜索最多同时占用 7 个连接，默认上限按两个并发搜索 + 写入留余量）
+POOL_MIN_SIZE = int(os.getenv("ADBPG_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("ADBPG_POOL_MAX_SIZE", "20"))
+# 每个连接缓存的预编译语句数（asyncpg 默认 100，0 表示关闭）
+POOL_STATEMENT_CACHE_SIZE = int(os.getenv("ADBPG_STATEMENT_CACHE_SIZE", "100"))
+# 单条 SQL 超时（秒），不设置表示不限制
+POOL_COMMAND_TIMEOUT = float(os.getenv("ADBPG_COMMAND_TIMEOUT")) if os.getenv("ADBPG_COMMAND_TIMEOUT") else None
+# 空闲连接最长保留时间（秒），超过后关闭（asyncpg 默认 300）
+POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("ADBPG_MAX_INACTIVE_LIFETIME", "300"))
+# 获取连接的最长等待时间（秒），不设置表示一直等待
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("ADBPG_POOL_ACQUIRE_TIMEOUT")) if os.getenv("ADBPG_POOL_ACQUIRE_TIMEOUT") else None
+
+# 连接池（InstrumentedPool 包装，记录获取等待时间和 SQL 耗时，见 pool_metrics.py）
+# _pool 是分片 0 的（写）连接池；其他分片的连接池在 _shard_pools 中（见 shard_router.py）
+_pool = None
+_shard_pools: Dict[int, object] = {}
+# 读连接池（配置了 ADBPG_READ_DSNS / ADBPG_READ_POOL_MAX_SIZE 时创建，见 db_routing.py）
+_read_pools: Dict[int, object] = {}
 
 def _normalize_user_id(user_id: Optional[str]) -> str:
     value = (user_id or "anonymous").strip()
@@ -58,6 +128,11 @@ def _row_to_dict(row: asyncpg.Record) -> Dict:
         item["image_embedding"] = list(item["image_embedding"])
     if item.get("metadata"):
         item["metadata"] = json.loads(item["metadata"]) if isinstance(item["metadata"], str) else item["metadata"]
+    if item.get("screenshot_hash"):
+        item["screenshot_url"] = screenshot_url(item["screenshot_hash"], item.get("user_id"))
+    elif item.get("screenshot_image"):
+        # 尚未迁移到 screenshot_blobs 的旧数据（或不是 data URL 的截图），直接使用原值
+        item["screenshot_url"] = item["screenshot_image"]
     return item
 
 async def _create_index(conn, description: str, sql: str):
@@ -67,44 +142,202 @@ async def _create_index(conn, description: str, sql: str):
         print(f"[VectorDB] Warning: could not create {description}: {e}")
 
 
-async def get_pool() -> asyncpg.Pool:
-    """获取数据库连接池（单例）"""
-    global _pool
-    if _pool is None:
+async def _ensure_column(conn, column_name: str, column_type: str):
+    """如果列不存在则添加（ADBPG 不支持 ADD COLUMN IF NOT EXISTS）"""
+    exists = await conn.fetchval(f"""
+        SELECT EXISTS (
+            SELECT FROM information_schema.columns 
+            WHERE table_schema = '{NAMESPACE}'
+              AND table_name = '{ACTIVE_TABLE_NAME}'
+              AND column_name = '{column_name}'
+        );
+    """)
+    if not exists:
+        await conn.execute(f"ALTER TABLE {ACTIVE_TABLE} ADD COLUMN {column_name} {column_type};")
+        print(f"[VectorDB] ✓ Added {column_name} column to {ACTIVE_TABLE}")
+
+
+def _feature_sql(first_param_idx: int) -> Tuple[str, str, str]:
+    """
+    生成写入派生列（search/features.py 的 FEATURE_COLUMNS）的 SQL 片段
+    
+    Args:
+        first_param_idx: 第一个派生列对应的参数序号
+    
+    Returns:
+        (列名列表, 占位符列表, ON CONFLICT 更新子句)
+    """
+    from search.features import FEATURE_COLUMNS
+    columns_sql = ", ".join(FEATURE_COLUMNS)
+    placeholders_sql = ", ".join(f"${first_param_idx + i}" for i in range(len(FEATURE_COLUMNS)))
+    update_sql = ",\n".join(f"{col} = EXCLUDED.{col}" for col in FEATURE_COLUMNS)
+    return columns_sql, placeholders_sql, update_sql
+
+
+def _row_fingerprint(*values) -> str:
+    """
+    计算一行写入内容的指纹（upsert 时与已存储的指纹比较，相同则跳过更新）
+    
+    values 必须是可 JSON 序列化的值（向量传入 to_vector_str 之后的字符串）
+    """
+    import hashlib
+    payload = json.dumps(values, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """新建连接时注册 SQL 耗时统计"""
+    from pool_metrics import query_logger
+    conn.add_query_logger(query_logger)
+
+
+async def _create_pool(shard: int, read: bool = False):
+    from pool_metrics import InstrumentedPool
+    max_size = POOL_MAX_SIZE
+    if read and db_routing.READ_POOL_MAX_SIZE is not None:
+        max_size = db_routing.READ_POOL_MAX_SIZE
+    if read and db_routing.READ_DSNS:
+        if shard >= len(db_routing.READ_DSNS):
+            raise ValueError(f"ADBPG_READ_DSNS has no entry for shard {shard}")
+        connect_kwargs = {"dsn": db_routing.READ_DSNS[shard]}
+    elif shard_router.SHARD_DSNS:
+        connect_kwargs = {"dsn": shard_router.SHARD_DSNS[shard]}
+    else:
         if not DB_HOST:
             raise ValueError("ADBPG_HOST environment variable not set")
-        _pool = await asyncpg.create_pool(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            min_size=2,
-            max_size=10,
-            ssl="disable",  # 根据用户提供的连接字符串
-        )
-    return _pool
+        connect_kwargs = {"host": DB_HOST, "port": DB_PORT, "database": DB_NAME, "user": DB_USER, "password": DB_PASSWORD}
+    raw_pool = await asyncpg.create_pool(
+        **connect_kwargs,
+        min_size=min(POOL_MIN_SIZE, max_size),
+        max_size=max_size,
+        statement_cache_size=POOL_STATEMENT_CACHE_SIZE,
+        command_timeout=POOL_COMMAND_TIMEOUT,
+        max_inactive_connection_lifetime=POOL_MAX_INACTIVE_LIFETIME,
+        init=_init_connection,
+        ssl="disable",  # 根据用户提供的连接字符串
+    )
+    print(
+        f"[VectorDB] ✓ {'Read' if read else 'Connection'} pool created (shard={shard}/{shard_router.SHARD_COUNT}, "
+        f"min={min(POOL_MIN_SIZE, max_size)}, max={max_size}, "
+        f"statement_cache={POOL_STATEMENT_CACHE_SIZE}, command_timeout={POOL_COMMAND_TIMEOUT}, "
+        f"max_inactive={POOL_MAX_INACTIVE_LIFETIME}s)"
+    )
+    return InstrumentedPool(raw_pool, acquire_timeout=POOL_ACQUIRE_TIMEOUT)
+
+
+async def get_shard_pool(shard: int):
+    """获取某个分片的连接池（单例，大小和超时见 ADBPG_POOL_* 环境变量）"""
+    global _pool
+    if shard == 0:
+        if _pool is None:
+            _pool = await _create_pool(0)
+        return _pool
+    if not 0 < shard < shard_router.SHARD_COUNT:
+        raise ValueError(f"Invalid shard {shard} (SHARD_COUNT={shard_router.SHARD_COUNT})")
+    if shard not in _shard_pools:
+        _shard_pools[shard] = await _create_pool(shard)
+    return _shard_pools[shard]
+
+
+async def get_shard_read_pool(shard: int):
+    """获取某个分片的读连接池（没有独立读连接池时返回写连接池）"""
+    if not db_routing.READ_POOL_ENABLED:
+        return await get_shard_pool(shard)
+    if not 0 <= shard < shard_router.SHARD_COUNT:
+        raise ValueError(f"Invalid shard {shard} (SHARD_COUNT={shard_router.SHARD_COUNT})")
+    if shard not in _read_pools:
+        _read_pools[shard] = await _create_pool(shard, read=True)
+    return _read_pools[shard]
+
+
+async def _user_shard(user_id: Optional[str]) -> int:
+    if user_id is None or shard_router.SHARD_COUNT == 1:
+        return 0
+    return await shard_router.shard_for_user(user_id)
+
+
+async def get_pool(user_id: Optional[str] = None):
+    """
+    获取写连接池（主库；写入、管理脚本，以及必须读到主库最新提交的查询；其他只读查询用 get_read_pool）
+    
+    写入提交后由调用方调用 db_routing.mark_write(user_id) 记录写入时间（read-your-writes，见 db_routing.py）
+    
+    Args:
+        user_id: 按用户写入时传入（已 _normalize_user_id），路由到该用户所在的分片；
+            不传时返回分片 0（只有一个分片时两者相同）
+    """
+    return await get_shard_pool(await _user_shard(user_id))
+
+
+async def get_shard_pools(user_id: Optional[str] = None) -> List:
+    """
+    管理脚本用：返回要处理的分片的写连接池
+
+    Args:
+        user_id: 只处理该用户时传入（已 _normalize_user_id），只返回该用户所在分片；
+            不传时返回所有分片（按分片号顺序）
+    """
+    if user_id is not None:
+        return [await get_shard_pool(await _user_shard(user_id))]
+    return [await get_shard_pool(shard) for shard in range(shard_router.SHARD_COUNT)]
+
+
+async def get_read_pool(user_id: Optional[str] = None):
+    """
+    获取读连接池（搜索召回、列表等只读查询）
+    
+    没有独立读连接池时与 get_pool 相同；读连接池指向副本且该用户最近写入过数据时返回主库连接池
+    
+    Args:
+        user_id: 按用户查询时传入（已 _normalize_user_id），路由到该用户所在的分片
+    """
+    shard = await _user_shard(user_id)
+    if db_routing.read_from_primary(user_id):
+        return await get_shard_pool(shard)
+    db_routing.record_read(db_routing.READ_FROM_REPLICA)
+    return await get_shard_read_pool(shard)
+
+
+def get_pool_metrics(top: int = 20) -> Dict:
+    """连接池指标快照 + 热点查询调用次数（连接池尚未创建时只返回已记录的统计）"""
+    from pool_metrics import metrics
+    snapshot = {**metrics.snapshot(_pool, top=top), "prepared_statements": query_registry.stats()}
+    if shard_router.SHARD_COUNT > 1:
+        snapshot["shards"] = shard_router.stats()
+    if db_routing.READ_POOL_ENABLED:
+        read_pool = _read_pools.get(0)
+        snapshot["routing"] = db_routing.stats()
+        if read_pool is not None:
+            size = read_pool.get_size()
+            snapshot["read_pool"] = {"size": size, "idle": read_pool.get_idle_size(), "in_use": size - read_pool.get_idle_size()}
+    return snapshot
 
 
 async def close_pool():
-    """关闭连接池"""
+    """关闭连接池（所有分片）"""
     global _pool
     if _pool:
         await _pool.close()
         _pool = None
+    for shard in list(_shard_pools):
+        await _shard_pools.pop(shard).close()
+    for shard in list(_read_pools):
+        await _read_pools.pop(shard).close()
 
 
+@db_route("write")
 async def drop_table_if_exists():
     """
     手动删除表（用于修复约束冲突问题）
     注意：这会删除表中的所有数据！
     """
     try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            await conn.execute(f"DROP TABLE IF EXISTS {ACTIVE_TABLE} CASCADE;")
-            print(f"[VectorDB] ✓ Dropped table {ACTIVE_TABLE}")
-            return True
+        for shard in range(shard_router.SHARD_COUNT):
+            pool = await get_shard_pool(shard)
+            async with pool.acquire() as conn:
+                await conn.execute(f"DROP TABLE IF EXISTS {ACTIVE_TABLE} CASCADE;")
+                print(f"[VectorDB] ✓ Dropped table {ACTIVE_TABLE} (shard={shard})")
+        return True
     except Exception as e:
         print(f"[VectorDB] Error dropping table: {e}")
         import traceback
@@ -176,10 +409,25 @@ async def check_table_constraints(conn, table_name: str = ACTIVE_TABLE_NAME) ->
         return False, f"Failed to check constraints: {e}"
 
 
-async def init_schema():
-    """初始化数据库表结构"""
+@db_route("write")
+async def init_schema(shard: Optional[int] = None):
+    """
+    初始化数据库表结构
+    
+    Args:
+        shard: 只初始化该分片；None 表示所有分片（见 shard_router.py）
+    """
+    shards = range(shard_router.SHARD_COUNT) if shard is None else [shard]
+    for shard_id in shards:
+        await _init_shard_schema(shard_id)
+
+
+@db_route("write")
+async def _init_shard_schema(shard: int):
+    """初始化一个分片的表结构（分片 0 额外创建分片目录表）"""
+    from search.config import PREFIX_EMBED_DIM
     try:
-        pool = await get_pool()
+        pool = await get_shard_pool(shard)
         
         async with pool.acquire() as conn:
             # 注意：在阿里云 ADB PostgreSQL 中，Namespace 应该通过 API 创建
@@ -223,6 +471,7 @@ async def init_schema():
                         description TEXT,
                         image TEXT,
                         screenshot_image TEXT,
+                        screenshot_hash TEXT,
                         site_name TEXT,
                         tab_id INTEGER,
                         tab_title TEXT,
@@ -235,6 +484,23 @@ async def init_schema():
                         dominant_colors TEXT[],
                         style_tags TEXT[],
                         object_tags TEXT[],
+                        -- 入库时计算的派生列（见 search/features.py）
+                        host TEXT,
+                        site_domain TEXT,
+                        caption_tokens TEXT[],
+                        is_doc BOOLEAN,
+                        is_designer_site BOOLEAN,
+                        normalized_title TEXT,
+                        normalized_url TEXT,
+                        caption_hash TEXT,
+                        image_hash TEXT,
+                        session_id TEXT,
+                        content_hash TEXT,
+                        row_fingerprint TEXT,
+                        -- 两阶段召回的 512 维前缀向量（search/features.prefix_embedding）
+                        text_embedding_512 vector({PREFIX_EMBED_DIM}),
+                        image_embedding_512 vector({PREFIX_EMBED_DIM}),
+                        caption_embedding_512 vector({PREFIX_EMBED_DIM}),
                         status TEXT DEFAULT 'active' CHECK (status IN ('active', 'deleted')),
                         deleted_at TIMESTAMP,
                         created_at TIMESTAMP DEFAULT NOW(),
@@ -271,7 +537,7 @@ async def init_schema():
                     ON {ACTIVE_TABLE}
                     USING ann(caption_embedding)
                     WITH (
-                        distancemeasure = cosine,
+                        distancemeasure = {VECTOR_DISTANCE_MEASURE},
                         hnsw_m           = 64,
                         pq_enable        = 0
                     );
@@ -327,6 +593,25 @@ async def init_schema():
                         ADD COLUMN deleted_at TIMESTAMP;
                     """)
                     print(f"[VectorDB] ✓ Added deleted_at column to {ACTIVE_TABLE}")
+                
+                # 添加入库派生列（已有数据通过 backfill_item_features.py 回填）
+                await _ensure_column(conn, "host", "TEXT")
+                await _ensure_column(conn, "site_domain", "TEXT")
+                await _ensure_column(conn, "caption_tokens", "TEXT[]")
+                await _ensure_column(conn, "is_doc", "BOOLEAN")
+                await _ensure_column(conn, "is_designer_site", "BOOLEAN")
+                await _ensure_column(conn, "normalized_title", "TEXT")
+                await _ensure_column(conn, "normalized_url", "TEXT")
+                await _ensure_column(conn, "caption_hash", "TEXT")
+                await _ensure_column(conn, "image_hash", "TEXT")
+                await _ensure_column(conn, "session_id", "TEXT")
+                await _ensure_column(conn, "content_hash", "TEXT")
+                await _ensure_column(conn, "row_fingerprint", "TEXT")
+                # 截图改为引用 screenshot_blobs（旧数据通过 migrate_screenshots_to_blobs.py 迁移）
+                await _ensure_column(conn, "screenshot_hash", "TEXT")
+                # 两阶段召回的 512 维前缀向量（旧数据通过 backfill_prefix_embeddings.py 回填）
+                for column in PREFIX_EMBEDDING_COLUMNS.values():
+                    await _ensure_column(conn, column, f"vector({PREFIX_EMBED_DIM})")
             
             # 创建必要索引（忽略已存在的错误）
             await _create_index(
@@ -335,39 +620,149 @@ async def init_schema():
                 f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_id ON {ACTIVE_TABLE}(user_id);"
             )
             
+            # 设计师网站召回：site_domain = ANY(...) 精确匹配
             await _create_index(
                 conn,
-                "text embedding index",
-                f"""
-                CREATE INDEX idx_{ACTIVE_TABLE_NAME}_text_embedding
-                ON {ACTIVE_TABLE}
-                USING ann(text_embedding)
-                WITH (
-                    distancemeasure = cosine,
-                    hnsw_m           = 64,
-                    pq_enable        = 0
-                );
-                """
+                "site_domain index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_site_domain ON {ACTIVE_TABLE}(user_id, site_domain);"
             )
             
             await _create_index(
                 conn,
-                "image embedding index",
-                f"""
-                CREATE INDEX idx_{ACTIVE_TABLE_NAME}_image_embedding
-                ON {ACTIVE_TABLE}
-                USING ann(image_embedding)
-                WITH (
-                    distancemeasure = cosine,
-                    hnsw_m           = 64,
-                    pq_enable        = 0
-                );
-                """
+                "host index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_host ON {ACTIVE_TABLE}(user_id, host);"
+            )
+            
+            # Caption 关键词召回：caption_tokens && $tokens（jieba 分词结果，中文可用）
+            await _create_index(
+                conn,
+                "caption_tokens GIN index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_caption_tokens_gin ON {ACTIVE_TABLE} USING GIN (caption_tokens);"
+            )
+            
+            # 去重：按标准化标题 / URL 查找同一用户的重复记录
+            await _create_index(
+                conn,
+                "normalized_title index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_normalized_title ON {ACTIVE_TABLE}(user_id, normalized_title);"
             )
             
-            print(f"[VectorDB] ✓ Schema initialized for namespace: {NAMESPACE} (table={ACTIVE_TABLE})")
+            await _create_index(
+                conn,
+                "normalized_url index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_normalized_url ON {ACTIVE_TABLE}(user_id, normalized_url);"
+            )
+            
+            # 入库去重检查 / 清理脚本：按 caption、图片哈希查找重复
+            await _create_index(
+                conn,
+                "caption_hash index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_caption_hash ON {ACTIVE_TABLE}(user_id, caption_hash);"
+            )
+            
+            await _create_index(
+                conn,
+                "image_hash index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_image_hash ON {ACTIVE_TABLE}(user_id, image_hash);"
+            )
+            
+            # Session / Tab 级操作（按 session 删除、列出，按 tab_id 过滤）
+            await _create_index(
+                conn,
+                "session_id index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_session_id ON {ACTIVE_TABLE}(user_id, session_id);"
+            )
+            
+            await _create_index(
+                conn,
+                "tab_id index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_tab_id ON {ACTIVE_TABLE}(user_id, tab_id);"
+            )
+            
+            # 分页列表和增量同步：按 (LIST_SORT_KEY, url) 做 keyset 分页（旧数据的 updated_at 可能为 NULL）；
+            # 增量同步原来按 (updated_at, url) 分页的索引不再使用
+            await conn.execute(f"DROP INDEX IF EXISTS {NAMESPACE}.idx_{ACTIVE_TABLE_NAME}_user_updated_at;")
+            await _create_index(
+                conn,
+                "list sort key index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_user_list_key ON {ACTIVE_TABLE}(user_id, ({LIST_SORT_KEY}), url);"
+            )
+            
+            # 截图引用计数 / 清理孤立截图时按 screenshot_hash 查找
+            await _create_index(
+                conn,
+                "screenshot_hash index",
+                f"CREATE INDEX idx_{ACTIVE_TABLE_NAME}_screenshot_hash ON {ACTIVE_TABLE}(screenshot_hash);"
+            )
+            
+            # 截图二进制表（BYTEA，不再以 base64 TEXT 存在主表里）
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {SCREENSHOT_BLOB_TABLE} (
+                    hash TEXT PRIMARY KEY,
+                    content_type TEXT NOT NULL,
+                    data BYTEA NOT NULL,
+                    size_bytes INTEGER,
+                    created_at TIMESTAMP DEFAULT NOW()
+                );
+            """)
+            
+            # ANN 索引：只建当前召回方式用到的那一套（见 FULL_DIM_ANN_INDEX_ENABLED / PREFIX_RECALL_ENABLED）
+            for column in ("text_embedding", "image_embedding"):
+                if not FULL_DIM_ANN_INDEX_ENABLED:
+                    await conn.execute(f"DROP INDEX IF EXISTS {NAMESPACE}.idx_{ACTIVE_TABLE_NAME}_{column};")
+                    continue
+                await _create_index(
+                    conn,
+                    f"{column} index",
+                    f"""
+                    CREATE INDEX idx_{ACTIVE_TABLE_NAME}_{column}
+                    ON {ACTIVE_TABLE}
+                    USING ann({column})
+                    WITH (
+                        distancemeasure = {VECTOR_DISTANCE_MEASURE},
+                        hnsw_m           = 64,
+                        pq_enable        = 0
+                    );
+                    """
+                )
+            
+            # 512 维前缀向量索引（两阶段召回的第一阶段，只在开启两阶段召回时建）
+            prefix_columns = PREFIX_EMBEDDING_COLUMNS.values() if PREFIX_RECALL_ENABLED else []
+            for column in prefix_columns:
+                await _create_index(
+                    conn,
+                    f"{column} index",
+                    f"""
+                    CREATE INDEX idx_{ACTIVE_TABLE_NAME}_{column}
+                    ON {ACTIVE_TABLE}
+                    USING ann({column})
+                    WITH (
+                        distancemeasure = {VECTOR_DISTANCE_MEASURE},
+                        hnsw_m           = 64,
+                        pq_enable        = 0
+                    );
+                    """
+                )
+            
+            # 按用户的数据版本号（每个分片保存该分片上用户的版本号，见 data_version.py）
+            await data_version.create_table(conn)
+            
+            if shard == 0 and shard_router.SHARD_COUNT > 1:
+                # 分片目录表：覆盖按哈希计算的默认分片（rebalance_user_shard.py 写入）
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {shard_router.directory_table()} (
+                        user_id TEXT PRIMARY KEY,
+                        shard INTEGER NOT NULL,
+                        updated_at TIMESTAMP DEFAULT NOW()
+                    );
+                """)
+            
+            print(
+                f"[VectorDB] ✓ Schema initialized for namespace: {NAMESPACE} (table={ACTIVE_TABLE}, "
+                f"shard={shard}/{shard_router.SHARD_COUNT})"
+            )
     except Exception as e:
-        print(f"[VectorDB] Error initializing schema: {e}")
+        print(f"[VectorDB] Error initializing schema (shard={shard}): {e}")
         import traceback
         traceback.print_exc()
         raise
@@ -403,6 +798,83 @@ def _normalize_url_for_storage(url: str) -> str:
         return url.lower()
 
 
+# 召回 SQL 需要返回的派生列（过滤、去重、设计师网站加权直接使用）
+SEARCH_FEATURE_COLUMNS = "site_domain, is_doc, is_designer_site, normalized_title, normalized_url"
+
+
+def _doc_clause(exclude_docs: bool) -> str:
+    """
+    排除文档类内容的 SQL 片段
+    
+    使用 IS NOT TRUE：尚未回填 is_doc 的旧数据（NULL）保留，由调用方在 Python 中兜底判断
+    """
+    return " AND is_doc IS NOT TRUE" if exclude_docs else ""
+
+
+def build_search_scope(
+    filter_urls: Optional[List[str]] = None,
+    filter_tab_ids: Optional[List[str]] = None,
+) -> Optional[Dict[str, List]]:
+    """
+    将 Personal Space 的 filter_urls / filter_tab_ids 转换为召回 SQL 使用的搜索范围
+    
+    URL 使用与存储相同的标准化规则（_normalize_url_for_storage），同时保留原始 URL，
+    兼容标准化之前写入的旧数据；tab_id 转为整数（与 tab_id 列类型一致）。
+    
+    Args:
+        filter_urls: 只搜索这些 URL
+        filter_tab_ids: 只搜索这些 tab_id
+    
+    Returns:
+        None 表示不限制范围；否则返回 {"urls": [...], "tab_ids": [...]}
+    """
+    if not filter_urls and not filter_tab_ids:
+        return None
+    
+    urls = set()
+    for url in filter_urls or []:
+        if not url:
+            continue
+        url = str(url).strip()
+        urls.add(url)
+        urls.add(_normalize_url_for_storage(url))
+    
+    tab_ids = set()
+    for tab_id in filter_tab_ids or []:
+        try:
+            tab_ids.add(int(tab_id))
+        except (ValueError, TypeError):
+            continue
+    
+    return {"urls": sorted(urls), "tab_ids": sorted(tab_ids)}
+
+
+def _scope_clause(scope: Optional[Dict[str, List]], params: List) -> str:
+    """
+    生成搜索范围的 SQL 条件（参数追加到 params 末尾）
+    
+    URL 和 tab_id 两个数组参数总是同时传入（可以为空数组），语句文本只取决于是否指定了范围，
+    便于预编译复用（见 query_registry.py）；两个数组都为空时 ANY 都不成立，不召回任何结果
+    
+    Returns:
+        " AND (...)" 形式的 SQL 片段；scope 为 None 时返回空字符串
+    """
+    if scope is None:
+        return ""
+    
+    params.append(list(scope.get("urls") or []))
+    urls_idx = len(params)
+    params.append(list(scope.get("tab_ids") or []))
+    tab_ids_idx = len(params)
+    return f" AND (url = ANY(${urls_idx}::text[]) OR tab_id = ANY(${tab_ids_idx}::int[]))"
+
+
+def _scoped_query_name(name: str, scope: Optional[Dict[str, List]], exclude_docs: bool = False) -> str:
+    """带搜索范围 / 文档过滤的语句有几种固定变体，每种变体使用一个预编译语句名"""
+    return name + (".scoped" if scope is not None else "") + (".no_docs" if exclude_docs else "")
+
+
+@db_route("write")
 async def upsert_opengraph_item(
     user_id: Optional[str],
     url: str,
@@ -421,6 +893,10 @@ async def upsert_opengraph_item(
     dominant_colors: Optional[List[str]] = None,
     style_tags: Optional[List[str]] = None,
     object_tags: Optional[List[str]] = None,
+    session_id: Optional[str] = None,
+    stats: Optional[Dict[str, int]] = None,
+    bump_version: bool = True,
+    content_hash: Optional[str] = None,
 ) -> bool:
     """
     插入或更新 OpenGraph 数据
@@ -428,6 +904,9 @@ async def upsert_opengraph_item(
     ✅ 自动去重：使用标准化 URL（移除查询参数、锚点）作为唯一标识
     这样可以避免同一个页面因为查询参数不同而被重复存储
     
+    ✅ 跳过未变化的行：写入内容的指纹（row_fingerprint）与已存储的一致且记录为 active 时，
+    ON CONFLICT 不做任何更新（不重写向量列、不触发 HNSW 索引更新、不修改 updated_at）
+    
     Args:
         url: 网页 URL（会自动标准化用于去重）
         title: 标题
@@ -439,13 +918,22 @@ async def upsert_opengraph_item(
         text_embedding: 文本 embedding 向量（1024维）
         image_embedding: 图像 embedding 向量（1024维）
         metadata: 其他元数据
+        session_id: 所属 Session ID（不传时从 metadata.session_id 读取）
+        stats: 统计字典（外部传入），写入时 stats["written"] += 1，跳过时 stats["skipped"] += 1
+        bump_version: 实际写入时递增用户的数据版本号（batch_upsert_items 传 False，整批结束后只递增一次）
+        content_hash: 按原始请求计算的内容哈希（见 search/features.compute_content_hash），不传时按写入的字段计算
     
     Returns:
-        是否成功
+        是否成功（跳过未变化的行也视为成功）
     """
     try:
         # ✅ 标准化 URL 用于去重（移除查询参数、锚点、尾随斜杠）
         normalized_url = _normalize_url_for_storage(url)
+        # ✅ 向量统一存为单位向量（已归一化的向量不变；维度不对 / NaN / 零向量置为 None）
+        from search.normalize import normalize_embeddings
+        text_embedding, image_embedding, caption_embedding = normalize_embeddings(
+            [text_embedding, image_embedding, caption_embedding]
+        )
         # ✅ 类型验证和规范化
         # 确保 image 是字符串，不是数组
         if image is not None:
@@ -474,7 +962,23 @@ async def upsert_opengraph_item(
                 tab_id = None
         
         user_id = _normalize_user_id(user_id)
-        pool = await get_pool()
+        
+        # ✅ 入库时一次性计算派生列（host、site_domain、caption_tokens），搜索时直接使用
+        from search.features import FEATURE_COLUMNS, compute_item_features
+        features = compute_item_features({
+            "url": normalized_url,
+            "title": title,
+            "tab_title": tab_title,
+            "description": description,
+            "site_name": site_name,
+            "image": image,
+            "image_caption": image_caption,
+            "metadata": metadata,
+            "session_id": session_id,
+            "content_hash": content_hash,
+        })
+        
+        pool = await get_pool(user_id)
         
         async with pool.acquire() as conn:
             # 准备 metadata
@@ -484,6 +988,12 @@ async def upsert_opengraph_item(
             text_vec = to_vector_str(text_embedding)
             image_vec = to_vector_str(image_embedding)
             caption_vec = to_vector_str(caption_embedding)
+            # 两阶段召回的 512 维前缀向量（由 1024 维向量派生，不参与行指纹）
+            from search.config import PREFIX_EMBED_DIM
+            from search.features import prefix_embedding
+            text_prefix_vec = to_vector_str(prefix_embedding(text_embedding))
+            image_prefix_vec = to_vector_str(prefix_embedding(image_embedding))
+            caption_prefix_vec = to_vector_str(prefix_embedding(caption_embedding))
             
             # 检查新字段是否存在（向后兼容）
             has_caption_fields = await conn.fetchval(f"""
@@ -495,62 +1005,114 @@ async def upsert_opengraph_item(
                 );
             """)
             
-            if has_caption_fields:
-                # 使用新字段
-                await conn.execute(f"""
-                    INSERT INTO {ACTIVE_TABLE} (
-                        user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, text_embedding, image_embedding, metadata,
-                        image_caption, caption_embedding, dominant_colors, style_tags, object_tags,
-                        status, updated_at
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::vector(1024), $10::vector(1024), $11::jsonb,
-                        $12, $13::vector(1024), $14, $15, $16,
-                        'active', NOW())
-                    ON CONFLICT (user_id, url) DO UPDATE SET
-                        title = EXCLUDED.title,
-                        description = EXCLUDED.description,
-                        image = EXCLUDED.image,
-                        site_name = EXCLUDED.site_name,
-                        tab_id = EXCLUDED.tab_id,
-                        tab_title = EXCLUDED.tab_title,
-                        text_embedding = EXCLUDED.text_embedding,
-                        image_embedding = EXCLUDED.image_embedding,
-                        metadata = EXCLUDED.metadata,
-                        image_caption = EXCLUDED.image_caption,
-                        caption_embedding = EXCLUDED.caption_embedding,
-                        dominant_colors = EXCLUDED.dominant_colors,
-                        style_tags = EXCLUDED.style_tags,
-                        object_tags = EXCLUDED.object_tags,
-                        status = 'active',
-                        deleted_at = NULL,
-                        updated_at = NOW();
-                """, user_id, normalized_url, title, description, image, site_name,
-                    tab_id, tab_title, text_vec, image_vec, metadata_json,
-                    image_caption, caption_vec, dominant_colors, style_tags, object_tags)
-            else:
-                # 降级到旧版本（只使用 metadata）
-                await conn.execute(f"""
-                    INSERT INTO {ACTIVE_TABLE} (
-                        user_id, url, title, description, image, site_name,
-                        tab_id, tab_title, text_embedding, image_embedding, metadata, 
-                        status, updated_at
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::vector(1024), $10::vector(1024), $11::jsonb, 'active', NOW())
-                    ON CONFLICT (user_id, url) DO UPDATE SET
-                        title = EXCLUDED.title,
-                        description = EXCLUDED.description,
-                        image = EXCLUDED.image,
-                        site_name = EXCLUDED.site_name,
-                        tab_id = EXCLUDED.tab_id,
-                        tab_title = EXCLUDED.tab_title,
-                        text_embedding = EXCLUDED.text_embedding,
-                        image_embedding = EXCLUDED.image_embedding,
-                        metadata = EXCLUDED.metadata,
-                        status = 'active',
-                        deleted_at = NULL,
-                        updated_at = NOW();
-                """, user_id, normalized_url, title, description, image, site_name,
-                    tab_id, tab_title, text_vec, image_vec, metadata_json)
+            feature_values = [features[col] for col in FEATURE_COLUMNS]
             
+            async with conn.transaction():
+                if has_caption_fields:
+                    # 使用新字段
+                    feature_cols, feature_placeholders, feature_updates = _feature_sql(17)
+                    fingerprint_idx = 17 + len(FEATURE_COLUMNS)
+                    row_fingerprint = _row_fingerprint(
+                        title, description, image, site_name, tab_id, tab_title, metadata_json,
+                        text_vec, image_vec, image_caption, caption_vec,
+                        dominant_colors, style_tags, object_tags, feature_values,
+                    )
+                    result = await conn.execute(f"""
+                        INSERT INTO {ACTIVE_TABLE} (
+                            user_id, url, title, description, image, site_name,
+                            tab_id, tab_title, text_embedding, image_embedding, metadata,
+                            image_caption, caption_embedding, dominant_colors, style_tags, object_tags,
+                            {feature_cols}, row_fingerprint,
+                            text_embedding_512, image_embedding_512, caption_embedding_512,
+                            status, updated_at
+                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::vector(1024), $10::vector(1024), $11::jsonb,
+                            $12, $13::vector(1024), $14, $15, $16,
+                            {feature_placeholders}, ${fingerprint_idx},
+                            ${fingerprint_idx + 1}::vector({PREFIX_EMBED_DIM}), ${fingerprint_idx + 2}::vector({PREFIX_EMBED_DIM}),
+                            ${fingerprint_idx + 3}::vector({PREFIX_EMBED_DIM}),
+                            'active', NOW())
+                        ON CONFLICT (user_id, url) DO UPDATE SET
+                            title = EXCLUDED.title,
+                            description = EXCLUDED.description,
+                            image = EXCLUDED.image,
+                            site_name = EXCLUDED.site_name,
+                            tab_id = EXCLUDED.tab_id,
+                            tab_title = EXCLUDED.tab_title,
+                            text_embedding = EXCLUDED.text_embedding,
+                            image_embedding = EXCLUDED.image_embedding,
+                            metadata = EXCLUDED.metadata,
+                            image_caption = EXCLUDED.image_caption,
+                            caption_embedding = EXCLUDED.caption_embedding,
+                            dominant_colors = EXCLUDED.dominant_colors,
+                            style_tags = EXCLUDED.style_tags,
+                            object_tags = EXCLUDED.object_tags,
+                            {feature_updates},
+                            row_fingerprint = EXCLUDED.row_fingerprint,
+                            text_embedding_512 = EXCLUDED.text_embedding_512,
+                            image_embedding_512 = EXCLUDED.image_embedding_512,
+                            caption_embedding_512 = EXCLUDED.caption_embedding_512,
+                            status = 'active',
+                            deleted_at = NULL,
+                            updated_at = NOW()
+                        WHERE {ACTIVE_TABLE}.row_fingerprint IS DISTINCT FROM EXCLUDED.row_fingerprint
+                           OR {ACTIVE_TABLE}.status <> 'active';
+                    """, user_id, normalized_url, title, description, image, site_name,
+                        tab_id, tab_title, text_vec, image_vec, metadata_json,
+                        image_caption, caption_vec, dominant_colors, style_tags, object_tags,
+                        *feature_values, row_fingerprint, text_prefix_vec, image_prefix_vec, caption_prefix_vec)
+                else:
+                    # 降级到旧版本（只使用 metadata）
+                    feature_cols, feature_placeholders, feature_updates = _feature_sql(12)
+                    fingerprint_idx = 12 + len(FEATURE_COLUMNS)
+                    row_fingerprint = _row_fingerprint(
+                        title, description, image, site_name, tab_id, tab_title, metadata_json,
+                        text_vec, image_vec, feature_values,
+                    )
+                    result = await conn.execute(f"""
+                        INSERT INTO {ACTIVE_TABLE} (
+                            user_id, url, title, description, image, site_name,
+                            tab_id, tab_title, text_embedding, image_embedding, metadata, 
+                            {feature_cols}, row_fingerprint, text_embedding_512, image_embedding_512,
+                            status, updated_at
+                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::vector(1024), $10::vector(1024), $11::jsonb,
+                            {feature_placeholders}, ${fingerprint_idx},
+                            ${fingerprint_idx + 1}::vector({PREFIX_EMBED_DIM}), ${fingerprint_idx + 2}::vector({PREFIX_EMBED_DIM}),
+                            'active', NOW())
+                        ON CONFLICT (user_id, url) DO UPDATE SET
+                            title = EXCLUDED.title,
+                            description = EXCLUDED.description,
+                            image = EXCLUDED.image,
+                            site_name = EXCLUDED.site_name,
+                            tab_id = EXCLUDED.tab_id,
+                            tab_title = EXCLUDED.tab_title,
+                            text_embedding = EXCLUDED.text_embedding,
+                            image_embedding = EXCLUDED.image_embedding,
+                            metadata = EXCLUDED.metadata,
+                            {feature_updates},
+                            row_fingerprint = EXCLUDED.row_fingerprint,
+                            text_embedding_512 = EXCLUDED.text_embedding_512,
+                            image_embedding_512 = EXCLUDED.image_embedding_512,
+                            status = 'active',
+                            deleted_at = NULL,
+                            updated_at = NOW()
+                        WHERE {ACTIVE_TABLE}.row_fingerprint IS DISTINCT FROM EXCLUDED.row_fingerprint
+                           OR {ACTIVE_TABLE}.status <> 'active';
+                    """, user_id, normalized_url, title, description, image, site_name,
+                        tab_id, tab_title, text_vec, image_vec, metadata_json,
+                        *feature_values, row_fingerprint, text_prefix_vec, image_prefix_vec)
+                
+                # "INSERT 0 1"：插入或更新了一行；"INSERT 0 0"：指纹一致，ON CONFLICT 跳过
+                written = not result.endswith(" 0")
+                if written and bump_version:
+                    # 与写入在同一个事务里递增数据版本号（见 data_version.py）
+                    await data_version.bump(conn, user_id)
+            if written:
+                vector_cache.invalidate_user(user_id)
+                db_routing.mark_write(user_id)
+                data_version.invalidate(user_id)
+            if stats is not None:
+                key = "written" if written else "skipped"
+                stats[key] = stats.get(key, 0) + 1
             return True
     except Exception as e:
         print(f"[VectorDB] Error upserting item {url[:50]}...: {e}")
@@ -559,29 +1121,154 @@ async def upsert_opengraph_item(
         return False
 
 
+def decode_image_data_url(data_url: Optional[str]) -> Optional[Tuple[str, bytes]]:
+    """
+    解析 Base64 图片 data URL（data:image/png;base64,....）
+    
+    Returns:
+        (content_type, 二进制数据)，不是合法的 Base64 图片 data URL 时返回 None
+    """
+    import base64
+    import binascii
+    if not data_url or not data_url.startswith("data:image/"):
+        return None
+    header, sep, payload = data_url.partition(",")
+    if not sep or not header.endswith(";base64"):
+        return None
+    content_type = header[len("data:"):-len(";base64")]
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return (content_type, data) if data else None
+
+
+async def store_screenshot_blob(conn, screenshot_image: str) -> Optional[str]:
+    """
+    把截图（Base64 data URL）以二进制写入 screenshot_blobs，返回内容哈希
+    
+    按 SHA-256 内容寻址：同一张截图只存一份。已存在时也会锁住这一行直到事务结束，
+    并发的 delete_unreferenced_screenshot_blobs 会等本事务提交后再判断引用，不会删掉正在被引用的截图
+    
+    Args:
+        conn: 数据库连接（调用方可放在自己的事务里）
+        screenshot_image: 截图的 Base64 data URL
+    
+    Returns:
+        screenshot_hash，无法解析时返回 None
+    """
+    import hashlib
+    decoded = decode_image_data_url(screenshot_image)
+    if not decoded:
+        return None
+    content_type, data = decoded
+    screenshot_hash = hashlib.sha256(data).hexdigest()
+    await conn.execute(f"""
+        INSERT INTO {SCREENSHOT_BLOB_TABLE} (hash, content_type, data, size_bytes)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (hash) DO UPDATE SET size_bytes = EXCLUDED.size_bytes;
+    """, screenshot_hash, content_type, data, len(data))
+    return screenshot_hash
+
+
+def screenshot_url(screenshot_hash: Optional[str], user_id: Optional[str] = None) -> Optional[str]:
+    """
+    截图的读取地址（GET /api/v1/screenshots/{hash}，支持 ETag 缓存）
+
+    <img src> 无法携带 X-User-ID，知道 user_id 时放在查询参数里；
+    不知道时（查询结果没有 user_id 列）由客户端带上 X-User-ID 或自行追加 ?user_id=
+    """
+    if not screenshot_hash:
+        return None
+    url = f"/api/v1/screenshots/{screenshot_hash}"
+    if user_id:
+        from urllib.parse import quote
+        url += f"?user_id={quote(user_id, safe='')}"
+    return url
+
+
+# 读取截图时的 screenshot_image 列：已迁移到 screenshot_blobs 的行不再返回，
+# 尚未迁移的旧数据（以及不是 data URL 的截图）仍从主表返回原值
+SCREENSHOT_IMAGE_SQL = "CASE WHEN screenshot_hash IS NULL THEN screenshot_image END AS screenshot_image"
+
+
+def _select_columns_sql(columns: List[str]) -> str:
+    """字段投影的 SELECT 列表（screenshot_image 按 SCREENSHOT_IMAGE_SQL 读取）"""
+    return ", ".join(SCREENSHOT_IMAGE_SQL if c == "screenshot_image" else c for c in columns)
+
+
+async def delete_unreferenced_screenshot_blobs(conn, screenshot_hashes: List[Optional[str]]) -> int:
+    """
+    删除 screenshot_hashes 中已经没有任何记录引用的截图
+    
+    在去掉引用的同一个事务里调用（conn 需处于事务中）：先锁住这些截图行，
+    正在写入同一截图的事务（store_screenshot_blob 也会锁这一行）提交后才做 NOT EXISTS 判断，
+    因此能看到它新写入的引用，不会留下指向已删除截图的记录
+    
+    Returns:
+        删除的截图数量
+    """
+    screenshot_hashes = sorted({h for h in screenshot_hashes if h})
+    if not screenshot_hashes:
+        return 0
+    await conn.execute(f"""
+        SELECT hash FROM {SCREENSHOT_BLOB_TABLE}
+        WHERE hash = ANY($1::text[])
+        ORDER BY hash
+        FOR UPDATE;
+    """, screenshot_hashes)
+    result = await conn.execute(f"""
+        DELETE FROM {SCREENSHOT_BLOB_TABLE} b
+        WHERE b.hash = ANY($1::text[])
+          AND NOT EXISTS (
+              SELECT 1 FROM {ACTIVE_TABLE} t WHERE t.screenshot_hash = b.hash
+          );
+    """, screenshot_hashes)
+    return int(result.split()[-1])
+
+
+@db_route("write")
 async def update_opengraph_item_screenshot(user_id: Optional[str], url: str, screenshot_image: str) -> bool:
     """
-    更新 OpenGraph item 的截图字段
+    更新 OpenGraph item 的截图
+    
+    Base64 data URL 的截图以二进制存入 screenshot_blobs，主表只记录 screenshot_hash（并清空旧的 screenshot_image）；
+    其他字符串（例如截图的 http URL）仍原样保存在 screenshot_image 中。只更新这两列，不会重写整行。
+    原来引用的截图如果不再被任何记录引用，在同一个事务里删除
     
     Args:
         url: 网页 URL
-        screenshot_image: 截图的 Base64 data URL
+        screenshot_image: 截图（Base64 data URL 或其他字符串）
     
     Returns:
         成功返回 True，失败返回 False
     """
     try:
         user_id = _normalize_user_id(user_id)
-        pool = await get_pool()
+        pool = await get_pool(user_id)
         
         async with pool.acquire() as conn:
-            await conn.execute(f"""
-                UPDATE {ACTIVE_TABLE}
-                SET screenshot_image = $1,
-                    updated_at = NOW()
-                WHERE user_id = $2 AND url = $3;
-            """, screenshot_image, user_id, url)
+            async with conn.transaction():
+                screenshot_hash = await store_screenshot_blob(conn, screenshot_image)
+                old_hash = await conn.fetchval(f"""
+                    SELECT screenshot_hash FROM {ACTIVE_TABLE}
+                    WHERE user_id = $1 AND url = $2
+                    FOR UPDATE;
+                """, user_id, url)
+                result = await conn.execute(f"""
+                    UPDATE {ACTIVE_TABLE}
+                    SET screenshot_hash = $1,
+                        screenshot_image = $2,
+                        updated_at = NOW()
+                    WHERE user_id = $3 AND url = $4;
+                """, screenshot_hash, None if screenshot_hash else screenshot_image, user_id, url)
+                if result != "UPDATE 0":
+                    await data_version.bump(conn, user_id)
+                if old_hash and old_hash != screenshot_hash:
+                    await delete_unreferenced_screenshot_blobs(conn, [old_hash])
             
+            db_routing.mark_write(user_id)
+            data_version.invalidate(user_id)
             return True
     except Exception as e:
         print(f"[VectorDB] Error updating screenshot for {url[:50]}...: {e}")
@@ -590,82 +1277,361 @@ async def update_opengraph_item_screenshot(user_id: Optional[str], url: str, scr
         return False
 
 
-async def get_opengraph_item(user_id: Optional[str], url: str) -> Optional[Dict]:
+@db_route("read")
+async def get_screenshot_blob(user_id: Optional[str], screenshot_hash: str) -> Optional[Dict]:
+    """
+    读取用户自己的截图二进制
+    
+    截图按内容去重、多个用户可能共用一份，只在该用户有记录引用这张截图时返回
+    （走 screenshot_hash 索引）；只查该用户所在的分片
+    
+    Args:
+        user_id: 用户ID
+        screenshot_hash: 截图内容哈希
+    
+    Returns:
+        {"content_type": ..., "data": bytes}，不存在或不属于该用户时返回 None
+    """
+    try:
+        user_id = _normalize_user_id(user_id)
+        pool = await get_read_pool(user_id)
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(f"""
+                SELECT b.content_type, b.data
+                FROM {SCREENSHOT_BLOB_TABLE} b
+                WHERE b.hash = $2
+                  AND EXISTS (
+                    SELECT 1 FROM {ACTIVE_TABLE} t
+                    WHERE t.screenshot_hash = $2 AND t.user_id = $1
+                  );
+            """, user_id, screenshot_hash)
+        return dict(row) if row else None
+    except Exception as e:
+        print(f"[VectorDB] Error getting screenshot {screenshot_hash[:16]}...: {e}")
+        return None
+
+
+@db_route("read")
+async def get_opengraph_item(user_id: Optional[str], url: str) -> Optional[Dict]:
+    """
+    根据 URL 获取 OpenGraph 数据（包括 embedding）
+    
+    Args:
+        url: 网页 URL
+    
+    Returns:
+        OpenGraph 数据字典，如果不存在返回 None
+    """
+    try:
+        user_id = _normalize_user_id(user_id)
+        pool = await get_read_pool(user_id)
+        
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(f"""
+                SELECT user_id, url, title, description, image, screenshot_hash, {SCREENSHOT_IMAGE_SQL}, site_name,
+                       tab_id, tab_title, text_embedding, image_embedding, metadata
+                FROM {ACTIVE_TABLE}
+                WHERE user_id = $1 AND url = $2 AND status = 'active';
+            """, user_id, url)
+            
+            if not row:
+                return None
+            
+            # 转换 vector 类型为列表
+            return _row_to_dict(row)
+    except Exception as e:
+        print(f"[VectorDB] Error getting item {url[:50]}...: {e}")
+        return None
+
+
+# get_items_by_urls 默认返回的列；可投影的列为这些列加上 LISTABLE_COLUMNS
+ITEM_LOOKUP_COLUMNS = [
+    "user_id", "url", "title", "description", "image", "screenshot_hash", "screenshot_image", "site_name",
+    "tab_id", "tab_title", "text_embedding", "image_embedding", "metadata", "content_hash",
+]
+# 每条语句最多查询多少个 URL（大批量同步拆成多块，在不同连接上并发执行）
+ITEM_LOOKUP_CHUNK_SIZE = int(os.getenv("ITEM_LOOKUP_CHUNK_SIZE", "200"))
+# 单次调用最多同时占用多少个连接
+ITEM_LOOKUP_MAX_CONCURRENCY = int(os.getenv("ITEM_LOOKUP_MAX_CONCURRENCY", "4"))
+
+
+@db_route("read")
+async def get_items_by_urls(
+    user_id: Optional[str],
+    urls: List[str],
+    fields: Optional[List[str]] = None,
+    chunk_size: Optional[int] = None,
+) -> List[Dict]:
+    """
+    批量根据 URL 列表获取 OpenGraph 数据（包括 embedding）
+    
+    URL 去重后按 chunk_size 分块，每块一条 url = ANY($2::text[]) 语句（文本固定，可预编译复用），
+    各块在不同连接上并发执行（最多 ITEM_LOOKUP_MAX_CONCURRENCY 个）
+    
+    Args:
+        urls: 网页 URL 列表
+        fields: 只返回这些列（默认 ITEM_LOOKUP_COLUMNS；url 总是返回）
+        chunk_size: 每块 URL 数（默认 ITEM_LOOKUP_CHUNK_SIZE）
+    
+    Returns:
+        OpenGraph 数据字典列表
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return []
+    
+    allowed = set(ITEM_LOOKUP_COLUMNS) | set(LISTABLE_COLUMNS)
+    columns = [f for f in dict.fromkeys(fields or ITEM_LOOKUP_COLUMNS) if f in allowed]
+    if "url" not in columns:
+        columns.insert(0, "url")
+    columns_sql = _select_columns_sql(columns)
+    query_name = "get_items_by_urls" if fields is None else f"get_items_by_urls[{', '.join(columns)}]"
+    
+    chunk_size = max(1, chunk_size or ITEM_LOOKUP_CHUNK_SIZE)
+    chunks = [urls[i:i + chunk_size] for i in range(0, len(urls), chunk_size)]
+    
+    try:
+        user_id = _normalize_user_id(user_id)
+        pool = await get_read_pool(user_id)
+        semaphore = asyncio.Semaphore(max(1, ITEM_LOOKUP_MAX_CONCURRENCY))
+        
+        async def fetch_chunk(chunk: List[str]) -> List[asyncpg.Record]:
+            async with semaphore:
+                async with pool.acquire() as conn:
+                    # 只返回 active 记录
+                    return await query_registry.fetch(conn, query_name, f"""
+                        SELECT {columns_sql}
+                        FROM {ACTIVE_TABLE}
+                        WHERE user_id = $1 AND url = ANY($2::text[]) AND status = 'active';
+                    """, user_id, chunk)
+        
+        if len(chunks) == 1:
+            chunk_rows = [await fetch_chunk(chunks[0])]
+        else:
+            chunk_rows = await asyncio.gather(*[fetch_chunk(chunk) for chunk in chunks])
+        
+        return [_row_to_dict(row) for rows in chunk_rows for row in rows]
+    except Exception as e:
+        print(f"[VectorDB] Error getting items by URLs: {e}")
+        import traceback
+        traceback.print_exc()
+        return []
+
+
+@db_route("read")
+async def find_items_needing_upload(
+    user_id: Optional[str],
+    items: List[Dict],
+) -> Tuple[List[str], List[str]]:
+    """
+    上传握手：根据客户端发来的 (url, content_hash) 判断哪些 item 需要上传
+    
+    一次批量查询（主键 (user_id, url) = ANY）比较已存储的 content_hash；
+    满足以下任一条件的 item 需要上传：
+    - 数据库中不存在，或已被软删除
+    - content_hash 不一致（或客户端没有提供 / 旧数据没有存储）
+    - 缺少 text_embedding 或 image_embedding
+    
+    Args:
+        user_id: 用户ID
+        items: [{"url": ..., "content_hash": ...}]（content_hash 计算规则见 search/features.compute_content_hash）
+    
+    Returns:
+        (needed_urls, unchanged_urls)，URL 为客户端发送的原始值
+    """
+    user_id = _normalize_user_id(user_id)
+    pairs = []
+    for item in items:
+        url = (item.get("url") or "").strip()
+        if url:
+            pairs.append((url, _normalize_url_for_storage(url), item.get("content_hash")))
+    if not pairs:
+        return [], []
+    
+    pool = await get_read_pool(user_id)
+    async with pool.acquire() as conn:
+        rows = await query_registry.fetch(conn, "find_items_needing_upload", f"""
+            SELECT url, content_hash, status,
+                   (text_embedding IS NOT NULL AND image_embedding IS NOT NULL) AS has_embeddings
+            FROM {ACTIVE_TABLE}
+            WHERE user_id = $1 AND url = ANY($2::text[]);
+        """, user_id, list({normalized for _, normalized, _ in pairs}))
+    stored = {row["url"]: row for row in rows}
+    
+    needed, unchanged = [], []
+    for url, normalized, client_hash in pairs:
+        row = stored.get(normalized)
+        if (
+            row is not None
+            and client_hash
+            and row["status"] == "active"
+            and row["has_embeddings"]
+            and row["content_hash"] == client_hash
+        ):
+            unchanged.append(url)
+        else:
+            needed.append(url)
+    return needed, unchanged
+
+
+# 进程内向量缓存加载的列（覆盖三个 search_by_*_embedding 返回的所有列）
+VECTOR_CACHE_COLUMNS = (
+    "user_id, url, title, description, image, site_name, " + SEARCH_FEATURE_COLUMNS + ", "
+    "tab_id, tab_title, text_embedding, image_embedding, metadata, "
+    "image_caption, caption_embedding, dominant_colors, style_tags, object_tags"
+)
+
+
+@db_route("read")
+async def _search_vector_cache(
+    user_id: str,
+    modality: str,
+    query_embedding: List[float],
+    top_k: int,
+    threshold: float,
+    scope: Optional[Dict[str, List]],
+    exclude_docs: bool,
+) -> Optional[List[Dict]]:
+    """
+    在进程内向量缓存中搜索（见 vector_cache.py）
+    
+    Returns:
+        结果列表；未开启缓存、读取数据版本号失败、用户数据量超过阈值或加载失败时返回 None（调用方走 SQL）
+    """
+    if not vector_cache.ENABLED or not query_embedding:
+        return None
+    
+    async def count_rows() -> int:
+        pool = await get_read_pool(user_id)
+        async with pool.acquire() as conn:
+            return await query_registry.fetchval(conn, "vector_cache.count", f"""
+                SELECT COUNT(*) FROM {ACTIVE_TABLE} WHERE user_id = $1 AND status = 'active';
+            """, user_id)
+    
+    async def load_rows() -> List[Dict]:
+        pool = await get_read_pool(user_id)
+        async with pool.acquire() as conn:
+            rows = await query_registry.fetch(conn, "vector_cache.load", f"""
+                SELECT {VECTOR_CACHE_COLUMNS}
+                FROM {ACTIVE_TABLE}
+                WHERE user_id = $1 AND status = 'active';
+            """, user_id)
+        return [_row_to_dict(row) for row in rows]
+    
+    # 缓存以 (user_id, 数据版本号) 为 key；版本号在加载数据之前读取，读取失败时不使用缓存
+    version = await data_version.get_version(user_id)
+    if version is None:
+        return None
+    
+    try:
+        index = await vector_cache.cache.get_index(user_id, version, load_rows, count_rows)
+    except Exception as e:
+        print(f"[VectorDB] Vector cache unavailable for {user_id}, falling back to SQL: {e}")
+        return None
+    if index is None:
+        return None
+    
+    async def fetch_vectors(urls: List[str]) -> Dict[str, Dict]:
+        # int8 缓存的全精度重排：只取回候选行的原始向量
+        rows = await get_items_by_urls(user_id, urls, fields=["url", *vector_cache.MODALITY_COLUMNS.values()])
+        return {row["url"]: row for row in rows}
+    
+    return await vector_cache.search_index(
+        index, modality, query_embedding, top_k, threshold, scope, exclude_docs, fetch_vectors=fetch_vectors
+    )
+
+
+# search_by_*_embedding 返回的列
+EMBEDDING_SEARCH_COLUMNS = (
+    "user_id, url, title, description, image, site_name, " + SEARCH_FEATURE_COLUMNS + ", "
+    "tab_id, tab_title, text_embedding, image_embedding, metadata"
+)
+CAPTION_EMBEDDING_SEARCH_COLUMNS = (
+    EMBEDDING_SEARCH_COLUMNS + ", image_caption, caption_embedding, dominant_colors, style_tags, object_tags"
+)
+
+
+def _use_prefix_recall(query_embedding: Optional[List[float]]) -> bool:
+    from search.config import PREFIX_EMBED_DIM
+    return PREFIX_RECALL_ENABLED and bool(query_embedding) and len(query_embedding) > PREFIX_EMBED_DIM
+
+
+def _embedding_search_params(
+    query_embedding: List[float],
+    normalized_user: str,
+    threshold: float,
+    top_k: int,
+    two_stage: bool,
+    candidate_factor: int,
+) -> List:
     """
-    根据 URL 获取 OpenGraph 数据（包括 embedding）
-    
-    Args:
-        url: 网页 URL
-    
-    Returns:
-        OpenGraph 数据字典，如果不存在返回 None
+    向量搜索的参数：$1 查询向量、$2 user_id、$3 阈值、$4 top_k；
+    两阶段召回时追加 $5 512 维前缀查询向量、$6 候选数（top_k * candidate_factor）
     """
-    try:
-        user_id = _normalize_user_id(user_id)
-        pool = await get_pool()
-        
-        async with pool.acquire() as conn:
-            row = await conn.fetchrow(f"""
-                SELECT user_id, url, title, description, image, screenshot_image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata
-                FROM {ACTIVE_TABLE}
-                WHERE user_id = $1 AND url = $2 AND status = 'active';
-            """, user_id, url)
-            
-            if not row:
-                return None
-            
-            # 转换 vector 类型为列表
-            return _row_to_dict(row)
-    except Exception as e:
-        print(f"[VectorDB] Error getting item {url[:50]}...: {e}")
-        return None
+    params = [to_vector_str(query_embedding), normalized_user, threshold, top_k]
+    if two_stage:
+        from search.features import prefix_embedding
+        params += [to_vector_str(prefix_embedding(query_embedding)), top_k * max(1, candidate_factor)]
+    return params
 
 
-async def get_items_by_urls(user_id: Optional[str], urls: List[str]) -> List[Dict]:
+def _embedding_search_sql(column: str, select_columns: str, scope_sql: str, two_stage: bool) -> str:
     """
-    批量根据 URL 列表获取 OpenGraph 数据（包括 embedding）
+    按 column 的向量相似度搜索（参数见 _embedding_search_params）
     
-    Args:
-        urls: 网页 URL 列表
+    每行的距离只计算一次：内层按原始距离 ORDER BY ... LIMIT $4（走 ANN 索引），
+    外层再做阈值过滤和相似度换算。相似度随距离单调变化，所以“先取最近的 top_k 再过滤阈值”
+    与“先过滤阈值再取 top_k”的结果完全相同。
     
-    Returns:
-        OpenGraph 数据字典列表
+    two_stage=True 时最内层先按 512 维前缀向量的 ANN 索引取 $6 个候选，再在候选上计算 1024 维距离
     """
-    if not urls:
-        return []
-    
-    try:
-        user_id = _normalize_user_id(user_id)
-        pool = await get_pool()
-        
-        async with pool.acquire() as conn:
-            # 使用 IN 查询批量获取（只返回 active 记录）
-            placeholders = ','.join([f'${i+1}' for i in range(len(urls))])
-            rows = await conn.fetch(f"""
-                SELECT user_id, url, title, description, image, screenshot_image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata
+    if not two_stage:
+        nearest_sql = f"""
+                SELECT {select_columns},
+                       {_distance_sql(column, "$1::vector(1024)")} AS distance
                 FROM {ACTIVE_TABLE}
-                WHERE user_id = ${len(urls)+1} AND url IN ({placeholders}) AND status = 'active';
-            """, *urls, user_id)
-            
-            results = []
-            for row in rows:
-                results.append(_row_to_dict(row))
-            
-            return results
-    except Exception as e:
-        print(f"[VectorDB] Error getting items by URLs: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+                WHERE status = 'active'
+                  AND user_id = $2
+                  AND {column} IS NOT NULL{scope_sql}
+                ORDER BY distance
+                LIMIT $4"""
+    else:
+        from search.config import PREFIX_EMBED_DIM
+        prefix_column = PREFIX_EMBEDDING_COLUMNS[column]
+        nearest_sql = f"""
+                SELECT candidates.*,
+                       {_distance_sql("candidates." + column, "$1::vector(1024)")} AS distance
+                FROM (
+                    SELECT {select_columns}
+                    FROM {ACTIVE_TABLE}
+                    WHERE status = 'active'
+                      AND user_id = $2
+                      AND {prefix_column} IS NOT NULL
+                      AND {column} IS NOT NULL{scope_sql}
+                    ORDER BY {_distance_sql(prefix_column, f"$5::vector({PREFIX_EMBED_DIM})")}
+                    LIMIT $6
+                ) candidates
+                ORDER BY distance
+                LIMIT $4"""
+    
+    return f"""
+            SELECT {select_columns},
+                   {_similarity_from_distance("nearest.distance")} AS similarity
+            FROM ({nearest_sql}
+            ) nearest
+            WHERE {_similarity_from_distance("nearest.distance")} >= $3
+            ORDER BY nearest.distance;
+        """
 
 
+@db_route("read")
 async def search_by_text_embedding(
     user_id: Optional[str],
     query_embedding: List[float],
     top_k: int = 20,
-    threshold: float = 0.0
+    threshold: float = 0.0,
+    scope: Optional[Dict[str, List]] = None,
+    exclude_docs: bool = False,
 ) -> List[Dict]:
     """
     根据文本 embedding 进行相似度搜索（严格按用户隔离）
@@ -675,29 +1641,33 @@ async def search_by_text_embedding(
         query_embedding: 查询文本的 embedding 向量（1024维）
         top_k: 返回前 K 个结果
         threshold: 相似度阈值（0-1）
+        scope: 搜索范围（build_search_scope 的返回值），None 表示不限制
+        exclude_docs: 是否在 SQL 中排除文档类内容（is_doc 列）
     
     Returns:
         相似度排序的结果列表
     """
     try:
         normalized_user = _normalize_user_id(user_id)
-        pool = await get_pool()
+        cached = await _search_vector_cache(
+            normalized_user, "text", query_embedding, top_k, threshold, scope, exclude_docs
+        )
+        if cached is not None:
+            return cached
+        pool = await get_read_pool(normalized_user)
         
         async with pool.acquire() as conn:
-            query_vec = to_vector_str(query_embedding)
-            
-            rows = await conn.fetch(f"""
-                SELECT user_id, url, title, description, image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata,
-                       1 - (text_embedding <=> $1::vector(1024)) AS similarity
-                FROM {ACTIVE_TABLE}
-                WHERE status = 'active'
-                  AND user_id = $2
-                  AND text_embedding IS NOT NULL
-                  AND (1 - (text_embedding <=> $1::vector(1024))) >= $3
-                ORDER BY text_embedding <=> $1::vector(1024)
-                LIMIT $4;
-            """, query_vec, normalized_user, threshold, top_k)
+            two_stage = _use_prefix_recall(query_embedding)
+            async with ann_search.ann_search_transaction(conn, "text", pool) as ann_settings:
+                params = _embedding_search_params(
+                    query_embedding, normalized_user, threshold, top_k, two_stage,
+                    candidate_factor=ann_settings["candidate_factor"],
+                )
+                scope_sql = _doc_clause(exclude_docs) + _scope_clause(scope, params)
+                
+                rows = await query_registry.fetch(conn, _scoped_query_name(
+                    "search_by_text_embedding" + (".prefix" if two_stage else ""), scope, exclude_docs
+                ), _embedding_search_sql("text_embedding", EMBEDDING_SEARCH_COLUMNS, scope_sql, two_stage), *params)
             
             results = []
             for row in rows:
@@ -712,11 +1682,14 @@ async def search_by_text_embedding(
         return []
 
 
+@db_route("read")
 async def search_by_image_embedding(
     user_id: Optional[str],
     query_embedding: List[float],
     top_k: int = 20,
-    threshold: float = 0.0
+    threshold: float = 0.0,
+    scope: Optional[Dict[str, List]] = None,
+    exclude_docs: bool = False,
 ) -> List[Dict]:
     """
     根据图像 embedding 进行相似度搜索（严格按用户隔离）
@@ -726,29 +1699,33 @@ async def search_by_image_embedding(
         query_embedding: 查询图像的 embedding 向量（1024维）
         top_k: 返回前 K 个结果
         threshold: 相似度阈值（0-1）
+        scope: 搜索范围（build_search_scope 的返回值），None 表示不限制
+        exclude_docs: 是否在 SQL 中排除文档类内容（is_doc 列）
     
     Returns:
         相似度排序的结果列表
     """
     try:
         normalized_user = _normalize_user_id(user_id)
-        pool = await get_pool()
+        cached = await _search_vector_cache(
+            normalized_user, "image", query_embedding, top_k, threshold, scope, exclude_docs
+        )
+        if cached is not None:
+            return cached
+        pool = await get_read_pool(normalized_user)
         
         async with pool.acquire() as conn:
-            query_vec = to_vector_str(query_embedding)
-            
-            rows = await conn.fetch(f"""
-                SELECT user_id, url, title, description, image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata,
-                       1 - (image_embedding <=> $1::vector(1024)) AS similarity
-                FROM {ACTIVE_TABLE}
-                WHERE status = 'active'
-                  AND user_id = $2
-                  AND image_embedding IS NOT NULL
-                  AND (1 - (image_embedding <=> $1::vector(1024))) >= $3
-                ORDER BY image_embedding <=> $1::vector(1024)
-                LIMIT $4;
-            """, query_vec, normalized_user, threshold, top_k)
+            two_stage = _use_prefix_recall(query_embedding)
+            async with ann_search.ann_search_transaction(conn, "image", pool) as ann_settings:
+                params = _embedding_search_params(
+                    query_embedding, normalized_user, threshold, top_k, two_stage,
+                    candidate_factor=ann_settings["candidate_factor"],
+                )
+                scope_sql = _doc_clause(exclude_docs) + _scope_clause(scope, params)
+                
+                rows = await query_registry.fetch(conn, _scoped_query_name(
+                    "search_by_image_embedding" + (".prefix" if two_stage else ""), scope, exclude_docs
+                ), _embedding_search_sql("image_embedding", EMBEDDING_SEARCH_COLUMNS, scope_sql, two_stage), *params)
             
             results = []
             for row in rows:
@@ -763,11 +1740,14 @@ async def search_by_image_embedding(
         return []
 
 
+@db_route("read")
 async def search_by_caption_embedding(
     user_id: Optional[str],
     query_embedding: List[float],
     top_k: int = 20,
-    threshold: float = 0.0
+    threshold: float = 0.0,
+    scope: Optional[Dict[str, List]] = None,
+    exclude_docs: bool = False,
 ) -> List[Dict]:
     """
     根据 Caption embedding 进行相似度搜索（严格按用户隔离）
@@ -777,13 +1757,20 @@ async def search_by_caption_embedding(
         query_embedding: 查询文本的 embedding 向量（1024维）
         top_k: 返回前 K 个结果
         threshold: 相似度阈值（0-1）
+        scope: 搜索范围（build_search_scope 的返回值），None 表示不限制
+        exclude_docs: 是否在 SQL 中排除文档类内容（is_doc 列）
     
     Returns:
         相似度排序的结果列表
     """
     try:
         normalized_user = _normalize_user_id(user_id)
-        pool = await get_pool()
+        cached = await _search_vector_cache(
+            normalized_user, "caption", query_embedding, top_k, threshold, scope, exclude_docs
+        )
+        if cached is not None:
+            return cached
+        pool = await get_read_pool(normalized_user)
         
         async with pool.acquire() as conn:
             # 检查 caption_embedding 字段是否存在
@@ -800,21 +1787,17 @@ async def search_by_caption_embedding(
                 print(f"[VectorDB] caption_embedding column not found, skipping caption embedding search")
                 return []
             
-            query_vec = to_vector_str(query_embedding)
-            
-            rows = await conn.fetch(f"""
-                SELECT user_id, url, title, description, image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata,
-                       image_caption, caption_embedding, dominant_colors, style_tags, object_tags,
-                       1 - (caption_embedding <=> $1::vector(1024)) AS similarity
-                FROM {ACTIVE_TABLE}
-                WHERE status = 'active'
-                  AND user_id = $2
-                  AND caption_embedding IS NOT NULL
-                  AND (1 - (caption_embedding <=> $1::vector(1024))) >= $3
-                ORDER BY caption_embedding <=> $1::vector(1024)
-                LIMIT $4;
-            """, query_vec, normalized_user, threshold, top_k)
+            two_stage = _use_prefix_recall(query_embedding)
+            async with ann_search.ann_search_transaction(conn, "caption", pool) as ann_settings:
+                params = _embedding_search_params(
+                    query_embedding, normalized_user, threshold, top_k, two_stage,
+                    candidate_factor=ann_settings["candidate_factor"],
+                )
+                scope_sql = _doc_clause(exclude_docs) + _scope_clause(scope, params)
+                
+                rows = await query_registry.fetch(conn, _scoped_query_name(
+                    "search_by_caption_embedding" + (".prefix" if two_stage else ""), scope, exclude_docs
+                ), _embedding_search_sql("caption_embedding", CAPTION_EMBEDDING_SEARCH_COLUMNS, scope_sql, two_stage), *params)
             
             results = []
             for row in rows:
@@ -829,7 +1812,82 @@ async def search_by_caption_embedding(
         return []
 
 
-async def batch_upsert_items(items: List[Dict], user_id: Optional[str], batch_size: int = 20) -> int:
+@db_route("read")
+async def search_by_caption_keyword(
+    user_id: Optional[str],
+    query_tokens: List[str],
+    top_k: int = 50,
+    scope: Optional[Dict[str, List]] = None,
+    exclude_docs: bool = False,
+) -> List[Dict]:
+    """
+    Caption 关键词搜索（严格按用户隔离）
+    
+    通过 caption_tokens && $tokens 走 GIN 索引召回，
+    rank = 命中的查询 token 数 / 查询 token 总数（token 重叠率）
+    
+    Args:
+        user_id: 用户ID
+        query_tokens: 查询分词结果（search/features.tokenize_caption）
+        top_k: 返回前 K 个结果
+        scope: 搜索范围（build_search_scope 的返回值），None 表示不限制
+        exclude_docs: 是否在 SQL 中排除文档类内容（is_doc 列）
+    
+    Returns:
+        按 rank 降序的结果列表（包含 rank 字段）
+    """
+    if not query_tokens:
+        return []
+    
+    normalized_user = _normalize_user_id(user_id)
+    pool = await get_read_pool(normalized_user)
+    
+    async with pool.acquire() as conn:
+        # 检查是否有 image_caption 字段（决定返回哪些列）
+        has_caption_field = await conn.fetchval(f"""
+            SELECT EXISTS (
+                SELECT FROM information_schema.columns 
+                WHERE table_schema = '{NAMESPACE}'
+                  AND table_name = '{ACTIVE_TABLE_NAME}'
+                  AND column_name = 'image_caption'
+            );
+        """)
+        
+        caption_columns = (
+            "image_caption, caption_embedding, dominant_colors, style_tags, object_tags,"
+            if has_caption_field else ""
+        )
+        
+        params = [normalized_user, list(query_tokens), float(len(query_tokens)), top_k]
+        # 文档类内容 / Personal Space 范围过滤（下推到 SQL）
+        scope_sql = _doc_clause(exclude_docs) + _scope_clause(scope, params)
+        
+        rows = await query_registry.fetch(conn, _scoped_query_name(
+            "search_by_caption_keyword" + (".caption_fields" if has_caption_field else ""), scope, exclude_docs
+        ), f"""
+            SELECT user_id, url, title, description, image, site_name, {SEARCH_FEATURE_COLUMNS},
+                   tab_id, tab_title, metadata,
+                   {caption_columns}
+                   (SELECT COUNT(DISTINCT t) FROM unnest(caption_tokens) AS t
+                    WHERE t = ANY($2::text[]))::float8 / $3 AS rank
+            FROM {ACTIVE_TABLE}
+            WHERE status = 'active'
+              AND user_id = $1
+              AND caption_tokens && $2::text[]{scope_sql}
+            ORDER BY rank DESC, url
+            LIMIT $4;
+        """, *params)
+    
+    return [dict(row) for row in rows]
+
+
+@db_route("write")
+async def batch_upsert_items(
+    items: List[Dict],
+    user_id: Optional[str],
+    batch_size: int = 20,
+    stats: Optional[Dict[str, int]] = None,
+) -> int:
     """
     批量插入或更新 OpenGraph 数据（优化版本：使用并发和批量处理）
     
@@ -842,9 +1900,10 @@ async def batch_upsert_items(items: List[Dict], user_id: Optional[str], batch_si
         items: OpenGraph 数据列表（每个包含 url, title, description 等字段）
         user_id: 用户 ID
         batch_size: 批量大小（默认 20，控制并发数）
+        stats: 统计字典（外部传入），会累加 written（实际写入）/ skipped（内容未变化跳过）
     
     Returns:
-        成功插入/更新的数量
+        成功插入/更新的数量（包括内容未变化而跳过的行）
     """
     if not items:
         return 0
@@ -874,81 +1933,100 @@ async def batch_upsert_items(items: List[Dict], user_id: Optional[str], batch_si
         print(f"[VectorDB] ⚠️  所有项都被过滤，没有可保存的数据")
         return 0
     
-    # ✅ 步骤 2: 检查重复的 caption 和 image（批量查询一次数据库）
-    pool = await get_pool()
+    # ✅ 步骤 2: 检查重复的 caption 和 image（按哈希批量查询，走 (user_id, caption_hash/image_hash) 索引）
+    # 还没有回填哈希的旧数据（caption_hash / image_hash 为 NULL，见 backfill_item_features.py）回退到按原始值比较：
+    # 同一个索引的 (user_id, hash IS NULL) 部分，回填完成后这部分为空
+    from search.features import caption_hash as compute_caption_hash, image_hash as compute_image_hash
+    normalized_user = _normalize_user_id(user_id)
+    pool = await get_pool(normalized_user)
     duplicate_caption_count = 0
     duplicate_image_count = 0
     final_items = []
     
     try:
         async with pool.acquire() as conn:
-            # 收集所有需要检查的 caption 和 image
-            caption_map = {}  # normalized_caption -> List[item]
-            image_map = {}    # image -> List[item]
+            # 收集所有需要检查的 caption 和 image（按哈希分组）
+            caption_map = {}  # caption_hash -> List[item]
+            image_map = {}    # image_hash -> List[item]
+            caption_values = set()  # 旧数据回退比较用的原始值（与哈希的规范化规则一致）
+            image_values = set()
             
             for item in filtered_items:
                 # 收集 caption
                 caption = item.get("image_caption") or (item.get("metadata") or {}).get("caption")
-                if caption:
-                    normalized_caption = caption.strip().lower()
-                    if normalized_caption not in caption_map:
-                        caption_map[normalized_caption] = []
-                    caption_map[normalized_caption].append(item)
+                caption_key = compute_caption_hash(caption)
+                if caption_key:
+                    caption_map.setdefault(caption_key, []).append(item)
+                    caption_values.add(caption.strip().lower())
                 
                 # 收集 image
-                image = item.get("image")
-                if image:
-                    if image not in image_map:
-                        image_map[image] = []
-                    image_map[image].append(item)
+                image_key = compute_image_hash(item.get("image"))
+                if image_key:
+                    image_map.setdefault(image_key, []).append(item)
+                    image_values.add(item.get("image").strip())
             
             # 批量查询数据库中已有的 caption
             existing_caption_set = set()
             if caption_map:
-                caption_values = list(caption_map.keys())
                 caption_query = f"""
-                    SELECT DISTINCT LOWER(TRIM(COALESCE(image_caption, metadata->>'caption', ''))) as normalized_caption
+                    SELECT DISTINCT caption_hash,
+                           CASE WHEN caption_hash IS NULL
+                                THEN LOWER(TRIM(COALESCE(image_caption, metadata->>'caption', '')))
+                           END AS legacy_caption
                     FROM {ACTIVE_TABLE}
-                    WHERE status = 'active'
-                      AND user_id = $1
+                    WHERE user_id = $1
                       AND (
-                        LOWER(TRIM(COALESCE(image_caption, ''))) = ANY($2::text[])
-                        OR LOWER(TRIM(COALESCE(metadata->>'caption', ''))) = ANY($2::text[])
+                        caption_hash = ANY($2::text[])
+                        OR (caption_hash IS NULL
+                            AND LOWER(TRIM(COALESCE(image_caption, metadata->>'caption', ''))) = ANY($3::text[]))
                       )
+                      AND status = 'active'
                 """
-                existing_captions = await conn.fetch(caption_query, user_id, caption_values)
-                existing_caption_set = {row['normalized_caption'] for row in existing_captions if row['normalized_caption']}
+                existing_captions = await conn.fetch(
+                    caption_query, normalized_user, list(caption_map.keys()), list(caption_values)
+                )
+                existing_caption_set = {
+                    row['caption_hash'] or compute_caption_hash(row['legacy_caption']) for row in existing_captions
+                }
             
             # 批量查询数据库中已有的 image
             existing_image_set = set()
             if image_map:
-                image_values = list(image_map.keys())
                 image_query = f"""
-                    SELECT DISTINCT image
+                    SELECT DISTINCT image_hash,
+                           CASE WHEN image_hash IS NULL THEN TRIM(image) END AS legacy_image
                     FROM {ACTIVE_TABLE}
-                    WHERE status = 'active'
-                      AND user_id = $1
-                      AND image = ANY($2::text[])
+                    WHERE user_id = $1
+                      AND (
+                        image_hash = ANY($2::text[])
+                        OR (image_hash IS NULL AND TRIM(image) = ANY($3::text[]))
+                      )
+                      AND status = 'active'
                 """
-                existing_images = await conn.fetch(image_query, user_id, image_values)
-                existing_image_set = {row['image'] for row in existing_images if row['image']}
+                existing_images = await conn.fetch(
+                    image_query, normalized_user, list(image_map.keys()), list(image_values)
+                )
+                existing_image_set = {
+                    row['image_hash'] or compute_image_hash(row['legacy_image']) for row in existing_images
+                }
             
             # 对每个项，检查是否应该被过滤（caption 或 image 重复）
             items_to_skip = set()  # 存储要跳过的 URL
             
             # 检查 caption 重复
-            for normalized_caption, items in caption_map.items():
-                if normalized_caption in existing_caption_set:
+            for caption_key, items in caption_map.items():
+                if caption_key in existing_caption_set:
                     duplicate_caption_count += len(items)
                     for item in items:
                         url = item.get("url", "")
                         if url:
                             items_to_skip.add(url)
-                            print(f"[VectorDB] 🚫 过滤重复 Caption: {url[:60]}... (Caption: {normalized_caption[:40]}...)")
+                            caption = item.get("image_caption") or (item.get("metadata") or {}).get("caption") or ""
+                            print(f"[VectorDB] 🚫 过滤重复 Caption: {url[:60]}... (Caption: {caption.strip()[:40]}...)")
             
             # 检查 image 重复
-            for image, items in image_map.items():
-                if image in existing_image_set:
+            for image_key, items in image_map.items():
+                if image_key in existing_image_set:
                     for item in items:
                         url = item.get("url", "")
                         if url and url not in items_to_skip:
@@ -1035,6 +2113,11 @@ async def batch_upsert_items(items: List[Dict], user_id: Optional[str], batch_si
     
     # 使用信号量控制并发数
     semaphore = asyncio.Semaphore(batch_size)
+    if stats is None:
+        stats = {}
+    stats.setdefault("written", 0)
+    stats.setdefault("skipped", 0)
+    written_before = stats["written"]
     
     async def upsert_one(item: Dict) -> bool:
         async with semaphore:
@@ -1056,6 +2139,10 @@ async def batch_upsert_items(items: List[Dict], user_id: Optional[str], batch_si
                 dominant_colors=item.get("dominant_colors"),
                 style_tags=item.get("style_tags"),
                 object_tags=item.get("object_tags"),
+                session_id=item.get("session_id"),
+                stats=stats,
+                bump_version=False,
+                content_hash=item.get("content_hash"),
             )
     
     # 并发处理所有项（使用补齐后的项）
@@ -1065,9 +2152,28 @@ async def batch_upsert_items(items: List[Dict], user_id: Optional[str], batch_si
     # 统计成功数量
     success_count = sum(1 for r in results if r is True)
     
+    # 整批只递增一次数据版本号（逐条递增会让同一用户的并发写入争抢版本号行锁）；
+    # 数据已经提交，递增失败只记录日志，不影响返回的成功数量
+    if stats["written"] > written_before:
+        try:
+            await data_version.bump_user(user_id)
+        except Exception as e:
+            print(f"[VectorDB] ⚠ Failed to bump data version for {user_id} after upsert (caches in other processes stay stale until the next write): {e}")
+            import traceback
+            traceback.print_exc()
+    print(f"[VectorDB] 📊 Upsert: written={stats['written']}, skipped(unchanged)={stats['skipped']}, failed={len(results) - success_count}")
+    
     return success_count
 
 
+# VectorDBClient.search_by_vector 返回的列（不使用 SELECT *，避免把截图等大字段拖过连接池）
+CLIENT_SEARCH_COLUMNS = (
+    "user_id, url, title, description, image, screenshot_hash, " + SCREENSHOT_IMAGE_SQL + ", site_name, "
+    "tab_id, tab_title, text_embedding, image_embedding, metadata, "
+    "image_caption, dominant_colors, style_tags, object_tags, " + SEARCH_FEATURE_COLUMNS
+)
+
+
 class VectorDBClient:
     """
     简单的数据库客户端，封装用户隔离相关操作
@@ -1076,29 +2182,46 @@ class VectorDBClient:
         self.table_name = table_name
         self.qualified_table = _qualified(table_name)
     
-    async def execute_query(self, query: str, params: Tuple = None, *, fetch: bool = False):
-        pool = await get_pool()
+    async def execute_query(
+        self, query: str, params: Tuple = None, *, fetch: bool = False, user_id: Optional[str] = None, read: bool = False
+    ):
+        """
+        user_id: 查询所属用户（已标准化），路由到该用户所在的分片
+        read: 只读查询走读连接池（见 db_routing.py）
+        """
+        pool = await (get_read_pool(user_id) if read else get_pool(user_id))
         async with pool.acquire() as conn:
             if fetch:
                 return await conn.fetch(query, *(params or ()))
             return await conn.execute(query, *(params or ()))
     
+    @db_route("write")
     async def upsert_item(self, item: Dict, user_id: str):
         """
         ✅ 自动去重：使用标准化 URL（移除查询参数、锚点）作为唯一标识
         """
+        from search.normalize import normalize_embeddings
         metadata_json = json.dumps(item.get("metadata") or {})
-        text_vec = to_vector_str(item.get("text_embedding"))
-        image_vec = to_vector_str(item.get("image_embedding"))
+        text_embedding, image_embedding = normalize_embeddings([item.get("text_embedding"), item.get("image_embedding")])
+        item = {**item, "text_embedding": text_embedding, "image_embedding": image_embedding}
+        text_vec = to_vector_str(text_embedding)
+        image_vec = to_vector_str(image_embedding)
         # ✅ 标准化 URL 用于去重
         original_url = item.get("url")
         normalized_url = _normalize_url_for_storage(original_url) if original_url else None
+        from search.config import PREFIX_EMBED_DIM
+        from search.features import FEATURE_COLUMNS, compute_item_features, prefix_embedding
+        features = compute_item_features({**item, "url": normalized_url})
+        feature_cols, feature_placeholders, feature_updates = _feature_sql(12)
+        prefix_idx = 12 + len(FEATURE_COLUMNS)
         await self.execute_query(
             f"""
             INSERT INTO {self.qualified_table} (
                 user_id, url, title, description, image, site_name,
-                tab_id, tab_title, text_embedding, image_embedding, metadata, updated_at
-            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::vector(1024), $10::vector(1024), $11::jsonb, NOW())
+                tab_id, tab_title, text_embedding, image_embedding, metadata,
+                {feature_cols}, text_embedding_512, image_embedding_512, updated_at
+            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::vector(1024), $10::vector(1024), $11::jsonb,
+                {feature_placeholders}, ${prefix_idx}::vector({PREFIX_EMBED_DIM}), ${prefix_idx + 1}::vector({PREFIX_EMBED_DIM}), NOW())
             ON CONFLICT (user_id, url) DO UPDATE SET
                 title = EXCLUDED.title,
                 description = EXCLUDED.description,
@@ -1109,6 +2232,9 @@ class VectorDBClient:
                 text_embedding = EXCLUDED.text_embedding,
                 image_embedding = EXCLUDED.image_embedding,
                 metadata = EXCLUDED.metadata,
+                {feature_updates},
+                text_embedding_512 = EXCLUDED.text_embedding_512,
+                image_embedding_512 = EXCLUDED.image_embedding_512,
                 updated_at = NOW();
             """,
             (
@@ -1123,9 +2249,22 @@ class VectorDBClient:
                 text_vec,
                 image_vec,
                 metadata_json,
-            )
+                *[features[col] for col in FEATURE_COLUMNS],
+                to_vector_str(prefix_embedding(item.get("text_embedding"))),
+                to_vector_str(prefix_embedding(item.get("image_embedding"))),
+            ),
+            user_id=_normalize_user_id(user_id),
         )
+        vector_cache.invalidate_user(_normalize_user_id(user_id))
+        # 数据已经提交，递增失败只记录日志
+        try:
+            await data_version.bump_user(user_id)
+        except Exception as e:
+            print(f"[VectorDBClient] ⚠ Failed to bump data version for {user_id} after upsert: {e}")
+            import traceback
+            traceback.print_exc()
     
+    @db_route("read")
     async def search_by_vector(
         self,
         query_vec: List[float],
@@ -1135,30 +2274,29 @@ class VectorDBClient:
     ) -> List[Dict]:
         user_id = _normalize_user_id(user_id)
         vec_str = to_vector_str(query_vec)
-        params = (vec_str, user_id, vec_str, min_similarity, vec_str, top_k)
+        params = (vec_str, user_id, min_similarity, top_k)
         
-        text_query = f"""
-            SELECT *, 1 - (text_embedding <=> $1::vector(1024)) as text_similarity
-            FROM {self.qualified_table}
-            WHERE user_id = $2
-              AND text_embedding IS NOT NULL
-              AND 1 - (text_embedding <=> $3::vector(1024)) > $4
-            ORDER BY text_embedding <=> $5::vector(1024)
-            LIMIT $6
-        """
+        def nearest_query(column: str, alias: str) -> str:
+            # 每行距离只计算一次：内层按距离取 top_k，外层做阈值过滤（见 _embedding_search_sql）
+            return f"""
+                SELECT {CLIENT_SEARCH_COLUMNS}, {_similarity_from_distance("nearest.distance")} as {alias}
+                FROM (
+                    SELECT {CLIENT_SEARCH_COLUMNS}, {_distance_sql(column, "$1::vector(1024)")} AS distance
+                    FROM {self.qualified_table}
+                    WHERE user_id = $2
+                      AND {column} IS NOT NULL
+                    ORDER BY distance
+                    LIMIT $4
+                ) nearest
+                WHERE {_similarity_from_distance("nearest.distance")} > $3
+                ORDER BY nearest.distance
+            """
         
-        image_query = f"""
-            SELECT *, 1 - (image_embedding <=> $1::vector(1024)) as image_similarity
-            FROM {self.qualified_table}
-            WHERE user_id = $2
-              AND image_embedding IS NOT NULL
-              AND 1 - (image_embedding <=> $3::vector(1024)) > $4
-            ORDER BY image_embedding <=> $5::vector(1024)
-            LIMIT $6
-        """
+        text_query = nearest_query("text_embedding", "text_similarity")
+        image_query = nearest_query("image_embedding", "image_similarity")
         
-        text_results = await self.execute_query(text_query, params, fetch=True)
-        image_results = await self.execute_query(image_query, params, fetch=True)
+        text_results = await self.execute_query(text_query, params, fetch=True, user_id=user_id, read=True)
+        image_results = await self.execute_query(image_query, params, fetch=True, user_id=user_id, read=True)
         
         from search.rank import _choose_weights
         from search.fuse import fuse_similarity_scores
@@ -1199,6 +2337,7 @@ class VectorDBClient:
         return results[:top_k]
 
 
+@db_route("write")
 async def soft_delete_tab(user_id: Optional[str], url: str) -> bool:
     """
     软删除一个 tab（OpenGraph item）
@@ -1212,17 +2351,23 @@ async def soft_delete_tab(user_id: Optional[str], url: str) -> bool:
     """
     try:
         user_id = _normalize_user_id(user_id)
-        pool = await get_pool()
+        pool = await get_pool(user_id)
         
         async with pool.acquire() as conn:
-            result = await conn.execute(f"""
-                UPDATE {ACTIVE_TABLE}
-                SET status = 'deleted',
-                    deleted_at = NOW(),
-                    updated_at = NOW()
-                WHERE user_id = $1 AND url = $2 AND status = 'active';
-            """, user_id, url)
+            async with conn.transaction():
+                result = await conn.execute(f"""
+                    UPDATE {ACTIVE_TABLE}
+                    SET status = 'deleted',
+                        deleted_at = NOW(),
+                        updated_at = NOW()
+                    WHERE user_id = $1 AND url = $2 AND status = 'active';
+                """, user_id, url)
+                if result != "UPDATE 0":
+                    await data_version.bump(conn, user_id)
             
+            vector_cache.invalidate_user(user_id)
+            db_routing.mark_write(user_id)
+            data_version.invalidate(user_id)
             return result == "UPDATE 1"
     except Exception as e:
         print(f"[VectorDB] Error soft deleting tab {url[:50]}...: {e}")
@@ -1231,32 +2376,164 @@ async def soft_delete_tab(user_id: Optional[str], url: str) -> bool:
         return False
 
 
+@db_route("write")
+async def batch_set_tabs_status(
+    user_id: Optional[str],
+    status: str,
+    urls: Optional[List[str]] = None,
+    tab_ids: Optional[List[str]] = None,
+) -> Dict[str, List[Dict]]:
+    """
+    批量软删除 / 恢复 tabs（一次集合 UPDATE，代替逐个 soft_delete_tab）
+    
+    URL 使用与存储相同的标准化规则匹配（同 build_search_scope），
+    被修改的行会更新 updated_at，供增量同步等依赖数据变化的逻辑感知
+    
+    Args:
+        user_id: 用户ID
+        status: 目标状态（'deleted' 软删除，'active' 恢复）
+        urls: 要处理的 URL 列表
+        tab_ids: 要处理的 tab_id 列表
+    
+    Returns:
+        {"updated": 实际修改的行数, "urls": [{"url", "result"}], "tab_ids": [{"tab_id", "result", "count"}]}
+        result 为 'updated'（已修改）/ 'unchanged'（已经是目标状态）/ 'not_found'（不存在）/ 'invalid'（tab_id 不是整数）
+    """
+    if status not in ("deleted", "active"):
+        raise ValueError(f"Invalid status: {status}")
+    
+    user_id = _normalize_user_id(user_id)
+    urls = [str(u).strip() for u in (urls or []) if u and str(u).strip()]
+    tab_ids = [str(t).strip() for t in (tab_ids or []) if t is not None and str(t).strip()]
+    outcome = {"updated": 0, "urls": [], "tab_ids": []}
+    
+    scope = build_search_scope(urls, tab_ids)
+    matched = []   # (url, tab_id, updated)
+    if scope and (scope["urls"] or scope["tab_ids"]):
+        pool = await get_pool(user_id)
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                params = [user_id, status]
+                scope_sql = _scope_clause(scope, params)
+                updated_rows = await conn.fetch(f"""
+                    UPDATE {ACTIVE_TABLE}
+                    SET status = $2,
+                        deleted_at = CASE WHEN $2 = 'deleted' THEN NOW() ELSE NULL END,
+                        updated_at = NOW()
+                    WHERE user_id = $1
+                      AND status <> $2{scope_sql}
+                    RETURNING url, tab_id;
+                """, *params)
+                if updated_rows:
+                    await data_version.bump(conn, user_id)
+                
+                params = [user_id, status]
+                scope_sql = _scope_clause(scope, params)
+                unchanged_rows = await conn.fetch(f"""
+                    SELECT url, tab_id
+                    FROM {ACTIVE_TABLE}
+                    WHERE user_id = $1
+                      AND status = $2{scope_sql};
+                """, *params)
+        
+        outcome["updated"] = len(updated_rows)
+        if updated_rows:
+            vector_cache.invalidate_user(user_id)
+            db_routing.mark_write(user_id)
+            data_version.invalidate(user_id)
+        updated_keys = {(row["url"], row["tab_id"]) for row in updated_rows}
+        matched = [(row["url"], row["tab_id"], True) for row in updated_rows]
+        matched += [
+            (row["url"], row["tab_id"], False)
+            for row in unchanged_rows
+            if (row["url"], row["tab_id"]) not in updated_keys
+        ]
+    
+    return _batch_status_outcome(outcome, urls, tab_ids, matched)
+
+
+def _batch_status_outcome(
+    outcome: Dict,
+    urls: List[str],
+    tab_ids: List[str],
+    matched: List[Tuple[str, Optional[int], bool]],
+) -> Dict[str, List[Dict]]:
+    """
+    按请求中的每个 URL / tab_id 汇总批量操作结果（SQLite 后端共用）
+    
+    Args:
+        outcome: {"updated": n, "urls": [], "tab_ids": []}
+        urls / tab_ids: 请求中的原始值
+        matched: 命中的行 [(url, tab_id, 是否被本次修改)]
+    """
+    for url in urls:
+        candidates = {url, _normalize_url_for_storage(url)}
+        hits = [updated for row_url, _, updated in matched if row_url in candidates]
+        if not hits:
+            result = "not_found"
+        else:
+            result = "updated" if any(hits) else "unchanged"
+        outcome["urls"].append({"url": url, "result": result})
+    
+    for raw_tab_id in tab_ids:
+        try:
+            tab_id = int(raw_tab_id)
+        except (ValueError, TypeError):
+            outcome["tab_ids"].append({"tab_id": raw_tab_id, "result": "invalid", "count": 0})
+            continue
+        hits = [updated for _, row_tab_id, updated in matched if row_tab_id == tab_id]
+        if not hits:
+            result = "not_found"
+        else:
+            result = "updated" if any(hits) else "unchanged"
+        outcome["tab_ids"].append({"tab_id": raw_tab_id, "result": result, "count": sum(hits)})
+    
+    return outcome
+
+
+def _session_clause(param: str) -> str:
+    """
+    按 session 过滤：优先 session_id 列，旧数据（backfill_item_features.py 回填前 session_id 为 NULL）
+    回退到 metadata->>'session_id'；两个分支都能走 (user_id, session_id) 索引（IS NULL 也可用 btree）
+    """
+    return f"(session_id = {param} OR (session_id IS NULL AND metadata->>'session_id' = {param}))"
+
+
+@db_route("write")
 async def soft_delete_session_tabs(user_id: Optional[str], session_id: str) -> int:
     """
     软删除一个 session 下的所有 tabs
     
+    使用 session_id 列（(user_id, session_id) 索引）；还没有回填 session_id 的旧数据
+    （session_id IS NULL）回退到 metadata->>'session_id'，见 _session_clause
+    
     Args:
         user_id: 用户ID
-        session_id: Session ID（存储在 metadata 中）
+        session_id: Session ID
     
     Returns:
         删除的 tab 数量
     """
     try:
         user_id = _normalize_user_id(user_id)
-        pool = await get_pool()
+        pool = await get_pool(user_id)
         
         async with pool.acquire() as conn:
-            # 查找该 session 的所有 tabs（通过 metadata 中的 session_id）
-            result = await conn.execute(f"""
-                UPDATE {ACTIVE_TABLE}
-                SET status = 'deleted',
-                    deleted_at = NOW(),
-                    updated_at = NOW()
-                WHERE user_id = $1 
-                  AND status = 'active'
-                  AND metadata->>'session_id' = $2;
-            """, user_id, session_id)
+            async with conn.transaction():
+                result = await conn.execute(f"""
+                    UPDATE {ACTIVE_TABLE}
+                    SET status = 'deleted',
+                        deleted_at = NOW(),
+                        updated_at = NOW()
+                    WHERE user_id = $1 
+                      AND {_session_clause("$2")}
+                      AND status = 'active';
+                """, user_id, session_id)
+                if result != "UPDATE 0":
+                    await data_version.bump(conn, user_id)
+            vector_cache.invalidate_user(user_id)
+            db_routing.mark_write(user_id)
+            data_version.invalidate(user_id)
             
             # 解析 UPDATE 结果获取影响行数
             if result.startswith("UPDATE "):
@@ -1270,10 +2547,49 @@ async def soft_delete_session_tabs(user_id: Optional[str], session_id: str) -> i
         return 0
 
 
+@db_route("read")
+async def get_session_tabs(user_id: Optional[str], session_id: str) -> List[Dict]:
+    """
+    获取一个 session 下的所有 active tabs（走 (user_id, session_id) 索引）
+    
+    只返回列表展示需要的字段，不返回 embedding 和截图
+    
+    Args:
+        user_id: 用户ID
+        session_id: Session ID
+    
+    Returns:
+        OpenGraph 数据列表（按创建时间倒序）
+    """
+    try:
+        user_id = _normalize_user_id(user_id)
+        pool = await get_read_pool(user_id)
+        
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT user_id, url, title, description, image, site_name,
+                       tab_id, tab_title, session_id, metadata, created_at, updated_at
+                FROM {ACTIVE_TABLE}
+                WHERE user_id = $1 AND {_session_clause("$2")} AND status = 'active'
+                ORDER BY created_at DESC;
+            """, user_id, session_id)
+            
+            return [_row_to_dict(row) for row in rows]
+    except Exception as e:
+        print(f"[VectorDB] Error getting session tabs {session_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        return []
+
+
+@db_route("read")
 async def get_user_active_tabs(user_id: Optional[str]) -> List[Dict]:
     """
     获取用户的所有 active tabs
     
+    ⚠️ 一次加载全部数据（含 embedding 和截图），数据量大时请使用
+    list_user_items（分页）或 iter_user_items（服务端游标）
+    
     Args:
         user_id: 用户ID
     
@@ -1282,11 +2598,11 @@ async def get_user_active_tabs(user_id: Optional[str]) -> List[Dict]:
     """
     try:
         user_id = _normalize_user_id(user_id)
-        pool = await get_pool()
+        pool = await get_read_pool(user_id)
         
         async with pool.acquire() as conn:
             rows = await conn.fetch(f"""
-                SELECT user_id, url, title, description, image, screenshot_image, site_name,
+                SELECT user_id, url, title, description, image, screenshot_hash, {SCREENSHOT_IMAGE_SQL}, site_name,
                        tab_id, tab_title, text_embedding, image_embedding, metadata
                 FROM {ACTIVE_TABLE}
                 WHERE user_id = $1 AND status = 'active'
@@ -1300,3 +2616,232 @@ async def get_user_active_tabs(user_id: Optional[str]) -> List[Dict]:
         traceback.print_exc()
         return []
 
+
+# 列表接口允许返回的字段（字段投影，避免默认返回 embedding；截图返回 screenshot_hash，未迁移的旧数据返回 screenshot_image）
+LISTABLE_COLUMNS = [
+    "user_id", "url", "title", "description", "image", "screenshot_hash", "screenshot_image", "site_name",
+    "tab_id", "tab_title", "session_id", "metadata",
+    "text_embedding", "image_embedding", "caption_embedding",
+    "image_caption", "dominant_colors", "style_tags", "object_tags",
+    "site_domain", "status", "deleted_at", "created_at", "updated_at",
+]
+DEFAULT_LIST_COLUMNS = [
+    "url", "title", "description", "image", "site_name",
+    "tab_id", "tab_title", "session_id", "metadata", "created_at", "updated_at",
+]
+
+
+# 列表的排序键：旧数据的 updated_at 可能为 NULL（游标无法编码，NULL 也无法参与行比较），
+# 依次回退到 created_at 和一个固定的最早时间
+LIST_SORT_KEY = "COALESCE(updated_at, created_at, TIMESTAMP '1970-01-01')"
+
+
+def _list_columns_sql(fields: Optional[List[str]]) -> str:
+    """
+    生成列表查询的 SELECT 字段（只允许 LISTABLE_COLUMNS 中的列）
+    
+    分页游标依赖 updated_at 和 url，这两列总是返回
+    """
+    columns = [f for f in (fields or DEFAULT_LIST_COLUMNS) if f in LISTABLE_COLUMNS]
+    for required in ("url", "updated_at"):
+        if required not in columns:
+            columns.append(required)
+    return _select_columns_sql(columns)
+
+
+def encode_list_cursor(sort_key: datetime, url: str) -> str:
+    """
+    把最后一行的 (排序时间, url) 编码为不透明的分页游标
+    
+    排序时间：列表和增量同步都是 LIST_SORT_KEY（不会为 NULL）
+    """
+    import base64
+    payload = json.dumps({"t": sort_key.isoformat(), "u": url}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_list_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    解析分页游标
+    
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    import base64
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        return datetime.fromisoformat(payload["t"]), payload["u"]
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor[:50]}") from e
+
+
+@db_route("read")
+async def list_user_items(
+    user_id: Optional[str],
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    fields: Optional[List[str]] = None,
+) -> Dict:
+    """
+    按 (updated_at, url) 倒序 keyset 分页列出用户的 active items
+    
+    updated_at 为 NULL 的旧数据按 created_at 排序（LIST_SORT_KEY）；
+    每页只查询 limit 行（走 (user_id, LIST_SORT_KEY, url) 表达式索引），
+    不会像 get_user_active_tabs 那样一次加载全部数据
+    
+    Args:
+        user_id: 用户ID
+        cursor: 上一页返回的 next_cursor（None 表示第一页）
+        limit: 每页条数
+        fields: 返回的字段（默认 DEFAULT_LIST_COLUMNS，不含 embedding 和截图）
+    
+    Returns:
+        {"items": [...], "next_cursor": str 或 None（没有更多数据）}
+    
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    user_id = _normalize_user_id(user_id)
+    columns_sql = _list_columns_sql(fields)
+    params = [user_id, limit + 1]
+    cursor_sql = ""
+    if cursor:
+        last_updated_at, last_url = decode_list_cursor(cursor)
+        params.extend([last_updated_at, last_url])
+        cursor_sql = f" AND ({LIST_SORT_KEY}, url) < ($3, $4)"
+    
+    pool = await get_read_pool(user_id)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT {columns_sql}, {LIST_SORT_KEY} AS list_sort_key
+            FROM {ACTIVE_TABLE}
+            WHERE user_id = $1 AND status = 'active'{cursor_sql}
+            ORDER BY {LIST_SORT_KEY} DESC, url DESC
+            LIMIT $2;
+        """, *params)
+    
+    # 多查一行用于判断是否还有下一页
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for row in rows:
+        item = _row_to_dict(row)
+        item.pop("list_sort_key", None)
+        items.append(item)
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_list_cursor(rows[-1]["list_sort_key"], rows[-1]["url"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@db_route("read")
+async def iter_user_items(
+    user_id: Optional[str],
+    fields: Optional[List[str]] = None,
+    prefetch: int = 500,
+):
+    """
+    逐行遍历用户的所有 active items（服务端游标，供内部批处理使用）
+    
+    使用 asyncpg 服务端游标每次预取 prefetch 行，内存占用与总行数无关；
+    遍历期间会一直占用一个连接（并持有一个只读事务），请尽快消费完
+    
+    Args:
+        user_id: 用户ID
+        fields: 返回的字段（默认 DEFAULT_LIST_COLUMNS）
+        prefetch: 每次从服务端取回的行数
+    
+    Yields:
+        OpenGraph 数据字典（按 updated_at、url 倒序）
+    """
+    user_id = _normalize_user_id(user_id)
+    columns_sql = _list_columns_sql(fields)
+    pool = await get_read_pool(user_id)
+    async with pool.acquire() as conn:
+        # 服务端游标必须在事务中使用
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(f"""
+                SELECT {columns_sql}
+                FROM {ACTIVE_TABLE}
+                WHERE user_id = $1 AND status = 'active'
+                ORDER BY {LIST_SORT_KEY} DESC, url DESC;
+            """, user_id, prefetch=prefetch):
+                yield _row_to_dict(row)
+
+
+# 增量同步返回的字段（不含 embedding 和截图；包含 status / deleted_at 以便客户端同步删除）
+SYNC_COLUMNS = [
+    "url", "title", "description", "image", "site_name",
+    "tab_id", "tab_title", "session_id",
+    "image_caption", "dominant_colors", "style_tags", "object_tags",
+    "status", "deleted_at", "updated_at",
+]
+
+# 增量同步的安全延迟：只返回 updated_at 早于 NOW() - 该秒数的变更，
+# 避免慢事务晚提交、但 updated_at 更早的行被水位线跳过
+SYNC_SAFETY_LAG_SECONDS = int(os.getenv("SYNC_SAFETY_LAG_SECONDS", "5"))
+
+
+@db_route("write")
+async def get_user_changes(
+    user_id: Optional[str],
+    since: Optional[str] = None,
+    limit: int = 500,
+    fields: Optional[List[str]] = None,
+) -> Dict:
+    """
+    增量同步：返回水位线之后新增、更新或软删除的行（按 LIST_SORT_KEY、url 正序）
+    
+    updated_at 为 NULL 的旧数据按 created_at 排序（与列表相同的 LIST_SORT_KEY），全量同步时也会返回。
+    客户端保存返回的 cursor，下次带上 since=cursor 轮询，只拉取变化的行；
+    软删除的行以 status='deleted' 返回。物理删除（cleanup_deleted_data --delete）不会出现在结果中。
+    
+    Args:
+        user_id: 用户ID
+        since: 上次返回的 cursor（None 表示从头全量同步）
+        limit: 每次最多返回的行数
+        fields: 返回的字段（默认 SYNC_COLUMNS）
+    
+    Returns:
+        {"changes": [...], "cursor": 新水位线, "has_more": 是否还有未拉取的变更}
+    
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    user_id = _normalize_user_id(user_id)
+    columns_sql = _list_columns_sql(fields or SYNC_COLUMNS)
+    params = [user_id, limit + 1, SYNC_SAFETY_LAG_SECONDS]
+    since_sql = ""
+    if since:
+        last_updated_at, last_url = decode_list_cursor(since)
+        params.extend([last_updated_at, last_url])
+        since_sql = f" AND ({LIST_SORT_KEY}, url) > ($4, $5)"
+    
+    # 走主库：水位线按主库的 NOW() 计算，副本的复制延迟可能超过 SYNC_SAFETY_LAG_SECONDS，
+    # 在副本上读会把延迟到达、updated_at 早于游标的行永久跳过
+    pool = await get_pool(user_id)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT {columns_sql}, {LIST_SORT_KEY} AS list_sort_key
+            FROM {ACTIVE_TABLE}
+            WHERE user_id = $1
+              AND {LIST_SORT_KEY} < NOW() - $3 * INTERVAL '1 second'{since_sql}
+            ORDER BY {LIST_SORT_KEY}, url
+            LIMIT $2;
+        """, *params)
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = []
+    for row in rows:
+        item = _row_to_dict(row)
+        item.pop("list_sort_key", None)
+        changes.append(item)
+    cursor = since
+    if rows:
+        cursor = encode_list_cursor(rows[-1]["list_sort_key"], rows[-1]["url"])
+    return {
+        "changes": changes,
+        "cursor": cursor,
+        "has_more": has_more,
+    }
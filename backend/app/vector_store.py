@@ -0,0 +1,249 @@
+"""
+向量存储接口（VectorStore）
+搜索和入库只依赖这里定义的接口，具体后端通过环境变量 VECTOR_STORE_BACKEND 选择：
+
+- adbpg（默认）：阿里云 AnalyticDB PostgreSQL，即 vector_db.py 中的实现
+- sqlite：本地 SQLite + numpy 暴力检索（sqlite_vector_store.py），不需要数据库，
+  可以在笔记本上跑完整服务（上传、搜索、列表、增量同步、批量删除 / 恢复、session），离线测试和压测；
+  截图二进制只存储在 ADBPG 中，sqlite 后端不提供
+"""
+import os
+from typing import Dict, List, Optional, Protocol, Tuple
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "adbpg").lower()
+
+
+class VectorStore(Protocol):
+    """向量存储需要实现的操作（所有方法按 user_id 严格隔离）"""
+
+    name: str
+
+    async def upsert_item(self, user_id: Optional[str], item: Dict, stats: Optional[Dict[str, int]] = None) -> bool:
+        """插入或更新一条记录（item 字段同 batch_upsert_items）"""
+        ...
+
+    async def batch_upsert_items(
+        self,
+        items: List[Dict],
+        user_id: Optional[str],
+        batch_size: int = 20,
+        stats: Optional[Dict[str, int]] = None,
+    ) -> int:
+        """批量插入或更新，返回成功数量"""
+        ...
+
+    async def search_by_text_embedding(
+        self,
+        user_id: Optional[str],
+        query_embedding: List[float],
+        top_k: int = 20,
+        threshold: float = 0.0,
+        scope: Optional[Dict[str, List]] = None,
+        exclude_docs: bool = False,
+    ) -> List[Dict]:
+        """text_embedding 余弦相似度搜索（结果包含 similarity）"""
+        ...
+
+    async def search_by_image_embedding(
+        self,
+        user_id: Optional[str],
+        query_embedding: List[float],
+        top_k: int = 20,
+        threshold: float = 0.0,
+        scope: Optional[Dict[str, List]] = None,
+        exclude_docs: bool = False,
+    ) -> List[Dict]:
+        """image_embedding 余弦相似度搜索（结果包含 similarity）"""
+        ...
+
+    async def search_by_caption_embedding(
+        self,
+        user_id: Optional[str],
+        query_embedding: List[float],
+        top_k: int = 20,
+        threshold: float = 0.0,
+        scope: Optional[Dict[str, List]] = None,
+        exclude_docs: bool = False,
+    ) -> List[Dict]:
+        """caption_embedding 余弦相似度搜索（结果包含 similarity）"""
+        ...
+
+    async def search_by_caption_keyword(
+        self,
+        user_id: Optional[str],
+        query_tokens: List[str],
+        top_k: int = 50,
+        scope: Optional[Dict[str, List]] = None,
+        exclude_docs: bool = False,
+    ) -> List[Dict]:
+        """caption 分词重叠搜索（结果包含 rank = 命中 token 数 / 查询 token 数）"""
+        ...
+
+    async def get_items_by_urls(
+        self,
+        user_id: Optional[str],
+        urls: List[str],
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """按 URL 批量获取 active 记录"""
+        ...
+
+    async def soft_delete_tab(self, user_id: Optional[str], url: str) -> bool:
+        """软删除一条记录，返回是否删除成功"""
+        ...
+
+    async def find_items_needing_upload(self, user_id: Optional[str], items: List[Dict]) -> Tuple[List[str], List[str]]:
+        """上传握手：返回 (needed_urls, unchanged_urls)"""
+        ...
+
+    async def list_user_items(
+        self,
+        user_id: Optional[str],
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        fields: Optional[List[str]] = None,
+    ) -> Dict:
+        """keyset 分页列出 active items：{"items": [...], "next_cursor": ...}（游标格式不正确时抛 ValueError）"""
+        ...
+
+    async def get_user_changes(
+        self,
+        user_id: Optional[str],
+        since: Optional[str] = None,
+        limit: int = 500,
+        fields: Optional[List[str]] = None,
+    ) -> Dict:
+        """增量同步：{"changes": [...], "cursor": ..., "has_more": ...}（游标格式不正确时抛 ValueError）"""
+        ...
+
+    async def batch_set_tabs_status(
+        self,
+        user_id: Optional[str],
+        status: str,
+        urls: Optional[List[str]] = None,
+        tab_ids: Optional[List[str]] = None,
+    ) -> Dict[str, List[Dict]]:
+        """批量软删除 / 恢复（status 为 'deleted' / 'active'），返回每个 URL / tab_id 的处理结果"""
+        ...
+
+    async def soft_delete_session_tabs(self, user_id: Optional[str], session_id: str) -> int:
+        """软删除一个 session 下的所有 tabs，返回删除数量"""
+        ...
+
+    async def get_session_tabs(self, user_id: Optional[str], session_id: str) -> List[Dict]:
+        """列出一个 session 下的 active tabs（按创建时间倒序）"""
+        ...
+
+    async def get_screenshot_blob(self, user_id: Optional[str], screenshot_hash: str) -> Optional[Dict]:
+        """按内容哈希读取该用户自己的截图：{"content_type", "data"}，不存在或不属于该用户返回 None"""
+        ...
+
+
+class AdbpgVectorStore:
+    """AnalyticDB PostgreSQL 后端（转发到 vector_db.py 中的函数）"""
+
+    name = "adbpg"
+
+    async def upsert_item(self, user_id: Optional[str], item: Dict, stats: Optional[Dict[str, int]] = None) -> bool:
+        from vector_db import upsert_opengraph_item
+        return await upsert_opengraph_item(
+            user_id=user_id,
+            url=item.get("url"),
+            title=item.get("title"),
+            description=item.get("description"),
+            image=item.get("image"),
+            site_name=item.get("site_name"),
+            tab_id=item.get("tab_id"),
+            tab_title=item.get("tab_title"),
+            text_embedding=item.get("text_embedding"),
+            image_embedding=item.get("image_embedding"),
+            metadata=item.get("metadata"),
+            image_caption=item.get("image_caption"),
+            caption_embedding=item.get("caption_embedding"),
+            dominant_colors=item.get("dominant_colors"),
+            style_tags=item.get("style_tags"),
+            object_tags=item.get("object_tags"),
+            session_id=item.get("session_id"),
+            stats=stats,
+        )
+
+    async def batch_upsert_items(self, items, user_id, batch_size=20, stats=None) -> int:
+        from vector_db import batch_upsert_items
+        return await batch_upsert_items(items, user_id=user_id, batch_size=batch_size, stats=stats)
+
+    async def search_by_text_embedding(self, user_id, query_embedding, top_k=20, threshold=0.0, scope=None, exclude_docs=False):
+        from vector_db import search_by_text_embedding
+        return await search_by_text_embedding(user_id, query_embedding, top_k, threshold, scope, exclude_docs)
+
+    async def search_by_image_embedding(self, user_id, query_embedding, top_k=20, threshold=0.0, scope=None, exclude_docs=False):
+        from vector_db import search_by_image_embedding
+        return await search_by_image_embedding(user_id, query_embedding, top_k, threshold, scope, exclude_docs)
+
+    async def search_by_caption_embedding(self, user_id, query_embedding, top_k=20, threshold=0.0, scope=None, exclude_docs=False):
+        from vector_db import search_by_caption_embedding
+        return await search_by_caption_embedding(user_id, query_embedding, top_k, threshold, scope, exclude_docs)
+
+    async def search_by_caption_keyword(self, user_id, query_tokens, top_k=50, scope=None, exclude_docs=False):
+        from vector_db import search_by_caption_keyword
+        return await search_by_caption_keyword(user_id, query_tokens, top_k, scope, exclude_docs)
+
+    async def get_items_by_urls(self, user_id, urls, fields=None):
+        from vector_db import get_items_by_urls
+        return await get_items_by_urls(user_id, urls, fields=fields)
+
+    async def soft_delete_tab(self, user_id, url) -> bool:
+        from vector_db import soft_delete_tab
+        return await soft_delete_tab(user_id, url)
+
+    async def find_items_needing_upload(self, user_id, items):
+        from vector_db import find_items_needing_upload
+        return await find_items_needing_upload(user_id, items)
+
+    async def list_user_items(self, user_id, cursor=None, limit=100, fields=None):
+        from vector_db import list_user_items
+        return await list_user_items(user_id, cursor=cursor, limit=limit, fields=fields)
+
+    async def get_user_changes(self, user_id, since=None, limit=500, fields=None):
+        from vector_db import get_user_changes
+        return await get_user_changes(user_id, since=since, limit=limit, fields=fields)
+
+    async def batch_set_tabs_status(self, user_id, status, urls=None, tab_ids=None):
+        from vector_db import batch_set_tabs_status
+        return await batch_set_tabs_status(user_id, status, urls=urls, tab_ids=tab_ids)
+
+    async def soft_delete_session_tabs(self, user_id, session_id) -> int:
+        from vector_db import soft_delete_session_tabs
+        return await soft_delete_session_tabs(user_id, session_id)
+
+    async def get_session_tabs(self, user_id, session_id):
+        from vector_db import get_session_tabs
+        return await get_session_tabs(user_id, session_id)
+
+    async def get_screenshot_blob(self, user_id, screenshot_hash):
+        from vector_db import get_screenshot_blob
+        return await get_screenshot_blob(user_id, screenshot_hash)
+
+
+_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> VectorStore:
+    """获取当前配置的向量存储（单例）"""
+    global _store
+    if _store is None:
+        if VECTOR_STORE_BACKEND == "sqlite":
+            from sqlite_vector_store import SQLiteVectorStore
+            _store = SQLiteVectorStore()
+        elif VECTOR_STORE_BACKEND == "adbpg":
+            _store = AdbpgVectorStore()
+        else:
+            raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND} (expected 'adbpg' or 'sqlite')")
+        print(f"[VectorStore] Using backend: {_store.name}")
+    return _store
+
+
+def is_vector_store_configured() -> bool:
+    """是否有可用的向量存储（sqlite 后端总是可用；adbpg 后端需要配置 ADBPG_HOST）"""
+    if VECTOR_STORE_BACKEND == "sqlite":
+        return True
+    return bool(os.getenv("ADBPG_HOST", ""))